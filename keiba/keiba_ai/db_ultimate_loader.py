@@ -123,13 +123,29 @@ def load_ultimate_training_frame_cached(
         df.attrs["stage_profile"] = stage_profile
     return df
 
-def load_ultimate_training_frame(db_path: Path) -> pd.DataFrame:
+def _race_id_filter(race_ids) -> tuple[str, list]:
+    """race_ids 指定時の WHERE 句とパラメータ（None なら全件）"""
+    if race_ids is None:
+        return "", []
+    ids = sorted({str(r) for r in race_ids})
+    return f" WHERE race_id IN ({','.join('?' * len(ids))})", ids
+
+
+def load_ultimate_training_frame(
+    db_path: Path,
+    dtype_schema: bool = True,
+    race_ids=None,
+) -> pd.DataFrame:
     """
     race_results_ultimateテーブルからUltimate版データを読み込む
     races_ultimateテーブルのdistance/track_type等もJOINして取得する
     
     Args:
         db_path: keiba_ultimate.dbのパス
+        dtype_schema: feature_catalog.yaml の dtype_schema（float32 / 小整数 / category /
+            生データ列の削除）を適用する。学習・推論（_HISTORY_CACHE）共通。
+        race_ids: 指定した race_id のみ読み込む（履歴キャッシュの差分追記用）。
+            行単位・レース単位の変換のみなので、全件ロード結果の該当行と同じ値になる。
         
     Returns:
         DataFrame with Ultimate features
@@ -160,14 +176,18 @@ def load_ultimate_training_frame(db_path: Path) -> pd.DataFrame:
     has_races_ultimate = cursor.fetchone() is not None
     
     # race_results_ultimate から全データ取得（イテレータでメモリ消費を削減）
-    cursor.execute("SELECT race_id, data FROM race_results_ultimate")
+    _where, _params = _race_id_filter(race_ids)
+    if race_ids is not None and not _params:
+        conn.close()
+        return pd.DataFrame()
+    cursor.execute("SELECT race_id, data FROM race_results_ultimate" + _where, _params)
     rows = cursor.fetchall()  # NOTE: 10万行超の場合は cursor.fetchmany() に切り替えの余地あり
     
     # races_ultimate から distance/track_type/date/num_horses を取得（イテレータで处理）
     race_meta = {}
     _invalid_race_ids: set = set()  # _invalid_distance フラグが立っているレース
     if has_races_ultimate:
-        cursor.execute("SELECT race_id, data FROM races_ultimate")
+        cursor.execute("SELECT race_id, data FROM races_ultimate" + _where, _params)
         for race_id, data_json in cursor:  # fetchall()よりメモリ効率的
             try:
                 data = json.loads(data_json)
@@ -214,7 +234,7 @@ def load_ultimate_training_frame(db_path: Path) -> pd.DataFrame:
     )
     if _rt_cursor.fetchone():
         _rt_cursor.execute(
-            "SELECT race_id, bet_type, payout FROM return_tables_ultimate"
+            "SELECT race_id, bet_type, payout FROM return_tables_ultimate" + _where, _params
         )
         for _race_id_rt, _bet_type, _payout in _rt_cursor.fetchall():
             if _race_id_rt not in race_meta:
@@ -416,16 +436,9 @@ def load_ultimate_training_frame(db_path: Path) -> pd.DataFrame:
         df['horse_weight'] = df['weight']
     
     # ===== corner_positions の解析 =====
-    # "7-7-2-2" → [7, 7, 2, 2] の変換（corner_positions_listが無い場合）
-    if 'corner_positions' in df.columns and 'corner_positions_list' not in df.columns:
-        def parse_corners(s):
-            try:
-                if pd.isna(s) or s == '':
-                    return []
-                return [int(x) for x in str(s).split('-') if x.strip().isdigit()]
-            except:
-                return []
-        df['corner_positions_list'] = df['corner_positions'].apply(parse_corners)
+    # "7-7-2-2" → corner_1〜corner_4（int16・0=コーナーなし）に一括展開。リスト列は残さない
+    from keiba_ai.feature_engineering import parse_corner_columns
+    df = parse_corner_columns(df)
     
     # ===== finish_time を秒数に変換 =====
     def parse_time(t):
@@ -479,6 +492,16 @@ def load_ultimate_training_frame(db_path: Path) -> pd.DataFrame:
         print(f"  ✓ distance: {df['distance'].notna().sum()}件取得")
     if 'surface' in df.columns:
         print(f"  ✓ surface: {df['surface'].notna().sum()}件取得")
+
+    # ===== メモリ型スキーマ（float32 / 小整数 / category / 生データ列削除） =====
+    if dtype_schema:
+        from keiba_ai.dtype_schema import apply_dtype_schema
+        _report: dict = {}
+        df = apply_dtype_schema(df, report=_report)
+        print(
+            f"  ✓ dtype スキーマ適用: {_report['bytes_before'] / 2**20:.1f}MB → "
+            f"{_report['bytes_after'] / 2**20:.1f}MB (削減 {_report['bytes_saved'] / 2**20:.1f}MB)"
+        )
     
     return df
 
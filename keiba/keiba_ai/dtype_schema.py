@@ -0,0 +1,116 @@
+"""
+学習・推論フレームのメモリ型スキーマ
+
+feature_catalog.yaml の dtype_schema セクションを単一真実源として、
+load_ultimate_training_frame の出力（学習フレーム / 推論側 _HISTORY_CACHE）に
+以下を適用する。
+
+  - float64 → float32（keep_float64 に列挙した列を除く）
+  - 欠損なし・整数値の小さな整数列 → int8 / int16（欠損ありは float32）
+  - 低〜中カーディナリティ文字列 → category
+  - 生データの塊（past_performances 等）→ 削除
+
+apply_dtype_schema(df, report=dict) で削減バイト数のレポートを受け取れる。
+"""
+from __future__ import annotations
+
+import functools
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+_DEFAULT_CATALOG = Path(__file__).parent.parent / "feature_catalog.yaml"
+
+
+@functools.lru_cache(maxsize=4)
+def load_dtype_schema(catalog_path: str = str(_DEFAULT_CATALOG)) -> Dict[str, Any]:
+    """feature_catalog.yaml から dtype_schema を読み込む（未定義・読込失敗時は空 dict）"""
+    try:
+        from keiba_ai.feature_catalog import FeatureCatalog  # type: ignore
+
+        return FeatureCatalog.load(catalog_path).dtype_schema()
+    except Exception:
+        return {}
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def apply_dtype_schema(
+    df: pd.DataFrame,
+    schema: Optional[Dict[str, Any]] = None,
+    report: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """dtype スキーマを適用した DataFrame を返す（入力は変更しない）。
+
+    Args:
+        schema: dtype_schema 辞書。省略時は feature_catalog.yaml から読み込む。
+        report: 渡された場合、bytes_before / bytes_after / bytes_saved / by_dtype を書き込む。
+    """
+    if schema is None:
+        schema = load_dtype_schema()
+    if not schema or df.empty:
+        if report is not None:
+            b = _frame_bytes(df)
+            report.update({"bytes_before": b, "bytes_after": b, "bytes_saved": 0, "by_dtype": {}})
+        return df
+
+    bytes_before = _frame_bytes(df) if report is not None else 0
+    float_dtype = np.dtype(schema.get("float_dtype", "float32"))
+    keep_float64 = set(schema.get("keep_float64") or [])
+    small_int: Dict[str, list] = schema.get("small_int") or {}
+    int_cols = {c: np.dtype(dt) for dt, cols in small_int.items() for c in (cols or [])}
+    category_cols = set(schema.get("category") or [])
+    drop_cols = [c for c in (schema.get("drop") or []) if c in df.columns]
+
+    out = df.drop(columns=drop_cols) if drop_cols else df.copy()
+    changed: Dict[str, int] = {}
+    for col in out.columns:
+        s = out[col]
+        if col in category_cols:
+            if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+                # 数値と文字列の混在列は category 化しない（比較・map の挙動が変わるため）
+                if pd.api.types.infer_dtype(s, skipna=True) not in ("string", "empty"):
+                    continue
+                out[col] = s.astype("category")
+                changed["category"] = changed.get("category", 0) + 1
+            continue
+        if col in int_cols and pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            dt = int_cols[col]
+            info = np.iinfo(dt)
+            vals = s.to_numpy(dtype=float, na_value=np.nan)
+            if (
+                len(vals) > 0
+                and not np.isnan(vals).any()
+                and np.all(np.mod(vals, 1) == 0)
+                and vals.min() >= info.min and vals.max() <= info.max
+            ):
+                out[col] = vals.astype(dt)
+                changed[str(dt)] = changed.get(str(dt), 0) + 1
+                continue
+            if col not in keep_float64:
+                out[col] = vals.astype(float_dtype)
+                changed[str(float_dtype)] = changed.get(str(float_dtype), 0) + 1
+            continue
+        if (
+            col not in keep_float64
+            and pd.api.types.is_float_dtype(s)
+            and not pd.api.types.is_extension_array_dtype(s)
+            and s.dtype != float_dtype
+        ):
+            out[col] = s.astype(float_dtype)
+            changed[str(float_dtype)] = changed.get(str(float_dtype), 0) + 1
+
+    if report is not None:
+        bytes_after = _frame_bytes(out)
+        report.update({
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_saved": bytes_before - bytes_after,
+            "dropped": drop_cols,
+            "by_dtype": changed,
+        })
+    return out
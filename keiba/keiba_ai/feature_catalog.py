@@ -71,6 +71,14 @@ class FeatureCatalog:
             for r in rows
         ]
 
+    # ------------------------------------------------------------------
+    # メモリ型スキーマ
+    # ------------------------------------------------------------------
+
+    def dtype_schema(self) -> dict[str, Any]:
+        """ロード時に適用する dtype スキーマ（keiba_ai.dtype_schema が参照）。"""
+        return dict(self._data.get("dtype_schema") or {})
+
     # ------------------------------------------------------------------
     # エンジニアリング特徴量
     # ------------------------------------------------------------------
@@ -10,6 +10,15 @@ import yaml
 import pandas as pd
 import numpy as np
 
+from .group_kernels import (
+    group_entropy,
+    group_normalize,
+    group_sum,
+    group_topk_sum,
+    group_zscore,
+)
+from .stage_profiler import traced_stage
+
 
 # ===========================================================================
 # 脚質分類ユーティリティ（動画: コーナー通過順位 → 逃げ/先行/差し/追込）
@@ -46,6 +55,67 @@ def classify_running_style(corners: list, n_horses: object) -> Optional[str]:
         return "追込"
 
 
+_CORNER_COLS = ['corner_1', 'corner_2', 'corner_3', 'corner_4']
+_RUNNING_STYLE_LABELS = np.array(["逃げ", "先行", "差し", "追込", None], dtype=object)
+
+
+def parse_corner_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """corner_positions（"7-7-2-2"）を固定幅の int16 列 corner_1〜corner_4 に展開する。
+
+    ロード時に 1 回だけ呼ぶ。str.split(expand=True) で一括分割し、数字でない
+    トークンは詰めて読み飛ばす（旧 corner_positions_list と同じ解釈）。
+    コーナーなしは 0。文字列が無い行は既存の corner_N 列を残す。
+    リスト列 corner_positions_list はフレームに残さない（in-place で変更して返す）。
+    """
+    n = len(df)
+    src = df['corner_positions'] if 'corner_positions' in df.columns else None
+    if src is None and 'corner_positions_list' in df.columns:
+        # 旧データ（JSON に文字列が無くリストだけある）からの復元
+        src = df['corner_positions_list'].map(
+            lambda x: '-'.join(str(v) for v in x) if isinstance(x, (list, tuple)) else x)
+    if src is None and not any(c in df.columns for c in _CORNER_COLS):
+        return df
+
+    mat = np.zeros((n, len(_CORNER_COLS)), dtype=np.float64)
+    if src is not None and n:
+        tokens = src.astype('string').str.split('-', expand=True)
+        vals = np.full((n, max(tokens.shape[1], len(_CORNER_COLS))), np.nan)
+        for j in range(tokens.shape[1]):
+            t = tokens.iloc[:, j].str.strip()
+            vals[:, j] = pd.to_numeric(t.where(t.str.fullmatch(r'\d+', na=False)), errors='coerce')
+        # 数字トークンを左詰め（安定ソートで順序は保つ）
+        order = np.argsort(np.isnan(vals), axis=1, kind='stable')
+        mat = np.nan_to_num(np.take_along_axis(vals, order, axis=1)[:, :len(_CORNER_COLS)], nan=0.0)
+    if any(c in df.columns for c in _CORNER_COLS):
+        old = np.column_stack([
+            pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            if c in df.columns else np.zeros(n)
+            for c in _CORNER_COLS
+        ])
+        keep = ~(mat > 0).any(axis=1)
+        mat[keep] = np.nan_to_num(old[keep], nan=0.0)
+    mat = np.clip(mat, 0, np.iinfo(np.int16).max).astype(np.int16)
+    for j, c in enumerate(_CORNER_COLS):
+        df[c] = mat[:, j]
+    if 'corner_positions_list' in df.columns:
+        df.drop(columns='corner_positions_list', inplace=True)
+    return df
+
+
+def running_style_codes(first: np.ndarray, mean_pos: np.ndarray, n_horses: object) -> np.ndarray:
+    """classify_running_style のベクトル版。0=逃げ 1=先行 2=差し 3=追込、-1=データなし（mean_pos が NaN）。"""
+    nh = pd.to_numeric(pd.Series(n_horses), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    nh = np.where(np.isnan(nh) | (nh == 0), 8.0, nh)
+    nh = np.maximum(np.trunc(nh), 2.0)
+    third = nh / 3.0
+    codes = np.select(
+        [np.isnan(mean_pos), (first <= 2) & (mean_pos <= third), mean_pos <= third, mean_pos <= nh * 2 / 3.0],
+        [-1, 0, 1, 2],
+        default=3,
+    )
+    return codes.astype(np.int8)
+
+
 # ===========================================================================
 # レースクラス数値化ユーティリティ（動画: regex ベース G1〜新馬マッピング）
 # ===========================================================================
@@ -99,6 +169,120 @@ def load_course_master(yaml_path: Optional[Path] = None) -> dict:
         return yaml.safe_load(f)
 
 
+_COURSE_DEFAULTS = {
+    'straight_length': 300.0,
+    'track_type': 'unknown',
+    'corner_radius': 'medium',
+    'inner_bias': 0,
+}
+
+
+class _CourseTable:
+    """course_master.yaml を (venue_code, surface, distance) の整列済み配列にコンパイルした表
+
+    行 0 はマスターに無い場合のデフォルト値。各 (venue_code, surface) ブロックは距離昇順に並び、
+    引く順序は 距離キー一致 → 'default' キー → 最も近い距離（同距離差なら YAML で先の行）。
+    1600.0 のような整数値の float は距離キー '1600' に一致させる（旧実装の str() 比較では
+    '1600.0' となり一致しなかった）。1600.5 のような端数付きは一致扱いにせず、'default' →
+    切り捨てた距離に最も近いキーの順で引く。
+    """
+
+    _DIST_SCALE = 1_000_000   # 複合キー = ブロック番号 × _DIST_SCALE + 距離
+
+    def __init__(self, master: dict):
+        rows = [dict(_COURSE_DEFAULTS)]
+        block_of: dict = {}
+        keys: list = []
+        key_rows: list = []
+        key_order: list = []
+        default_row: list = []
+        for venue_code, venue in (master or {}).get('courses', {}).items():
+            for surface, surface_data in (venue or {}).items():
+                if not isinstance(surface_data, dict):
+                    continue
+                b = block_of.setdefault((str(venue_code), str(surface)), len(block_of))
+                default_row.append(0)
+                for order, (dist_key, course_data) in enumerate(surface_data.items()):
+                    rows.append({k: (course_data or {}).get(k, v) for k, v in _COURSE_DEFAULTS.items()})
+                    if dist_key == 'default':
+                        default_row[b] = len(rows) - 1
+                        continue
+                    keys.append(b * self._DIST_SCALE + int(dist_key))
+                    key_rows.append(len(rows) - 1)
+                    key_order.append(order)
+        self._block_of = block_of
+        self._default_row = np.asarray(default_row, dtype=np.int64)
+        srt = np.argsort(np.asarray(keys, dtype=np.int64), kind='stable')
+        self._keys = np.asarray(keys, dtype=np.int64)[srt]
+        self._key_rows = np.asarray(key_rows, dtype=np.int64)[srt]
+        self._key_order = np.asarray(key_order, dtype=np.int64)[srt]
+        self.straight_length = np.array([r['straight_length'] for r in rows], dtype=float)
+        self.track_type = np.array([r['track_type'] for r in rows], dtype=object)
+        self.corner_radius = np.array([r['corner_radius'] for r in rows], dtype=object)
+        self.inner_bias = np.array([r['inner_bias'] for r in rows], dtype=np.int64)
+
+    def lookup(self, venue_code, distance, surface) -> np.ndarray:
+        """各行のコース特性の行番号（配列入力・ベクトル化）"""
+        dist = pd.to_numeric(pd.Series(distance), errors='coerce').to_numpy(dtype=float)
+        # (venue_code, surface) → ブロック番号は、それぞれのユニーク値どうしの小さな表で引く
+        v_codes, v_uniques = pd.factorize(pd.Series(venue_code, dtype=object).astype(str))
+        s_codes, s_uniques = pd.factorize(pd.Series(surface, dtype=object).astype(str))
+        # 末尾の行・列は欠損（factorize のコード -1）用で、常にマスター外
+        table = np.full((len(v_uniques) + 1, len(s_uniques) + 1), -1, dtype=np.int64)
+        for i, v in enumerate(v_uniques):
+            for j, sf in enumerate(s_uniques):
+                table[i, j] = self._block_of.get((v, sf), -1)
+        block = table[v_codes, s_codes]
+        out = np.zeros(len(block), dtype=np.int64)
+        known = block >= 0
+        out[known] = self._default_row[block[known]]
+
+        # 距離キーを持つブロックは最も近い距離（完全一致は距離差 0）を引く
+        has_dist = known & ~np.isnan(dist)
+        if not has_dist.any() or not len(self._keys):
+            return out
+        b = block[has_dist]
+        integral = dist[has_dist] == np.trunc(dist[has_dist])
+        d = np.clip(np.trunc(dist[has_dist]), 0, self._DIST_SCALE - 1).astype(np.int64)
+        lo = np.searchsorted(self._keys, b * self._DIST_SCALE, side='left')
+        hi = np.searchsorted(self._keys, (b + 1) * self._DIST_SCALE, side='left')
+        pos = np.searchsorted(self._keys, b * self._DIST_SCALE + d, side='left')
+        left = np.clip(pos - 1, 0, len(self._keys) - 1)
+        right = np.clip(pos, 0, len(self._keys) - 1)
+        left_ok = pos - 1 >= lo
+        right_ok = pos < hi
+        key_d = self._keys % self._DIST_SCALE
+        diff_l = np.where(left_ok, np.abs(d - key_d[left]), np.iinfo(np.int64).max)
+        diff_r = np.where(right_ok, np.abs(key_d[right] - d), np.iinfo(np.int64).max)
+        take_right = (diff_r < diff_l) | ((diff_r == diff_l) & (self._key_order[right] < self._key_order[left]))
+        nearest = np.where(take_right, right, left)
+        found = left_ok | right_ok
+        exact = found & integral & (np.minimum(diff_l, diff_r) == 0)
+        # 距離キー一致 > default > 最も近い距離
+        use_nearest = found & (exact | (self._default_row[b] == 0))
+        sub = out[has_dist]
+        sub[use_nearest] = self._key_rows[nearest[use_nearest]]
+        out[has_dist] = sub
+        return out
+
+    def features(self, rows: np.ndarray) -> dict:
+        return {
+            'straight_length': self.straight_length[rows],
+            'track_type': self.track_type[rows],
+            'corner_radius': self.corner_radius[rows],
+            'inner_bias': self.inner_bias[rows],
+        }
+
+    def lookup_one(self, venue_code, distance, surface) -> dict:
+        row = int(self.lookup([venue_code], [distance], [surface])[0])
+        return {k: v[0].item() if hasattr(v[0], 'item') else v[0]
+                for k, v in self.features(np.array([row])).items()}
+
+
+# コースマスターはプロセスごとに 1 回だけ読み込み、検索表へコンパイルしておく
+_COURSE_TABLE = _CourseTable(load_course_master())
+
+
 def extract_race_info(race_id: str) -> dict:
     """race_idから競馬場コード、距離、芝/ダートを抽出
     
@@ -139,80 +323,12 @@ def get_course_features(race_id: str, distance: int, surface: str = "turf") -> d
             - corner_radius: tight/medium/large/none
             - inner_bias: 内枠有利性 (0=フラット, 1=有利)
     """
-    course_master = load_course_master()
-    race_info = extract_race_info(race_id)
-    venue_code = race_info['venue_code']
-    
-    if venue_code not in course_master['courses']:
-        # デフォルト値
-        return {
-            'straight_length': 300.0,
-            'track_type': 'unknown',
-            'corner_radius': 'medium',
-            'inner_bias': 0
-        }
-    
-    venue = course_master['courses'][venue_code]
-    surface_data = venue.get(surface, {})
-    
-    # 距離に最も近いコース設定を探す
-    distance_str = str(distance)
-    if distance_str in surface_data:
-        course_data = surface_data[distance_str]
-    elif 'default' in surface_data:
-        course_data = surface_data['default']
-    else:
-        # 最も近い距離を探す
-        available_distances = [k for k in surface_data.keys() if k != 'default']
-        if available_distances:
-            closest = min(available_distances, key=lambda x: abs(int(x) - distance))
-            course_data = surface_data[closest]
-        else:
-            course_data = {
-                'straight_length': 300.0,
-                'track_type': 'unknown',
-                'corner_radius': 'medium',
-                'inner_bias': 0
-            }
-    
-    return {
-        'straight_length': course_data.get('straight_length', 300.0),
-        'track_type': course_data.get('track_type', 'unknown'),
-        'corner_radius': course_data.get('corner_radius', 'medium'),
-        'inner_bias': course_data.get('inner_bias', 0)
-    }
+    return _COURSE_TABLE.lookup_one(extract_race_info(race_id)['venue_code'], distance, surface)
 
 
 def _get_course_features_by_venue(venue_code: str, distance: int, surface: str = "turf") -> dict:
-    """venue_code を直接受け取るコース特性取得（vectorize用）。
-
-    get_course_features と同ロジックだが extract_race_info / load_course_master の
-    重複呼び出しを省くためにインライン化している。
-    """
-    course_master = load_course_master()
-    if venue_code not in course_master['courses']:
-        return {'straight_length': 300.0, 'track_type': 'unknown',
-                'corner_radius': 'medium', 'inner_bias': 0}
-    venue_data = course_master['courses'][venue_code]
-    surface_data = venue_data.get(str(surface), {})
-    distance_str = str(distance)
-    if distance_str in surface_data:
-        course_data = surface_data[distance_str]
-    elif 'default' in surface_data:
-        course_data = surface_data['default']
-    else:
-        available = [k for k in surface_data if k != 'default']
-        if available:
-            closest = min(available, key=lambda x: abs(int(x) - int(distance)))
-            course_data = surface_data[closest]
-        else:
-            course_data = {}
-    return {
-        'straight_length': course_data.get('straight_length', 300.0),
-        'track_type':      course_data.get('track_type', 'unknown'),
-        'corner_radius':   course_data.get('corner_radius', 'medium'),
-        'inner_bias':      course_data.get('inner_bias', 0),
-    }
+    """venue_code を直接受け取るコース特性取得（1 件版。フレームには _COURSE_TABLE.lookup を使う）"""
+    return _COURSE_TABLE.lookup_one(venue_code, distance, surface)
 
 
 
@@ -380,19 +496,12 @@ def _expanding_stats(
 # Private pipeline stages for add_derived_features
 # ===========================================================================
 
-def _fe_days_from_history(df: pd.DataFrame, full_history_df: pd.DataFrame) -> pd.DataFrame:
-    """[P3-1] DB全履歴から馬ごとに days_since_last_race を計算して付与する。
-
-    prev_race_date はスクレイプ時点の最新レース日のため負になるケースがある。
-    DB全履歴を使って horse 別・時系列順に正確に計算し、
-    rest_category / is_missing フラグより前に適用する。
-    """
+def _days_from_history_table(full_history_df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """horse_id × race_id ごとの前走からの日数 _days_db を DB全履歴から計算する（必要列が無ければ None）。"""
     if not ('horse_id'  in full_history_df.columns and
             'race_date' in full_history_df.columns and
-            'race_id'   in full_history_df.columns and
-            'horse_id'  in df.columns and
-            'race_id'   in df.columns):
-        return df
+            'race_id'   in full_history_df.columns):
+        return None
 
     _hist = full_history_df[['horse_id', 'race_id', 'race_date']].copy()
     _hist['_rdt'] = pd.to_datetime(
@@ -408,9 +517,12 @@ def _fe_days_from_history(df: pd.DataFrame, full_history_df: pd.DataFrame) -> pd
     _hist['_prev_rdt'] = _hist.groupby('horse_id', sort=False)['_rdt'].shift(1)
     _hist['_days_db']  = (_hist['_rdt'] - _hist['_prev_rdt']).dt.days
     _hist = _hist[['horse_id', 'race_id', '_days_db']].dropna(subset=['_days_db'])
-    _hist = _hist[_hist['_days_db'] > 0]
+    return _hist[_hist['_days_db'] > 0]
+
 
-    df = df.merge(_hist, on=['horse_id', 'race_id'], how='left')
+def _apply_days_from_history(df: pd.DataFrame, days: pd.DataFrame) -> pd.DataFrame:
+    """_days_from_history_table の結果で days_since_last_race を付与・補正する。"""
+    df = df.merge(days, on=['horse_id', 'race_id'], how='left')
     if 'days_since_last_race' not in df.columns:
         df['days_since_last_race'] = df['_days_db'].where(df['_days_db'] >= 0)
     else:
@@ -421,6 +533,23 @@ def _fe_days_from_history(df: pd.DataFrame, full_history_df: pd.DataFrame) -> pd
     return df.drop(columns=['_days_db'])
 
 
+@traced_stage
+def _fe_days_from_history(df: pd.DataFrame, full_history_df: pd.DataFrame) -> pd.DataFrame:
+    """[P3-1] DB全履歴から馬ごとに days_since_last_race を計算して付与する。
+
+    prev_race_date はスクレイプ時点の最新レース日のため負になるケースがある。
+    DB全履歴を使って horse 別・時系列順に正確に計算し、
+    rest_category / is_missing フラグより前に適用する。
+    """
+    if not ('horse_id' in df.columns and 'race_id' in df.columns):
+        return df
+    days = _days_from_history_table(full_history_df)
+    if days is None:
+        return df
+    return _apply_days_from_history(df, days)
+
+
+@traced_stage
 def _fe_horse_category(df: pd.DataFrame) -> pd.DataFrame:
     """性齢・コーナー通過・ペース・上がり順位・休養カテゴリ派生特徴量を追加する。"""
     # 性別ダミー + 年齢カテゴリ
@@ -432,20 +561,29 @@ def _fe_horse_category(df: pd.DataFrame) -> pd.DataFrame:
         df['is_veteran'] = (df['age'] >= 7).astype(int)
 
     # コーナー通過順位
-    if 'corner_positions_list' in df.columns:
-        _cp = df['corner_positions_list']
-        df['corner_position_avg']      = _cp.apply(lambda x: np.mean(x) if isinstance(x, list) and x else np.nan)
-        df['corner_position_variance'] = _cp.apply(lambda x: np.var(x)  if isinstance(x, list) and len(x) > 1 else 0)
-        df['last_corner_position']     = _cp.apply(lambda x: x[-1]      if isinstance(x, list) and x else np.nan)
-        df['position_change']          = _cp.apply(lambda x: x[0] - x[-1] if isinstance(x, list) and len(x) > 1 else 0)
+    _parsed = all(c in df.columns and df[c].dtype == np.int16 for c in _CORNER_COLS)
+    if 'corner_positions_list' in df.columns or not _parsed:
+        df = parse_corner_columns(df)   # ローダーを通っていない入力向け
+    if 'corner_1' in df.columns:
+        # corner_1〜4 は左詰め・0=コーナーなし
+        _cm  = df[_CORNER_COLS].to_numpy(dtype=np.float64, na_value=0.0)
+        _ok  = _cm > 0
+        _n   = _ok.sum(axis=1)
+        _cm  = np.where(_ok, _cm, np.nan)
+        _has = _n > 0
+        _avg = np.divide(np.nansum(_cm, axis=1), _n, out=np.full(len(df), np.nan), where=_has)
+        _var = np.divide(np.nansum((_cm - _avg[:, None]) ** 2, axis=1), _n, out=np.zeros(len(df)), where=_n > 1)
+        _last = np.where(_has, _cm[np.arange(len(df)), np.maximum(_n - 1, 0)], np.nan)
+        df['corner_position_avg']      = _avg
+        df['corner_position_variance'] = _var
+        df['last_corner_position']     = _last
+        df['position_change']          = np.where(_n > 1, _cm[:, 0] - _last, 0.0)
 
         # 脚質分類（逃げ/先行/差し/追込）
-        _nh_col = df['n_horses'] if 'n_horses' in df.columns else pd.Series([8] * len(df), index=df.index)
-        df['running_style'] = [
-            classify_running_style(c, nh)
-            for c, nh in zip(_cp, _nh_col)
-        ]
-        df['running_style_num'] = df['running_style'].map(_RUNNING_STYLE_NUM)
+        _nh_col = next((df[c] for c in ('n_horses', 'num_horses') if c in df.columns), 8)
+        _codes = running_style_codes(_cm[:, 0], _avg, _nh_col)
+        df['running_style'] = _RUNNING_STYLE_LABELS[_codes]
+        df['running_style_num'] = np.where(_codes >= 0, _codes, np.nan)
 
     # ペース区分ダミー
     if 'pace_classification' in df.columns:
@@ -474,6 +612,7 @@ def _fe_horse_category(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+@traced_stage
 def _fe_id_season(df: pd.DataFrame) -> pd.DataFrame:
     """race_id から venue_code / race_num / n_horses と季節・性別交互作用特徴量を追加する。"""
     # race_id → venue_code / race_num（O(n) str スライス）
@@ -524,6 +663,7 @@ def _fe_id_season(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+@traced_stage
 def _fe_course(df: pd.DataFrame) -> pd.DataFrame:
     """コース特性（直線長・コーナー半径・内枠バイアス）を venue_code × distance × surface ごとに付与する。"""
     if 'distance' not in df.columns or 'surface' not in df.columns:
@@ -531,32 +671,18 @@ def _fe_course(df: pd.DataFrame) -> pd.DataFrame:
 
     _SF_EN = {'芝': 'turf', 'ダート': 'dirt', 'ばんえい': 'dirt', 'sand': 'dirt'}
     if 'surface_en' in df.columns:
-        _surface_col = 'surface_en'
-    else:
-        df['_surface_tmp'] = df['surface'].map(lambda v: _SF_EN.get(str(v), v) if pd.notna(v) else 'turf')
-        _surface_col = '_surface_tmp'
-
-    # venue_code はすでに _fe_id_season() で付与済み。なければ抽出する。
-    if '_vcol' not in df.columns:
-        df['_vcol'] = df['race_id'].str[8:10]
+        _surface = df['surface_en']
     else:
-        df['_vcol'] = df['venue_code']
+        _surface = df['surface'].astype(object)
+        _surface = _surface.astype(str).map(_SF_EN).fillna(_surface).where(_surface.notna(), 'turf')
 
-    # ユニークな組み合わせのみ計算してマージ（O(行数) → O(ユニーク数)）
-    unique_combos = df[['_vcol', 'distance', _surface_col]].drop_duplicates().copy()
-    combo_feats = unique_combos.apply(
-        lambda row: pd.Series(_get_course_features_by_venue(row['_vcol'], row['distance'], row[_surface_col])),
-        axis=1,
-    )
-    unique_combos[['straight_length', 'track_type', 'corner_radius', 'inner_bias']] = combo_feats
-    # マージ時のサフィックス衝突を防ぐ: db_ultimate_loader で surface にコピー済みの
-    # track_type 列（芝/ダート）は不要なので、コースマスター由来の track_type を優先する
-    if 'track_type' in df.columns:
-        df = df.drop(columns=['track_type'])
-    df = df.merge(unique_combos, on=['_vcol', 'distance', _surface_col], how='left')
-    df = df.drop(columns=['_vcol'], errors='ignore')
-    if '_surface_tmp' in df.columns:
-        df = df.drop(columns=['_surface_tmp'])
+    # venue_code は race_id の 9〜10 桁目（コースマスターのキー）。検索表を一括で引く
+    rows = _COURSE_TABLE.lookup(df['race_id'].str[8:10].to_numpy(), df['distance'].to_numpy(), _surface.to_numpy())
+    # db_ultimate_loader で surface にコピー済みの track_type 列（芝/ダート）は不要なので、
+    # コースマスター由来の track_type を優先する
+    df = df.drop(columns=['track_type'], errors='ignore').reset_index(drop=True)
+    for col, values in _COURSE_TABLE.features(rows).items():
+        df[col] = values
 
     # 内枠有利コース × 内枠 の交互作用
     if 'inner_bias' in df.columns:
@@ -578,29 +704,19 @@ def _fe_market(df: pd.DataFrame) -> pd.DataFrame:
 
     if 'race_id' in df.columns:
         # レース内正規化・順位・z-score
-        df['implied_prob_norm'] = df.groupby('race_id')['implied_prob'].transform(
-            lambda x: x / x.sum() if x.sum() > 0 else x
-        )
+        _rid = df['race_id']
+        df['implied_prob_norm'] = group_normalize(df['implied_prob'], _rid)
         df['odds_rank_in_race'] = df.groupby('race_id')['odds'].rank(method='min', na_option='bottom')
-        df['odds_z_in_race']    = df.groupby('race_id')['odds'].transform(
-            lambda x: (x - x.mean()) / (x.std() + 1e-8)
-        )
-        # 市場エントロピー / 上位3頭の暗黙確率和
-        def _market_stats(grp: pd.DataFrame) -> pd.Series:
-            o = pd.to_numeric(grp['odds'], errors='coerce').dropna()
-            if len(o) < 2:
-                return pd.Series({'market_entropy': 0.0, 'top3_probability': 0.5})
-            probs = 1.0 / o
-            total = probs.sum()
-            if total == 0:
-                return pd.Series({'market_entropy': 0.0, 'top3_probability': 0.5})
-            probs /= total
-            return pd.Series({
-                'market_entropy':   float(-np.sum(probs * np.log(probs + 1e-10))),
-                'top3_probability': float(probs.nlargest(3).sum()),
-            })
-        market_agg = df.groupby('race_id', sort=False).apply(_market_stats, include_groups=False).reset_index()
-        df = df.merge(market_agg, on='race_id', how='left')
+        df['odds_z_in_race']    = group_zscore(_o, _rid)
+        # 市場エントロピー / 上位3頭の暗黙確率和（有効オッズ 2 頭未満のレースは既定値）
+        with np.errstate(divide='ignore'):
+            _q = 1.0 / _o
+        _total = group_sum(_q, _rid)
+        _p     = _q / _total
+        _default = (_o.groupby(_rid, sort=False).transform('count') < 2) | (_total == 0)
+        df['market_entropy']   = group_entropy(_p, _rid).mask(_default, 0.0)
+        df['top3_probability'] = group_topk_sum(_p, _rid, k=3).mask(_default, 0.5)
+        df = df.reset_index(drop=True)
     else:
         # 単レース予測（race_id なし）
         df['implied_prob_norm'] = df['implied_prob']
@@ -618,6 +734,92 @@ def _fe_market(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def _fe_odds_drift(df: pd.DataFrame, odds_drift_df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """オッズ時系列のドリフト特徴量（odds_drift_5m / odds_volatility 等）を race_id × 馬番で結合する。
+
+    odds_drift_df は python-api の services.odds_timeseries.odds_drift_frame の出力。
+    記録の無いレース・馬は NaN のまま（学習データの大半は時系列を持たない）。
+    """
+    hcol = 'horse_number' if 'horse_number' in df.columns else 'horse_no'
+    if odds_drift_df is None or odds_drift_df.empty or hcol not in df.columns:
+        return df
+    feat_cols = [c for c in odds_drift_df.columns if c not in ('race_id', 'horse_number')]
+    right = odds_drift_df.assign(
+        race_id=odds_drift_df['race_id'].astype(str),
+        horse_number=pd.to_numeric(odds_drift_df['horse_number'], errors='coerce').astype(float),
+    ).drop_duplicates(['race_id', 'horse_number'], keep='last')
+    if 'race_id' in df.columns:
+        left_race = df['race_id'].astype(str)
+    else:
+        # 単レース予測（race_id なし）: 時系列側が 1 レースのときだけ結合する
+        if right['race_id'].nunique() != 1:
+            return df
+        left_race = pd.Series(right['race_id'].iloc[0], index=df.index)
+    key = pd.MultiIndex.from_arrays([
+        left_race.to_numpy(), pd.to_numeric(df[hcol], errors='coerce').astype(float).to_numpy(),
+    ])
+    pos = pd.MultiIndex.from_frame(right[['race_id', 'horse_number']]).get_indexer(key)
+    for c in feat_cols:
+        vals = pd.to_numeric(right[c], errors='coerce').to_numpy(dtype=float)
+        df[c] = np.where(pos >= 0, vals[np.maximum(pos, 0)], np.nan)
+    return df
+
+
+# オッズ・人気に依存する列（市場レイヤー）。オッズ更新時はここだけ再計算すればよく、
+# 履歴統計などそれ以外の特徴量はオッズに依存しない（_fe_market / _fe_odds_drift 以外は参照しない）
+MARKET_INPUT_COLUMNS = ('odds', 'popularity')
+MARKET_FEATURE_COLUMNS = (
+    'implied_prob', 'odds_is_missing', 'implied_prob_norm', 'odds_rank_in_race', 'odds_z_in_race',
+    'market_entropy', 'top3_probability', 'popularity_is_missing', 'popularity_normalized',
+)
+_ODDS_DRIFT_PREFIXES = (
+    'odds_drift_', 'odds_share_change_', 'odds_rank_change_', 'place_odds_drift_',
+    'odds_volatility', 'odds_snapshot_count',
+)
+
+
+def is_market_column(name: str) -> bool:
+    """オッズ・人気（とその時系列）から計算される列か"""
+    return (
+        name in MARKET_INPUT_COLUMNS
+        or name in MARKET_FEATURE_COLUMNS
+        or str(name).startswith(_ODDS_DRIFT_PREFIXES)
+    )
+
+
+@traced_stage
+def _fe_market_layer(df: pd.DataFrame, odds_drift_df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    # 再計算時に market_entropy_x のような重複列ができないよう、前回の出力を落としてから計算する
+    stale = [c for c in df.columns if is_market_column(c) and c not in MARKET_INPUT_COLUMNS]
+    if stale:
+        df = df.drop(columns=stale)
+    return _fe_odds_drift(_fe_market(df), odds_drift_df)
+
+
+def add_market_features(df: pd.DataFrame, odds_drift_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """市場レイヤー（_fe_market + _fe_odds_drift）だけを計算する（公開 API）。
+
+    add_derived_features の出力のうちオッズ依存の列は、この関数の出力と一致する。
+    推論側はオッズ非依存の特徴量をキャッシュしておき、オッズ更新時はこれだけを再計算する。
+    """
+    return _fe_market_layer(_decategorize(df.copy()), odds_drift_df)
+
+
+# 同条件 z-score のキー（レースをまたぐ統計。並列実行時は連結後に全体で計算し直す）
+_SPEED_ZSCORE_KEYS = (
+    ('prev_speed_zscore',  'prev_speed_index',  ('surface', 'prev_race_distance')),
+    ('prev2_speed_zscore', 'prev2_speed_index', ('surface', 'prev2_race_distance')),
+)
+
+
+def _speed_zscore(index: pd.Series, keys: pd.DataFrame):
+    """スピード指数の同条件（馬場 × 距離）内 z-score。キー列が無ければ 0.0。"""
+    if keys.shape[1] == 0:
+        return 0.0
+    return group_zscore(index, [keys[c] for c in keys.columns], dropna=False, singleton=0.0)
+
+
+@traced_stage
 def _fe_prev_race(df: pd.DataFrame) -> pd.DataFrame:
     """前走日由来の days_since_last_race 補完・距離変化・馬の通算勝率・スピード指数を追加する。"""
     # prev_race_date → days 補完（DB 計算値が優先、こちらは残った NaN を埋める）
@@ -657,26 +859,16 @@ def _fe_prev_race(df: pd.DataFrame) -> pd.DataFrame:
         _pt = df['prev_race_time_seconds']
         _pd2 = pd.to_numeric(df['prev_race_distance'], errors='coerce')
         df['prev_speed_index'] = np.where((_pt > 0) & (_pd2 > 0), _pd2 / _pt, np.nan)
-        _grp = [c for c in ('surface', 'prev_race_distance') if c in df.columns]
-        if _grp:
-            df['prev_speed_zscore'] = df.groupby(_grp, sort=False, dropna=False)['prev_speed_index'].transform(
-                lambda x: (x - x.mean()) / (x.std() + 1e-8) if len(x) > 1 else 0.0
-            )
-        else:
-            df['prev_speed_zscore'] = 0.0
+        _grp = [c for c in _SPEED_ZSCORE_KEYS[0][2] if c in df.columns]
+        df['prev_speed_zscore'] = _speed_zscore(df['prev_speed_index'], df[_grp])
 
     # 前々走スピード指数（prev2_race_time は DB で秒数で格納、距離との高相関 r=0.980 を解消）
     if 'prev2_race_time' in df.columns and 'prev2_race_distance' in df.columns:
         _p2t = pd.to_numeric(df['prev2_race_time'], errors='coerce')
         _p2d = pd.to_numeric(df['prev2_race_distance'], errors='coerce')
         df['prev2_speed_index'] = np.where((_p2t > 0) & (_p2d > 0), _p2d / _p2t, np.nan)
-        _grp2 = [c for c in ('surface', 'prev2_race_distance') if c in df.columns]
-        if _grp2:
-            df['prev2_speed_zscore'] = df.groupby(_grp2, sort=False, dropna=False)['prev2_speed_index'].transform(
-                lambda x: (x - x.mean()) / (x.std() + 1e-8) if len(x) > 1 else 0.0
-            )
-        else:
-            df['prev2_speed_zscore'] = 0.0
+        _grp2 = [c for c in _SPEED_ZSCORE_KEYS[1][2] if c in df.columns]
+        df['prev2_speed_zscore'] = _speed_zscore(df['prev2_speed_index'], df[_grp2])
 
     # 近走フォーム加重平均（ITR-04: 直近重視のモメンタム特徴量）
     # 単純な prev_race_finish(1.82%) より時系列的な改善/悪化トレンドを捉える
@@ -705,6 +897,7 @@ def _fe_prev_race(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+@traced_stage
 def _fe_missing_flags(df: pd.DataFrame) -> pd.DataFrame:
     """数値欠損フラグ（{col}_is_missing）を生成し、対象列を数値型に統一する。"""
     _FLAG_COLS = [
@@ -727,6 +920,7 @@ def _fe_missing_flags(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+@traced_stage
 def _fe_lap(df: pd.DataFrame) -> pd.DataFrame:
     """ラップタイム展開（lap_Xm / lap_sect_Xm）とペース要約特徴量を追加する。"""
     import json as _json_fe
@@ -795,6 +989,7 @@ def _fe_lap(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+@traced_stage
 def _fe_payout(df: pd.DataFrame) -> pd.DataFrame:
     """配当情報（tansho / sanrentan）から派生特徴量を追加する。"""
     if 'tansho_payout' in df.columns:
@@ -808,13 +1003,12 @@ def _fe_payout(df: pd.DataFrame) -> pd.DataFrame:
         df['sanrentan_payout_log']      = np.log1p(_stp.fillna(0))
         df['sanrentan_payout_is_missing'] = _stp.isna().astype(int)
         if 'race_id' in df.columns:
-            df['sanrentan_z_in_races'] = df.groupby('race_id')['sanrentan_payout_log'].transform(
-                lambda x: (x - x.mean()) / (x.std() + 1e-8) if len(x) > 1 else 0.0
-            )
+            df['sanrentan_z_in_races'] = group_zscore(df['sanrentan_payout_log'], df['race_id'], singleton=0.0)
 
     return df
 
 
+@traced_stage
 def _fe_history(df: pd.DataFrame, full_history_df: pd.DataFrame) -> pd.DataFrame:
     """full_history_df を用いる全 expanding window / rolling 統計を追加する。
 
@@ -850,6 +1044,7 @@ def _fe_history(df: pd.DataFrame, full_history_df: pd.DataFrame) -> pd.DataFrame
 # h   = full_history_df（expanding window の計算ベース。一部のサブ関数が列を追加する）
 # ---------------------------------------------------------------------------
 
+@traced_stage
 def _feh_jockey_course(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -863,6 +1058,7 @@ def _feh_jockey_course(
     return df, h
 
 
+@traced_stage
 def _feh_horse_aptitude(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -930,6 +1126,7 @@ def _feh_horse_aptitude(
     return df, h
 
 
+@traced_stage
 def _feh_gate_bias(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -961,6 +1158,7 @@ def _feh_gate_bias(
     return df, h
 
 
+@traced_stage
 def _feh_jt_combo(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -993,6 +1191,7 @@ def _feh_jt_combo(
     return df, h
 
 
+@traced_stage
 def _feh_entity_career(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -1026,6 +1225,7 @@ def _feh_entity_career(
     return df, h
 
 
+@traced_stage
 def _feh_recent_form(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -1065,6 +1265,7 @@ def _feh_recent_form(
     return df, h
 
 
+@traced_stage
 def _feh_entity_recent30(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -1094,6 +1295,7 @@ def _feh_entity_recent30(
     return df, h
 
 
+@traced_stage
 def _feh_last_3f(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -1126,6 +1328,7 @@ def _feh_last_3f(
     return df, h
 
 
+@traced_stage
 def _feh_payout_history(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -1151,6 +1354,7 @@ def _feh_payout_history(
     return df, h
 
 
+@traced_stage
 def _feh_running_style(
     df: pd.DataFrame, h: pd.DataFrame
 ) -> tuple:
@@ -1186,15 +1390,106 @@ def _feh_running_style(
     return df
 
 
+# _fe_days_from_history / _fe_history が full_history_df から読む列
+HISTORY_SOURCE_COLUMNS = (
+    'race_id', 'race_date', 'horse_id', 'jockey_id', 'trainer_id', 'sire', 'damsire',
+    'venue', 'distance', 'surface', 'bracket_number', 'finish',
+    'last_3f_time', 'last_3f_rank', 'tansho_payout', 'running_style_num',
+)
+# 静的集計で参照期間に依存するため事前計算表に含めず、引き当て時に full_history_df から計算する列
+_GATE_BIAS_SOURCE_COLUMNS = ('race_date', 'venue', 'distance', 'surface', 'bracket_number', 'finish')
+
+
+def precompute_history_features(full_history_df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """full_history_df の全行について履歴特徴量（days_since_last_race 補正用の日数と
+    _fe_history の expanding / rolling 統計）を一括計算し、horse_id × race_id で一意な表を返す。
+
+    add_derived_features(history_features=...) に渡すと統計を再計算せずに引き当てる。
+    日付チャンク単位の学習で、チャンクごとに履歴全体を再計算しないために使う。
+    計算は HISTORY_SOURCE_COLUMNS だけに絞ったフレームで行う。gate_win_rate は含めない。
+    同じ馬が同一レースに複数行ある場合は先頭行の値になる。horse_id / race_id が無い場合は None。
+    """
+    cols = [c for c in HISTORY_SOURCE_COLUMNS if c in full_history_df.columns]
+    if 'horse_id' not in cols or 'race_id' not in cols:
+        return None
+    h = _decategorize(full_history_df[cols]).reset_index(drop=True)
+    table = _fe_history(h.copy(), h)
+    del h
+    days = _days_from_history_table(table)
+    if days is not None:
+        table = table.merge(days, on=['horse_id', 'race_id'], how='left')
+    table = table.drop(columns=[c for c in cols if c not in ('horse_id', 'race_id')] + ['gate_win_rate'],
+                       errors='ignore')
+    return table.drop_duplicates(subset=['horse_id', 'race_id']).reset_index(drop=True)
+
+
+@traced_stage
+def _fe_days_from_table(df: pd.DataFrame, history_features: pd.DataFrame) -> pd.DataFrame:
+    """precompute_history_features の表から days_since_last_race を付与・補正する。"""
+    if not ('horse_id' in df.columns and 'race_id' in df.columns and '_days_db' in history_features.columns):
+        return df
+    days = history_features[['horse_id', 'race_id', '_days_db']].dropna(subset=['_days_db'])
+    return _apply_days_from_history(df, days)
+
+
+@traced_stage
+def _fe_history_from_table(
+    df: pd.DataFrame,
+    history_features: pd.DataFrame,
+    full_history_df: Optional[pd.DataFrame],
+) -> pd.DataFrame:
+    """precompute_history_features の表から _fe_history の統計を引き当てる。
+
+    gate_win_rate だけは full_history_df（指定時）から _feh_gate_bias で計算する。
+    """
+    if 'horse_id' in df.columns and 'race_id' in df.columns:
+        cols = [c for c in history_features.columns if c != '_days_db']
+        df = df.merge(history_features[cols], on=['horse_id', 'race_id'], how='left')
+    if full_history_df is not None:
+        df, _ = _feh_gate_bias(df, full_history_df)
+    return df
+
+
+def _decategorize(df: pd.DataFrame) -> pd.DataFrame:
+    """dtype スキーマで category 化された列を object に戻す（map/算術/文字列連結の挙動を揃える）。"""
+    cat_cols = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if not cat_cols:
+        return df
+    df = df.copy()
+    for c in cat_cols:
+        df[c] = df[c].astype(object)
+    return df
+
+
 # ===========================================================================
 # Public API
 # ===========================================================================
 
+def _fe_stateless(df: pd.DataFrame, odds_drift_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """add_derived_features の step 2〜9（履歴を使わないステージ）を順に実行する。
+
+    レースをまたぐのは _SPEED_ZSCORE_KEYS の z-score だけで、それ以外はレース単位で完結する。
+    """
+    df = _fe_horse_category(df)
+    df = _fe_id_season(df)
+    df = _fe_course(df)
+    df = _fe_market_layer(df, odds_drift_df)
+    df = _fe_prev_race(df)
+    df = _fe_lap(df)
+    df = _fe_payout(df)
+    df = _fe_missing_flags(df)
+    return df
+
+
+@traced_stage
 def add_derived_features(
     df: pd.DataFrame,
     full_history_df: Optional[pd.DataFrame] = None,
     training_df: Optional[pd.DataFrame] = None,
     speed_figures_df: Optional[pd.DataFrame] = None,
+    odds_drift_df: Optional[pd.DataFrame] = None,
+    n_jobs: int = 1,
+    history_features: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
     """データフレームに派生特徴量を追加する（公開 API）。
 
@@ -1204,6 +1499,7 @@ def add_derived_features(
       3. _fe_id_season          — race_id 分解・季節性・馬場×枠番交互作用
       4. _fe_course             — コース特性（直線長・内枠バイアス）
       5. _fe_market             — オッズ・市場エントロピー
+         _fe_odds_drift         — オッズ時系列のドリフト（odds_drift_df 指定時のみ）
       6. _fe_prev_race          — 前走日・距離変化・スピード指数
       7. _fe_lap                — ラップタイム展開・ペース要約
       8. _fe_payout             — 配当派生特徴量
@@ -1215,6 +1511,11 @@ def add_derived_features(
         full_history_df: 過去データ全体（統計計算用）。省略時は step 1/10 をスキップ。
         training_df: 旧API互換引数（未使用）。
         speed_figures_df: 旧API互換引数（未使用）。
+        odds_drift_df: race_id × horse_number ごとのオッズドリフト特徴量（任意）。
+        n_jobs: 2 以上なら step 2〜9 を開催日パーティション単位でプロセス並列に実行する
+            （training.parallel_fe。結果は直列実行と一致する）。
+        history_features: precompute_history_features の結果（任意）。指定時は step 1/10 の
+            履歴統計を表から引き当て、full_history_df は gate_win_rate の集計にだけ使う。
 
     Returns:
         pd.DataFrame: 派生特徴量が追加されたデータフレーム。
@@ -1224,18 +1525,21 @@ def add_derived_features(
     _ = training_df
     _ = speed_figures_df
 
-    df = df.copy()
+    df = _decategorize(df.copy())
     if full_history_df is not None:
+        full_history_df = _decategorize(full_history_df)
+    if history_features is not None:
+        df = _fe_days_from_table(df, history_features)
+    elif full_history_df is not None:
         df = _fe_days_from_history(df, full_history_df)
-    df = _fe_horse_category(df)
-    df = _fe_id_season(df)
-    df = _fe_course(df)
-    df = _fe_market(df)
-    df = _fe_prev_race(df)
-    df = _fe_lap(df)
-    df = _fe_payout(df)
-    df = _fe_missing_flags(df)
-    if full_history_df is not None:
+    if n_jobs > 1:
+        from .training.parallel_fe import fe_stateless_parallel
+        df = fe_stateless_parallel(df, odds_drift_df, n_jobs)
+    else:
+        df = _fe_stateless(df, odds_drift_df)
+    if history_features is not None:
+        df = _fe_history_from_table(df, history_features, full_history_df)
+    elif full_history_df is not None:
         df = _fe_history(df, full_history_df)
     # ── ITR-05: 騎手コース得意度（_fe_history後に計算 jockey_course_win_rateが必要）
     # 正 = このコースで平均より高勝率、負 = 苦手コース
@@ -0,0 +1,123 @@
+"""
+グループ集計カーネル（レース内 z-score・正規化・エントロピー・上位 k 和）
+
+groupby(...).transform(lambda x: ...) / groupby(...).apply(...) はグループごとに
+Python コールバックを呼ぶため、10 万レース規模ではこれが特徴量計算の大半を占める。
+ここでは同じ結果を
+
+  - group_sum / group_mean / group_std / group_size : transform('sum'|'mean'|'std'|'size')
+  - group_zscore / group_normalize                    : 上記の組み合わせ
+  - group_entropy / group_topk_sum                    : グループ順に並べ替えて np.add.reduceat
+
+で計算する。いずれも入力と同じ index の Series を返し、値の NaN は集計から除外する
+（pandas の skipna と同じ）。キーが NaN の行は groupby(dropna=True) と同じく NaN になる。
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _grouped(values: pd.Series, by: Any, dropna: bool):
+    return pd.to_numeric(values, errors='coerce').astype(np.float64).groupby(by, sort=False, dropna=dropna)
+
+
+def group_sum(values: pd.Series, by: Any, dropna: bool = True) -> pd.Series:
+    """グループ和を各行に展開する（全 NaN のグループは 0）。"""
+    return _grouped(values, by, dropna).transform('sum')
+
+
+def group_mean(values: pd.Series, by: Any, dropna: bool = True) -> pd.Series:
+    """グループ平均を各行に展開する。"""
+    return _grouped(values, by, dropna).transform('mean')
+
+
+def group_std(values: pd.Series, by: Any, dropna: bool = True) -> pd.Series:
+    """グループ標準偏差（ddof=1）を各行に展開する。"""
+    return _grouped(values, by, dropna).transform('std')
+
+
+def group_size(values: pd.Series, by: Any, dropna: bool = True) -> pd.Series:
+    """グループの行数（NaN の値も数える）を各行に展開する。"""
+    return _grouped(values, by, dropna).transform('size')
+
+
+def group_zscore(
+    values: pd.Series,
+    by: Any,
+    dropna: bool = True,
+    eps: float = 1e-8,
+    singleton: Optional[float] = None,
+) -> pd.Series:
+    """(x - mean) / (std + eps)。singleton を指定すると 1 行だけのグループはその値にする。
+
+    transform(lambda x: (x - x.mean()) / (x.std() + eps) if len(x) > 1 else singleton) と同じ。
+    """
+    g = _grouped(values, by, dropna)
+    x = g.obj
+    z = (x - g.transform('mean')) / (g.transform('std') + eps)
+    if singleton is not None:
+        z = z.mask(g.transform('size') <= 1, singleton)
+    return z
+
+
+def group_normalize(values: pd.Series, by: Any, dropna: bool = True) -> pd.Series:
+    """グループ和で割る（和が 0 以下のグループはそのまま）。
+
+    transform(lambda x: x / x.sum() if x.sum() > 0 else x) と同じ。
+    """
+    g = _grouped(values, by, dropna)
+    s = g.transform('sum')
+    x = g.obj
+    return x.where(~(s > 0), x / s).where(s.notna())
+
+
+def _sorted_groups(values: pd.Series, by: Any, dropna: bool, descending: bool = False):
+    """(値, グループコード, 並べ替え順, グループ先頭位置) を返す。
+
+    並べ替えはグループコード昇順・同一グループ内は値の昇順（descending なら降順、NaN は末尾）。
+    """
+    x = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    codes = pd.Series(x, index=values.index).groupby(by, sort=False, dropna=dropna).ngroup()
+    codes = codes.to_numpy(dtype=np.float64, na_value=np.nan)
+    codes = np.where(np.isnan(codes), -1, codes).astype(np.int64)
+    key = np.where(np.isnan(x), np.inf, -x if descending else x)
+    order = np.lexsort((key, codes))
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.array([], dtype=np.int64)
+    return x, codes, order, starts
+
+
+def _broadcast(index: pd.Index, codes: np.ndarray, order: np.ndarray, starts: np.ndarray, per_group: np.ndarray) -> pd.Series:
+    """並べ替え済みグループごとの値を元の行に戻す（キー NaN の行は NaN）。"""
+    out = np.full(len(codes), np.nan)
+    if len(starts):
+        group_codes = codes[order][starts]
+        lut = np.full(int(group_codes.max()) + 2, np.nan)
+        lut[group_codes] = per_group
+        out = np.where(codes >= 0, lut[codes], np.nan)
+    return pd.Series(out, index=index)
+
+
+def group_entropy(p: pd.Series, by: Any, dropna: bool = True, eps: float = 1e-10) -> pd.Series:
+    """グループ内 -Σ p·log(p + eps) を各行に展開する（p は正規化済み確率を想定）。"""
+    x, codes, order, starts = _sorted_groups(p, by, dropna)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        term = x * np.log(x + eps)
+    term = np.where(np.isnan(term), 0.0, term)[order]
+    per_group = -np.add.reduceat(term, starts) if len(starts) else np.array([])
+    return _broadcast(p.index, codes, order, starts, per_group)
+
+
+def group_topk_sum(values: pd.Series, by: Any, k: int = 3, dropna: bool = True) -> pd.Series:
+    """グループ内で大きい順に k 個の和（Series.nlargest(k).sum() と同じ・NaN は除外）を各行に展開する。"""
+    x, codes, order, starts = _sorted_groups(values, by, dropna, descending=True)
+    if not len(starts):
+        return pd.Series(np.full(len(x), np.nan), index=values.index)
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    xs = x[order]
+    take = (rank < k) & ~np.isnan(xs)
+    per_group = np.add.reduceat(np.where(take, xs, 0.0), starts)
+    return _broadcast(values.index, codes, order, starts, per_group)
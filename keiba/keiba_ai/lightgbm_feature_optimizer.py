@@ -11,6 +11,7 @@ import numpy as np
 from sklearn.preprocessing import LabelEncoder
 
 from .constants import FUTURE_FIELDS, UNNECESSARY_COLUMNS  # 共通定数
+from .stage_profiler import traced_stage
 
 # 後方互換エイリアス（外部コードが FUTURE_INFO_BLACKLIST を参照している場合）
 # =========================================================
@@ -119,6 +120,7 @@ class LightGBMFeatureOptimizer:
         self.feature_stats = {}
         self.fitted = False
     
+    @traced_stage(name="optimizer.fit_transform")
     def fit_transform(self, df: pd.DataFrame, target_col: Optional[str] = None) -> Tuple[pd.DataFrame, List[str]]:
         """学習データに対して特徴量最適化を実行
         
@@ -385,16 +387,8 @@ class LightGBMFeatureOptimizer:
         print("\n【5. リスト型変数】")
         print("処理: 統計値（平均、分散など）に変換")
         
-        # corner_positions_list: [5, 5, 4, 3] → 統計値
-        if 'corner_positions_list' in df.columns:
-            # これは既にfeature_engineeringで処理済み
-            # (corner_position_avg, corner_position_variance, etc.)
-            print(f"  ✓ corner_positions_list → 統計値に変換済み（feature_engineeringで処理）")
-            # 元のリストは削除
-            if 'corner_positions_list' in df.columns:
-                df = df.drop('corner_positions_list', axis=1)
-        
-        # past_performances（リスト）も同様に処理済み
+        # corner_positions はロード時に corner_1〜4（int16）へ展開済みでリスト列は来ない
+        # past_performances（リスト）は処理済み
         if 'past_performances' in df.columns:
             print(f"  ✓ past_performances → 削除（days_since_last_raceなどに変換済み）")
             df = df.drop('past_performances', axis=1)
@@ -535,6 +529,7 @@ class LightGBMFeatureOptimizer:
         self.fitted = True
         return df, self.categorical_features
     
+    @traced_stage(name="optimizer.transform")
     def transform(self, df: pd.DataFrame) -> pd.DataFrame:
         """テスト/予測データに対して同じ変換を適用
         
@@ -583,9 +578,9 @@ class LightGBMFeatureOptimizer:
                 le = self.label_encoders[original_col]
                 # A-8: 未知カテゴリは NaN にする（-1 は LightGBM が既知値として扱うため）
                 # NaN → LightGBM が「欠損」として両枝を探索 = 最も安全な未知カテゴリ処理
-                df[encoded_col] = df[original_col].map(
-                    lambda x, _le=le: float(_le.transform([x])[0]) if x in _le.classes_ else np.nan
-                )
+                # le.transform を 1 要素ずつ呼ぶと学習行列全体の transform で支配的になるため辞書で引く
+                _codes = {c: float(i) for i, c in enumerate(le.classes_)}
+                df[encoded_col] = df[original_col].map(_codes).astype(float)
         
         # 高カーディナリティ文字列列を削除（fit_transform と同じセット）
         _hc_cols_t = [
@@ -597,8 +592,6 @@ class LightGBMFeatureOptimizer:
                 df = df.drop(col, axis=1)
         
         # リスト型変数を削除
-        if 'corner_positions_list' in df.columns:
-            df = df.drop('corner_positions_list', axis=1)
         if 'past_performances' in df.columns:
             df = df.drop('past_performances', axis=1)
         
@@ -718,6 +711,11 @@ class LightGBMFeatureOptimizer:
           - horse_win_rate: L1-1 NaN のまま保持（_is_missing フラグで処理）
           - 体重・オッズ: LightGBMがNaNを自動処理するため補完不要
         """
+        # ── dtype スキーマで category 化された列は object に戻す ──────────────
+        # （'Unknown' 埋め・track_type からの補完など未登録カテゴリの代入を許容するため）
+        for col in df.select_dtypes(include='category').columns:
+            df[col] = df[col].astype(object)
+
         # ── L1-3: venue名正規化（表記揺れ→VENUE_MAP準拠の正式名に統一）──────
         if 'venue' in df.columns:
             df['venue'] = (
@@ -1049,13 +1047,13 @@ if __name__ == "__main__":
        │ → そのまま使用（0/1エンコード済み）         │
        └─────────────────────────────────────────────┘
     
-    5. リスト型変数（2種類）
+    5. リスト型変数（1種類）
        ┌─────────────────────────────────────────────┐
-       │ corner_positions_list, past_performances      │
+       │ past_performances                             │
        │ → 統計値（平均、分散）に変換               │
        └─────────────────────────────────────────────┘
        
-       処理後: [5,5,4,3] → corner_position_avg=4.25, variance=0.69
+       corner_positions はロード時に corner_1〜4 へ展開済み
     
     6. ダミー変数（10種類以上）
        ┌─────────────────────────────────────────────┐
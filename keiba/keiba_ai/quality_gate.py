@@ -11,6 +11,10 @@ Quality Gate: レース入力データの整合チェック
     # 壊れたレースを除外して学習/推論に使う
     df_clean = filter_valid_races(df)
 
+    # 学習時に基準分布を作ってバンドルに保存し、推論時は学習フレームなしでドリフトを見る
+    bundle["drift_reference"] = fit_drift_reference(X_train)
+    drift = check_feature_drift(None, X_infer, reference=bundle["drift_reference"])
+
 チェック項目（Sランク必須）:
   [Q1] distance == 0 / NaN         → レース条件が取得できていない = 距離帯特徴が全壊
   [Q2] odds 欠損率 >= 80%          → 市場情報が使えない = 最重要特徴が欠落
@@ -34,6 +38,7 @@ DIST_ZERO_THRESHOLD = 0           # distance <= 0 で bad
 ODDS_NULL_RATE_THRESHOLD = 0.80   # 80% 以上 null/NaN → bad race
 POP_NULL_RATE_THRESHOLD = 0.80    # 80% 以上 null/NaN → bad race
 INTRA_RACE_N_UNIQUE_MAX = 1       # 同一レース内で同一であるべき列の許容 unique 数
+_PSI_EPS = 1e-8                   # PSI のゼロ割・log(0) 対策
 
 
 @dataclass
@@ -99,6 +104,9 @@ def validate_race_entries(
 ) -> ValidationResult:
     """DataFrame（馬単位）のレース入力データ品質をチェックする。
 
+    Q1〜Q5 はフレーム全体に対する列単位のマスクと race_id ごとの集計（bincount）で
+    判定し、RaceIssue は引っかかったレースについてのみ生成する（全履歴でも O(行数)）。
+
     Parameters
     ----------
     df : pd.DataFrame
@@ -112,105 +120,122 @@ def validate_race_entries(
     """
     result = ValidationResult()
 
-    if race_id_col not in df.columns:
-        # race_id 列がない場合は全体を 1 レースとして扱う
-        _df = df.copy()
-        _df[race_id_col] = "__single__"
+    if race_id_col in df.columns:
+        codes, race_ids = pd.factorize(df[race_id_col], use_na_sentinel=False)
     else:
-        _df = df.copy()
-
-    race_ids = _df[race_id_col].unique()
-    result.total_races = len(race_ids)
-    result.total_entries = len(_df)
-
-    for race_id in race_ids:
-        sub = _df[_df[race_id_col] == race_id]
-
-        # ── [Q1] distance == 0 / NaN ─────────────────────────────────────
-        if distance_col in sub.columns:
-            _dist = pd.to_numeric(sub[distance_col], errors="coerce")
-            if (_dist.isna() | (_dist <= DIST_ZERO_THRESHOLD)).all():
-                result.bad_race_ids.add(race_id)
-                result.issues.append(RaceIssue(
-                    race_id=str(race_id),
-                    issue_code="Q1",
-                    severity="ERROR",
-                    message=f"distance が 0 または NaN（{_dist.tolist()[:3]}…）",
-                ))
-
-        # ── [Q2] odds 欠損率 ──────────────────────────────────────────────
-        if odds_col in sub.columns:
-            _odds = pd.to_numeric(sub[odds_col], errors="coerce")
-            null_rate = _odds.isna().mean()
-            if null_rate >= ODDS_NULL_RATE_THRESHOLD:
-                result.bad_race_ids.add(race_id)
-                result.issues.append(RaceIssue(
-                    race_id=str(race_id),
-                    issue_code="Q2",
-                    severity="ERROR",
-                    message=f"odds 欠損率 {null_rate:.0%}（最重要特徴が使えない）",
-                ))
-            elif null_rate > 0:
-                result.warn_race_ids.add(race_id)
-                result.issues.append(RaceIssue(
-                    race_id=str(race_id),
-                    issue_code="Q2",
-                    severity="WARNING",
-                    message=f"odds 欠損 {_odds.isna().sum()}/{len(_odds)} 頭",
-                ))
-
-        # ── [Q3] レース内 distance/venue 揺れ ───────────────────────────
-        intra_check_cols = {
-            distance_col: "distance",
-            venue_col: "venue",
-        }
-        for col, label in intra_check_cols.items():
-            if col not in sub.columns:
-                continue
-            vals = sub[col].dropna().astype(str).unique()
-            if len(vals) > INTRA_RACE_N_UNIQUE_MAX:
-                result.bad_race_ids.add(race_id)
-                result.issues.append(RaceIssue(
-                    race_id=str(race_id),
-                    issue_code="Q3",
-                    severity="ERROR",
-                    message=f"レース内 {label} が揺れている: {vals.tolist()}",
-                ))
-
-        # ── [Q4] horse_name 空文字率（警告のみ）─────────────────────────
-        if horse_name_col in sub.columns:
-            empty_mask = (
-                sub[horse_name_col].isna() |
-                (sub[horse_name_col].astype(str).str.strip() == "")
-            )
-            empty_rate = empty_mask.mean()
-            if empty_rate > 0:
-                result.warn_race_ids.add(race_id)
-                result.issues.append(RaceIssue(
-                    race_id=str(race_id),
-                    issue_code="Q4",
-                    severity="WARNING",
-                    message=f"horse_name 空/NaN: {empty_mask.sum()}/{len(sub)} 頭",
-                ))
-
-        # ── [Q5] popularity 欠損率 ───────────────────────────────────────
-        if popularity_col in sub.columns:
-            _pop = pd.to_numeric(sub[popularity_col], errors="coerce")
-            null_rate = _pop.isna().mean()
-            if null_rate >= POP_NULL_RATE_THRESHOLD:
-                result.bad_race_ids.add(race_id)
-                result.issues.append(RaceIssue(
-                    race_id=str(race_id),
-                    issue_code="Q5",
-                    severity="ERROR",
-                    message=f"popularity 欠損率 {null_rate:.0%}",
-                ))
+        # race_id 列がない場合は全体を 1 レースとして扱う
+        codes, race_ids = np.zeros(len(df), dtype=np.intp), np.array(["__single__"], dtype=object)
+    race_ids = np.asarray(race_ids, dtype=object)
+    n_races = len(race_ids) if len(df) else 0
+    result.total_races = n_races
+    result.total_entries = len(df)
+    if n_races == 0:
+        return result
+
+    groups = _RaceGroups(codes, n_races)
+    # (レース出現順, チェック順, RaceIssue) — 最後に従来のレース単位ループと同じ順に並べる
+    found: List[tuple] = []
+
+    def _flag(race_codes: np.ndarray, order: int, code: str, severity: str, message) -> None:
+        for c in race_codes.tolist():
+            race_id = race_ids[c]
+            (result.bad_race_ids if severity == "ERROR" else result.warn_race_ids).add(race_id)
+            found.append((c, order, RaceIssue(
+                race_id=str(race_id), issue_code=code, severity=severity, message=message(c),
+            )))
+
+    # ── [Q1] distance == 0 / NaN ─────────────────────────────────────────
+    if distance_col in df.columns:
+        _dist = pd.to_numeric(df[distance_col], errors="coerce").to_numpy(dtype=float)
+        ok = ~(np.isnan(_dist) | (_dist <= DIST_ZERO_THRESHOLD))
+        _flag(
+            np.flatnonzero(groups.count(ok) == 0), 0, "Q1", "ERROR",
+            lambda c: f"distance が 0 または NaN（{_dist[groups.rows(c)].tolist()[:3]}…）",
+        )
+
+    # ── [Q2] odds 欠損率 ──────────────────────────────────────────────────
+    if odds_col in df.columns:
+        odds_null = groups.count(pd.to_numeric(df[odds_col], errors="coerce").isna().to_numpy())
+        null_rate = odds_null / groups.size
+        _flag(
+            np.flatnonzero(null_rate >= ODDS_NULL_RATE_THRESHOLD), 1, "Q2", "ERROR",
+            lambda c: f"odds 欠損率 {null_rate[c]:.0%}（最重要特徴が使えない）",
+        )
+        _flag(
+            np.flatnonzero((null_rate > 0) & (null_rate < ODDS_NULL_RATE_THRESHOLD)), 1, "Q2", "WARNING",
+            lambda c: f"odds 欠損 {int(odds_null[c])}/{int(groups.size[c])} 頭",
+        )
+
+    # ── [Q3] レース内 distance/venue 揺れ ───────────────────────────────
+    for order, (col, label) in enumerate(((distance_col, "distance"), (venue_col, "venue")), start=2):
+        if col not in df.columns:
+            continue
+        present = df[col].notna().to_numpy()
+        vals = df[col][present].astype(str).to_numpy(dtype=object)
+        n_unique = groups.nunique(vals, present)
+        _flag(
+            np.flatnonzero(n_unique > INTRA_RACE_N_UNIQUE_MAX), order, "Q3", "ERROR",
+            lambda c, _vals=vals, _present=present, _label=label: (
+                f"レース内 {_label} が揺れている: "
+                f"{pd.unique(_vals[groups.rows(c, _present)]).tolist()}"
+            ),
+        )
+
+    # ── [Q4] horse_name 空文字率（警告のみ）─────────────────────────────
+    if horse_name_col in df.columns:
+        _name = df[horse_name_col]
+        empty = (_name.isna() | (_name.astype(str).str.strip() == "")).to_numpy(dtype=bool)
+        n_empty = groups.count(empty)
+        _flag(
+            np.flatnonzero(n_empty > 0), 4, "Q4", "WARNING",
+            lambda c: f"horse_name 空/NaN: {int(n_empty[c])}/{int(groups.size[c])} 頭",
+        )
+
+    # ── [Q5] popularity 欠損率 ───────────────────────────────────────────
+    if popularity_col in df.columns:
+        pop_rate = groups.count(pd.to_numeric(df[popularity_col], errors="coerce").isna().to_numpy()) / groups.size
+        _flag(
+            np.flatnonzero(pop_rate >= POP_NULL_RATE_THRESHOLD), 5, "Q5", "ERROR",
+            lambda c: f"popularity 欠損率 {pop_rate[c]:.0%}",
+        )
 
+    found.sort(key=lambda t: (t[0], t[1]))
+    result.issues = [issue for _, _, issue in found]
     # warn_race_ids から bad_race_ids を除外（重複抑制）
     result.warn_race_ids -= result.bad_race_ids
     return result
 
 
+class _RaceGroups:
+    """行 → レース番号（出現順）の対応から、レース単位の集計と行の取り出しを行う"""
+
+    def __init__(self, codes: np.ndarray, n_races: int) -> None:
+        self.codes = np.asarray(codes, dtype=np.intp)
+        self.n_races = n_races
+        self.size = np.bincount(self.codes, minlength=n_races).astype(float)
+        self._order = np.argsort(self.codes, kind="stable")
+        self._start = np.concatenate([[0], np.cumsum(self.size.astype(np.intp))])
+
+    def count(self, mask: np.ndarray) -> np.ndarray:
+        """レースごとの True の数"""
+        return np.bincount(self.codes[np.asarray(mask, dtype=bool)], minlength=self.n_races).astype(float)
+
+    def nunique(self, values: np.ndarray, present: np.ndarray) -> np.ndarray:
+        """present 行の values のレースごとのユニーク数"""
+        codes = self.codes[present]
+        if len(codes) == 0:
+            return np.zeros(self.n_races)
+        v_codes, _ = pd.factorize(values)
+        pairs = np.unique(codes.astype(np.int64) * (int(v_codes.max()) + 1) + v_codes)
+        return np.bincount(pairs // (int(v_codes.max()) + 1), minlength=self.n_races)
+
+    def rows(self, c: int, present: Optional[np.ndarray] = None) -> np.ndarray:
+        """レース c の行位置（元の並び順）。present を渡すとその部分配列上の位置を返す"""
+        if present is None:
+            return self._order[self._start[c]:self._start[c + 1]]
+        return np.flatnonzero(self.codes[present] == c)
+
+
 def filter_valid_races(
     df: pd.DataFrame,
     race_id_col: str = "race_id",
@@ -244,62 +269,198 @@ def filter_valid_races(
     return df[mask].reset_index(drop=True)
 
 
+def fit_drift_reference(
+    train: "pd.DataFrame | np.ndarray",
+    numeric_cols: Optional[List[str]] = None,
+    n_bins: int = 10,
+    max_rows: int = 100_000,
+) -> Dict:
+    """学習データの数値列から PSI 用の分位ビンと基準分布を作る（モデルバンドル保存用）。
+
+    全列の分位点を 1 回のソートでまとめて求め、ビンごとの構成比・欠損率・中央値を
+    JSON 化できる dict で返す。行数が max_rows を超える場合は等間隔に間引いて求める。
+    train に ndarray（memmap 可）を渡す場合は numeric_cols に列名を指定すること。
+    """
+    if isinstance(train, pd.DataFrame):
+        if numeric_cols is None:
+            numeric_cols = train.select_dtypes(include=[np.number]).columns.tolist()
+        cols = [c for c in numeric_cols if c in train.columns]
+        step = max(1, -(-len(train) // max_rows))
+        mat = _float_matrix(train[cols].iloc[::step])
+    else:
+        cols = list(numeric_cols or [])
+        step = max(1, -(-len(train) // max_rows))
+        mat = np.asarray(train[::step], dtype=float)
+    n_cols = len(cols)
+    n_valid = (~np.isnan(mat)).sum(axis=0) if n_cols else np.zeros(0, dtype=int)
+
+    # np.percentile（linear 補間）と同じ分位点を列ごとの非欠損数に合わせて一括で求める
+    srt = np.sort(mat, axis=0)   # NaN は末尾
+    pos = np.linspace(0, 1, n_bins + 1)[:, None] * np.maximum(n_valid - 1, 0)[None, :]
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, np.maximum(n_valid - 1, 0)[None, :])
+    frac = pos - lo
+    if len(srt):
+        q_lo = np.take_along_axis(srt, lo, axis=0)
+        q_hi = np.take_along_axis(srt, hi, axis=0)
+        quantiles = q_lo + (q_hi - q_lo) * frac
+    else:
+        quantiles = np.full((n_bins + 1, n_cols), np.nan)
+
+    edges: List[List[float]] = []
+    for j in range(n_cols):
+        if n_valid[j] <= 10:
+            edges.append([])
+            continue
+        e = quantiles[:, j].copy()
+        e[0] -= _PSI_EPS
+        e[-1] += _PSI_EPS
+        e = np.unique(e)   # 重複 bin を除去
+        edges.append(e.tolist() if len(e) >= 2 else [])
+
+    counts = _binned_counts(mat, edges)
+    totals = counts.sum(axis=1, keepdims=True)
+    expected = counts / (totals + _PSI_EPS)
+    medians = np.full(n_cols, np.nan)
+    has = n_valid > 0
+    if has.any():
+        mid = (n_valid[has] - 1) / 2.0
+        medians[has] = (
+            np.take_along_axis(srt[:, has], np.floor(mid).astype(np.intp)[None, :], axis=0)[0]
+            + np.take_along_axis(srt[:, has], np.ceil(mid).astype(np.intp)[None, :], axis=0)[0]
+        ) / 2.0
+    n_rows = len(mat)
+    return {
+        "columns": cols,
+        "n_bins": n_bins,
+        "n_rows": n_rows,
+        "edges": edges,
+        "expected_pct": [expected[j, :max(len(edges[j]) - 1, 0)].tolist() for j in range(n_cols)],
+        "missing_rate": [float(1.0 - n_valid[j] / n_rows) if n_rows else 1.0 for j in range(n_cols)],
+        "median": [None if np.isnan(m) else float(m) for m in medians],
+    }
+
+
 def check_feature_drift(
-    train_df: pd.DataFrame,
+    train_df: Optional[pd.DataFrame],
     infer_df: pd.DataFrame,
     numeric_cols: Optional[List[str]] = None,
     cat_cols: Optional[List[str]] = None,
     psi_threshold: float = 0.2,
+    reference: Optional[Dict] = None,
 ) -> pd.DataFrame:
     """学習データ（train）と推論データ（infer）の特徴量ドリフトを計算する。
 
+    reference（fit_drift_reference の結果。モデルバンドルの "drift_reference"）を渡すと
+    学習フレームなしで計算する。PSI は全列を 1 回のビン集計でまとめて求める。
+
     Returns
     -------
     pd.DataFrame  columns: [feature, train_missing_pct, infer_missing_pct,
                              missing_drift, train_median, infer_median,
                              psi, drift_flag]
     """
+    if reference is None:
+        if train_df is None:
+            raise ValueError("train_df か reference のどちらかが必要です")
+        if numeric_cols is None:
+            numeric_cols = train_df.select_dtypes(include=[np.number]).columns.tolist()
+        reference = fit_drift_reference(train_df, numeric_cols, max_rows=max(len(train_df), 1))
     if numeric_cols is None:
-        numeric_cols = train_df.select_dtypes(include=[np.number]).columns.tolist()
-
-    rows = []
-    for col in numeric_cols:
-        t = train_df[col].dropna() if col in train_df.columns else pd.Series(dtype=float)
-        i = infer_df[col].dropna() if col in infer_df.columns else pd.Series(dtype=float)
-
-        train_miss = (
-            train_df[col].isna().mean() if col in train_df.columns else 1.0
-        )
-        infer_miss = (
-            infer_df[col].isna().mean() if col in infer_df.columns else 1.0
-        )
-        missing_drift = abs(infer_miss - train_miss)
-
-        t_med = float(t.median()) if len(t) else float("nan")
-        i_med = float(i.median()) if len(i) else float("nan")
-
-        # PSI（Population Stability Index）を10分位で計算
-        psi_val = _calc_psi(t, i) if (len(t) > 10 and len(i) > 0) else float("nan")
-
-        drift_flag = (
-            missing_drift > 0.2 or
-            (not np.isnan(psi_val) and psi_val >= psi_threshold)
-        )
-        rows.append({
-            "feature": col,
-            "train_missing_pct": round(train_miss * 100, 1),
-            "infer_missing_pct": round(infer_miss * 100, 1),
-            "missing_drift": round(missing_drift * 100, 1),
-            "train_median": round(t_med, 4) if not np.isnan(t_med) else None,
-            "infer_median": round(i_med, 4) if not np.isnan(i_med) else None,
-            "psi": round(psi_val, 4) if not np.isnan(psi_val) else None,
-            "drift_flag": drift_flag,
-        })
-
-    result_df = pd.DataFrame(rows)
-    if len(result_df):
-        result_df = result_df.sort_values("psi", ascending=False, na_position="last")
-    return result_df
+        numeric_cols = list(reference["columns"])
+    ref_idx = {c: j for j, c in enumerate(reference["columns"])}
+    if not numeric_cols:
+        return pd.DataFrame()
+
+    present = [c for c in numeric_cols if c in infer_df.columns]
+    mat = _float_matrix(infer_df[present])
+    col_pos = {c: j for j, c in enumerate(present)}
+    # infer 側に無い列は全欠損の列として扱う
+    full = np.full((len(infer_df), len(numeric_cols)), np.nan)
+    for k, c in enumerate(numeric_cols):
+        if c in col_pos:
+            full[:, k] = mat[:, col_pos[c]]
+
+    edges = [reference["edges"][ref_idx[c]] if c in ref_idx else [] for c in numeric_cols]
+    expected = [reference["expected_pct"][ref_idx[c]] if c in ref_idx else [] for c in numeric_cols]
+    psi = _batched_psi(full, edges, expected)
+
+    n_infer = (~np.isnan(full)).sum(axis=0)
+    infer_miss = 1.0 - n_infer / len(full) if len(full) else np.ones(len(numeric_cols))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # 全欠損列の nanmedian
+        infer_med = np.nanmedian(full, axis=0) if len(full) else np.full(len(numeric_cols), np.nan)
+    train_miss = np.array([reference["missing_rate"][ref_idx[c]] if c in ref_idx else 1.0 for c in numeric_cols])
+    train_med = [reference["median"][ref_idx[c]] if c in ref_idx else None for c in numeric_cols]
+    missing_drift = np.abs(infer_miss - train_miss)
+    psi = np.where(n_infer > 0, psi, np.nan)
+    drift_flag = (missing_drift > 0.2) | (~np.isnan(psi) & (psi >= psi_threshold))
+
+    result_df = pd.DataFrame({
+        "feature": numeric_cols,
+        "train_missing_pct": np.round(train_miss * 100, 1),
+        "infer_missing_pct": np.round(infer_miss * 100, 1),
+        "missing_drift": np.round(missing_drift * 100, 1),
+        "train_median": [None if m is None else round(float(m), 4) for m in train_med],
+        "infer_median": [None if np.isnan(m) else round(float(m), 4) for m in infer_med],
+        "psi": [None if np.isnan(p) else round(float(p), 4) for p in psi],
+        "drift_flag": drift_flag.astype(bool),
+    })
+    return result_df.sort_values("psi", ascending=False, na_position="last")
+
+
+def _float_matrix(df: pd.DataFrame) -> np.ndarray:
+    """数値列を float 行列にする（数値化できない値は NaN）"""
+    try:
+        return df.to_numpy(dtype=float, na_value=np.nan)
+    except (TypeError, ValueError):
+        return df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+def _binned_counts(mat: np.ndarray, edges: List[List[float]]) -> np.ndarray:
+    """全列をまとめてビン集計する（np.histogram と同じく最終ビンのみ右閉・範囲外と NaN は数えない）
+
+    Returns: shape (n_cols, max_bins)。ビン数が少ない列の余りは 0。
+    """
+    n_cols = mat.shape[1] if mat.ndim == 2 else 0
+    max_bins = max((len(e) - 1 for e in edges), default=0)
+    if n_cols == 0 or max_bins <= 0:
+        return np.zeros((n_cols, max(max_bins, 0)))
+    # 内側の境界を +inf で揃えた (n_cols, max_bins - 1) 行列と、列ごとの下端・上端
+    inner = np.full((n_cols, max(max_bins - 1, 0)), np.inf)
+    low = np.full(n_cols, np.nan)
+    high = np.full(n_cols, np.nan)
+    for j, e in enumerate(edges):
+        if len(e) >= 2:
+            inner[j, :len(e) - 2] = e[1:-1]
+            low[j], high[j] = e[0], e[-1]
+    counts = np.zeros(n_cols * max_bins)
+    col_offset = np.arange(n_cols) * max_bins
+    block = max(1, 4_000_000 // max(n_cols * max_bins, 1))   # 比較テンソルのサイズを抑える
+    for start in range(0, len(mat), block):
+        x = mat[start:start + block]
+        with np.errstate(invalid="ignore"):
+            in_range = (x >= low) & (x <= high)   # NaN / 範囲外 / ビンなし列は False
+            idx = (x[:, :, None] >= inner[None, :, :]).sum(axis=2)
+        counts += np.bincount((idx + col_offset)[in_range], minlength=n_cols * max_bins)
+    return counts.reshape(n_cols, max_bins)
+
+
+def _batched_psi(mat: np.ndarray, edges: List[List[float]], expected_pct: List[List[float]]) -> np.ndarray:
+    """列ごとの PSI をまとめて計算する（ビンが作れなかった列は NaN、1 ビンしかない列は 0）"""
+    n_cols = len(edges)
+    counts = _binned_counts(mat, edges)
+    max_bins = counts.shape[1] if counts.ndim == 2 else 0
+    valid = np.zeros((n_cols, max_bins), dtype=bool)
+    exp = np.zeros((n_cols, max_bins))
+    for j, e in enumerate(expected_pct):
+        valid[j, :len(e)] = True
+        exp[j, :len(e)] = e
+    act = counts / (counts.sum(axis=1, keepdims=True) + _PSI_EPS)
+    exp = np.where(exp == 0, _PSI_EPS, exp)
+    act = np.where(act == 0, _PSI_EPS, act)
+    psi = np.where(valid, (act - exp) * np.log(act / exp), 0.0).sum(axis=1)
+    return np.where([len(e) >= 2 for e in edges], psi, np.nan)
 
 
 def _calc_psi(expected: pd.Series, actual: pd.Series, n_bins: int = 10) -> float:
@@ -0,0 +1,185 @@
+"""
+ステージ単位の処理時間プロファイラ
+
+add_derived_features の各ステージ・_feh_* サブステージ・optimizer.transform・model.predict の
+どれが 1 回の推論／学習を支配しているかを調べるための軽量トレース。
+
+  with trace_stages() as trace:          # このコンテキスト（スレッド / asyncio タスク）でだけ有効
+      add_derived_features(df, ...)
+  trace.to_dict()                         # {"total_ms", "stages": [{name, depth, wall_ms, rows_in, ...}]}
+
+計測対象は @traced_stage を付けた関数と run_stage(name, fn, ...) の呼び出し。
+トレースが無効なときは ContextVar を 1 回参照するだけで元の関数を呼ぶ。
+memory=True のときは tracemalloc でステージごとのピーク増分（MB）も記録する
+（tracemalloc はプロセス全体の状態のため、同時に走る他の処理の確保も含まれる）。
+"""
+from __future__ import annotations
+
+import functools
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_ACTIVE: ContextVar[Optional["StageTrace"]] = ContextVar("keiba_stage_trace", default=None)
+
+_MB = 1024 * 1024
+_TRACEMALLOC_LOCK = threading.Lock()
+_TRACEMALLOC_USERS = 0
+
+
+@dataclass
+class StageRecord:
+    """1 ステージの計測結果（records は開始順・depth は入れ子の深さ）"""
+
+    name: str
+    depth: int
+    wall_ms: float
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    cols_added: Optional[int] = None
+    mem_peak_mb: Optional[float] = None
+
+
+def _shape(obj: Any) -> tuple:
+    """(行数, 列名) を返す。DataFrame 以外は列名 None・長さが取れなければ (None, None)"""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]            # _feh_* は (df, h) を返す
+    columns = getattr(obj, "columns", None)
+    try:
+        rows = len(obj) if obj is not None and not isinstance(obj, (str, bytes)) else None
+    except TypeError:
+        rows = None
+    return rows, columns
+
+
+class StageTrace:
+    """1 回の推論／学習で実行されたステージの記録"""
+
+    def __init__(self, memory: bool = False) -> None:
+        self.memory = memory
+        self.records: List[Optional[StageRecord]] = []
+        self._depth = 0
+        self._mem_stack: List[list] = []
+        self._t0 = time.perf_counter()
+        self.total_ms: Optional[float] = None
+
+    def run(self, name: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        frame_in = next((a for a in args if hasattr(a, "columns")), None)
+        rows_in, cols_in = _shape(frame_in)
+        slot = len(self.records)
+        self.records.append(None)
+        depth = self._depth
+        self._depth += 1
+        mem_base = self._mem_enter() if self.memory else None
+        t0 = time.perf_counter()
+        try:
+            out = fn(*args, **kwargs)
+        finally:
+            wall_ms = (time.perf_counter() - t0) * 1000.0
+            self._depth -= 1
+            mem_peak = self._mem_exit(mem_base) if self.memory else None
+            self.records[slot] = StageRecord(name=name, depth=depth, wall_ms=round(wall_ms, 3),
+                                             rows_in=rows_in, mem_peak_mb=mem_peak)
+        rows_out, cols_out = _shape(out)
+        rec = self.records[slot]
+        rec.rows_out = rows_out
+        if cols_in is not None and cols_out is not None:
+            rec.cols_added = len(set(cols_out) - set(cols_in))
+        return out
+
+    # ── tracemalloc（入れ子ステージでも親のピークを失わないように子の開始前に退避する）
+    def _mem_enter(self) -> int:
+        current, peak = tracemalloc.get_traced_memory()
+        if self._mem_stack:
+            self._mem_stack[-1][1] = max(self._mem_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        self._mem_stack.append([current, current])
+        return current
+
+    def _mem_exit(self, base: int) -> float:
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, self._mem_stack.pop()[1])
+        if self._mem_stack:
+            self._mem_stack[-1][1] = max(self._mem_stack[-1][1], peak)
+        return round((peak - base) / _MB, 3)
+
+    def finish(self) -> None:
+        self.total_ms = round((time.perf_counter() - self._t0) * 1000.0, 3)
+
+    @property
+    def stages(self) -> List[StageRecord]:
+        return [r for r in self.records if r is not None]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"total_ms": self.total_ms, "memory": self.memory, "stages": [asdict(r) for r in self.stages]}
+
+    def compact(self) -> List[list]:
+        """ヘッダ向けの短い形式: [name, wall_ms, rows_out, cols_added, mem_peak_mb]"""
+        return [[r.name, round(r.wall_ms, 1), r.rows_out, r.cols_added, r.mem_peak_mb] for r in self.stages]
+
+
+def _tracemalloc_acquire() -> None:
+    global _TRACEMALLOC_USERS
+    with _TRACEMALLOC_LOCK:
+        if _TRACEMALLOC_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACEMALLOC_USERS = 1
+        elif _TRACEMALLOC_USERS:
+            _TRACEMALLOC_USERS += 1
+
+
+def _tracemalloc_release() -> None:
+    global _TRACEMALLOC_USERS
+    with _TRACEMALLOC_LOCK:
+        if _TRACEMALLOC_USERS:
+            _TRACEMALLOC_USERS -= 1
+            if _TRACEMALLOC_USERS == 0:
+                tracemalloc.stop()
+
+
+@contextmanager
+def trace_stages(memory: bool = False) -> Iterator[StageTrace]:
+    """このコンテキスト内で実行された計測対象ステージを記録する StageTrace を返す"""
+    trace = StageTrace(memory=memory)
+    if memory:
+        _tracemalloc_acquire()
+    token = _ACTIVE.set(trace)
+    try:
+        yield trace
+    finally:
+        _ACTIVE.reset(token)
+        if memory:
+            _tracemalloc_release()
+        trace.finish()
+
+
+def current_trace() -> Optional[StageTrace]:
+    return _ACTIVE.get()
+
+
+def run_stage(name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """fn(*args, **kwargs) を name のステージとして計測する（トレース無効時はそのまま呼ぶ）"""
+    trace = _ACTIVE.get()
+    if trace is None:
+        return fn(*args, **kwargs)
+    return trace.run(name, fn, args, kwargs)
+
+
+def traced_stage(fn: Optional[Callable[..., Any]] = None, *, name: Optional[str] = None):
+    """関数をステージとして計測するデコレータ（@traced_stage / @traced_stage(name="...")）"""
+    def _wrap(f: Callable[..., Any]) -> Callable[..., Any]:
+        stage_name = name or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            trace = _ACTIVE.get()
+            if trace is None:
+                return f(*args, **kwargs)
+            return trace.run(stage_name, f, args, kwargs)
+        return wrapper
+
+    return _wrap(fn) if fn is not None else _wrap
@@ -0,0 +1,1048 @@
+"""
+性能テスト用の合成データ生成（keiba_ultimate.db / fetch_cache.db）
+
+ローダー・特徴量・学習・買い目の性能改善を本番 DB なしで測るための再現可能な合成データ。
+スクレイパー（python-api/scraping/race.py・horse.py）が保存するのと同じ JSON 形で
+races_ultimate / race_results_ultimate / return_tables_ultimate を作る。
+
+  for race in generate_races(100_000, seed=0):   # {"race_info", "horses", "return_tables"}
+      ...
+  write_ultimate_db(Path("work/keiba_ultimate.db"), 1_000_000, seed=0)
+  write_fetch_cache(Path("work/fetch_cache.db"), 10_000, seed=0)   # パーサーベンチ用 HTML
+
+  python -m keiba_ai.synthetic_data --rows 1000000 --db work/keiba_ultimate.db
+
+生成モデル:
+  - 開催: JRA は土日 3 場 × 12R（4 週 = 1 開催で回・日目を採番）、NAR は平日 1 場（nar_share で量を調整）
+  - 馬: 能力・距離適性・脚質を持つ馬を一定数アクティブに保ち、出走ごとに確率的に引退・新馬を補充
+    （出走間隔は中 1 週〜8 週で、同じ馬が同じ日に 2 回走ることはない）
+  - 着順は能力 + 騎手 + 適性 + ノイズ、オッズは市場の見立て（ノイズ小）から控除率 20% で算出
+  - 払戻は市場確率の Harville 近似から単勝〜三連単まで、人気順も同じ確率で付ける
+  - 馬詳細（血統・生年月日・通算成績・前走/前々走）はスクレイプ直後の馬ページと同じく
+    当該レースを含むスナップショット（prev_* は当該レース、prev2_* はその前走）
+  - NAR の一部は "B" 始まりの馬 ID（血統のみ・取得不可なら unknown_local）
+  - 距離が 200m の倍数でないレースはラップなし（スクレイパーがラップ表を読めないのと同じ）
+  - 少数の出走取消（着順 "取"）と距離パース失敗レース（_invalid_distance）を含む
+
+同じ引数・seed なら同じ行を同じ順序で返す（1 本の numpy Generator を先頭から順に消費する）。
+生成＋DB 書き込みは 1 万行あたり約 1 秒で、レース単位のストリームなので 1000 万行でもメモリは一定。
+"""
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ── 会場 ────────────────────────────────────────────────────────────
+_JRA_VENUES = {
+    "01": "札幌", "02": "函館", "03": "福島", "04": "新潟", "05": "東京",
+    "06": "中山", "07": "中京", "08": "京都", "09": "阪神", "10": "小倉",
+}
+_NAR_VENUES = {
+    "30": "門別", "35": "盛岡", "36": "水沢", "42": "浦和", "43": "船橋", "44": "大井",
+    "45": "川崎", "46": "金沢", "47": "笠松", "48": "名古屋", "50": "園田", "51": "姫路",
+    "54": "福山", "55": "高知", "60": "佐賀",
+}
+_LEFT_TURN = {"04", "05", "07", "35", "42", "43", "45"}
+# 4 週（8 開催日）ごとの 3 場の組み合わせ。年初から順に回り、場ごとの登場回数が「回」になる
+_JRA_ROTATION = [("06", "08", "07"), ("05", "09", "10"), ("03", "04", "09"),
+                 ("01", "02", "07"), ("05", "06", "08"), ("04", "09", "10")]
+
+_DISTANCES = {
+    "芝": ((1200, 1400, 1600, 1800, 2000, 2200, 2400, 2500, 3000, 3200),
+           (0.16, 0.12, 0.17, 0.17, 0.18, 0.07, 0.07, 0.03, 0.02, 0.01)),
+    "ダート": ((1000, 1150, 1200, 1400, 1600, 1700, 1800, 1900, 2100),
+             (0.06, 0.03, 0.24, 0.18, 0.08, 0.12, 0.22, 0.03, 0.04)),
+    "障害": ((2750, 2880, 3000, 3110, 3300, 3390, 4250), (0.2, 0.2, 0.15, 0.15, 0.15, 0.1, 0.05)),
+    "NAR": ((800, 1000, 1200, 1230, 1300, 1400, 1500, 1600, 1700, 1800, 2000, 2100, 2400),
+            (0.04, 0.1, 0.16, 0.06, 0.08, 0.16, 0.1, 0.1, 0.05, 0.07, 0.04, 0.02, 0.02)),
+}
+_SPEED = {"芝": 16.6, "ダート": 15.9, "障害": 14.2}           # 良馬場の勝ちタイム基準（m/s）
+_GOING_FACTOR = {
+    "芝": {"良": 1.0, "稍重": 0.995, "重": 0.99, "不良": 0.982},
+    "ダート": {"良": 1.0, "稍重": 1.004, "重": 1.007, "不良": 1.01},
+}
+
+# ── クラス・賞金 ────────────────────────────────────────────────────
+_JRA_CLASS_BY_RACE_NO = {1: "未勝利", 2: "未勝利", 3: "未勝利", 4: "新馬", 5: "未勝利", 6: "1勝クラス",
+                         7: "1勝クラス", 8: "1勝クラス", 9: "2勝クラス", 10: "2勝クラス", 11: "オープン",
+                         12: "3勝クラス"}
+_CLASS_LEVEL = {"新馬": 0, "未勝利": 0, "1勝クラス": 1, "2勝クラス": 2, "3勝クラス": 3, "オープン": 4,
+                "G3": 5, "G2": 6, "G1": 7}
+_FIRST_PRIZE_MAN = {"新馬": 720, "未勝利": 560, "1勝クラス": 850, "2勝クラス": 1140, "3勝クラス": 1540,
+                    "オープン": 2400, "G3": 4300, "G2": 6700, "G1": 20000,
+                    "A1": 100, "A2": 80, "B1": 60, "B2": 45, "B3": 40, "C1": 30, "C2": 25, "C3": 20,
+                    "2歳": 50, "3歳": 40}
+_PRIZE_SHARE = (1.0, 0.4, 0.25, 0.15, 0.1)
+_NAR_CLASSES = (("C3", "C2", "C1", "B3", "B2", "B1", "A2", "A1", "2歳", "3歳"),
+                (0.2, 0.2, 0.16, 0.1, 0.08, 0.06, 0.04, 0.03, 0.06, 0.07))
+
+# ── 払戻 ────────────────────────────────────────────────────────────
+_TAKEOUT = {"単勝": 0.8, "複勝": 0.8, "枠連": 0.775, "馬連": 0.775, "ワイド": 0.775,
+            "馬単": 0.75, "三連複": 0.75, "三連単": 0.725}
+
+# ── 名前プール ──────────────────────────────────────────────────────
+_KANA = list("アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワ"
+             "ガギグゲゴザジズゼゾダデドバビブベボパピプペポ")
+_KANA_TAIL = ["ー", "ン", "ル", "ス", "ト", "ア", "ド", "ク"]
+_SURNAMES = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤", "吉田", "山田",
+             "佐々木", "山口", "松本", "井上", "木村", "林", "斎藤", "清水", "山崎", "森", "池田", "橋本",
+             "阿部", "石川", "山下", "中島", "石井", "小川", "前田", "岡田", "長谷川", "藤田", "後藤", "近藤",
+             "村上", "遠藤", "青木", "坂本"]
+_GIVEN = ["翔", "大輝", "健太", "拓也", "悠人", "誠", "亮", "雄一", "和也", "直樹", "達也", "勇気", "光",
+          "蓮", "陽太", "隼人", "剛", "優", "一馬", "聡"]
+_PLACE_WORDS = ["六甲", "比叡", "鳴尾", "夕月", "白秋", "若葉", "清洲", "浜名湖", "筑紫", "由比ヶ浜",
+                "白川郷", "八甲田", "豊明", "鷹巣山", "立志", "花園", "摩耶", "天神", "長良川", "大原"]
+_FARMS = ["日高町", "新冠町", "浦河町", "新ひだか町", "安平町", "平取町", "むかわ町", "千歳市", "様似町",
+          "えりも町", "洞爺湖町", "米"]
+_WEATHER = (("晴", "曇", "小雨", "雨", "雪"), (0.55, 0.3, 0.07, 0.06, 0.02))
+_GOING = ("良", "稍重", "重", "不良")
+_MARGIN_STEPS = ((0.5, "1/2"), (0.75, "3/4"), (1.0, "1"), (1.25, "1.1/4"), (1.5, "1.1/2"), (1.75, "1.3/4"),
+                 (2.0, "2"), (2.5, "2.1/2"), (3.0, "3"), (3.5, "3.1/2"), (4.0, "4"), (5.0, "5"), (6.0, "6"),
+                 (7.0, "7"), (8.0, "8"), (9.0, "9"), (10.0, "10"))
+
+# ── 生成パラメータ既定値 ────────────────────────────────────────────
+DEFAULT_START = date(2015, 1, 3)
+JRA_RACES_PER_WEEK = 72               # 2 日 × 3 場 × 12R
+_MEAN_CAREER_RUNS = 8                  # 引退確率 = 1 / _MEAN_CAREER_RUNS（出走ごと）
+_MAX_ACTIVE = 6000                     # 1 団体あたりの現役頭数の目安（出走可能な馬が足りなければ補充）
+_REST_DAYS = (13, 56)                  # 出走間隔（日）：中 1 週〜8 週
+
+_RACES_DDL = (
+    """CREATE TABLE IF NOT EXISTS races_ultimate (
+        race_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS race_results_ultimate (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        race_id TEXT,
+        data TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS return_tables_ultimate (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        race_id TEXT NOT NULL,
+        bet_type TEXT NOT NULL,
+        combinations TEXT NOT NULL,
+        payout INTEGER NOT NULL,
+        popularity INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_return_race_id ON return_tables_ultimate (race_id)",
+    """CREATE TABLE IF NOT EXISTS data_version_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        race_id TEXT,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS scraped_dates (
+        date TEXT PRIMARY KEY,
+        race_count INTEGER DEFAULT 0,
+        no_race INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+)
+_CACHE_DDL = (
+    """CREATE TABLE IF NOT EXISTS http_cache (
+        normalized_url TEXT PRIMARY KEY,
+        final_url TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        headers_json TEXT NOT NULL,
+        body BLOB NOT NULL,
+        fetched_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS fetch_resume (
+        resume_key TEXT PRIMARY KEY,
+        normalized_url TEXT NOT NULL,
+        status TEXT NOT NULL,
+        source TEXT NOT NULL,
+        http_status INTEGER NOT NULL,
+        attempts INTEGER NOT NULL,
+        updated_at REAL NOT NULL,
+        error TEXT
+    )""",
+)
+_NETKEIBA = "https://db.netkeiba.com"
+
+
+# ===========================================================================
+# 小物
+# ===========================================================================
+
+def _kana_name(rng: np.random.Generator, lo: int = 3, hi: int = 7) -> str:
+    n = int(rng.integers(lo, hi + 1))
+    body = "".join(_KANA[int(i)] for i in rng.integers(0, len(_KANA), n - 1))
+    return body + _KANA_TAIL[int(rng.integers(0, len(_KANA_TAIL)))]
+
+
+def _person_name(rng: np.random.Generator) -> str:
+    return _SURNAMES[int(rng.integers(0, len(_SURNAMES)))] + _GIVEN[int(rng.integers(0, len(_GIVEN)))]
+
+
+def _fmt_time(tenths: int) -> str:
+    """0.1 秒単位の整数 → netkeiba のタイム表記（"1:34.5"）"""
+    m, r = divmod(int(tenths), 600)
+    return f"{m}:{r // 10:02d}.{r % 10}"
+
+
+def _time_seconds(t: str) -> Optional[float]:
+    """馬ページのタイム列を scraping/horse.py と同じ式で秒に直す"""
+    m, _, s = t.partition(":")
+    try:
+        return float(m) * 60 + float(s) if s else float(m)
+    except ValueError:
+        return None
+
+
+def _margin(gap_sec: float, same_tenth: bool) -> str:
+    if same_tenth:
+        return "ハナ" if gap_sec < 0.02 else ("アタマ" if gap_sec < 0.05 else "クビ")
+    lengths = gap_sec / 0.17
+    for limit, label in _MARGIN_STEPS:
+        if lengths <= limit + 0.12:
+            return label
+    return "大"
+
+
+def _brackets(n: int) -> List[int]:
+    """JRA の枠順（9 頭以上は外枠から 2 頭目・3 頭目を入れる）"""
+    if n <= 8:
+        return list(range(1, n + 1))
+    counts = [1] * 8
+    k = 7
+    for _ in range(n - 8):
+        counts[k] += 1
+        k = k - 1 if k > 0 else 7
+    return [b + 1 for b in range(8) for _ in range(counts[b])]
+
+
+def _pick(rng: np.random.Generator, choices: Sequence[Any], p: Sequence[float]) -> Any:
+    p_arr = np.asarray(p, dtype=float)
+    return choices[int(rng.choice(len(choices), p=p_arr / p_arr.sum()))]
+
+
+# ===========================================================================
+# 馬・騎手・調教師
+# ===========================================================================
+
+class _Horse:
+    __slots__ = ("horse_id", "name", "sex", "birth", "sire", "dam", "damsire", "owner", "breeder", "farm",
+                 "trainer", "ability", "pref_dist", "turf_apt", "style", "weight", "runs", "wins",
+                 "prize_man", "local_id", "prev", "prev2")
+
+    def __init__(self, **kw: Any) -> None:
+        for k, v in kw.items():
+            setattr(self, k, v)
+
+
+class _Pool:
+    """JRA / NAR それぞれの現役馬・騎手・調教師"""
+
+    def __init__(self, rng: np.random.Generator, nar: bool, target_active: int, b_id_share: float,
+                 sires: List[str], sire_p: np.ndarray) -> None:
+        self.nar = nar
+        self.target_active = target_active
+        self.b_id_share = b_id_share
+        self.sires, self.sire_p = sires, sire_p
+        self.active: List[_Horse] = []
+        self.ready_at = np.zeros(1024, dtype=np.int64)      # active と同じ並び：次に出走できる日（ordinal）
+        self.next_no = 0
+        n_j, n_t = (80, 120) if nar else (150, 200)
+        prefix = "a" if nar else ""
+        self.jockeys = [(f"{prefix}{1000 + i:04d}" if nar else f"{1000 + i:05d}", _person_name(rng))
+                        for i in range(n_j)]
+        self.jockey_skill = rng.normal(0.0, 1.0, n_j)
+        self.trainers = [(f"{prefix}{2000 + i:04d}" if nar else f"{1000 + i:05d}", _person_name(rng))
+                         for i in range(n_t)]
+        self.owners = [_person_name(rng) if rng.random() < 0.6 else f"{_kana_name(rng)}ホールディングス"
+                       for _ in range(200)]
+        self.breeders = [f"{_person_name(rng)}牧場" if rng.random() < 0.5 else f"{_kana_name(rng)}ファーム"
+                         for _ in range(150)]
+
+    def _recruit(self, rng: np.random.Generator, on: date) -> _Horse:
+        no = self.next_no
+        self.next_no += 1
+        age = 2 if rng.random() < 0.6 else 3
+        birth = date(on.year - age, int(rng.integers(2, 6)), int(rng.integers(1, 29)))
+        local_id = self.nar and rng.random() < self.b_id_share
+        if local_id:
+            horse_id = f"B{no:09d}"
+        else:
+            horse_id = f"{birth.year}{3 if self.nar else 1}{no:05d}"     # JRA は 1・NAR は 3 で衝突しない
+        sex = _pick(rng, ("牡", "牝", "セ"), (0.5, 0.42, 0.08))
+        sire = self.sires[int(rng.choice(len(self.sires), p=self.sire_p))]
+        damsire = self.sires[int(rng.integers(0, len(self.sires)))]
+        known = not local_id or rng.random() < 0.5
+        return _Horse(
+            horse_id=horse_id, name=_kana_name(rng), sex=sex, birth=birth,
+            sire=sire if known else "unknown_local", dam=_kana_name(rng) if known else "unknown_local",
+            damsire=damsire if known else "unknown_local",
+            owner=self.owners[int(rng.integers(0, len(self.owners)))],
+            breeder=self.breeders[int(rng.integers(0, len(self.breeders)))],
+            farm=_FARMS[int(rng.integers(0, len(_FARMS)))],
+            trainer=self.trainers[int(rng.integers(0, len(self.trainers)))],
+            ability=float(rng.normal(0.0, 1.0)), pref_dist=float(rng.normal(1700.0, 400.0)),
+            turf_apt=float(rng.normal(0.0, 0.5)), style=float(rng.normal(0.0, 1.0)),
+            weight=int(np.clip(rng.normal(470.0, 26.0), 380, 580)) // 2 * 2,
+            runs=0, wins=0, prize_man=0.0, local_id=local_id, prev=None, prev2=None,
+        )
+
+    def _add(self, h: _Horse) -> None:
+        if len(self.active) == len(self.ready_at):
+            self.ready_at = np.concatenate([self.ready_at, np.zeros_like(self.ready_at)])
+        self.ready_at[len(self.active)] = 0
+        self.active.append(h)
+
+    def draw(self, rng: np.random.Generator, n: int, on: date) -> Tuple[np.ndarray, List[_Horse]]:
+        """出走可能な馬から n 頭を選び、次走まで _REST_DAYS の間隔を空ける（足りなければ新馬を補充）"""
+        while len(self.active) < self.target_active:
+            self._add(self._recruit(rng, on))
+        day = on.toordinal()
+        ready = np.flatnonzero(self.ready_at[:len(self.active)] <= day)
+        if len(ready) < n:
+            first = len(self.active)
+            for _ in range(n - len(ready)):
+                self._add(self._recruit(rng, on))
+            ready = np.concatenate([ready, np.arange(first, len(self.active))])
+        pos = ready[rng.choice(len(ready), size=n, replace=False)]
+        self.ready_at[pos] = day + rng.integers(_REST_DAYS[0], _REST_DAYS[1] + 1, n)
+        return pos, [self.active[int(i)] for i in pos]
+
+    def retire(self, positions: Sequence[int]) -> None:
+        for p in sorted(positions, reverse=True):
+            last = self.active.pop()
+            if p < len(self.active):
+                self.active[p] = last
+                self.ready_at[p] = self.ready_at[len(self.active)]
+
+
+# ===========================================================================
+# 開催スケジュール
+# ===========================================================================
+
+def _jra_meeting(d: date) -> List[Tuple[str, int, int]]:
+    """土日 1 日分の (会場コード, 回, 日目)。4 週ごとにローテーションを 1 つ進める"""
+    w = (d.timetuple().tm_yday - 1) // 7
+    block = w // 4
+    venues = _JRA_ROTATION[block % len(_JRA_ROTATION)]
+    nichi = (w % 4) * 2 + (1 if d.weekday() == 5 else 2)
+    out = []
+    for v in venues:
+        kai = 1 + sum(v in _JRA_ROTATION[b % len(_JRA_ROTATION)] for b in range(block))
+        out.append((v, kai, nichi))
+    return out
+
+
+def _schedule(start: date, nar_per_day: int) -> Iterator[Tuple[date, str, int, int, int, bool]]:
+    """(日付, 会場コード, 回, 日目, R, NAR か) を無限に返す"""
+    nar_codes = list(_NAR_VENUES)
+    d = start
+    while True:
+        if d.weekday() >= 5:
+            for venue, kai, nichi in _jra_meeting(d):
+                for r in range(1, 13):
+                    yield d, venue, kai, nichi, r, False
+        elif nar_per_day:
+            venue = nar_codes[d.toordinal() % len(nar_codes)]
+            kai, nichi = d.month, 1 + (d.day - 1) % 6
+            for r in range(1, nar_per_day + 1):
+                yield d, venue, kai, nichi, r, True
+        d += timedelta(days=1)
+
+
+# ===========================================================================
+# レース生成
+# ===========================================================================
+
+def _race_conditions(rng: np.random.Generator, d: date, venue: str, race_no: int,
+                     nar: bool) -> Dict[str, Any]:
+    """コース・クラス・レース名・天候など、出走馬に依らない条件"""
+    if nar:
+        track = "ダート"
+        dists, p = _DISTANCES["NAR"]
+        cls = _pick(rng, *_NAR_CLASSES)
+        name = f"{cls}{_PLACE_WORDS[int(rng.integers(0, len(_PLACE_WORDS)))]}特別" if cls.endswith("歳") \
+            else f"{cls}{'一二三四五'[int(rng.integers(0, 5))]}組"
+    else:
+        cls = _JRA_CLASS_BY_RACE_NO[race_no]
+        if cls == "新馬" and d.month < 6:
+            cls = "未勝利"
+        track = "障害" if race_no == 1 and rng.random() < 0.2 else _pick(rng, ("芝", "ダート"), (0.48, 0.52))
+        dists, p = _DISTANCES[track]
+        cond = "2歳" if cls == "新馬" or (cls == "未勝利" and d.month >= 7 and race_no <= 2) else (
+            "3歳" if cls == "未勝利" else "3歳以上")
+        word = _PLACE_WORDS[int(rng.integers(0, len(_PLACE_WORDS)))]
+        if race_no == 11:
+            u = rng.random() if d.weekday() == 6 else 1.0
+            cls = "G1" if u < 0.02 else ("G2" if u < 0.07 else ("G3" if u < 0.19 else cls))
+            name = f"{word}賞({cls})" if cls.startswith("G") else f"{_kana_name(rng)}ステークス"
+        elif race_no in (9, 10, 12):
+            name = f"{word}特別"
+        else:
+            name = f"{cond}{cls}"
+    distance = int(dists[int(rng.choice(len(dists), p=np.asarray(p) / np.sum(p)))])
+    weather = _pick(rng, *_WEATHER)
+    if weather == "雪" and d.month not in (12, 1, 2):
+        weather = "曇"
+    wet = weather in ("小雨", "雨", "雪")
+    going = _pick(rng, _GOING, (0.25, 0.3, 0.3, 0.15) if wet else (0.8, 0.13, 0.05, 0.02))
+    if track == "障害":
+        direction = ""
+    else:
+        direction = "左" if venue in _LEFT_TURN else "右"
+        if track == "芝" and venue in ("04", "05", "08", "09", "06") and rng.random() < 0.3:
+            direction += "外" if rng.random() < 0.7 else "内"
+    minutes = 9 * 60 + 50 + (race_no - 1) * 30 + (15 if nar else 0)
+    return {
+        "track": track, "distance": distance, "race_class": cls, "race_name": name,
+        "weather": weather, "going": going, "direction": direction,
+        "post_time": f"{minutes // 60}:{minutes % 60:02d}",
+    }
+
+
+def _laps(rng: np.random.Generator, distance: int, winner_sec: float) -> Tuple[Dict[int, float], Dict[int, float]]:
+    """勝ちタイムに合う累積・区間ラップ（スクレイパーと同じ丸め順）"""
+    n = distance // 200
+    shape = np.zeros(n)
+    shape[0] = 0.8
+    shape[-3:] += rng.normal(0.0, 0.35, min(3, n)).cumsum()
+    raw = winner_sec / n + shape + rng.normal(0.0, 0.2, n)
+    cum = np.cumsum(raw * (winner_sec / raw.sum()))
+    lap_cumulative = {200 * (k + 1): float(f"{cum[k]:.1f}") for k in range(n)}
+    lap_sectional: Dict[int, float] = {}
+    prev = 0.0
+    for d in sorted(lap_cumulative):
+        lap_sectional[d] = round(lap_cumulative[d] - prev, 1)
+        prev = lap_cumulative[d]
+    return lap_cumulative, lap_sectional
+
+
+def _harville(p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """単勝確率 → 馬単（i→j）と三連単（i→j→k）の確率テンソル"""
+    n = len(p)
+    eye = np.eye(n, dtype=bool)
+    ex = p[:, None] * p[None, :] / np.maximum(1.0 - p[:, None], 1e-9)
+    ex[eye] = 0.0
+    rest = np.maximum(1.0 - p[:, None] - p[None, :], 1e-9)
+    tri = ex[:, :, None] * p[None, None, :] / rest[:, :, None]
+    idx = np.arange(n)
+    tri[idx, :, idx] = 0.0
+    tri[:, idx, idx] = 0.0
+    tri[idx, idx, :] = 0.0
+    return ex, tri
+
+
+def _payout(bet: str, prob: float) -> int:
+    return max(100, int(round(_TAKEOUT[bet] / max(prob, 1e-9) * 10)) * 10)
+
+
+def _return_tables(odds: np.ndarray, pops: np.ndarray, p: np.ndarray, order: np.ndarray,
+                   numbers: np.ndarray, brackets: np.ndarray) -> List[dict]:
+    """出走馬（取消除く）の払戻表。order は着順どおりの index、p は市場の単勝確率"""
+    rows: List[dict] = []
+    n = len(order)
+
+    def add(bet: str, combo: str, prob: float, pop: int, payout: Optional[int] = None) -> None:
+        rows.append({"bet_type": bet, "combinations": combo,
+                     "payout": payout if payout is not None else _payout(bet, prob), "popularity": int(pop)})
+
+    w = int(order[0])
+    add("単勝", str(numbers[w]), 0.0, pops[w], int(round(odds[w] * 100)))
+    k_place = 3 if n >= 8 else (2 if n >= 5 else 0)
+    for j in order[:k_place]:
+        add("複勝", str(numbers[j]), 0.0, pops[j], max(100, int(round((1.0 + (odds[j] - 1.0) / 4.5) * 10)) * 10))
+    if n < 2:
+        return rows
+    ex, tri = _harville(p)
+    quin = ex + ex.T
+    a, b = int(order[0]), int(order[1])
+    if n >= 9:
+        n_br = int(brackets.max())
+        onehot = np.zeros((n, n_br))
+        onehot[np.arange(n), brackets - 1] = 1.0
+        br = onehot.T @ np.triu(quin) @ onehot
+        br = np.triu(br + br.T - np.diag(np.diag(br)))
+        x, y = sorted((int(brackets[a]), int(brackets[b])))
+        pr = br[x - 1, y - 1]
+        add("枠連", f"{x} - {y}", pr, 1 + int((br > pr).sum()))
+    lo, hi = sorted((a, b), key=lambda i: numbers[i])
+    add("馬連", f"{numbers[lo]} - {numbers[hi]}", quin[a, b], 1 + int((np.triu(quin) > quin[a, b]).sum()))
+    if n >= 3:
+        trio = sum(tri.transpose(t) for t in ((0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)))
+        wide = trio.sum(axis=2)
+        upper_wide = np.triu(wide, 1)
+        top3 = sorted((int(i) for i in order[:3]), key=lambda i: numbers[i])
+        for i, j in ((0, 1), (0, 2), (1, 2)):
+            hi_, hj = top3[i], top3[j]
+            add("ワイド", f"{numbers[hi_]} - {numbers[hj]}", wide[hi_, hj],
+                1 + int((upper_wide > wide[hi_, hj]).sum()))
+    add("馬単", f"{numbers[a]} → {numbers[b]}", ex[a, b], 1 + int((ex > ex[a, b]).sum()))
+    if n >= 3:
+        c = int(order[2])
+        s = sorted((a, b, c), key=lambda i: numbers[i])
+        add("三連複", " - ".join(str(numbers[i]) for i in s), trio[a, b, c],
+            1 + int((trio > trio[a, b, c]).sum()) // 6)
+        add("三連単", f"{numbers[a]} → {numbers[b]} → {numbers[c]}", tri[a, b, c],
+            1 + int((tri > tri[a, b, c]).sum()))
+    return rows
+
+
+def _prev_record(race_info: dict, venue_label: str, finish: Any, time_str: str, weight_kg: Optional[int],
+                 distance: int, track: str) -> Dict[str, Any]:
+    """馬ページの成績 1 行を scraping/horse.py が読む形で保持する"""
+    rec: Dict[str, Any] = {
+        "race_date": f"{race_info['date'][:4]}/{race_info['date'][4:6]}/{race_info['date'][6:]}",
+        "race_venue": venue_label,
+    }
+    if isinstance(finish, int):
+        rec["race_finish"] = finish
+    t = _time_seconds(time_str) if time_str else None
+    if t is not None:
+        rec["race_time"] = t
+    if weight_kg is not None:
+        rec["race_weight"] = weight_kg
+    rec["race_distance"] = distance
+    if track in ("芝", "ダート"):
+        rec["race_surface"] = track
+    return rec
+
+
+def _horse_detail(h: _Horse) -> Dict[str, Any]:
+    """scrape_horse_detail が返す馬詳細（B 始まりの地方馬は血統のみ）"""
+    if h.local_id:
+        return {"sire": h.sire, "dam": h.dam, "damsire": h.damsire}
+    out: Dict[str, Any] = {
+        "horse_birth_date": f"{h.birth.year}年{h.birth.month}月{h.birth.day}日",
+        "horse_owner": h.owner,
+        "horse_breeder": h.breeder,
+        "horse_breeding_farm": h.farm,
+        "horse_total_runs": h.runs,
+        "horse_total_wins": h.wins,
+        "horse_total_prize_money": float(int(h.prize_man)) * 10000,
+        "sire": h.sire, "dam": h.dam, "damsire": h.damsire,
+    }
+    for pfx, rec in (("prev", h.prev), ("prev2", h.prev2)):
+        if rec:
+            out.update({f"{pfx}_{k}": v for k, v in rec.items()})
+    return out
+
+
+def _make_race(rng: np.random.Generator, pool: _Pool, d: date, venue: str, kai: int, nichi: int,
+               race_no: int, scratch_share: float, invalid: bool) -> dict:
+    nar = pool.nar
+    cond = _race_conditions(rng, d, venue, race_no, nar)
+    track, distance = cond["track"], cond["distance"]
+    n = int(rng.integers(6, 13)) if nar else int(min(18, max(7, round(rng.normal(14.5, 2.5)))))
+    if track == "障害":
+        n = min(n, 14)
+    race_id = f"{d.year}{venue}{d.month:02d}{d.day:02d}{race_no:02d}" if nar \
+        else f"{d.year}{venue}{kai:02d}{nichi:02d}{race_no:02d}"
+    venue_name = (_NAR_VENUES if nar else _JRA_VENUES)[venue]
+
+    positions, horses = pool.draw(rng, n, d)
+    ages = np.array([d.year - h.birth.year for h in horses])
+    ability = np.array([h.ability for h in horses]) + 0.25 * np.minimum(ages - 2, 2) - 0.2 * np.maximum(ages - 5, 0)
+    jockey_idx = rng.integers(0, len(pool.jockeys), n)
+    aptitude = -((distance - np.array([h.pref_dist for h in horses])) / 700.0) ** 2
+    if track == "芝":
+        aptitude = aptitude + np.array([h.turf_apt for h in horses])
+    base = ability + 0.25 * pool.jockey_skill[jockey_idx] + aptitude
+    scratched = rng.random(n) < scratch_share
+    if scratched.all():
+        scratched[:] = False
+    runners = np.flatnonzero(~scratched)
+    strength = base[runners] + rng.normal(0.0, 1.2, len(runners))
+    order = runners[np.argsort(-strength, kind="stable")]            # 着順どおりの index
+    finish = np.zeros(n, dtype=int)
+    finish[order] = np.arange(1, len(order) + 1)
+
+    # 市場（単勝オッズ・人気）
+    score = 0.8 * (base[runners] + rng.normal(0.0, 0.5, len(runners)))
+    p_run = np.exp(score - score.max())
+    p_run /= p_run.sum()
+    odds_run = np.clip(np.round(0.8 / p_run, 1), 1.0, 999.9)
+    odds = np.full(n, np.nan)
+    odds[runners] = odds_run
+    pops = np.zeros(n, dtype=int)
+    pops[runners[np.argsort(odds_run, kind="stable")]] = np.arange(1, len(runners) + 1)
+
+    # タイム・ラップ
+    speed = 14.8 if (nar and track == "ダート") else _SPEED[track]
+    speed *= _GOING_FACTOR.get(track, _GOING_FACTOR["芝"])[cond["going"]] if track != "障害" else 1.0
+    level = _CLASS_LEVEL.get(cond["race_class"], 1)
+    winner_sec = distance / (speed * (1.0 + 0.004 * level)) * (1.0 + rng.normal(0.0, 0.006))
+    lap_cumulative: Dict[int, float] = {}
+    lap_sectional: Dict[int, float] = {}
+    if track != "障害" and distance % 200 == 0 and not invalid:
+        lap_cumulative, lap_sectional = _laps(rng, distance, winner_sec)
+        winner_sec = lap_cumulative[distance]
+    gaps = np.concatenate([[0.0], rng.exponential(0.18 if track != "障害" else 0.6, len(order) - 1)])
+    raw_times = winner_sec + np.cumsum(gaps)
+    tenths = np.round(raw_times * 10).astype(int)
+    time_by = {int(i): int(t) for i, t in zip(order, tenths)}
+    margin_by = {int(order[0]): ""}
+    for k in range(1, len(order)):
+        margin_by[int(order[k])] = _margin(float(gaps[k]), tenths[k] == tenths[k - 1])
+
+    # 上り 3F・通過順
+    l3_base = (34.6 if track == "芝" else (37.6 if track == "ダート" else 39.0)) + (distance - 1600) / 1000 * 0.8
+    style = np.array([h.style for h in horses])
+    last3f = {int(i): l3_base + 0.06 * k + 0.25 * style[i] + rng.normal(0.0, 0.45) for k, i in enumerate(order)}
+    n_corner = 2 if distance <= 1400 else (3 if distance <= 1600 else 4)
+    if track == "障害":
+        n_corner = 4
+    early = np.argsort(np.argsort(-style[order] + rng.normal(0.0, 0.6, len(order))))
+    corners: Dict[int, List[int]] = {int(i): [] for i in order}
+    for c in range(n_corner):
+        mix = (c + 1) / (n_corner + 1)
+        s = (1 - mix) * early + mix * np.arange(len(order)) + rng.normal(0.0, 1.2, len(order))
+        rank = np.argsort(np.argsort(s, kind="stable"), kind="stable") + 1
+        for k, i in enumerate(order):
+            corners[int(i)].append(int(rank[k]))
+
+    race_info = {
+        "race_id": race_id,
+        "race_name": cond["race_name"],
+        "venue": venue_name,
+        "date": d.strftime("%Y%m%d"),
+        "post_time": cond["post_time"],
+        "race_class": cond["race_class"],
+        "kai": kai,
+        "day": nichi,
+        "course_direction": "" if invalid else cond["direction"],
+        "distance": 0 if invalid else distance,
+        "track_type": "" if invalid else track,
+        "weather": cond["weather"],
+        "field_condition": cond["going"],
+        "num_horses": n,
+        "surface": None,
+        "lap_cumulative": lap_cumulative,
+        "lap_sectional": lap_sectional,
+        **({"_invalid_distance": True, "_skip_reason": "distance=0: HTMLからの距離パース失敗"} if invalid else {}),
+    }
+
+    numbers = np.arange(1, n + 1)
+    brackets = np.array(_brackets(n))
+    first_prize = _FIRST_PRIZE_MAN.get(cond["race_class"], 560)
+    venue_label = f"{kai}{venue_name}{nichi}"
+    rows: List[dict] = []
+    retire: List[int] = []
+    for k, h in enumerate(horses):
+        sc = bool(scratched[k])
+        fin: Any = "取" if sc else int(finish[k])
+        age = int(ages[k])
+        jw = (55.0 if age == 2 else (57.0 if age == 3 else 58.0)) - (2.0 if h.sex == "牝" else 0.0)
+        if nar:
+            jw -= 1.0
+        if rng.random() < 0.1:
+            jw -= float(rng.integers(1, 4))
+        change = 0 if h.runs == 0 else int(np.clip(round(rng.normal(0.0, 4.0) / 2) * 2, -20, 20))
+        h.weight = int(np.clip(h.weight + change, 360, 600))
+        jockey_id, jockey_name = pool.jockeys[int(jockey_idx[k])]
+        trainer_id, trainer_name = h.trainer
+        prize_t = ""
+        if not sc and int(fin) <= len(_PRIZE_SHARE):
+            prize_t = f"{first_prize * _PRIZE_SHARE[int(fin) - 1]:,.1f}"
+        time_str = "" if sc else _fmt_time(time_by[k])
+        corner_list = [] if sc else corners[k]
+        weight_kg = None if sc else h.weight
+        row = {
+            "race_id": race_id,
+            "finish_position": fin,
+            "bracket_number": int(brackets[k]),
+            "horse_number": int(numbers[k]),
+            "horse_name": h.name,
+            "horse_url": f"{_NETKEIBA}/horse/{h.horse_id}/",
+            "horse_id": h.horse_id,
+            "sex_age": f"{h.sex}{age}",
+            "sex": h.sex,
+            "age": age,
+            "jockey_weight": jw,
+            "jockey_name": jockey_name,
+            "jockey_url": f"{_NETKEIBA}/jockey/result/recent/{jockey_id}/",
+            "jockey_id": jockey_id,
+            "finish_time": time_str,
+            "margin": "" if sc else margin_by[k],
+            "odds": None if sc else float(odds[k]),
+            "popularity": None if sc else int(pops[k]),
+            "corner_positions": "-".join(map(str, corner_list)),
+            "corner_positions_list": corner_list,
+            "corner_1": corner_list[0] if len(corner_list) >= 1 else None,
+            "corner_2": corner_list[1] if len(corner_list) >= 2 else None,
+            "corner_3": corner_list[2] if len(corner_list) >= 3 else None,
+            "corner_4": corner_list[3] if len(corner_list) >= 4 else None,
+            "last_3f": "" if sc else f"{last3f[k]:.1f}",
+            "weight": "計不" if sc else f"{h.weight}({change:+d})" if change else f"{h.weight}(0)",
+            "weight_kg": weight_kg,
+            "weight_change": None if sc else change,
+            "trainer_name": trainer_name,
+            "trainer_url": f"{_NETKEIBA}/trainer/result/recent/{trainer_id}/",
+            "trainer_id": trainer_id,
+            "prize_money": float(prize_t.replace(",", "")) * 10000 if prize_t else None,
+        }
+        # スクレイプ直後の馬ページ = 当該レースまでを含む通算成績・直近 2 走
+        if not sc:
+            h.runs += 1
+            h.wins += int(fin == 1)
+            if not nar and prize_t:
+                h.prize_man += float(prize_t.replace(",", ""))
+        h.prev2 = h.prev
+        h.prev = _prev_record(race_info, venue_label, fin, time_str, weight_kg, distance, track)
+        rows.append(row)
+        if age >= 8 or rng.random() < 1.0 / _MEAN_CAREER_RUNS:
+            retire.append(int(positions[k]))
+
+    # last_3f_rank（scrape_race_full と同じ順位付け）
+    vals = [float(r["last_3f"]) if r["last_3f"] else float("inf") for r in rows]
+    ranked = sorted(range(len(vals)), key=lambda i: vals[i])
+    ranks = [0] * len(rows)
+    for rank, i in enumerate(ranked):
+        if vals[i] != float("inf"):
+            ranks[i] = rank + 1
+    for r, rank, h in zip(rows, ranks, horses):
+        r["last_3f_rank"] = rank or None
+        r.update(_horse_detail(h))
+    pool.retire(retire)
+
+    return_tables = _return_tables(odds[runners], pops[runners], p_run, np.searchsorted(runners, order),
+                                   numbers[runners], brackets[runners])
+    return {"race_info": race_info, "horses": rows, "return_tables": return_tables}
+
+
+def generate_races(
+    n_rows: int,
+    seed: int = 0,
+    start: date = DEFAULT_START,
+    nar_share: float = 0.3,
+    b_id_share: float = 0.3,
+    scratch_share: float = 0.005,
+    invalid_share: float = 0.002,
+) -> Iterator[dict]:
+    """合成レースを日付順に返す（race_results_ultimate の行数が n_rows に達したレースで止める）
+
+    返り値は scrape_race_full と同じ {"race_info", "horses", "return_tables"}。
+    nar_share: 全レースに占める地方競馬の割合の目安（平日 1 場・最大 12R/日）
+    b_id_share: 地方馬のうち "B" 始まり ID（血統のみ取得できる馬）の割合
+    scratch_share / invalid_share: 出走取消の頭数割合 / 距離パース失敗レースの割合
+    """
+    rng = np.random.default_rng(seed)
+    nar_per_day = 0
+    if nar_share > 0:
+        nar_per_day = int(min(12, max(1, round(JRA_RACES_PER_WEEK * nar_share / (1.0 - nar_share) / 5))))
+    target = int(np.clip(n_rows // 20, 60, _MAX_ACTIVE))
+    sires = [_kana_name(rng, 4, 8) for _ in range(80)]
+    sire_p = 1.0 / np.arange(1, len(sires) + 1) ** 1.1
+    sire_p /= sire_p.sum()
+    pools = {
+        False: _Pool(rng, False, target, b_id_share, sires, sire_p),
+        True: _Pool(rng, True, max(60, int(target * nar_share)), b_id_share, sires, sire_p),
+    }
+    rows = 0
+    for d, venue, kai, nichi, race_no, nar in _schedule(start, nar_per_day):
+        if rows >= n_rows:
+            return
+        race = _make_race(rng, pools[nar], d, venue, kai, nichi, race_no, scratch_share,
+                          invalid=bool(rng.random() < invalid_share))
+        rows += len(race["horses"])
+        yield race
+
+
+# ===========================================================================
+# keiba_ultimate.db
+# ===========================================================================
+
+def _fresh_sqlite(path: Path, overwrite: bool) -> None:
+    if path.exists():
+        if not overwrite:
+            raise FileExistsError(f"{path} が既に存在します（overwrite=True で作り直し）")
+        for p in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+            p.unlink(missing_ok=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+
+def write_ultimate_db(db_path: Path, n_rows: int, seed: int = 0, overwrite: bool = False,
+                      batch_races: int = 500, verbose: bool = False, **kwargs: Any) -> Dict[str, Any]:
+    """generate_races の結果を keiba_ultimate.db と同じスキーマ（WAL）で書き出す
+
+    scraped_dates に開催日ごとのレース数を、data_version_log に全件入れ替え（race_id=NULL）を記録する。
+    kwargs は generate_races に渡す。返り値は行数・レース数・開催日の要約。
+    """
+    db_path = Path(db_path)
+    _fresh_sqlite(db_path, overwrite)
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    for ddl in _RACES_DDL:
+        conn.execute(ddl)
+    races: List[Tuple[str, str]] = []
+    results: List[Tuple[str, str]] = []
+    returns: List[Tuple[Any, ...]] = []
+    per_date: Dict[str, int] = {}
+    n_races = n_result_rows = n_return_rows = 0
+    t0 = time.perf_counter()
+
+    def flush() -> None:
+        conn.executemany("INSERT INTO races_ultimate (race_id, data) VALUES (?, ?)", races)
+        conn.executemany("INSERT INTO race_results_ultimate (race_id, data) VALUES (?, ?)", results)
+        conn.executemany(
+            "INSERT INTO return_tables_ultimate (race_id, bet_type, combinations, payout, popularity)"
+            " VALUES (?, ?, ?, ?, ?)", returns)
+        conn.commit()
+        races.clear()
+        results.clear()
+        returns.clear()
+
+    for race in generate_races(n_rows, seed, **kwargs):
+        info = race["race_info"]
+        rid = info["race_id"]
+        races.append((rid, json.dumps(info, ensure_ascii=False)))
+        results.extend((rid, json.dumps(h, ensure_ascii=False)) for h in race["horses"])
+        returns.extend((rid, rt["bet_type"], rt["combinations"], rt["payout"], rt["popularity"])
+                       for rt in race["return_tables"])
+        per_date[info["date"]] = per_date.get(info["date"], 0) + 1
+        n_races += 1
+        n_result_rows += len(race["horses"])
+        n_return_rows += len(race["return_tables"])
+        if len(races) >= batch_races:
+            flush()
+            if verbose:
+                print(f"  {n_result_rows:,} / {n_rows:,} 行 ({time.perf_counter() - t0:.1f}s)")
+    flush()
+    conn.executemany("INSERT OR REPLACE INTO scraped_dates (date, race_count, no_race) VALUES (?, ?, 0)",
+                     sorted(per_date.items()))
+    conn.execute("INSERT INTO data_version_log (race_id) VALUES (NULL)")
+    conn.commit()
+    conn.close()
+    dates = sorted(per_date)
+    return {"db": str(db_path), "seed": seed, "races": n_races, "rows": n_result_rows,
+            "return_rows": n_return_rows, "first_date": dates[0] if dates else None,
+            "last_date": dates[-1] if dates else None, "dates": dates,
+            "elapsed_sec": round(time.perf_counter() - t0, 2)}
+
+
+# ===========================================================================
+# fetch_cache.db（db.netkeiba.com の HTML）
+# ===========================================================================
+
+def _td(v: Any, cls: str = "") -> str:
+    return f'<td class="{cls}">{v}</td>' if cls else f"<td>{v}</td>"
+
+
+def render_race_html(race: dict) -> str:
+    """レース結果ページ（/race/{race_id}/）。scrape_race_full が race/horses/払戻を読み戻せる形"""
+    info, horses = race["race_info"], race["horses"]
+    e = html.escape
+    y, m, d = info["date"][:4], int(info["date"][4:6]), int(info["date"][6:])
+    track = info["track_type"]
+    if info.get("_invalid_distance"):
+        course = ""
+    elif track == "障害":
+        course = f"障害{info['distance']}m / "
+    else:
+        course = f"{'芝' if track == '芝' else 'ダ'}{info['course_direction']}{info['distance']}m / "
+    going_label = "ダート" if track == "ダート" else "芝"
+    cls = info["race_class"]
+    cls_text = "オープン" if cls.startswith("G") else cls
+    cond = "" if cls_text[0] in "ABC" or cls_text.endswith("歳") else (
+        "2歳" if cls in ("新馬",) else "3歳以上")
+    smalltxt = f"{y}年{m}月{d}日 {info['kai']}回{info['venue']}{info['day']}日目 {cond}{cls_text}"
+    header = ["着順", "枠番", "馬番", "馬名", "性齢", "斤量", "騎手", "タイム", "着差", "ﾀｲﾑ指数", "通過", "上り",
+              "単勝", "人気", "馬体重", "調教ﾀｲﾑ", "厩舎ｺﾒﾝﾄ", "備考", "調教師", "馬主", "賞金(万円)"]
+    out = [
+        "<html><head><meta charset=\"EUC-JP\">",
+        f"<title>{e(info['race_name'])}｜{y}年{m}月{d}日 {e(info['venue'])} | netkeiba</title></head><body>",
+        '<div class="data_intro"><div class="mainrace_data fc"><dl class="racedata fc">',
+        f"<dt>{int(info['race_id'][-2:])} R</dt><dd><h1>{e(info['race_name'])}</h1>",
+        f"<p><span>{course}天候 : {info['weather']} / {going_label} : {info['field_condition']}"
+        f" / 発走 : {info['post_time']}</span></p></dd></dl>",
+        f'<p class="smalltxt">{smalltxt}</p></div></div>',
+        '<table class="race_table_01 nk_tb_common" summary="レース結果"><tr>',
+        "".join(f"<th>{h}</th>" for h in header), "</tr>",
+    ]
+    for h in horses:
+        prize = h["prize_money"]
+        out.append("<tr>" + "".join([
+            _td(h["finish_position"]), _td(h["bracket_number"]), _td(h["horse_number"]),
+            _td(f'<a href="/horse/{h["horse_id"]}/" title="{e(h["horse_name"])}">{e(h["horse_name"])}</a>'),
+            _td(h["sex_age"]), _td(f"{h['jockey_weight']:.1f}"),
+            _td(f'<a href="/jockey/result/recent/{h["jockey_id"]}/">{e(h["jockey_name"])}</a>'),
+            _td(h["finish_time"]), _td(h["margin"]), _td("**"), _td(h["corner_positions"]), _td(h["last_3f"]),
+            _td("---" if h["odds"] is None else f"{h['odds']:.1f}", "txt_r"),
+            _td("" if h["popularity"] is None else h["popularity"]), _td(h["weight"]), _td(""), _td(""), _td(""),
+            _td(f'[{"地" if h["trainer_id"].startswith("a") else "東"}] '
+                f'<a href="/trainer/result/recent/{h["trainer_id"]}/">{e(h["trainer_name"])}</a>'),
+            _td(e(h.get("horse_owner", ""))),
+            _td("" if prize is None else f"{prize / 10000:,.1f}", "txt_r"),
+        ]) + "</tr>")
+    out.append("</table>")
+    if info["lap_cumulative"]:
+        dists = sorted(info["lap_cumulative"])
+        out.append('<table class="Race_HaronTime"><tr class="Header">'
+                   + "".join(f"<th>{k}m</th>" for k in dists) + "</tr>"
+                   + '<tr class="HaronTime">' + "".join(_td(f"{info['lap_cumulative'][k]:.1f}") for k in dists)
+                   + "</tr>" + '<tr class="HaronTime">'
+                   + "".join(_td(f"{info['lap_sectional'][k]:.1f}") for k in dists) + "</tr></table>")
+    grouped: Dict[str, List[dict]] = {}
+    for rt in race["return_tables"]:
+        grouped.setdefault(rt["bet_type"], []).append(rt)
+    out.append('<div class="result_info box_left"><table class="pay_table_01" summary="払い戻し">')
+    for bet, items in grouped.items():
+        out.append(f"<tr><th>{bet}</th>"
+                   + _td("<br />".join(it["combinations"] for it in items))
+                   + _td("<br />".join(f"{it['payout']:,}" for it in items), "txt_r")
+                   + _td("<br />".join("" if it["popularity"] is None else str(it["popularity"]) for it in items),
+                         "txt_r") + "</tr>")
+    out.append("</table></div></body></html>")
+    return "\n".join(out)
+
+
+def render_horse_html(horse: dict) -> str:
+    """馬ページ（/horse/{horse_id}/）: プロフィール表と直近 2 走の成績表"""
+    e = html.escape
+    prize_man = int(horse.get("horse_total_prize_money") or 0) // 10000
+    out = [
+        f"<html><head><meta charset=\"EUC-JP\"><title>{e(horse['horse_name'])} | 競走馬データ - netkeiba</title>"
+        f"</head><body><div class=\"horse_title\"><h1>{e(horse['horse_name'])}</h1></div>",
+        '<table class="db_prof_table no_OwnerUnit" summary="のプロフィール">',
+        f"<tr><th>生年月日</th><td>{horse['horse_birth_date']}</td></tr>",
+        f'<tr><th>調教師</th><td><a href="/trainer/{horse["trainer_id"]}/">{e(horse["trainer_name"])}</a></td></tr>',
+        f"<tr><th>馬主</th><td>{e(horse['horse_owner'])}</td></tr>",
+        f"<tr><th>生産者</th><td>{e(horse['horse_breeder'])}</td></tr>",
+        f"<tr><th>産地</th><td>{horse['horse_breeding_farm']}</td></tr>",
+        f"<tr><th>獲得賞金 (中央)</th><td>{prize_man:,}万円</td></tr>",
+        f"<tr><th>通算成績</th><td>{horse['horse_total_runs']}戦{horse['horse_total_wins']}勝</td></tr>",
+        "</table>",
+        '<table class="db_h_race_results nk_tb_common"><thead><tr>'
+        "<th>日付</th><th>開催</th><th>天気</th><th>R</th><th>レース名</th><th>頭数</th><th>着順</th>"
+        "<th>距離</th><th>馬場</th><th>タイム</th><th>馬体重</th></tr></thead><tbody>",
+    ]
+    for pfx in ("prev", "prev2"):
+        if f"{pfx}_race_date" not in horse:
+            continue
+        t = horse.get(f"{pfx}_race_time")
+        time_cell = "" if t is None else _fmt_time(int(round(t * 10)))
+        surface = horse.get(f"{pfx}_race_surface")
+        course = {"芝": "芝", "ダート": "ダ"}.get(surface or "", "障")
+        finish = horse.get(f"{pfx}_race_finish", "取")
+        weight = horse.get(f"{pfx}_race_weight")
+        out.append("<tr>" + "".join([
+            _td(horse[f"{pfx}_race_date"]), _td(horse[f"{pfx}_race_venue"]), _td(""), _td(""), _td(""), _td(""),
+            _td(finish), _td(f"{course}{horse[f'{pfx}_race_distance']}"), _td(""), _td(time_cell),
+            _td("計不" if weight is None else f"{weight}(0)"),
+        ]) + "</tr>")
+    out.append("</tbody></table></body></html>")
+    return "\n".join(out)
+
+
+def render_ped_html(horse: dict) -> str:
+    """血統ページ（/horse/ped/{horse_id}/）。unknown_local の馬は血統表なし"""
+    e = html.escape
+    body = ""
+    if horse.get("sire") and horse["sire"] != "unknown_local":
+        body = (
+            '<table class="blood_table detail" summary="5代血統表">'
+            f'<tr><td rowspan="2" class="b_ml"><a href="/horse/ped/sire/">{e(horse["sire"])}</a></td>'
+            "<td><a>-</a></td></tr><tr><td><a>-</a></td></tr>"
+            f'<tr><td rowspan="2" class="b_fml"><a href="/horse/ped/dam/">{e(horse["dam"])}</a></td>'
+            f'<td><a href="/horse/ped/damsire/">{e(horse["damsire"])}</a></td></tr><tr><td><a>-</a></td></tr>'
+            "</table>"
+        )
+    return (f"<html><head><meta charset=\"EUC-JP\"><title>{e(horse['horse_name'])}の血統表 | netkeiba</title>"
+            f"</head><body>{body}</body></html>")
+
+
+def write_fetch_cache(cache_path: Path, n_rows: int, seed: int = 0, overwrite: bool = False,
+                      horse_pages: bool = True, ttl_days: float = 3650.0, batch_races: int = 200,
+                      **kwargs: Any) -> Dict[str, Any]:
+    """fetch_cache.db の http_cache に合成 HTML（EUC-JP）を書き出す
+
+    レースページに加え、horse_pages=True なら馬ページと血統ページも書く（同じ馬は最後の出走時点で上書き）。
+    quick_mode=True の scrape_race_full はネットワークなしで全ページをキャッシュから読める。
+    fetch_resume は空のまま（成功済み resume 行があると本文なしで返るため）。
+    """
+    cache_path = Path(cache_path)
+    _fresh_sqlite(cache_path, overwrite)
+    conn = sqlite3.connect(str(cache_path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    for ddl in _CACHE_DDL:
+        conn.execute(ddl)
+    headers = json.dumps({"Content-Type": "text/html; charset=EUC-JP"})
+    now = time.time()
+    expires = now + ttl_days * 86400
+    pending: Dict[str, bytes] = {}
+    pages = races = body_bytes = 0
+
+    def flush() -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO http_cache"
+            " (normalized_url, final_url, status, headers_json, body, fetched_at, expires_at)"
+            " VALUES (?, ?, 200, ?, ?, ?, ?)",
+            [(u, u, headers, b, now, expires) for u, b in pending.items()])
+        conn.commit()
+        pending.clear()
+
+    for race in generate_races(n_rows, seed, **kwargs):
+        pending[f"{_NETKEIBA}/race/{race['race_info']['race_id']}/"] = render_race_html(race).encode("euc-jp")
+        if horse_pages:
+            for h in race["horses"]:
+                pending[f"{_NETKEIBA}/horse/ped/{h['horse_id']}/"] = render_ped_html(h).encode("euc-jp")
+                if "horse_birth_date" in h:
+                    pending[h["horse_url"]] = render_horse_html(h).encode("euc-jp")
+        races += 1
+        if races % batch_races == 0:
+            pages += len(pending)
+            body_bytes += sum(len(b) for b in pending.values())
+            flush()
+    pages += len(pending)
+    body_bytes += sum(len(b) for b in pending.values())
+    flush()
+    unique_pages = conn.execute("SELECT COUNT(*) FROM http_cache").fetchone()[0]
+    conn.close()
+    return {"cache": str(cache_path), "seed": seed, "races": races, "pages_written": pages,
+            "pages": int(unique_pages), "body_mb": round(body_bytes / 1024 / 1024, 1)}
+
+
+# ===========================================================================
+# CLI
+# ===========================================================================
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    p = argparse.ArgumentParser(description="Generate a synthetic keiba_ultimate.db / fetch_cache.db.")
+    p.add_argument("--rows", type=int, default=100_000, help="race_results_ultimate rows (1k-10M)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--db", default=None, help="output keiba_ultimate.db path")
+    p.add_argument("--fetch-cache", default=None, help="output fetch_cache.db path (synthetic HTML)")
+    p.add_argument("--cache-rows", type=int, default=None, help="rows covered by --fetch-cache (default: --rows)")
+    p.add_argument("--no-horse-pages", action="store_true")
+    p.add_argument("--start", default=DEFAULT_START.isoformat(), help="first race date (YYYY-MM-DD)")
+    p.add_argument("--nar-share", type=float, default=0.3)
+    p.add_argument("--overwrite", action="store_true")
+    args = p.parse_args(argv)
+    if not args.db and not args.fetch_cache:
+        p.error("--db と --fetch-cache の少なくとも一方を指定してください")
+
+    gen_kwargs = {"start": date.fromisoformat(args.start), "nar_share": args.nar_share}
+    if args.db:
+        summary = write_ultimate_db(Path(args.db), args.rows, args.seed, overwrite=args.overwrite,
+                                    verbose=True, **gen_kwargs)
+        print(f"✓ {summary['db']}: {summary['races']:,} races / {summary['rows']:,} rows / "
+              f"{summary['return_rows']:,} payouts ({summary['first_date']}〜{summary['last_date']}, "
+              f"{summary['elapsed_sec']}s)")
+    if args.fetch_cache:
+        summary = write_fetch_cache(Path(args.fetch_cache), args.cache_rows or args.rows, args.seed,
+                                    overwrite=args.overwrite, horse_pages=not args.no_horse_pages, **gen_kwargs)
+        print(f"✓ {summary['cache']}: {summary['races']:,} races / {summary['pages']:,} pages "
+              f"({summary['body_mb']} MB)")
+
+
+if __name__ == "__main__":
+    main()
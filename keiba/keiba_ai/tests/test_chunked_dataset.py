@@ -0,0 +1,110 @@
+"""
+日付チャンク単位のアウトオブコア学習データ構築（keiba_ai.training.chunked）のテスト
+
+DB 不要。小さな合成レースフレームで以下を検証する:
+  - race_date の月単位チャンク分割
+  - memmap（float32）への書き込みと行の日付昇順
+  - 時系列分割 index と LightGBM binary の往復
+  - 事前計算した履歴統計の引き当てが全履歴からの再計算と一致すること
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+sys.path.insert(0, str(_HERE.parent.parent.parent.parent / "python-api"))
+
+from keiba_ai.feature_engineering import add_derived_features, precompute_history_features  # type: ignore
+from keiba_ai.training.chunked import build_chunked_dataset, iter_date_chunks  # type: ignore
+
+lgb = pytest.importorskip("lightgbm")
+
+
+def _make_raw(n_days: int = 16, races_per_day: int = 2, horses: int = 10, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for d in pd.date_range("2023-01-07", periods=n_days, freq="14D"):
+        for r in range(races_per_day):
+            rid = f"{d:%Y}05{d:%m%d}{r + 1:02d}"
+            odds = np.round(rng.gamma(2, 8, horses) + 1.1, 1)
+            fin = np.argsort(np.argsort(odds + rng.normal(0, 10, horses))) + 1
+            dist = int(rng.choice([1200, 1600, 2000]))
+            for i in range(horses):
+                rows.append({
+                    "race_id": rid, "race_date": f"{d:%Y%m%d}",
+                    "horse_id": f"h{rng.integers(60):03d}", "jockey_id": f"j{rng.integers(10)}",
+                    "trainer_id": f"t{rng.integers(8)}", "finish": int(fin[i]),
+                    "horse_number": i + 1, "odds": float(odds[i]), "distance": dist,
+                    "surface": "芝" if r % 2 else "ダ", "venue": "東京", "num_horses": horses,
+                    "time_seconds": dist / 16.0 + float(rng.normal(0, 1)),
+                })
+    return pd.DataFrame(rows)
+
+
+class TestIterDateChunks:
+    def test_month_buckets_in_order(self):
+        rd = pd.Series(["20230105", "20230220", "20230301", "20230415", "bad", "20230702"])
+        chunks = list(iter_date_chunks(rd, 2))
+        assert [(a, b) for a, b, _ in chunks] == [
+            ("20230105", "20230220"), ("20230301", "20230415"), ("20230702", "20230702"),
+        ]
+        covered = np.zeros(len(rd), dtype=bool)
+        for _, _, m in chunks:
+            assert not (covered & m).any()
+            covered |= m
+        assert covered.tolist() == [True, True, True, True, False, True]
+
+
+class TestBuildChunkedDataset:
+    def test_memmap_rows_sorted_and_trainable(self, tmp_path, capsys):
+        df = _make_raw()
+        ds = build_chunked_dataset(df, "win", tmp_path / "work", chunk_months=2)
+        try:
+            assert isinstance(ds.X, np.memmap)
+            assert ds.X.dtype == np.float32
+            assert ds.n_rows == len(df) == sum(ds.chunk_rows)
+            assert len(ds.chunk_rows) > 1
+            assert list(ds.race_date) == sorted(ds.race_date)
+            assert ds.y.sum() == (df["finish"] == 1).sum()
+
+            n_train = ds.time_split_index(0.25)
+            assert 0 < n_train < ds.n_rows
+            assert ds.race_date[n_train - 1] < ds.race_date[n_train]
+
+            path = ds.to_lgb_binary(0, n_train, "train")
+            booster = lgb.train(
+                {"objective": "binary", "verbose": -1, "min_data_in_leaf": 5},
+                lgb.Dataset(str(path)), num_boost_round=5,
+            )
+            pred = ds.predict(booster, n_train, ds.n_rows, batch_rows=17)
+            assert pred.shape == (ds.n_rows - n_train,)
+            assert np.isfinite(pred).all()
+        finally:
+            ds.cleanup()
+        assert not (tmp_path / "work").exists()
+
+
+class TestPrecomputedHistory:
+    def test_matches_full_history(self):
+        # 表は horse_id × race_id で引き当てるので、同じ馬が同一レースに 2 回出る合成行は除く
+        df = _make_raw(n_days=20, seed=3).drop_duplicates(subset=["horse_id", "race_id"]).reset_index(drop=True)
+        ref = add_derived_features(df, full_history_df=df)
+        history = precompute_history_features(df)
+        assert history is not None and "past3_avg_finish" in history.columns
+        assert "gate_win_rate" not in history.columns
+
+        # チャンク単位で引き当てても全履歴から一括計算した統計と一致する
+        half = df["race_date"] >= df["race_date"].iloc[len(df) // 2]
+        got = add_derived_features(df.loc[half], full_history_df=df, history_features=history)
+        assert sorted(got.columns) == sorted(ref.columns)
+        pd.testing.assert_frame_equal(
+            got[ref.columns].reset_index(drop=True),
+            ref.loc[half.values].reset_index(drop=True),
+            check_dtype=False,
+        )
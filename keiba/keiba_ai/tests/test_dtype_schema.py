@@ -0,0 +1,114 @@
+"""
+メモリ型スキーマ（keiba_ai.dtype_schema）のテスト
+
+  - feature_catalog.yaml の dtype_schema が読めること
+  - float32 / 小整数 / category / 生データ列削除が適用され、削減バイト数が報告されること
+  - スキーマ適用前後で add_derived_features → optimizer → モデル出力が数値的に一致すること
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.dtype_schema import apply_dtype_schema, load_dtype_schema  # type: ignore
+from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+from keiba_ai.lightgbm_feature_optimizer import prepare_for_lightgbm_ultimate  # type: ignore
+
+_ID_COLS = ("race_id", "horse_id", "jockey_id", "trainer_id")
+
+
+def _make_raw(n_days: int = 20, races_per_day: int = 3, horses: int = 12, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for d in pd.date_range("2023-01-07", periods=n_days, freq="7D"):
+        for r in range(races_per_day):
+            odds = np.round(rng.gamma(2, 8, horses) + 1.1, 1)
+            fin = np.argsort(np.argsort(odds + rng.normal(0, 10, horses))) + 1
+            dist = int(rng.choice([1200, 1600, 2000]))
+            for i in range(horses):
+                hid = f"h{rng.integers(80):03d}"
+                rows.append({
+                    "race_id": f"{d:%Y}05{d:%m%d}{r + 1:02d}", "race_date": f"{d:%Y%m%d}",
+                    "horse_id": hid, "horse_name": hid,
+                    "jockey_id": f"j{rng.integers(12)}", "trainer_id": f"t{rng.integers(8)}",
+                    "finish": int(fin[i]), "horse_number": i + 1, "bracket_number": i // 2 + 1,
+                    "odds": float(odds[i]), "popularity": int(np.argsort(np.argsort(odds))[i]) + 1,
+                    "distance": dist, "surface": "芝" if r % 2 else "ダート", "venue": "東京",
+                    "race_class": rng.choice(["未勝利", "1勝クラス", "オープン"]),
+                    "sire": rng.choice(["A", "B", None]), "num_horses": horses,
+                    "horse_weight": float(rng.integers(430, 520)),
+                    "prev_race_finish": rng.choice([1.0, 6.0, np.nan]),
+                    "past_performances": [{"finish": 1}, {"finish": 3}],
+                    "horse_url": f"https://db.netkeiba.com/horse/{hid}/",
+                    "tansho_payout": float(rng.integers(110, 90000)),
+                    "time_seconds": dist / 16.0 + float(rng.normal(0, 1)),
+                })
+    return pd.DataFrame(rows)
+
+
+def _features(df: pd.DataFrame) -> pd.DataFrame:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return add_derived_features(df, full_history_df=df)
+
+
+class TestSchema:
+    def test_catalog_has_schema(self):
+        schema = load_dtype_schema()
+        assert schema.get("float_dtype") == "float32"
+        assert "past_performances" in schema.get("drop", [])
+        assert {"venue", "surface", "race_class", "jockey_id", "trainer_id", "sire"} <= set(schema["category"])
+
+    def test_dtypes_and_report(self):
+        raw = _make_raw(n_days=4)
+        report: dict = {}
+        out = apply_dtype_schema(raw, report=report)
+        assert "past_performances" not in out.columns and "horse_url" not in out.columns
+        assert out["odds"].dtype == np.float32
+        assert out["tansho_payout"].dtype == np.float64        # keep_float64
+        assert out["horse_number"].dtype == np.int8
+        assert out["distance"].dtype == np.int16
+        for col in ("venue", "surface", "race_class", "jockey_id", "trainer_id", "sire"):
+            assert isinstance(out[col].dtype, pd.CategoricalDtype), col
+        assert report["bytes_saved"] > 0
+        assert report["bytes_after"] < report["bytes_before"]
+        # 入力は変更しない
+        assert "past_performances" in raw.columns and raw["odds"].dtype == np.float64
+
+    def test_nullable_small_int_falls_back_to_float32(self):
+        df = pd.DataFrame({"horse_number": [1.0, np.nan, 3.0], "age": [3, 4, 300]})
+        out = apply_dtype_schema(df)
+        assert out["horse_number"].dtype == np.float32
+        assert out["age"].dtype == np.float32    # int8 範囲外
+
+
+class TestModelOutputParity:
+    def test_features_and_predictions_match(self):
+        lgb = pytest.importorskip("lightgbm")
+        raw = _make_raw()
+        fe_a = _features(raw).drop(columns=["finish", "time_seconds"])
+        fe_b = _features(apply_dtype_schema(raw)).drop(columns=["finish", "time_seconds"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            opt_a, optimizer, _ = prepare_for_lightgbm_ultimate(fe_a, is_training=True)
+            opt_b = optimizer.transform(fe_b)
+            opt_b_fit, _, _ = prepare_for_lightgbm_ultimate(fe_b, is_training=True)
+
+        cols = [c for c in opt_a.columns
+                if c not in _ID_COLS and pd.api.types.is_numeric_dtype(opt_a[c])]
+        X_a = opt_a[cols].astype(float)
+        X_b = opt_b.reindex(columns=cols).astype(float)
+        np.testing.assert_allclose(X_b.to_numpy(), X_a.to_numpy(), rtol=1e-5, atol=1e-5)
+        # 学習経路（スキーマ適用フレームで fit）も同じ特徴量列になる
+        assert set(cols) <= set(opt_b_fit.columns)
+
+        y = (raw["finish"] == 1).astype(int)
+        model = lgb.train({"objective": "binary", "verbose": -1}, lgb.Dataset(X_a, y), num_boost_round=30)
+        np.testing.assert_allclose(model.predict(X_b), model.predict(X_a), atol=1e-6)
@@ -25,6 +25,13 @@ from keiba_ai.feature_engineering import (  # type: ignore
     _dist_band,
     parse_race_time_to_seconds,
     add_derived_features,
+    add_market_features,
+    is_market_column,
+    _CourseTable,
+    _fe_course,
+    _fe_horse_category,
+    classify_running_style,
+    parse_corner_columns,
     _fe_id_season,
     _fe_market,
     _fe_prev_race,
@@ -146,6 +153,94 @@ class TestExtractRaceInfo:
         assert info["date"] is None
 
 
+# ===========================================================================
+# コースマスター検索表 / _fe_course
+# ===========================================================================
+
+class TestCourseLookup:
+    def test_exact_nearest_default_and_unknown(self):
+        assert get_course_features("202405020511", 1600, "turf")["straight_length"] == 525.9
+        # 1500m は 1400 / 1600 から等距離 → YAML で先に書かれた 1400 を採用
+        assert get_course_features("202405020511", 1500, "turf") == get_course_features("202405020511", 1400, "turf")
+        assert get_course_features("202406020611", 1900, "dirt")["track_type"] == "unknown"
+        assert get_course_features("202401020111", 1234, "dirt")["straight_length"] == 264.0   # default キー
+        assert get_course_features("202401029911", 1600, "turf") == {
+            "straight_length": 300.0, "track_type": "unknown", "corner_radius": "medium", "inner_bias": 0,
+        }
+
+    def test_fe_course_matches_single_lookup(self):
+        df = pd.DataFrame({
+            "race_id": ["202405020511", "202406020601", "202401020101", "202409020901", "202499020901"],
+            "distance": [1500.0, 1210.0, 1800.0, np.nan, 1600.0],
+            "surface": ["芝", "ダート", "芝", "芝", None],
+            "bracket_number": [1, 5, 2, 3, 8],
+            "track_type": ["芝"] * 5,
+        }, index=[10, 11, 12, 13, 14])
+        out = _fe_course(df.copy())
+        assert list(out.index) == list(range(5))
+        for i, row in df.reset_index(drop=True).iterrows():
+            surface = {"芝": "turf", "ダート": "dirt"}.get(row["surface"], "turf")
+            dist = row["distance"] if pd.notna(row["distance"]) else None
+            expected = (get_course_features(row["race_id"], dist, surface) if dist is not None
+                        else {"straight_length": 300.0, "track_type": "unknown", "corner_radius": "medium", "inner_bias": 0})
+            assert out.loc[i, ["straight_length", "track_type", "corner_radius", "inner_bias"]].to_dict() == expected
+        assert out["inner_advantage"].tolist() == (out["inner_bias"] * (df["bracket_number"].to_numpy() <= 3)).tolist()
+
+    def test_float_distance(self):
+        # 距離キーと default を両方持つブロック: 整数値の float は一致、端数付きは default
+        table = _CourseTable({"courses": {"05": {"turf": {
+            "1600": {"straight_length": 525.9},
+            "default": {"straight_length": 400.0},
+        }}}})
+        rows = table.lookup(["05"] * 4, [1600, 1600.0, 1600.5, 1700.0], ["turf"] * 4)
+        assert table.straight_length[rows].tolist() == [525.9, 525.9, 400.0, 400.0]
+        # default を持たないブロックでは端数は切り捨てた距離に最も近いキー
+        df = pd.DataFrame({
+            "race_id": ["202405020511"] * 3,
+            "distance": [1600.0, 1600.5, 1500.9],
+            "surface": ["芝"] * 3,
+        })
+        out = _fe_course(df)
+        assert out["straight_length"].tolist() == [525.9] * 3
+        assert out["track_type"].tolist() == [
+            get_course_features("202405020511", d, "turf")["track_type"] for d in (1600, 1600, 1400)
+        ]
+
+
+class TestCornerColumns:
+    def test_parse_to_fixed_width_int16(self):
+        df = pd.DataFrame({
+            "corner_positions": ["7-7-2-2", "3-x-1", "", None, " 12 - 10 ", "5"],
+            "corner_positions_list": [[7, 7, 2, 2], [3, 1], [], [], [12, 10], [5]],
+            "corner_1": [np.nan, np.nan, np.nan, 4, np.nan, np.nan],    # 文字列が無い行は既存値を残す
+        })
+        out = parse_corner_columns(df)
+        assert "corner_positions_list" not in out.columns
+        assert [str(out[f"corner_{k}"].dtype) for k in range(1, 5)] == ["int16"] * 4
+        assert out[["corner_1", "corner_2", "corner_3", "corner_4"]].to_numpy().tolist() == [
+            [7, 7, 2, 2], [3, 1, 0, 0], [0, 0, 0, 0], [4, 0, 0, 0], [12, 10, 0, 0], [5, 0, 0, 0],
+        ]
+
+    def test_stats_match_per_row_classification(self):
+        rng = np.random.default_rng(0)
+        lists = [rng.integers(1, 17, rng.integers(0, 5)).tolist() for _ in range(300)]
+        n_horses = rng.choice([np.nan, 0, 6, 12, 16], 300)
+        out = _fe_horse_category(parse_corner_columns(pd.DataFrame({
+            "corner_positions": ["-".join(map(str, c)) for c in lists],
+            "num_horses": n_horses,
+        })))
+        for i, (c, nh) in enumerate(zip(lists, n_horses)):
+            style = out.loc[i, "running_style"]
+            assert (None if pd.isna(style) else style) == classify_running_style(c, nh)
+            if c:
+                assert out.loc[i, "corner_position_avg"] == pytest.approx(np.mean(c))
+                assert out.loc[i, "corner_position_variance"] == pytest.approx(np.var(c))
+                assert out.loc[i, "last_corner_position"] == c[-1]
+                assert out.loc[i, "position_change"] == (c[0] - c[-1] if len(c) > 1 else 0)
+            else:
+                assert np.isnan(out.loc[i, "corner_position_avg"]) and np.isnan(out.loc[i, "running_style_num"])
+
+
 # ===========================================================================
 # _fe_id_season
 # ===========================================================================
@@ -431,3 +526,32 @@ class TestAddDerivedFeaturesIntegration:
     def test_n_horses_correct(self):
         df = add_derived_features(self._make_minimal_df())
         assert (df["n_horses"] == 2).all()
+
+    def test_odds_drift_df_merged_by_race_and_horse(self):
+        """odds_drift_df は race_id × 馬番で結合され、記録の無い馬は NaN"""
+        drift = pd.DataFrame({
+            "race_id":         ["202505060301", "202505060399"],
+            "horse_number":    [2, 1],
+            "odds_drift_5m":   [-0.2, 0.5],
+            "odds_volatility": [0.05, 0.01],
+        })
+        df = add_derived_features(self._make_minimal_df(), odds_drift_df=drift)
+        assert len(df) == 2
+        by_horse = df.set_index("horse_no")
+        assert by_horse.loc[2, "odds_drift_5m"] == pytest.approx(-0.2)
+        assert np.isnan(by_horse.loc[1, "odds_drift_5m"])
+        assert "odds_drift_5m" not in add_derived_features(self._make_minimal_df()).columns
+
+    def test_market_layer_recomputes_only_odds_columns(self):
+        """オッズ更新後の add_derived_features は、非市場列が不変・市場列が add_market_features と一致"""
+        before = add_derived_features(self._make_minimal_df())
+        updated = self._make_minimal_df().assign(odds=[12.0, 2.5], popularity=[2, 1])
+        after = add_derived_features(updated)
+        for c in before.columns:
+            if not is_market_column(c):
+                pd.testing.assert_series_equal(before[c], after[c], check_names=False)
+        refreshed = add_market_features(before.assign(odds=[12.0, 2.5], popularity=[2, 1]))
+        assert list(refreshed.columns).count("market_entropy") == 1
+        for c in after.columns:
+            if is_market_column(c):
+                pd.testing.assert_series_equal(refreshed[c], after[c], check_names=False)
@@ -0,0 +1,106 @@
+"""
+グループ集計カーネル（keiba_ai.group_kernels）のテスト
+
+  - group_zscore / group_normalize が置き換え前の groupby.transform(lambda) と許容誤差内で一致すること
+    （単頭レース・全 NaN・キー NaN・複数キー dropna=False を含む）
+  - group_entropy / group_topk_sum がレースごとの素朴な計算と一致すること
+  - _fe_market の市場エントロピー / top3_probability が旧 groupby.apply 版と一致すること
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.feature_engineering import _fe_market  # type: ignore
+from keiba_ai.group_kernels import (  # type: ignore
+    group_entropy,
+    group_normalize,
+    group_topk_sum,
+    group_zscore,
+)
+
+
+def _frame(n_races: int = 400, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 19, n_races)
+    race_id = pd.Series(np.repeat([f"R{i:05d}" for i in range(n_races)], sizes), dtype=object)
+    n = len(race_id)
+    race_id[rng.random(n) < 0.01] = np.nan
+    x = rng.gamma(1.5, 12, n) + 1
+    x[rng.random(n) < 0.1] = np.nan
+    x[race_id == "R00003"] = np.nan
+    return pd.DataFrame({
+        "race_id": race_id,
+        "x": x,
+        "surface": rng.choice(["芝", "ダート", None], n),
+        "dist": rng.choice([1200.0, 1600.0, np.nan], n),
+    }, index=np.arange(n) * 2 + 7)
+
+
+class TestTransformKernels:
+    def test_zscore_matches_lambda(self):
+        df = _frame()
+        expected = df.groupby("race_id")["x"].transform(
+            lambda x: (x - x.mean()) / (x.std() + 1e-8) if len(x) > 1 else 0.0)
+        got = group_zscore(df["x"], df["race_id"], singleton=0.0)
+        np.testing.assert_allclose(got, expected, rtol=1e-9, atol=1e-12, equal_nan=True)
+        # singleton 指定なし: 単頭レースは std=NaN のまま NaN
+        expected = df.groupby("race_id")["x"].transform(lambda x: (x - x.mean()) / (x.std() + 1e-8))
+        np.testing.assert_allclose(group_zscore(df["x"], df["race_id"]), expected, rtol=1e-9, equal_nan=True)
+
+    def test_multi_key_keeps_nan_groups(self):
+        df = _frame(seed=1)
+        expected = df.groupby(["surface", "dist"], sort=False, dropna=False)["x"].transform(
+            lambda x: (x - x.mean()) / (x.std() + 1e-8) if len(x) > 1 else 0.0)
+        got = group_zscore(df["x"], [df["surface"], df["dist"]], dropna=False, singleton=0.0)
+        np.testing.assert_allclose(got, expected, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+    def test_normalize_matches_lambda(self):
+        df = _frame(seed=2)
+        expected = df.groupby("race_id")["x"].transform(lambda x: x / x.sum() if x.sum() > 0 else x)
+        got = group_normalize(df["x"], df["race_id"])
+        assert got.index.equals(df.index)
+        np.testing.assert_allclose(got, expected, rtol=1e-12, equal_nan=True)
+
+
+class TestSortedGroupKernels:
+    def test_entropy_and_topk_match_per_race(self):
+        df = _frame(seed=3)
+        ent = group_entropy(df["x"] / 100.0, df["race_id"])
+        top = group_topk_sum(df["x"], df["race_id"], k=3)
+        for rid, grp in df.groupby("race_id"):
+            p = grp["x"].dropna() / 100.0
+            np.testing.assert_allclose(ent[grp.index], -np.sum(p * np.log(p + 1e-10)), rtol=1e-9)
+            np.testing.assert_allclose(top[grp.index], grp["x"].nlargest(3).sum(), rtol=1e-12)
+        assert ent[df["race_id"].isna()].isna().all() and top[df["race_id"].isna()].isna().all()
+
+    def test_market_stats_match_group_apply(self):
+        df = _frame(seed=4).rename(columns={"x": "odds"})[["race_id", "odds"]]
+        df.loc[df.index[5], "odds"] = 0.0
+        out = _fe_market(df.copy())
+
+        def _market_stats(grp: pd.DataFrame) -> pd.Series:
+            o = pd.to_numeric(grp["odds"], errors="coerce").dropna()
+            if len(o) < 2:
+                return pd.Series({"market_entropy": 0.0, "top3_probability": 0.5})
+            probs = 1.0 / o
+            total = probs.sum()
+            if total == 0:
+                return pd.Series({"market_entropy": 0.0, "top3_probability": 0.5})
+            probs /= total
+            return pd.Series({
+                "market_entropy": float(-np.sum(probs * np.log(probs + 1e-10))),
+                "top3_probability": float(probs.nlargest(3).sum()),
+            })
+
+        agg = df.groupby("race_id", sort=False).apply(_market_stats, include_groups=False).reset_index()
+        expected = df.merge(agg, on="race_id", how="left")
+        assert list(out.index) == list(range(len(df)))
+        for col in ("market_entropy", "top3_probability"):
+            np.testing.assert_allclose(out[col], expected[col], rtol=1e-9, atol=1e-12, equal_nan=True)
@@ -0,0 +1,135 @@
+"""
+ウォームスタート増分学習ヘルパー（keiba_ai.training.incremental）のテスト
+
+DB 不要。合成データで以下を検証する:
+  - 特徴量行列キャッシュの保存・読込
+  - 新規レース行の抽出（学習期間の反映を含む）とローリングホールドアウト分割
+  - init_model による追加ブースティング（元ブースターは不変）
+  - 劣化ガードレール判定
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.training.incremental import (  # type: ignore
+    FEATURE_CACHE_SUFFIX,
+    continue_boosting,
+    continue_params,
+    degradation_exceeded,
+    feature_cache_path,
+    feature_engineering_hash,
+    holdout_loss,
+    load_feature_cache,
+    rolling_holdout_split,
+    save_feature_cache,
+    select_new_rows,
+    training_window_conflict,
+)
+
+lgb = pytest.importorskip("lightgbm")
+
+
+def _make_xy(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, 4)), columns=["f0", "f1", "f2", "f3"])
+    y = pd.Series((X["f0"] + 0.5 * X["f1"] + rng.normal(scale=0.5, size=n) > 0).astype(int))
+    return X, y
+
+
+def _dates(n_days: int, per_day: int) -> pd.Series:
+    days = pd.date_range("2024-01-06", periods=n_days, freq="7D").strftime("%Y%m%d")
+    return pd.Series(np.repeat(days, per_day))
+
+
+class TestFeatureCache:
+    def test_path_does_not_match_model_glob(self, tmp_path):
+        p = feature_cache_path(tmp_path / "model_win_lightgbm_20240101_20241231_20250101_1200.joblib")
+        assert p.name.endswith(FEATURE_CACHE_SUFFIX)
+        assert not p.name.endswith(".joblib")
+
+    def test_roundtrip(self, tmp_path):
+        X, y = _make_xy(40)
+        rd = _dates(4, 10)
+        path = save_feature_cache(tmp_path / "m.features.pkl", X, y, rd, rd.str[:6] + "0101", "20240120")
+        cache = load_feature_cache(path)
+        assert cache is not None
+        pd.testing.assert_frame_equal(cache["X"], X)
+        assert cache["train_cutoff"] == "20240120"
+        assert cache["race_date"].tolist() == rd.tolist()
+        assert cache["feature_columns"] == ["f0", "f1", "f2", "f3"]
+
+    def test_missing_returns_none(self, tmp_path):
+        assert load_feature_cache(tmp_path / "none.features.pkl") is None
+
+    def test_hash_is_12_hex(self):
+        h = feature_engineering_hash()
+        assert len(h) == 12
+        int(h, 16)
+
+
+class TestRollingSplit:
+    def test_select_new_rows(self):
+        df = pd.DataFrame({"race_date": ["20240106", "20240113", "20240120", None, "bad"]})
+        new = select_new_rows(df, "20240113")
+        assert new["race_date"].tolist() == ["20240120"]
+
+    def test_select_new_rows_until_month(self):
+        df = pd.DataFrame({"race_date": ["20240106", "20240127", "20240203", "20240302"]})
+        new = select_new_rows(df, "20240106", "2024-02")
+        assert new["race_date"].tolist() == ["20240127", "20240203"]
+
+    def test_window_conflict(self):
+        cached = pd.Series(["20230107", "20230610", "20231230"])
+        assert training_window_conflict(cached, None, None) is None
+        assert training_window_conflict(cached, "2022-01", "2024-06") is None
+        assert training_window_conflict(cached, "2023-01", "2023-12") is None
+        # 学習済み行を除外する必要がある期間指定は増分学習では守れない
+        assert training_window_conflict(cached, "2023-02", None)
+        assert training_window_conflict(cached, None, "2023-11")
+
+    def test_boost_rows_are_between_cutoffs(self):
+        rd = _dates(20, 10)
+        boost, hold, new_cutoff = rolling_holdout_split(rd, 0.2, "20240302")
+        assert new_cutoff > "20240302"
+        assert (rd[boost] > "20240302").all() and (rd[boost] <= new_cutoff).all()
+        assert (rd[hold] > new_cutoff).all()
+        assert not (boost & hold).any()
+        # 旧カットオフ以前の行（学習済み）はどちらにも入らない
+        assert not (boost | hold)[(rd <= "20240302").values].any()
+
+    def test_cutoff_never_moves_backwards(self):
+        rd = _dates(10, 5)
+        _, _, new_cutoff = rolling_holdout_split(rd, 0.5, "20240302")
+        assert new_cutoff >= "20240302"
+
+
+class TestContinueBoosting:
+    def test_adds_trees_without_mutating_base(self):
+        X, y = _make_xy(600)
+        base = lgb.train(
+            {"objective": "binary", "verbose": -1, "learning_rate": 0.1},
+            lgb.Dataset(X.iloc[:400], y.iloc[:400]), num_boost_round=20,
+        )
+        params = continue_params(base, {"objective": "binary"})
+        assert "num_iterations" not in params
+        new = continue_boosting(base, X.iloc[400:500], y.iloc[400:500], params, 7)
+        assert base.num_trees() == 20
+        assert new.num_trees() == 27
+        assert new.predict(X.iloc[500:]).shape == (100,)
+
+    def test_holdout_loss_and_guardrail(self):
+        X, y = _make_xy(300)
+        model = lgb.train({"objective": "binary", "verbose": -1}, lgb.Dataset(X, y), num_boost_round=10)
+        loss = holdout_loss(model, X, y, is_regression=False)
+        assert 0.0 < loss < np.log(2)
+        assert not degradation_exceeded(0.50, 0.504, 0.01)
+        assert degradation_exceeded(0.50, 0.51, 0.01)
+        assert degradation_exceeded(0.50, float("nan"), 0.01)
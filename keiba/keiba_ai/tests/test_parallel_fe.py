@@ -0,0 +1,87 @@
+"""
+開催日パーティション並列の特徴量生成（keiba_ai.training.parallel_fe）のテスト
+
+  - partition_by_race_date がレースを分割せず、開催日の連続範囲でパーティションを作ること
+  - add_derived_features(n_jobs>1) が直列実行と完全に一致すること
+  - 他のスレッドが動いているプロセスでは fork せず forkserver / spawn で実行すること
+    （パーティションごとに値が欠けるダミー列・レースをまたぐ z-score・行順のシャッフルを含む）
+"""
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+from keiba_ai.training import parallel_fe  # type: ignore
+from keiba_ai.training.parallel_fe import partition_by_race_date  # type: ignore
+
+
+def _make_frame(n_weeks: int = 16, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for d in pd.date_range("2024-01-06", periods=n_weeks, freq="7D"):
+        for v in ("05", "06"):
+            for r in range(1, 5):
+                rid, n = f"{d:%Y}{v}01{d.day:02d}{r:02d}", int(rng.integers(6, 15))
+                dist = int(rng.choice([1200, 1600, 2000]))
+                pace = "X" if d.month == 2 else rng.choice(["H", "M", "S", None])   # 2 月だけの値
+                for h in range(n):
+                    rows.append({
+                        "race_id": rid, "race_date": f"{d:%Y%m%d}", "horse_id": f"H{int(rng.integers(150))}",
+                        "jockey_id": f"J{int(rng.integers(20))}", "trainer_id": f"T{int(rng.integers(15))}",
+                        "sex": "牝" if d.month == 3 else str(rng.choice(["牡", "牝", "セ"])),
+                        "age": int(rng.integers(2, 9)), "odds": float(np.round(rng.gamma(1.5, 12) + 1, 1)),
+                        "popularity": h + 1, "num_horses": n, "distance": dist,
+                        "surface": str(rng.choice(["芝", "ダート"])), "bracket_number": h // 2 + 1,
+                        "horse_number": h + 1, "corner_positions": "-".join(map(str, rng.integers(1, n + 1, 4))),
+                        "pace_classification": pace, "prev_race_time": float(rng.normal(95, 5)),
+                        "prev_race_distance": float(rng.choice([1200, 1600, 2000])),
+                        "sanrentan_payout": float(rng.gamma(2, 5000)), "finish": int(rng.integers(1, n + 1)),
+                    })
+    df = pd.DataFrame(rows)
+    df["sex"] = df["sex"].astype(object)
+    df["pace_classification"] = df["pace_classification"].astype(object)
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+class TestPartition:
+    def test_races_stay_whole_and_dates_are_contiguous(self):
+        df = _make_frame(n_weeks=10)
+        parts = partition_by_race_date(df, 4)
+        assert 1 < len(parts) <= 4
+        assert sorted(np.concatenate(parts).tolist()) == list(range(len(df)))
+        race_part = pd.Series(np.repeat(np.arange(len(parts)), [len(p) for p in parts]),
+                              index=np.concatenate(parts)).sort_index()
+        assert (race_part.groupby(df["race_id"]).nunique() == 1).all()
+        spans = [(df["race_date"].iloc[p].min(), df["race_date"].iloc[p].max()) for p in parts]
+        assert all(a[1] < b[0] for a, b in zip(spans, spans[1:]))
+
+
+class TestParallelDeterminism:
+    def test_matches_serial(self):
+        df = _make_frame()
+        serial = add_derived_features(df, full_history_df=df)
+        parallel = add_derived_features(df, full_history_df=df, n_jobs=2)
+        assert {"pace_X", "sex_セ"} <= set(serial.columns)
+        pd.testing.assert_frame_equal(parallel, serial)
+
+    def test_multithreaded_process_does_not_fork(self):
+        df = _make_frame(n_weeks=8)
+        serial = add_derived_features(df, full_history_df=df)
+        stop = threading.Event()
+        worker = threading.Thread(target=stop.wait, daemon=True)     # API プロセスのスレッドプール相当
+        worker.start()
+        try:
+            assert parallel_fe._start_method() in ("forkserver", "spawn")
+            parallel = add_derived_features(df, full_history_df=df, n_jobs=2)
+        finally:
+            stop.set()
+            worker.join()
+        pd.testing.assert_frame_equal(parallel, serial)
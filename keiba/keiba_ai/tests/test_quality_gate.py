@@ -0,0 +1,97 @@
+"""
+Quality Gate（keiba_ai.quality_gate）のテスト
+
+  - ベクトル化した Q1〜Q5 判定がレース単位の素朴な判定と同じ issue を同じ順で返すこと
+  - 保存済みの drift_reference から計算した PSI が学習フレームからの計算（_calc_psi）と一致すること
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.quality_gate import (  # type: ignore
+    _calc_psi,
+    check_feature_drift,
+    fit_drift_reference,
+    validate_race_entries,
+)
+
+
+def _make_entries() -> pd.DataFrame:
+    rows = []
+    for r in range(6):
+        for i in range(10):
+            rows.append({
+                "race_id": f"R{r}", "distance": 1600.0, "venue": "東京",
+                "odds": 3.0 + i, "popularity": float(i + 1), "horse_name": f"馬{i}",
+            })
+    df = pd.DataFrame(rows)
+    df.loc[df["race_id"] == "R1", "distance"] = [0.0] * 5 + [np.nan] * 5      # Q1
+    df.loc[df["race_id"] == "R2", "odds"] = np.nan                              # Q2 ERROR + Q5
+    df.loc[df["race_id"] == "R2", "popularity"] = np.nan
+    df.loc[21, "odds"] = np.nan                                                 # Q2 WARNING
+    df.loc[df.index[df["race_id"] == "R3"][3], "venue"] = "中山"                 # Q3
+    df.loc[df.index[df["race_id"] == "R4"][0], "horse_name"] = " "              # Q4
+    df.loc[df.index[df["race_id"] == "R0"][1], "odds"] = np.nan                  # Q2 WARNING + Q4
+    df.loc[df.index[df["race_id"] == "R0"][2], "horse_name"] = np.nan
+    return df
+
+
+class TestValidateRaceEntries:
+    def test_issues_only_for_failing_races_in_race_order(self):
+        result = validate_race_entries(_make_entries())
+        assert result.total_races == 6 and result.total_entries == 60
+        assert result.bad_race_ids == {"R1", "R2", "R3"}
+        assert result.warn_race_ids == {"R0", "R4"}
+        assert [(i.race_id, i.issue_code, i.severity) for i in result.issues] == [
+            ("R0", "Q2", "WARNING"), ("R0", "Q4", "WARNING"),
+            ("R1", "Q1", "ERROR"),
+            ("R2", "Q2", "ERROR"), ("R2", "Q5", "ERROR"),
+            ("R3", "Q3", "ERROR"),
+            ("R4", "Q4", "WARNING"),
+        ]
+        msgs = {(i.race_id, i.issue_code): i.message for i in result.issues}
+        assert msgs[("R0", "Q2")] == "odds 欠損 1/10 頭"
+        assert msgs[("R1", "Q1")].startswith("distance が 0 または NaN（[0.0, 0.0, 0.0]")
+        assert msgs[("R3", "Q3")] == "レース内 venue が揺れている: ['東京', '中山']"
+
+    def test_missing_race_id_column_is_one_race(self):
+        df = _make_entries().drop(columns="race_id").iloc[10:20]
+        result = validate_race_entries(df)
+        assert result.total_races == 1 and result.bad_race_ids == {"__single__"}
+        assert validate_race_entries(df.iloc[:0]).total_races == 0
+
+
+class TestDriftReference:
+    def test_reference_psi_matches_training_frame(self):
+        rng = np.random.default_rng(0)
+        train = pd.DataFrame({
+            "odds": rng.gamma(2, 8, 4000),
+            "age": rng.integers(2, 8, 4000).astype(float),
+            "weight": np.where(rng.random(4000) < 0.3, np.nan, rng.normal(470, 20, 4000)),
+            "const": np.ones(4000),
+            "sparse": [np.nan] * 3995 + [1.0, 2.0, 3.0, 4.0, 5.0],
+        })
+        infer = pd.DataFrame({
+            "odds": rng.gamma(2, 12, 200),
+            "age": rng.integers(2, 10, 200).astype(float),   # 学習範囲外の値はビンに入らない
+            "weight": rng.normal(470, 20, 200),
+            "const": np.ones(200),
+        })
+        reference = fit_drift_reference(train)
+        drift = check_feature_drift(None, infer, reference=reference).set_index("feature")
+        for col in ("odds", "age", "weight", "const"):
+            expected = _calc_psi(train[col].dropna(), infer[col].dropna())
+            assert drift.loc[col, "psi"] == round(expected, 4)
+        assert np.isnan(drift.loc["sparse", "psi"]) and drift.loc["sparse", "infer_missing_pct"] == 100.0
+        assert drift.loc["weight", "train_missing_pct"] == round(train["weight"].isna().mean() * 100, 1)
+        assert drift.loc["odds", "train_median"] == round(train["odds"].median(), 4)
+
+        from_frame = check_feature_drift(train, infer).reset_index(drop=True)
+        pd.testing.assert_frame_equal(from_frame, drift.reset_index()[from_frame.columns])
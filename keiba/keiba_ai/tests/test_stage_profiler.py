@@ -0,0 +1,68 @@
+"""
+ステージ単位プロファイラ（keiba_ai.stage_profiler）のテスト
+
+  - trace_stages 内の add_derived_features が各 _fe_* ステージと入れ子の _feh_* を記録すること
+  - 行数・追加列数が記録され、トレースの有無で出力が変わらないこと
+  - トレース外ではレコードが作られず、memory=True でピーク増分が記録されること
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+from keiba_ai.stage_profiler import current_trace, run_stage, trace_stages  # type: ignore
+
+
+def _make_frame(n_races: int = 12, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for r in range(n_races):
+        rid, n = f"2024050101{r:02d}", int(rng.integers(6, 12))
+        for h in range(n):
+            rows.append({
+                "race_id": rid, "race_date": f"202401{r % 28 + 1:02d}", "horse_id": f"H{int(rng.integers(40))}",
+                "jockey_id": f"J{int(rng.integers(8))}", "trainer_id": f"T{int(rng.integers(6))}",
+                "sex": str(rng.choice(["牡", "牝"])), "age": int(rng.integers(2, 8)),
+                "odds": float(np.round(rng.gamma(1.5, 12) + 1, 1)), "popularity": h + 1, "num_horses": n,
+                "distance": 1600, "surface": "芝", "horse_number": h + 1, "bracket_number": h // 2 + 1,
+                "corner_positions": "-".join(map(str, rng.integers(1, n + 1, 4))),
+                "finish": int(rng.integers(1, n + 1)),
+            })
+    return pd.DataFrame(rows)
+
+
+class TestStageTrace:
+    def test_records_stages_with_nesting_and_shapes(self):
+        df = _make_frame()
+        plain = add_derived_features(df, full_history_df=df)
+        with trace_stages() as trace:
+            traced = add_derived_features(df, full_history_df=df)
+        pd.testing.assert_frame_equal(traced, plain)
+
+        stages = {r.name: r for r in trace.stages}
+        top = stages["add_derived_features"]
+        assert top.depth == 0 and top.rows_in == top.rows_out == len(df)
+        assert top.cols_added == len(set(plain.columns) - set(df.columns))
+        assert stages["_fe_horse_category"].depth == 1 and stages["_fe_horse_category"].cols_added > 0
+        assert stages["_feh_recent_form"].depth == 2
+        assert trace.total_ms >= top.wall_ms > 0
+        assert trace.compact()[0][0] == "add_derived_features"
+
+    def test_inactive_outside_context_and_memory_mode(self):
+        df = _make_frame(n_races=4)
+        assert current_trace() is None
+        assert run_stage("noop", len, df) == len(df)
+
+        with trace_stages(memory=True) as trace:
+            run_stage("alloc", lambda n: np.ones(n), 2_000_000)
+        assert current_trace() is None
+        (rec,) = trace.stages
+        assert rec.name == "alloc" and rec.rows_out == 2_000_000
+        assert rec.mem_peak_mb >= 15
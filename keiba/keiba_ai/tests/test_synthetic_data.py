@@ -0,0 +1,89 @@
+"""
+合成データ生成（keiba_ai.synthetic_data）のテスト
+
+  - 同じ seed なら同じレース列、違う seed なら違うレース列になること
+  - ラップ・コーナー通過順・"B" 馬 ID・払戻がスクレイパーの保存形式どおりであること
+  - 同じ馬が同じ日に 2 回出走しないこと
+  - write_ultimate_db の DB を load_ultimate_training_frame がそのまま読めること
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.db_ultimate_loader import load_ultimate_training_frame  # type: ignore
+from keiba_ai.synthetic_data import generate_races, write_ultimate_db  # type: ignore
+
+
+_PEDIGREE_KEYS = {"sire", "dam", "damsire"}
+
+
+class TestGenerateRaces:
+
+    def test_deterministic_by_seed(self):
+        a = list(generate_races(1500, seed=7))
+        b = list(generate_races(1500, seed=7))
+        c = list(generate_races(1500, seed=8))
+        assert json.dumps(a, ensure_ascii=False) == json.dumps(b, ensure_ascii=False)
+        assert json.dumps(a, ensure_ascii=False) != json.dumps(c, ensure_ascii=False)
+
+    def test_stops_at_requested_rows(self):
+        races = list(generate_races(1000, seed=0))
+        rows = sum(len(r["horses"]) for r in races)
+        assert 1000 <= rows < 1000 + 18
+        dates = [r["race_info"]["date"] for r in races]
+        assert dates == sorted(dates)
+
+    def test_scraper_shapes(self):
+        races = list(generate_races(3000, seed=1, scratch_share=0.05, invalid_share=0.05))
+        seen: set = set()
+        for r in races:
+            info = r["race_info"]
+            if info.get("_invalid_distance"):
+                continue
+            laps = info.get("lap_cumulative")
+            if laps:
+                assert list(laps) == list(range(200, info["distance"] + 1, 200))
+                assert set(info["lap_sectional"]) == set(laps)
+            assert {t["bet_type"] for t in r["return_tables"]} >= {"単勝", "複勝", "馬連"}
+            for h in r["horses"]:
+                key = (h["horse_id"], info["date"])
+                assert key not in seen
+                seen.add(key)
+                if h["finish_position"] == "取":
+                    assert h["odds"] is None and h["corner_positions"] == ""
+                    continue
+                assert h["corner_positions"] == "-".join(map(str, h["corner_positions_list"]))
+                assert h["corner_1"] == h["corner_positions_list"][0]
+                if h["horse_id"].startswith("B"):
+                    assert "prev_race_date" not in h and "horse_birth_date" not in h
+                    assert _PEDIGREE_KEYS <= set(h)
+                else:
+                    assert h["prev_race_date"].replace("/", "") == info["date"]
+        assert any(h["horse_id"].startswith("B") for r in races for h in r["horses"])
+        assert any(r["race_info"].get("_invalid_distance") for r in races)
+
+
+class TestWriteUltimateDb:
+
+    def test_loader_reads_synthetic_db(self, tmp_path):
+        db = tmp_path / "keiba_ultimate.db"
+        summary = write_ultimate_db(db, 2000, seed=3)
+        with sqlite3.connect(str(db)) as conn:
+            n_rows = conn.execute("SELECT COUNT(*) FROM race_results_ultimate").fetchone()[0]
+            n_races = conn.execute("SELECT COUNT(*) FROM races_ultimate").fetchone()[0]
+        assert (n_rows, n_races) == (summary["rows"], summary["races"])
+
+        df = load_ultimate_training_frame(db)
+        assert len(df) > 0.9 * summary["rows"]
+        assert {"race_id", "horse_id", "finish", "odds", "race_date"} <= set(df.columns)
+
+        with pytest.raises(FileExistsError):
+            write_ultimate_db(db, 2000, seed=3)
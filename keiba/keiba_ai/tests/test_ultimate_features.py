@@ -0,0 +1,97 @@
+"""
+Ultimate版特徴量（keiba_ai.ultimate_features）のテスト
+
+  - calculate_batch（履歴 1 回読み込み + 一括窓計算）が per-row の
+    calculate_horse_past_10_races / calculate_jockey_stats / calculate_trainer_stats と
+    全列で一致すること（欠損着順・ID/名前照合・日付でない race_id・履歴なしの馬を含む）
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(_HERE.parent.parent.parent))        # keiba/ を追加
+
+from keiba_ai.ultimate_features import UltimateFeatureCalculator  # type: ignore
+
+
+def _make_db(path: Path, n_days: int = 40, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    race_ids = []
+    rows = []
+    for d in pd.date_range("2023-01-01", periods=n_days, freq="3D"):
+        for r in range(6):
+            # r % 3 == 0 は race_id[:8] が日付として読めない形式（騎手/調教師は全期間集計）
+            rid = f"{d:%Y%m%d}{r + 1:04d}" if r % 3 else f"{d:%Y}{13 + r:02d}{d:%m%d}{r + 1:02d}"
+            race_ids.append(rid)
+            for i, h in enumerate(rng.choice(60, 12, replace=False).tolist()):
+                rec = {
+                    "horse_id": f"H{h:03d}", "horse_number": i + 1,
+                    "finish_position": str(int(rng.integers(1, 13))) if rng.random() > 0.05 else "中止",
+                    "popularity": int(rng.integers(1, 13)) if rng.random() > 0.1 else None,
+                    "jockey_name": f"J{int(rng.integers(15))}",
+                    "trainer_id": f"T{int(rng.integers(10))}", "trainer_name": f"TN{int(rng.integers(10))}",
+                    "last_3f": round(float(rng.normal(35, 1)), 1), "last_3f_rank": int(rng.integers(1, 13)),
+                }
+                if h % 5:   # 馬体重キーを持たない馬も混ぜる
+                    rec["weight_kg"] = int(rng.integers(430, 520)) if rng.random() > 0.2 else None
+                    rec["weight_change"] = int(rng.integers(-8, 9))
+                if rng.random() > 0.2:
+                    rec["jockey_id"] = rec["jockey_name"] if rng.random() > 0.5 else f"0{rec['jockey_name']}"
+                rows.append((rid, json.dumps(rec, ensure_ascii=False)))
+    rows.append(("202303010099", "{broken"))   # 壊れた JSON は読み飛ばす
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE race_results_ultimate (id INTEGER PRIMARY KEY AUTOINCREMENT, race_id TEXT, data TEXT NOT NULL)"
+    )
+    conn.executemany("INSERT INTO race_results_ultimate (race_id, data) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return sorted(race_ids)
+
+
+class TestCalculateBatch:
+    def test_matches_per_row_stats(self, tmp_path):
+        db = tmp_path / "ultimate.db"
+        race_ids = _make_db(db)
+        rng = np.random.default_rng(5)
+        n = 120
+        df = pd.DataFrame({
+            "race_id": rng.choice(race_ids, n),
+            "horse_id": [f"H{int(x):03d}" for x in rng.integers(0, 65, n)],      # H060〜 は履歴なし
+            "jockey_id": [f"J{int(x)}" if x % 4 else f"0J{int(x)}" for x in rng.integers(0, 17, n)],
+            "trainer_id": [f"T{int(x)}" if x % 3 else f"TN{int(x)}" for x in rng.integers(0, 11, n)],
+        }, index=np.arange(100, 100 + n))
+
+        calc = UltimateFeatureCalculator(str(db))
+        batch = calc.calculate_batch(df)
+        expected = pd.DataFrame([
+            {
+                **calc.calculate_horse_past_10_races(r.horse_id, r.race_id),
+                **calc.calculate_jockey_stats(r.jockey_id, r.race_id),
+                **calc.calculate_trainer_stats(r.trainer_id, r.race_id),
+            }
+            for r in df.itertuples()
+        ], index=df.index)
+
+        assert list(batch.columns) == list(expected.columns)
+        assert (batch["past_10_races_count"] == 0).any() and (batch["past_10_races_count"] == 10).any()
+        for col in expected.columns:
+            np.testing.assert_allclose(
+                batch[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col,
+            )
+
+    def test_add_ultimate_features_keeps_input_columns(self, tmp_path):
+        db = tmp_path / "ultimate.db"
+        race_ids = _make_db(db, n_days=5)
+        df = pd.DataFrame({"race_id": [race_ids[-1]] * 2, "horse_id": ["H001", "H002"]})
+        out = UltimateFeatureCalculator(str(db)).add_ultimate_features(df)
+        assert list(out.columns[:2]) == ["race_id", "horse_id"]
+        assert "past_10_avg_finish" in out.columns and "jockey_recent_races" not in out.columns
@@ -1,6 +1,7 @@
 from .pipeline import run_notebook_pipeline
 from .reporter import print_training_summary
 from .bundle import build_feature_importance_df, build_model_bundle, save_model_bundle
+from .incremental import IncrementalFallback, feature_cache_path, feature_engineering_hash
 
 __all__ = [
     "run_notebook_pipeline",
@@ -8,4 +9,7 @@ __all__ = [
     "build_feature_importance_df",
     "build_model_bundle",
     "save_model_bundle",
+    "IncrementalFallback",
+    "feature_cache_path",
+    "feature_engineering_hash",
 ]
@@ -0,0 +1,255 @@
+"""
+日付パーティション単位のアウトオブコア学習データ構築
+
+10 年超の履歴を一括で add_derived_features → optimizer → X_train/X_test と
+展開すると 2GB インスタンスで OOM になるため、以下の 2 パスで構築する。
+
+  パス 0: エンティティ状態（騎手・調教師・馬の expanding / rolling 統計）を
+          precompute_history_features で全履歴に対して 1 回だけ計算する。
+          履歴ステージが読む列だけに絞ったフレームで計算するため生フレームより小さい。
+  パス 1: race_date を chunk_months ヶ月単位に分割し、チャンクごとに
+          add_derived_features(chunk, history_features=パス 0 の表) を実行。
+          履歴統計は表から引き当てるのでチャンク境界で途切れず、チャンクごとの再計算も無い。
+          gate_win_rate（静的集計）だけは従来どおり履歴[<= チャンク末日] から集計する。
+          結果はスプールファイルに退避し、optimizer 学習用の層化サンプルだけ保持する。
+  パス 2: サンプルで optimizer を学習 → 各スプールを transform して
+          float32 の np.memmap（行 = race_date 昇順）へ直接書き込む。
+
+行が日付順に並ぶため時系列分割は memmap のスライス（コピーなし）で表現でき、
+LightGBM Dataset は save_binary したファイルからブースティングできる。
+ピークメモリは「生の履歴フレーム + 履歴統計表 + 1 チャンク分の特徴量」で頭打ちになり、
+チャンクを小さくするほど下がる。
+
+注意: _fe_prev_race の z-score 等のクロスセクション統計はチャンク内で計算される
+（推論時の 1 レース単位計算と同じく、全期間一括計算とは厳密には一致しない）。
+"""
+from __future__ import annotations
+
+import math
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# _do_train と同じ除外列（ID / 目的変数）
+_EXCLUDE_COLS = ("race_id", "horse_id", "jockey_id", "trainer_id", "owner_id", "finish_position")
+
+
+@dataclass
+class ChunkedDataset:
+    """memmap 上に構築した学習行列（行は race_date 昇順）"""
+
+    X: np.ndarray                 # np.memmap float32 (n_rows, n_features)
+    y: np.ndarray
+    race_date: np.ndarray         # YYYYMMDD 文字列
+    race_id: np.ndarray
+    feature_columns: List[str]
+    categorical_features: List[str]
+    optimizer: Any
+    workdir: Path
+    chunk_rows: List[int] = field(default_factory=list)
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.X.shape[0])
+
+    @property
+    def categorical_indices(self) -> List[int]:
+        return [self.feature_columns.index(c) for c in self.categorical_features if c in self.feature_columns]
+
+    def time_split_index(self, test_size: float) -> int:
+        """race_date の (1 - test_size) 分位点以下の行数（= 学習行の末尾 index）"""
+        dates = pd.to_datetime(pd.Series(self.race_date), format="%Y%m%d", errors="coerce")
+        cutoff = dates.quantile(1.0 - test_size)
+        if pd.isna(cutoff):
+            return 0
+        return int(np.searchsorted(self.race_date, cutoff.strftime("%Y%m%d"), side="right"))
+
+    def to_lgb_binary(self, start: int, stop: int, name: str, params: Optional[dict] = None) -> Path:
+        """X[start:stop] から LightGBM Dataset を構築して binary ファイルに保存し、そのパスを返す"""
+        import lightgbm as lgb
+
+        path = self.workdir / f"{name}.bin"
+        ds = lgb.Dataset(
+            self.X[start:stop], label=self.y[start:stop],
+            feature_name=list(self.feature_columns),
+            categorical_feature=self.categorical_indices,
+            params=dict(params or {}, verbose=-1),
+            free_raw_data=True,
+        )
+        ds.save_binary(str(path))
+        del ds
+        return path
+
+    def predict(self, booster: Any, start: int, stop: int, batch_rows: int = 100_000) -> np.ndarray:
+        """X[start:stop] をバッチごとに推論（memmap を一括で読み込まない）"""
+        out = [
+            np.asarray(booster.predict(self.X[i:min(i + batch_rows, stop)]), dtype=float)
+            for i in range(start, stop, batch_rows)
+        ]
+        return np.concatenate(out) if out else np.empty(0)
+
+    def cleanup(self) -> None:
+        """memmap / スプール / binary を削除"""
+        try:
+            if isinstance(self.X, np.memmap):
+                self.X._mmap.close()  # type: ignore[attr-defined]
+        except Exception:
+            pass
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _date8(s: pd.Series) -> pd.Series:
+    s = s.astype(str).str.strip().str[:8]
+    return s.where(s.str.match(r"^\d{8}$"), "")
+
+
+def iter_date_chunks(race_date: pd.Series, chunk_months: int) -> Iterator[Tuple[str, str, np.ndarray]]:
+    """race_date を chunk_months ヶ月単位に区切り (開始日, 終了日, 行マスク) を昇順に返す"""
+    d8 = _date8(race_date)
+    valid = d8 != ""
+    if not valid.any():
+        return
+    ym = pd.to_numeric(d8.str[:6], errors="coerce").fillna(0).astype(int)
+    month_idx = (ym // 100) * 12 + (ym % 100 - 1)
+    base = int(month_idx[valid].min())
+    bucket = ((month_idx - base) // max(1, int(chunk_months))).where(valid, -1)
+    for b in sorted(int(x) for x in bucket[valid].unique()):
+        mask = (bucket == b).values
+        dates = d8[mask]
+        yield str(dates.min()), str(dates.max()), mask
+
+
+def build_chunked_dataset(
+    df_raw: pd.DataFrame,
+    target: str,
+    workdir: "str | Path",
+    chunk_months: int = 6,
+    optimizer_sample_rows: int = 200_000,
+    progress_cb: Optional[Callable[[str, Optional[int]], None]] = None,
+    random_state: int = 42,
+) -> ChunkedDataset:
+    """生の学習フレームから日付チャンク単位で特徴量を生成し、memmap 学習行列を構築する。
+
+    Args:
+        df_raw: load_ultimate_training_frame の出力（期間フィルタ済み）
+        target: 目的変数（win / place3 / win_tie / speed_deviation）
+        workdir: スプール・memmap・binary の作業ディレクトリ
+        chunk_months: 1 チャンクの月数（小さいほどピークメモリが下がる）
+        optimizer_sample_rows: optimizer.fit_transform に渡す層化サンプル行数
+    """
+    from keiba_ai.constants import FUTURE_FIELDS  # type: ignore
+    from keiba_ai.feature_engineering import (  # type: ignore
+        _GATE_BIAS_SOURCE_COLUMNS,
+        add_derived_features,
+        precompute_history_features,
+    )
+    from keiba_ai.lightgbm_feature_optimizer import prepare_for_lightgbm_ultimate  # type: ignore
+    from keiba_ai.train import _make_target  # type: ignore
+
+    if progress_cb is None:
+        def progress_cb(msg: str, pct: Optional[int] = None) -> None:  # noqa: F811
+            pass
+
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    hist_d8 = _date8(df_raw["race_date"])
+    chunks = list(iter_date_chunks(df_raw["race_date"], chunk_months))
+    if not chunks:
+        raise ValueError("race_date が有効な行がありません")
+    total_rows = int(sum(int(m.sum()) for _, _, m in chunks))
+    is_regression = target == "speed_deviation"
+    rng = np.random.default_rng(random_state)
+
+    # ── パス 0: 履歴統計を全期間で 1 回だけ計算 ──
+    progress_cb("履歴統計を計算中...", 18)
+    history = precompute_history_features(df_raw)
+    hist_cols = (
+        [c for c in _GATE_BIAS_SOURCE_COLUMNS if c in df_raw.columns] if history is not None
+        else list(df_raw.columns)
+    )
+
+    # ── パス 1: チャンク単位の特徴量生成 → スプール ──
+    spools: List[Tuple[Path, int]] = []
+    samples: List[pd.DataFrame] = []
+    for i, (d_from, d_to, mask) in enumerate(chunks):
+        progress_cb(f"チャンク特徴量生成 {i + 1}/{len(chunks)} ({d_from}〜{d_to})", 20 + int(15 * i / len(chunks)))
+        chunk = df_raw.loc[mask]
+        y_chunk = _make_target(chunk, target).to_numpy()
+        eng = add_derived_features(
+            chunk,
+            full_history_df=df_raw.loc[(hist_d8 <= d_to).values, hist_cols],
+            history_features=history,
+        )
+        if len(eng) != len(y_chunk):
+            raise ValueError(f"チャンク {d_from}〜{d_to}: 特徴量生成で行数が変化しました")
+        eng = eng.loc[:, ~eng.columns.duplicated()]
+        eng = eng.drop(columns=[c for c in FUTURE_FIELDS if c in eng.columns])
+        eng = eng.reset_index(drop=True)
+        eng["_y"] = y_chunk
+        if is_regression:
+            eng = eng.loc[pd.notna(eng["_y"])]
+        eng["_d8"] = _date8(eng["race_date"]) if "race_date" in eng.columns else d_to
+        eng = eng.sort_values("_d8", kind="mergesort").reset_index(drop=True)
+
+        quota = math.ceil(optimizer_sample_rows * len(eng) / max(total_rows, 1))
+        if quota > 0 and len(eng) > 0:
+            take = rng.choice(len(eng), size=min(quota, len(eng)), replace=False)
+            samples.append(eng.iloc[np.sort(take)])
+        path = workdir / f"chunk_{i:04d}.pkl"
+        joblib.dump(eng, path)
+        spools.append((path, len(eng)))
+        del eng, chunk
+
+    del history
+    # ── optimizer をサンプルで学習 ──
+    progress_cb("特徴量選択・最適化中（サンプル）...", 36)
+    sample = pd.concat(samples, ignore_index=True)
+    del samples
+    sample_opt, optimizer, categorical_features = prepare_for_lightgbm_ultimate(
+        sample.drop(columns=["_y", "_d8"]), target_col=target, is_training=True
+    )
+    X_s = sample_opt.drop(columns=[c for c in (target, *_EXCLUDE_COLS) if c in sample_opt.columns])
+    X_s = X_s.drop(columns=X_s.select_dtypes(include=["object"]).columns.tolist())
+    feature_columns = X_s.columns.tolist()
+    del sample, sample_opt, X_s
+
+    # ── パス 2: transform → float32 memmap ──
+    n_rows = int(sum(n for _, n in spools))
+    X = np.lib.format.open_memmap(
+        str(workdir / "X.npy"), mode="w+", dtype=np.float32, shape=(n_rows, len(feature_columns))
+    )
+    y = np.empty(n_rows, dtype=np.float64)
+    race_date = np.empty(n_rows, dtype=object)
+    race_id = np.empty(n_rows, dtype=object)
+    pos = 0
+    for i, (path, n) in enumerate(spools):
+        progress_cb(f"チャンク書き込み {i + 1}/{len(spools)}", 38 + int(10 * i / len(spools)))
+        eng = joblib.load(path)
+        path.unlink(missing_ok=True)
+        if n == 0:
+            continue
+        y[pos:pos + n] = eng["_y"].to_numpy(dtype=np.float64)
+        race_date[pos:pos + n] = eng["_d8"].to_numpy()
+        race_id[pos:pos + n] = (
+            eng["race_id"].astype(str).to_numpy() if "race_id" in eng.columns else ""
+        )
+        opt = optimizer.transform(eng.drop(columns=["_y", "_d8"]))
+        X[pos:pos + n] = opt.reindex(columns=feature_columns).to_numpy(dtype=np.float32, na_value=np.nan)
+        pos += n
+        del eng, opt
+    X.flush()
+
+    return ChunkedDataset(
+        X=X, y=y,
+        race_date=race_date.astype(str), race_id=race_id.astype(str),
+        feature_columns=feature_columns,
+        categorical_features=list(categorical_features),
+        optimizer=optimizer,
+        workdir=workdir,
+        chunk_rows=[n for _, n in spools],
+    )
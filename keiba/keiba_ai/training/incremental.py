@@ -0,0 +1,212 @@
+"""
+ウォームスタート増分学習ヘルパー
+
+週末のスクレイプ後に 10 年分を毎回ゼロから学習し直す代わりに、
+アクティブモデルのブースターへ新規レース分だけを init_model で追加学習する。
+
+  - 特徴量行列キャッシュ（学習時の X / y / race_date / race_id / 学習カットオフ）の保存・読込
+  - 新規レース行の抽出（学習期間の反映を含む）とローリングホールドアウト分割
+  - init_model による追加ブースティングとホールドアウト損失の評価
+  - 全期間再学習へのフォールバック判定（IncrementalFallback）
+
+オーケストレーション（DB 読込・特徴量生成・バンドル保存）は python-api/routers/train.py 側で行う。
+"""
+from __future__ import annotations
+
+import hashlib
+import inspect
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# model_*.joblib / *{model_id}*.joblib の glob に掛からない拡張子にする
+FEATURE_CACHE_SUFFIX = ".features.pkl"
+
+# init_model 継続時に引き継がない学習パラメータ（num_boost_round を上書きしてしまう）
+_NON_INHERITED_PARAMS = {
+    "num_iterations", "num_iteration", "n_iter", "num_tree", "num_trees",
+    "num_round", "num_rounds", "num_boost_round", "n_estimators", "max_iter",
+    "early_stopping_round", "early_stopping_rounds", "early_stopping", "n_iter_no_change",
+}
+
+
+class IncrementalFallback(Exception):
+    """増分学習を断念して全期間再学習に切り替えるべき状況を表す（メッセージ = 理由）"""
+
+
+def feature_engineering_hash() -> str:
+    """keiba_ai.feature_engineering のソースハッシュ（バンドルの pipeline_config と同じ算出方法）"""
+    import keiba_ai.feature_engineering as _fe_mod  # type: ignore
+
+    return hashlib.md5(inspect.getsource(_fe_mod).encode()).hexdigest()[:12]
+
+
+def feature_cache_path(model_path: "str | Path") -> Path:
+    """モデルファイルに対応する特徴量行列キャッシュのパスを返す"""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + FEATURE_CACHE_SUFFIX)
+
+
+def save_feature_cache(
+    path: "str | Path",
+    X: pd.DataFrame,
+    y: pd.Series,
+    race_date: pd.Series,
+    race_id: Optional[pd.Series] = None,
+    train_cutoff: Optional[str] = None,
+) -> Path:
+    """学習に使った特徴量行列を保存する。
+
+    train_cutoff は「ブースターが学習済みの最終日付」(YYYYMMDD)。
+    これより後の行はホールドアウト扱いでブースターは未学習。
+    """
+    path = Path(path)
+    payload = {
+        "X": X.reset_index(drop=True),
+        "y": pd.Series(y).reset_index(drop=True),
+        "race_date": _date8(race_date).reset_index(drop=True),
+        "race_id": (
+            pd.Series(race_id).astype(str).reset_index(drop=True)
+            if race_id is not None else None
+        ),
+        "train_cutoff": train_cutoff,
+        "feature_columns": X.columns.tolist(),
+    }
+    joblib.dump(payload, path)
+    return path
+
+
+def load_feature_cache(path: "str | Path") -> Optional[Dict[str, Any]]:
+    """特徴量行列キャッシュを読み込む。存在しない・壊れている場合は None"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        payload = joblib.load(path)
+    except Exception:
+        return None
+    if not isinstance(payload, dict) or "X" not in payload or "race_date" not in payload:
+        return None
+    return payload
+
+
+def _date8(s: pd.Series) -> pd.Series:
+    """race_date を YYYYMMDD 文字列に正規化（不正値は空文字）"""
+    s = pd.Series(s).astype(str).str.strip().str[:8]
+    return s.where(s.str.match(r"^\d{8}$"), "")
+
+
+def select_new_rows(df: pd.DataFrame, since_date8: str, until_ym: Optional[str] = None) -> pd.DataFrame:
+    """race_date が since_date8 より後の行（= キャッシュに無い新規レース）を返す。
+
+    until_ym（YYYY-MM / YYYYMM）を指定するとその月末までの行に限る（学習期間 training_date_to）。
+    """
+    if df.empty or "race_date" not in df.columns:
+        return df.iloc[0:0]
+    d8 = _date8(df["race_date"])
+    mask = (d8 != "") & (d8 > str(since_date8))
+    if until_ym:
+        mask &= d8.str[:6] <= str(until_ym).replace("-", "")
+    return df.loc[mask]
+
+
+def training_window_conflict(
+    cached_race_date: pd.Series,
+    date_from: Optional[str],
+    date_to: Optional[str],
+) -> Optional[str]:
+    """学習期間（YYYY-MM）が増分学習で守れない場合にその理由を返す（守れるなら None）。
+
+    ブースターはキャッシュ行を学習済みで「忘れる」ことはできないため、
+    キャッシュ先頭月より後の date_from、キャッシュ最終月より前の date_to は全期間再学習でしか反映できない。
+    """
+    d8 = _date8(cached_race_date)
+    yms = d8[d8 != ""].str[:6]
+    if yms.empty:
+        return None
+    if date_from and date_from.replace("-", "") > yms.min():
+        return f"学習期間の開始 {date_from} がベースモデルの学習開始 {yms.min()[:4]}-{yms.min()[4:]} より後です"
+    if date_to and date_to.replace("-", "") < yms.max():
+        return f"学習期間の終了 {date_to} がベースモデルの学習済み期間 {yms.max()[:4]}-{yms.max()[4:]} より前です"
+    return None
+
+
+def rolling_holdout_split(
+    race_date: pd.Series,
+    holdout_frac: float,
+    train_cutoff: str,
+) -> Tuple[np.ndarray, np.ndarray, str]:
+    """ローリングホールドアウト分割。
+
+    新しいカットオフは全学習と同じく race_date の (1 - holdout_frac) 分位点。
+    Returns:
+        (boost_mask, holdout_mask, new_cutoff)
+        boost_mask  : 旧カットオフ < date <= 新カットオフ（ブースター未学習 → 追加学習対象）
+        holdout_mask: date > 新カットオフ（再検証・キャリブレーション用）
+    """
+    d8 = _date8(race_date).reset_index(drop=True)
+    dates = pd.to_datetime(d8, format="%Y%m%d", errors="coerce")
+    cutoff = dates.quantile(1.0 - holdout_frac)
+    new_cutoff = cutoff.strftime("%Y%m%d") if pd.notna(cutoff) else str(train_cutoff)
+    new_cutoff = max(new_cutoff, str(train_cutoff))
+    valid = (d8 != "").values
+    boost_mask = valid & (d8 > str(train_cutoff)).values & (d8 <= new_cutoff).values
+    holdout_mask = valid & (d8 > new_cutoff).values
+    return boost_mask, holdout_mask, new_cutoff
+
+
+def continue_params(booster: Any, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """既存ブースターの学習パラメータを継承した追加学習用パラメータを返す"""
+    params = dict(defaults)
+    params.update(dict(getattr(booster, "params", None) or {}))
+    for k in _NON_INHERITED_PARAMS:
+        params.pop(k, None)
+    params.setdefault("verbose", -1)
+    return params
+
+
+def continue_boosting(
+    booster: Any,
+    X: pd.DataFrame,
+    y: pd.Series,
+    params: Dict[str, Any],
+    num_boost_round: int,
+    categorical_feature: "Sequence[int] | str" = "auto",
+    callbacks: Optional[list] = None,
+) -> Any:
+    """既存ブースターを init_model として num_boost_round 本の木を追加した新ブースターを返す。
+
+    元の booster は変更しない（ガードレールで差し戻せるように）。
+    """
+    import lightgbm as lgb
+
+    train_data = lgb.Dataset(X, y, categorical_feature=categorical_feature, free_raw_data=False)
+    return lgb.train(
+        params, train_data,
+        num_boost_round=int(num_boost_round),
+        init_model=booster,
+        keep_training_booster=False,
+        callbacks=callbacks or [],
+    )
+
+
+def holdout_loss(booster: Any, X: pd.DataFrame, y: pd.Series, is_regression: bool) -> float:
+    """ホールドアウト損失（分類: logloss / 回帰: RMSE。小さいほど良い）"""
+    pred = np.asarray(booster.predict(X), dtype=float)
+    y_arr = np.asarray(y, dtype=float)
+    if is_regression:
+        return float(np.sqrt(np.nanmean((y_arr - pred) ** 2)))
+    p = np.clip(pred, 1e-15, 1.0 - 1e-15)
+    return float(-np.mean(y_arr * np.log(p) + (1.0 - y_arr) * np.log(1.0 - p)))
+
+
+def degradation_exceeded(base_loss: float, new_loss: float, tolerance: float) -> bool:
+    """新モデルの損失が旧モデル比で tolerance（相対）を超えて悪化したか"""
+    if not np.isfinite(new_loss):
+        return True
+    if not np.isfinite(base_loss):
+        return False
+    return new_loss > base_loss * (1.0 + tolerance)
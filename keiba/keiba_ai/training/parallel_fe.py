@@ -0,0 +1,147 @@
+"""
+開催日パーティション単位の並列特徴量生成（add_derived_features の step 2〜9）
+
+学習フレームに対する add_derived_features(df, full_history_df=df) はシングルスレッドの
+pandas で、履歴を使わないステージ（_fe_horse_category〜_fe_missing_flags）も全行を
+1 プロセスで処理していた。これらはレース単位で完結するため、本モジュールでは
+
+  1. 各レースを開催日（race_date、無ければ race_id[:8]）に割り当て、行数が均等になるよう
+     連続した日付範囲のパーティションに分ける（レースがパーティションをまたぐことはない）
+  2. パーティションごとに _fe_stateless をプロセスプールで実行する。単一スレッドのプロセス
+     （CLI・オフライン学習）で fork が使える場合は入力フレームをモジュール変数に置いてから
+     fork し、子プロセスは行位置だけを受け取ってコピーオンライトで参照する（入力の pickle が
+     発生しない）。API プロセスのようにスレッド（uvicorn・keiba-io / to_thread のプール・
+     LightGBM の OpenMP）が動いている場合は、fork 時点で握られていたロックで子が固まり得るため
+     forkserver（無ければ spawn）で起動し、分割フレームを pickle で渡す
+  3. 結果を元の行順に連結し、パーティションごとに値の種類が違うダミー列
+     （sex_* / pace_* / pop_trend_*）を補って列順を直列実行に合わせる
+  4. レースをまたぐ z-score（_SPEED_ZSCORE_KEYS）だけ全体で計算し直す
+
+_fe_history は呼び出し側（add_derived_features）が連結後の全体に対して 1 回だけ実行する。
+
+注意: race_date の書式判定（NaN 率 50% 超なら別書式で再パース）はパーティション内で行われる。
+書式が混在する日付列では直列実行と一致しないことがある。
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..stage_profiler import traced_stage
+
+# fork した子プロセスが参照する (入力フレーム, odds_drift_df)
+_SHARED: Optional[Tuple[pd.DataFrame, Optional[pd.DataFrame]]] = None
+
+# 値の種類で列が増えるダミー化の元列と、その出力列の接頭辞
+_DUMMY_SOURCES = ("sex", "pace_classification", "popularity_trend")
+_DUMMY_PREFIXES = ("sex_", "pace_", "pop_trend_", "rest_")
+
+
+def partition_by_race_date(df: pd.DataFrame, n_parts: int) -> List[np.ndarray]:
+    """行位置をレース単位のまま開催日の連続範囲で n_parts 個以下に分ける（空のパーティションは返さない）。"""
+    if len(df) == 0:
+        return []
+    date = df["race_date"] if "race_date" in df.columns else df["race_id"].str[:8]
+    date = date.astype(str).str.strip()
+    if "race_id" in df.columns:
+        date = date.groupby(df["race_id"], sort=False, dropna=False).transform("first")
+    codes, _ = pd.factorize(date, sort=True)
+    codes = codes + 1                                   # 欠損日付（-1）は先頭に寄せる
+    per_date = np.bincount(codes)
+    start_rows = np.cumsum(per_date) - per_date         # 各日付より前の行数
+    part_of_date = np.minimum(start_rows * n_parts // len(df), n_parts - 1)
+    part = part_of_date[codes]
+    order = np.argsort(part, kind="stable")
+    bounds = np.flatnonzero(np.diff(part[order])) + 1
+    return [p for p in np.split(order, bounds) if len(p)]
+
+
+def _thread_count() -> int:
+    """プロセス内のスレッド数（ネイティブスレッドを含む。/proc が無ければ Python スレッドのみ）"""
+    try:
+        return len(os.listdir("/proc/self/task"))
+    except OSError:
+        return threading.active_count()
+
+
+def _start_method() -> str:
+    """fork は他のスレッドがいないときだけ使う（マルチスレッドからの fork はデッドロックし得る）"""
+    methods = mp.get_all_start_methods()
+    if "fork" in methods and _thread_count() == 1:
+        return "fork"
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+def _run_partition(task) -> pd.DataFrame:
+    from keiba_ai.feature_engineering import _fe_stateless  # type: ignore
+
+    positions, shard, odds_drift_df = task
+    if shard is None:
+        frame, odds_drift_df = _SHARED                  # fork 済み: 親のフレームを参照
+        shard = frame.iloc[positions]
+    return _fe_stateless(shard.reset_index(drop=True), odds_drift_df)
+
+
+def _probe_rows(df: pd.DataFrame) -> np.ndarray:
+    """直列実行と同じ列集合・列順を得るための代表行（各ダミー元列の値ごとに先頭 1 行）"""
+    rows = {0}
+    for col in _DUMMY_SOURCES:
+        if col in df.columns:
+            s = df[col].reset_index(drop=True)
+            rows.update(s[~s.duplicated() & s.notna()].index.tolist())
+    return np.array(sorted(rows))
+
+
+@traced_stage
+def fe_stateless_parallel(
+    df: pd.DataFrame,
+    odds_drift_df: Optional[pd.DataFrame],
+    n_jobs: int,
+    n_parts: Optional[int] = None,
+) -> pd.DataFrame:
+    """_fe_stateless を開催日パーティション単位で並列実行する（出力は直列実行と同じ行順・列順）。"""
+    from keiba_ai.feature_engineering import _SPEED_ZSCORE_KEYS, _fe_stateless, _speed_zscore  # type: ignore
+
+    global _SHARED
+    df = df.reset_index(drop=True)
+    parts = partition_by_race_date(df, n_parts or n_jobs * 2) if "race_id" in df.columns else []
+    if n_jobs <= 1 or len(parts) <= 1 or "race_id" not in df.columns:
+        return _fe_stateless(df, odds_drift_df)
+
+    method = _start_method()
+    if method == "fork":
+        _SHARED = (df, odds_drift_df)
+        tasks = [(p, None, None) for p in parts]
+    else:
+        tasks = [(p, df.iloc[p], odds_drift_df) for p in parts]
+    try:
+        ctx = mp.get_context(method)
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(parts)), mp_context=ctx) as pool:
+            results = list(pool.map(_run_partition, tasks))
+    finally:
+        _SHARED = None
+
+    # 列集合・列順は代表行での直列実行に合わせる（無い値のダミー列は False）
+    template = _fe_stateless(df.iloc[_probe_rows(df)].reset_index(drop=True), odds_drift_df)
+    out = pd.concat(results, ignore_index=True)
+    missing = [c for c in template.columns
+               if c.startswith(_DUMMY_PREFIXES) and any(c not in r.columns for r in results)]
+    for c in missing:
+        out[c] = out[c].astype(object).fillna(False).astype(bool) if c in out.columns else False
+    out = out[list(template.columns)]
+    out = out.take(np.argsort(np.concatenate(parts), kind="stable")).reset_index(drop=True)
+
+    # レースをまたぐ統計は全体で計算し直す
+    for z_col, index_col, keys in _SPEED_ZSCORE_KEYS:
+        if z_col in out.columns and index_col in out.columns:
+            z = _speed_zscore(out[index_col], df[[c for c in keys if c in df.columns]])
+            out[z_col] = z
+            if f"{z_col}_is_missing" in out.columns:
+                out[f"{z_col}_is_missing"] = pd.Series(z, index=out.index).isna().astype(int)
+    return out
@@ -1,14 +1,45 @@
 """
 Ultimate版特徴量計算モジュール
 過去10走統計を自動計算
+
+calculate_horse_past_10_races / calculate_jockey_stats / calculate_trainer_stats は
+1 行ごとに race_results_ultimate を全件走査する参照実装。フレーム全体には
+calculate_batch（add_ultimate_features が使用）を使うこと。履歴を 1 回だけ読み込み、
+エンティティ ID を整数コード化して (エンティティ, race_id) 順に並べ、
+過去10走は NumPy の窓ギャザー、騎手/調教師の直近期間は累積和の差で全行を一括計算する。
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 import sqlite3
 from pathlib import Path
 
 
+# 一括計算で race_results_ultimate の JSON から取り出すキー
+_HISTORY_KEYS = (
+    'horse_id', 'jockey_id', 'jockey_name', 'trainer_id', 'trainer_name',
+    'finish_position', 'finish', 'popularity',
+    'weight_kg', 'horse_weight', 'weight', 'weight_change',
+    'last_3f_time', 'last_3f', 'last_3f_rank',
+)
+_PAST_N = 10
+
+_JOCKEY_DEFAULTS = {
+    'jockey_recent_win_rate': 0.0,
+    'jockey_recent_place_rate': 0.0,
+    'jockey_recent_show_rate': 0.0,
+    'jockey_recent_races': 0,
+    'jockey_avg_finish': 0.0,
+}
+_TRAINER_DEFAULTS = {
+    'trainer_recent_win_rate': 0.0,
+    'trainer_recent_place_rate': 0.0,
+    'trainer_recent_show_rate': 0.0,
+    'trainer_recent_races': 0,
+}
+
+
 class UltimateFeatureCalculator:
     """Ultimate版特徴量（過去10走統計）を計算"""
     
@@ -306,9 +337,115 @@ class UltimateFeatureCalculator:
             'trainer_recent_races': len(df),
         }
     
+    # ── 一括計算 ────────────────────────────────────────────────────────
+
+    def load_history(self, before_race_id: Optional[str] = None) -> pd.DataFrame:
+        """race_results_ultimate から一括計算に必要なキーだけを 1 回の走査で取り出す
+
+        Returns:
+            race_id と各キーの値 / 有無（has_*）を持つ DataFrame。数値キーは数値化済み
+            （"中止" などは NaN）。1 レコード内の優先順位は per-row 版の列マッピングと同じ。
+        """
+        exprs = ", ".join(
+            f"json_extract(data, '$.{k}'), json_type(data, '$.{k}') IS NOT NULL" for k in _HISTORY_KEYS
+        )
+        query = f"SELECT race_id, {exprs} FROM race_results_ultimate WHERE race_id IS NOT NULL AND json_valid(data)"
+        params: Tuple = ()
+        if before_race_id is not None:
+            query += " AND race_id < ?"
+            params = (str(before_race_id),)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+        cols = ['race_id'] + [f"{p}{k}" for k in _HISTORY_KEYS for p in ('', 'has_')]
+        raw = pd.DataFrame.from_records(rows, columns=cols)
+
+        def _num(k: str) -> np.ndarray:
+            return pd.to_numeric(raw[k], errors='coerce').to_numpy(dtype=float)
+
+        def _has(k: str) -> np.ndarray:
+            return raw[f'has_{k}'].to_numpy(dtype=bool)
+
+        def _first(keys: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+            """keys のうちレコードに存在する最初のキーの値"""
+            val = np.full(len(raw), np.nan)
+            has = np.zeros(len(raw), dtype=bool)
+            for k in reversed(keys):
+                val = np.where(_has(k), _num(k), val)
+                has |= _has(k)
+            return val, has
+
+        hist = raw[['race_id', 'horse_id', 'jockey_id', 'jockey_name', 'trainer_id', 'trainer_name']].copy()
+        hist['race_id'] = hist['race_id'].astype(str)
+        for name, keys in (
+            ('finish', ('finish_position', 'finish')),
+            ('popularity', ('popularity',)),
+            ('weight_kg', ('weight_kg', 'horse_weight', 'weight')),
+            ('weight_change', ('weight_change',)),
+            ('last_3f', ('last_3f_time', 'last_3f')),
+            ('last_3f_rank', ('last_3f_rank',)),
+        ):
+            hist[name], hist[f'has_{name}'] = _first(keys)
+        return hist
+
+    def calculate_batch(
+        self,
+        df: pd.DataFrame,
+        history: Optional[pd.DataFrame] = None,
+        days: int = 180,
+    ) -> pd.DataFrame:
+        """フレーム全体の過去10走・騎手/調教師直近統計を一括計算する（per-row 版と同じ値）
+
+        Args:
+            df: race_id と horse_id / jockey_id / trainer_id（あるものだけ計算）を持つフレーム
+            history: load_history の結果（省略時は df の最大 race_id より前を読み込む）
+            days: 騎手・調教師の集計期間（日数）
+
+        Returns:
+            df と同じ index の統計 DataFrame
+        """
+        out = pd.DataFrame(index=df.index)
+        if 'race_id' not in df.columns or len(df) == 0:
+            return out
+        race_ids = df['race_id'].astype(str).to_numpy()
+        if history is None:
+            history = self.load_history(before_race_id=max(race_ids))
+        index = _HistoryIndex(history)
+        q_rank = index.rank(race_ids)
+
+        if 'horse_id' in df.columns:
+            out = out.join(pd.DataFrame(
+                _horse_past_n_batch(index, index.codes(df['horse_id']), q_rank, self._get_default_stats()),
+                index=df.index,
+            ))
+
+        lo_rank = index.rank(_cutoff_dates(race_ids, days)) if len(race_ids) else q_rank
+        for role, defaults in (('jockey', _JOCKEY_DEFAULTS), ('trainer', _TRAINER_DEFAULTS)):
+            if f'{role}_id' not in df.columns:
+                continue
+            sums = index.entity_window_sums(role, index.codes(df[f'{role}_id']), lo_rank, q_rank)
+            n = sums['n']
+            found = sums['has_finish'] > 0
+            safe_n = np.where(n > 0, n, 1)
+            stats = {
+                f'{role}_recent_win_rate': np.where(found, sums['win'] / safe_n, 0.0),
+                f'{role}_recent_place_rate': np.where(found, sums['place'] / safe_n, 0.0),
+                f'{role}_recent_show_rate': np.where(found, sums['show'] / safe_n, 0.0),
+                f'{role}_recent_races': np.where(found, n, 0).astype(int),
+            }
+            if role == 'jockey':
+                valid = sums['valid']
+                avg = np.where(valid > 0, sums['fsum'] / np.maximum(valid, 1), np.nan)
+                stats['jockey_avg_finish'] = np.where(found, avg, 0.0)
+            out = out.join(pd.DataFrame({k: stats[k] for k in defaults}, index=df.index))
+        return out
+
     def add_ultimate_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        データフレームにUltimate版特徴量を追加
+        データフレームにUltimate版特徴量を追加（calculate_batch で全行を一括計算）
         
         Args:
             df: 入力データフレーム（horse_id, jockey_id, trainer_id, race_id必須）
@@ -319,42 +456,16 @@ class UltimateFeatureCalculator:
         df = df.copy()
         
         print(f"\n🚀 Ultimate版特徴量計算開始: {len(df)}行")
-        
-        # 馬の過去10走統計
-        if 'horse_id' in df.columns and 'race_id' in df.columns:
-            print("  - 馬の過去10走統計を計算中...")
-            horse_stats_list = []
-            for idx, row in df.iterrows():
-                stats = self.calculate_horse_past_10_races(row['horse_id'], row['race_id'])
-                horse_stats_list.append(stats)
-            
-            horse_stats_df = pd.DataFrame(horse_stats_list)
-            df = pd.concat([df, horse_stats_df], axis=1)
-            print(f"    ✓ {len(horse_stats_df.columns)}個の特徴量を追加")
-        
-        # 騎手統計
-        if 'jockey_id' in df.columns:
-            print("  - 騎手統計を計算中...")
-            jockey_stats_list = []
-            for idx, row in df.iterrows():
-                stats = self.calculate_jockey_stats(row['jockey_id'], row['race_id'])
-                jockey_stats_list.append(stats)
-            
-            jockey_stats_df = pd.DataFrame(jockey_stats_list)
-            df = pd.concat([df, jockey_stats_df], axis=1)
-            print(f"    ✓ {len(jockey_stats_df.columns)}個の特徴量を追加")
-        
-        # 調教師統計
-        if 'trainer_id' in df.columns:
-            print("  - 調教師統計を計算中...")
-            trainer_stats_list = []
-            for idx, row in df.iterrows():
-                stats = self.calculate_trainer_stats(row['trainer_id'], row['race_id'])
-                trainer_stats_list.append(stats)
-            
-            trainer_stats_df = pd.DataFrame(trainer_stats_list)
-            df = pd.concat([df, trainer_stats_df], axis=1)
-            print(f"    ✓ {len(trainer_stats_df.columns)}個の特徴量を追加")
+        stats_df = self.calculate_batch(df)
+        role_cols = {
+            '馬の過去10走統計': [c for c in stats_df.columns if not c.startswith(('jockey_', 'trainer_'))],
+            '騎手統計': [c for c in stats_df.columns if c.startswith('jockey_')],
+            '調教師統計': [c for c in stats_df.columns if c.startswith('trainer_')],
+        }
+        for label, cols in role_cols.items():
+            if cols:
+                print(f"  - {label}: ✓ {len(cols)}個の特徴量を追加")
+        df = pd.concat([df, stats_df], axis=1)
         
         print(f"✓ Ultimate版特徴量計算完了: 合計{len(df.columns)}列")
         
@@ -388,6 +499,184 @@ class UltimateFeatureCalculator:
         }
 
 
+def _cutoff_dates(race_ids: np.ndarray, days: int) -> np.ndarray:
+    """per-row 版と同じ集計開始日（race_id[:8] - days。日付でなければ全期間 '00000000'）"""
+    cutoff = {}
+    for rid in pd.unique(race_ids):
+        try:
+            cutoff[rid] = (datetime.strptime(rid[:8], '%Y%m%d') - timedelta(days=days)).strftime('%Y%m%d')
+        except ValueError:
+            cutoff[rid] = '00000000'
+    return np.array([cutoff[r] for r in race_ids], dtype=str)
+
+
+class _HistoryIndex:
+    """load_history の結果を (エンティティコード, race_id 順位) で引けるようにした索引"""
+
+    _METRICS = ('n', 'has_finish', 'win', 'place', 'show', 'valid', 'fsum')
+
+    def __init__(self, hist: pd.DataFrame):
+        self.hist = hist.reset_index(drop=True)
+        self.races = np.unique(self.hist['race_id'].to_numpy(dtype=str))
+        self.R = len(self.races) + 1
+        self.hist_rank = np.searchsorted(self.races, self.hist['race_id'].to_numpy(dtype=str))
+        # ID と名前を同じコード空間に載せる（jockey_id == jockey_name 照合のため）
+        id_cols = [c for c in ('horse_id', 'jockey_id', 'jockey_name', 'trainer_id', 'trainer_name') if c in self.hist]
+        values = pd.concat([self.hist[c] for c in id_cols], ignore_index=True) if id_cols else pd.Series([], dtype=object)
+        _, uniques = pd.factorize(values)
+        self._keys = pd.Index(uniques)
+        self._prefix: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+
+        f = self.hist['finish'].to_numpy(dtype=float)
+        valid = ~np.isnan(f)
+        self._metric_rows = np.column_stack([
+            np.ones(len(f)),
+            self.hist['has_finish'].to_numpy(dtype=float),
+            (valid & (f == 1)).astype(float),
+            (valid & (f <= 2)).astype(float),
+            (valid & (f <= 3)).astype(float),
+            valid.astype(float),
+            np.where(valid, f, 0.0),
+        ]) if len(f) else np.zeros((0, len(self._METRICS)))
+
+    def codes(self, values) -> np.ndarray:
+        """値 → エンティティコード（履歴に無い値・欠損は -1）"""
+        return self._keys.get_indexer(pd.Index(values, dtype=object)) if len(self._keys) else np.full(len(values), -1)
+
+    def rank(self, race_ids) -> np.ndarray:
+        """race_id → それ未満の履歴 race_id の種類数（SQL の race_id < ? と同じ文字列比較）"""
+        return np.searchsorted(self.races, np.asarray(race_ids, dtype=str), side='left')
+
+    def sorted_by(self, col: str) -> Tuple[np.ndarray, np.ndarray]:
+        """col のコードと race_id 順位で並べた (複合キー, 元の行番号)。コード -1 の行は除く"""
+        c = self.codes(self.hist[col]) if col in self.hist else np.full(len(self.hist), -1)
+        keep = np.flatnonzero(c >= 0)
+        order = keep[np.lexsort((self.hist_rank[keep], c[keep]))]
+        return c[order].astype(np.int64) * self.R + self.hist_rank[order], order
+
+    def entity_window_sums(
+        self, role: str, q_codes: np.ndarray, lo_rank: np.ndarray, hi_rank: np.ndarray,
+    ) -> Dict[str, np.ndarray]:
+        """{role}_id または {role}_name がクエリと一致し lo <= race 順位 < hi のレコードの集計"""
+        total = np.zeros((len(q_codes), len(self._METRICS)))
+        for kind, sign in (('id', 1.0), ('name', 1.0), ('both', -1.0)):
+            comp, cum = self._prefix_sums(role, kind)
+            q = np.asarray(q_codes, dtype=np.int64)
+            s = np.searchsorted(comp, q * self.R + lo_rank, side='left')
+            e = np.searchsorted(comp, q * self.R + hi_rank, side='left')
+            total += sign * np.where((q >= 0)[:, None], cum[e] - cum[s], 0.0)
+        return {m: total[:, j] for j, m in enumerate(self._METRICS)}
+
+    def _prefix_sums(self, role: str, kind: str) -> Tuple[np.ndarray, np.ndarray]:
+        key = (role, kind)
+        if key not in self._prefix:
+            if kind == 'both':
+                # ID と名前が同じ値のレコードは id / name の両方で数えられるので差し引く
+                c_id = self.codes(self.hist[f'{role}_id']) if f'{role}_id' in self.hist else np.full(len(self.hist), -1)
+                c_nm = self.codes(self.hist[f'{role}_name']) if f'{role}_name' in self.hist else np.full(len(self.hist), -1)
+                c = np.where(c_id == c_nm, c_id, -1)
+                keep = np.flatnonzero(c >= 0)
+                order = keep[np.lexsort((self.hist_rank[keep], c[keep]))]
+                comp = c[order].astype(np.int64) * self.R + self.hist_rank[order]
+            else:
+                comp, order = self.sorted_by(f'{role}_{kind}')
+            cum = np.vstack([np.zeros((1, len(self._METRICS))), np.cumsum(self._metric_rows[order], axis=0)])
+            self._prefix[key] = (comp, cum)
+        return self._prefix[key]
+
+
+def _horse_past_n_batch(
+    index: _HistoryIndex, q_codes: np.ndarray, q_rank: np.ndarray, defaults: Dict, n_past: int = _PAST_N,
+) -> Dict[str, np.ndarray]:
+    """各クエリ行について race_id 降順の直近 n_past 走を (行, 走) 行列に集めて統計を計算する"""
+    comp, order = index.sorted_by('horse_id')
+    q = np.asarray(q_codes, dtype=np.int64)
+    end = np.searchsorted(comp, q * index.R + q_rank, side='left')
+    start = np.searchsorted(comp, q * index.R, side='left')
+    n = np.where(q >= 0, np.clip(end - start, 0, n_past), 0)
+    j = np.arange(n_past)
+    in_win = j[None, :] < n[:, None]
+    rows = order[np.clip(end[:, None] - 1 - j[None, :], 0, max(len(order) - 1, 0))] if len(order) else np.zeros((len(q), n_past), dtype=int)
+
+    def _take(col: str) -> Tuple[np.ndarray, np.ndarray]:
+        if not len(order):
+            return np.full(in_win.shape, np.nan), np.zeros(len(q), dtype=bool)
+        vals = np.where(in_win, index.hist[col].to_numpy(dtype=float)[rows], np.nan)
+        present = (in_win & index.hist[f'has_{col}'].to_numpy(dtype=bool)[rows]).any(axis=1)
+        return vals, present
+
+    def _mean(x: np.ndarray) -> np.ndarray:
+        k = (~np.isnan(x)).sum(axis=1)
+        return np.where(k > 0, np.nansum(x, axis=1) / np.maximum(k, 1), np.nan)
+
+    F, has_f = _take('finish')
+    P, has_p = _take('popularity')
+    W, has_w = _take('weight_kg')
+    WC, has_wc = _take('weight_change')
+    L, has_l = _take('last_3f')
+    LR, has_lr = _take('last_3f_rank')
+
+    k_f = (~np.isnan(F)).sum(axis=1)
+    mean_f = _mean(F)
+    dev = np.where(np.isnan(F), 0.0, F - mean_f[:, None])
+    std_f = np.where(k_f >= 2, np.sqrt((dev ** 2).sum(axis=1) / np.maximum(k_f - 1, 1)), np.nan)
+    safe_n = np.maximum(n, 1)
+    with np.errstate(invalid='ignore'):
+        head3 = _mean(F[:, :3])
+        form = 10 - head3
+        stats = {
+            'past_10_races_count': n,
+            'past_10_avg_finish': mean_f,
+            'past_10_std_finish': np.where(n > 1, std_f, 0.0),
+            'past_10_best_finish': np.where(k_f > 0, np.where(np.isnan(F), np.inf, F).min(axis=1), np.nan),
+            'past_10_worst_finish': np.where(k_f > 0, np.where(np.isnan(F), -np.inf, F).max(axis=1), np.nan),
+            'past_10_win_rate': (F == 1).sum(axis=1) / safe_n,
+            'past_10_place_rate': (F <= 2).sum(axis=1) / safe_n,
+            'past_10_show_rate': (F <= 3).sum(axis=1) / safe_n,
+            'past_10_avg_popularity': np.where(has_p, _mean(P), 0.0),
+            'recent_3_avg_finish': np.where(n >= 3, head3, mean_f),
+            'past_7_avg_finish': np.where(n >= 10, _mean(F[:, 3:10]), 0.0),
+            'finish_consistency': np.where(n > 1, 1 / (1 + std_f), 0.5),
+            'recent_form_score': np.where(n >= 3, np.where(form > 0, form, 0.0) / 10, 0.0),
+        }
+
+    # 体重トレンド: 直近 5 走の有効値に 0..k-1 を振った最小二乗の傾き
+    W5 = W[:, :5]
+    w_ok = ~np.isnan(W5)
+    k_w = w_ok.sum(axis=1)
+    x = np.where(w_ok, np.cumsum(w_ok, axis=1) - 1, 0).astype(float)
+    xm = np.where(w_ok, x, 0.0).sum(axis=1) / np.maximum(k_w, 1)
+    ym = _mean(W5)
+    sxx = np.where(w_ok, (x - xm[:, None]) ** 2, 0.0).sum(axis=1)
+    sxy = np.where(w_ok, (x - xm[:, None]) * (np.nan_to_num(W5) - np.nan_to_num(ym)[:, None]), 0.0).sum(axis=1)
+    stats['past_5_weight_slope'] = np.where(has_w & (k_w >= 3), sxy / np.where(sxx > 0, sxx, 1.0), 0.0)
+    WC5 = WC[:, :5]
+    stats['past_5_weight_avg_change'] = np.where(
+        has_wc & ((~np.isnan(WC5)).sum(axis=1) >= 2), _mean(WC5), 0.0,
+    )
+
+    # 上がり3F統計
+    k_l = (~np.isnan(L)).sum(axis=1)
+    stats['past_10_avg_last3f_time'] = np.where(has_l & (k_l >= 1), _mean(L), np.nan)
+    stats['past_10_best_last3f_time'] = np.where(
+        has_l & (k_l >= 1), np.where(np.isnan(L), np.inf, L).min(axis=1), np.nan,
+    )
+    stats['recent_3_avg_last3f_time'] = np.where(has_l, _mean(L[:, :3]), np.nan)
+    k_lr = (~np.isnan(LR)).sum(axis=1)
+    stats['past_10_avg_last3f_rank'] = np.where(has_lr & (k_lr >= 1), _mean(LR), np.nan)
+    stats['past_10_last3f_top1_rate'] = np.where(
+        has_lr & (k_lr >= 1), (LR == 1).sum(axis=1) / np.maximum(k_lr, 1), 0.0,
+    )
+
+    # 履歴なし / 着順キーが 1 件も無い行はデフォルト値
+    use_default = (n == 0) | ~has_f
+    return {
+        k: np.where(use_default, defaults[k], stats[k]) if k != 'past_10_races_count'
+        else np.where(use_default, 0, n).astype(int)
+        for k in defaults
+    }
+
+
 def test_ultimate_features():
     """テスト実行"""
     import sys
@@ -5,6 +5,7 @@
 from __future__ import annotations
 
 import logging
+import os
 import sys
 from ipaddress import ip_address
 from pathlib import Path
@@ -34,11 +35,14 @@ logger.info(f"ログファイル: {log_file}")
 logger.info("=" * 80)
 
 # ── パス定数 ──────────────────────────────────────────────────────
-MODELS_DIR = Path(__file__).parent / "models"
-MODELS_DIR.mkdir(exist_ok=True)
+# KEIBA_MODELS_DIR / KEIBA_ULTIMATE_DB で差し替え可能（負荷試験の合成データなど）
+MODELS_DIR = Path(os.environ.get("KEIBA_MODELS_DIR") or Path(__file__).parent / "models")
+MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
 CONFIG_PATH = Path(__file__).parent.parent / "keiba" / "config.yaml"
-ULTIMATE_DB = Path(__file__).parent.parent / "keiba" / "data" / "keiba_ultimate.db"
+ULTIMATE_DB = Path(
+    os.environ.get("KEIBA_ULTIMATE_DB") or Path(__file__).parent.parent / "keiba" / "data" / "keiba_ultimate.db"
+)
 
 # ── keiba_ai.config の load_config を再エクスポート ──────────────
 try:
@@ -1,4 +1,5 @@
 # betting/ — 投票・購入戦略パッケージ
 # strategy.py : Kelly基準・購入推奨ロジック
+# combination.py : Harville 組み合わせ確率エンジン（NumPy）
 # execute.py  : 自動投票CLIスクリプト
 # ipat.py     : IPATブラウザ投票実装
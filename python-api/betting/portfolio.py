@@ -0,0 +1,381 @@
+"""
+開催日単位の馬券ポートフォリオ最適化（フラクショナル・ケリー）
+
+BettingRecommender はレースごとに独立して「最高期待値の 1 頭にケリー額」を決めるが、
+土日の全レースを買う場合は資金を日単位でまとめて配分したい。本モジュールでは
+全レースの組み合わせ確率（Harville）とオッズから、
+
+    maximize  Σ_race Σ_ω P(ω) · log( 1 - S_race + Σ_b f_b · odds_b · 1[b が ω で的中] )
+    s.t.      f ≥ 0,  Σ_{b∈race} f_b ≤ per_race_limit / bankroll,  Σ_b f_b ≤ budget / bankroll
+
+を対数バリア法（ニュートン法）で解く（ω は 1〜3 着の着順。単勝〜三連単の的中はすべて着順の関数なので、
+同一レース内で券種を混ぜても同時分布を正しく扱える）。
+得られた最適解（フルケリー）に kelly_fraction を掛け、100 円単位に丸めて
+routers/bet_export.py と同じ買い目行を返す。
+
+ニュートン方向はレースごとの小さな (K, K) 連立方程式をまとめて解くだけなので、
+36 レース × 30 候補でも 1 秒を大きく下回る（外部ソルバーには依存しない）。
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from betting.combination import (  # type: ignore
+    candidate_arrays,
+    estimated_odds,
+    format_combination,
+    harville_probabilities,
+    market_probabilities,
+    odds_tensor,
+)
+
+# 券種コード → bet_export の日本語ラベル
+BET_TYPE_LABELS: Dict[str, str] = {
+    "tansho": "単勝",
+    "umaren": "馬連",
+    "wide": "ワイド",
+    "umatan": "馬単",
+    "sanrenpuku": "三連複",
+    "sanrentan": "三連単",
+}
+
+
+@dataclass
+class PortfolioRace:
+    """1 レース分の入力（確率は単勝確率、オッズは単勝 + 任意の組み合わせオッズ）"""
+
+    race_id: str
+    horse_numbers: Sequence[int]
+    win_probs: Sequence[float]
+    win_odds: Sequence[Optional[float]]
+    combination_odds: Dict[str, Mapping] = field(default_factory=dict)
+    race_info: Dict[str, Any] = field(default_factory=dict)
+    horse_names: Dict[int, str] = field(default_factory=dict)
+
+
+@dataclass
+class PortfolioConfig:
+    bankroll: int
+    budget: Optional[int] = None            # 開催日の総投資上限（省略時 bankroll の 10%）
+    per_race_limit: Optional[int] = None    # 1 レースの投資上限（省略時 bankroll の 3.5%）
+    kelly_fraction: float = 0.25
+    unit: int = 100
+    bet_types: Tuple[str, ...] = ("tansho", "umaren", "wide", "umatan", "sanrenpuku", "sanrentan")
+    min_ev: float = 1.0
+    min_prob: float = 0.0                   # 的中確率がこれ未満の買い目は候補にしない
+    max_candidates_per_race: int = 30
+    max_iter: int = 200
+    tol: float = 1e-10
+
+
+@dataclass
+class PortfolioResult:
+    rows: List[Dict[str, Any]]
+    expected_log_growth: float
+    iterations: int
+    solve_ms: float
+    total_cost: int
+
+
+# ── 候補と着順アウトカムの構築 ───────────────────────────────────────
+
+def _outcome_masks(kind: str, tuples: np.ndarray, F: np.ndarray) -> np.ndarray:
+    """候補 (m, size) が各着順アウトカム F (Ω, 3) で的中するかの (m, Ω) bool 行列"""
+    f0, f1, f2 = F[:, 0][None, :], F[:, 1][None, :], F[:, 2][None, :]
+    col = [tuples[:, i][:, None] for i in range(tuples.shape[1])]
+
+    def in_top3(x: np.ndarray) -> np.ndarray:
+        return (f0 == x) | (f1 == x) | (f2 == x)
+
+    if kind == "tansho":
+        return f0 == col[0]
+    if kind == "umaren":
+        return ((f0 == col[0]) & (f1 == col[1])) | ((f0 == col[1]) & (f1 == col[0]))
+    if kind == "wide":
+        return in_top3(col[0]) & in_top3(col[1])
+    if kind == "umatan":
+        return (f0 == col[0]) & (f1 == col[1])
+    if kind == "sanrenpuku":
+        return in_top3(col[0]) & in_top3(col[1]) & in_top3(col[2])
+    if kind == "sanrentan":
+        return (f0 == col[0]) & (f1 == col[1]) & (f2 == col[2])
+    raise ValueError(f"unsupported bet type: {kind}")
+
+
+def _race_candidates(race: PortfolioRace, cfg: PortfolioConfig) -> Optional[Dict[str, Any]]:
+    """1 レースの候補買い目と、的中パターンで圧縮したアウトカム行列を作る"""
+    nums = np.asarray(race.horse_numbers, dtype=int)
+    if len(nums) < 3:
+        return None
+    probs = harville_probabilities(race.win_probs, nums)
+    has_win_odds = any(o is not None and o > 1.0 for o in race.win_odds)
+    market = harville_probabilities(market_probabilities(race.win_odds)) if has_win_odds else None
+
+    kinds: List[str] = []
+    tuples_l: List[np.ndarray] = []
+    prob_l: List[np.ndarray] = []
+    odds_l: List[np.ndarray] = []
+    ev_l: List[np.ndarray] = []
+    for kind in cfg.bet_types:
+        if kind == "tansho":
+            real = odds_tensor({str(h): o for h, o in zip(nums, race.win_odds)}, nums, kind)
+            odds = real
+        else:
+            odds = estimated_odds(market, kind) if market is not None else np.full(probs.matrix(kind).shape, np.nan)
+            given = race.combination_odds.get(kind)
+            if given:
+                real = odds_tensor(given, nums, kind)
+                odds = np.where(np.isnan(real), odds, real)
+        tuples, prob, odd, ev = candidate_arrays(probs, kind, odds)
+        keep = (ev > cfg.min_ev) & (prob >= cfg.min_prob) & np.isfinite(odd) & (odd > 1.0)
+        if keep.any():
+            kinds += [kind] * int(keep.sum())
+            tuples_l.append(tuples[keep])
+            prob_l.append(prob[keep])
+            odds_l.append(odd[keep])
+            ev_l.append(ev[keep])
+    if not kinds:
+        return None
+
+    ev = np.concatenate(ev_l)
+    prob = np.concatenate(prob_l)
+    odd = np.concatenate(odds_l)
+    order = np.lexsort((-prob, -ev))[: cfg.max_candidates_per_race]
+    kind_arr = np.asarray(kinds, dtype=object)[order]
+    tuple_list = [t for arr in tuples_l for t in arr]
+    sel_tuples = [tuple_list[i] for i in order]
+
+    # 着順アウトカム（確率 > 0 の三連単）
+    F = np.argwhere(probs.trifecta > 0)
+    P = probs.trifecta[tuple(F.T)]
+    masks = np.zeros((len(order), len(F)), dtype=bool)
+    for kind in dict.fromkeys(kind_arr):
+        rows = np.flatnonzero(kind_arr == kind)
+        masks[rows] = _outcome_masks(kind, np.asarray([sel_tuples[i] for i in rows]), F)
+
+    # 的中パターンが同じアウトカムは確率を合算（+ どれも当たらないアウトカム 1 つ）
+    pays = masks.any(axis=0)
+    patterns, inverse = np.unique(masks[:, pays].T, axis=0, return_inverse=True)
+    pattern_p = np.bincount(inverse.ravel(), weights=P[pays], minlength=len(patterns))
+    miss_p = max(0.0, 1.0 - float(pattern_p.sum()))
+    if miss_p > 0:
+        patterns = np.vstack([patterns, np.zeros((1, len(order)), dtype=bool)])
+        pattern_p = np.append(pattern_p, miss_p)
+
+    return {
+        "race": race,
+        "kinds": list(kind_arr),
+        "horses": [nums[list(t)] for t in sel_tuples],
+        "prob": prob[order],
+        "odds": odd[order],
+        "ev": ev[order],
+        "patterns": patterns,
+        "pattern_p": pattern_p / pattern_p.sum(),
+    }
+
+
+# ── 最適化本体（対数バリア + ニュートン法、レース方向にバッチ化） ─────────────
+
+def _pad_races(cands: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """レースごとの (アウトカム, 買い目) をパディングして
+    A (R, Ω, K) = 的中時の純払戻（オッズ - 1、外れは -1）, P (R, Ω), 有効買い目 mask (R, K) を作る"""
+    R = len(cands)
+    n_w = max(len(c["pattern_p"]) for c in cands)
+    n_b = max(len(c["odds"]) for c in cands)
+    A = np.zeros((R, n_w, n_b))
+    P = np.zeros((R, n_w))
+    mask = np.zeros((R, n_b), dtype=bool)
+    for r, c in enumerate(cands):
+        w, b = c["patterns"].shape
+        A[r, :w, :b] = c["patterns"] * c["odds"][None, :] - 1.0
+        P[r, :w] = c["pattern_p"]
+        mask[r, :b] = True
+    return A, P, mask
+
+
+def _solve(
+    A: np.ndarray, P: np.ndarray, mask: np.ndarray,
+    race_cap: float, total_cap: float, max_iter: int, tol: float,
+) -> Tuple[np.ndarray, float, int]:
+    """maximize Σ P·log(1 + A f)  s.t. f ≥ 0, レース内合計 ≤ race_cap, 全体合計 ≤ total_cap
+
+    レース間の結合は全体予算のバリア項だけ（ヘッセ行列はブロック対角 + ランク 1）なので、
+    ニュートン方向はレースごとの (K, K) 連立方程式 + Sherman–Morrison で求まる。
+    """
+    R, _, K = A.shape
+    n_valid = int(mask.sum())
+    eye = np.eye(K)
+    pair = (mask[:, :, None] & mask[:, None, :]).astype(float)
+    f = np.where(mask, min(race_cap, total_cap / R) / (4.0 * K), 0.0)
+
+    def barrier(f: np.ndarray, mu: float) -> float:
+        W = 1.0 + (A @ f[:, :, None])[..., 0]
+        s = f.sum(axis=1)
+        slack_r, slack_t = race_cap - s, total_cap - s.sum()
+        if (W <= 0).any() or (f[mask] <= 0).any() or (slack_r <= 0).any() or slack_t <= 0:
+            return -np.inf
+        return float((P * np.log(W)).sum()
+                     + mu * (np.log(f[mask]).sum() + np.log(slack_r).sum() + np.log(slack_t)))
+
+    mu, it = 1e-3, 0
+    while it < max_iter:
+        for _ in range(50):
+            it += 1
+            W = 1.0 + (A @ f[:, :, None])[..., 0]
+            s = f.sum(axis=1)
+            slack_r, slack_t = race_cap - s, total_cap - s.sum()
+            y = P / W
+            f_safe = np.where(mask, f, 1.0)
+            g = (y[:, None, :] @ A)[:, 0, :] + mu / f_safe - (mu / slack_r)[:, None] - mu / slack_t
+            g = np.where(mask, g, 0.0)
+            # -H = A^T diag(P/W²) A + μ diag(1/f²) + μ/slack_r² 11^T （+ 全体予算のランク 1 項）
+            D = (A * (y / W)[:, :, None]).transpose(0, 2, 1) @ A
+            D += eye * np.where(mask, mu / f_safe ** 2, 1.0)[:, :, None]
+            D += (mu / slack_r ** 2)[:, None, None] * pair
+            u = np.where(mask, np.sqrt(mu) / slack_t, 0.0)
+            sol = np.linalg.solve(D, np.stack([g, u], axis=2))
+            Dg, Du = sol[..., 0], sol[..., 1]
+            d = Dg - Du * (u * Dg).sum() / (1.0 + (u * Du).sum())
+            d = np.where(mask, d, 0.0)
+            decrement = float((g * d).sum())
+            if decrement / 2 < tol:
+                break
+            # 可行域内に留まる最大ステップ → バックトラッキング
+            step = 1.0
+            neg = d < 0
+            if neg.any():
+                step = min(step, 0.99 * float(np.min(-f[neg] / d[neg])))
+            ds = d.sum(axis=1)
+            grow = ds > 0
+            if grow.any():
+                step = min(step, 0.99 * float(np.min(slack_r[grow] / ds[grow])))
+            if ds.sum() > 0:
+                step = min(step, 0.99 * slack_t / float(ds.sum()))
+            dW = (A @ d[:, :, None])[..., 0]
+            shrink = dW < 0
+            if shrink.any():
+                step = min(step, 0.99 * float(np.min(-W[shrink] / dW[shrink])))
+            base = barrier(f, mu)
+            while barrier(f + step * d, mu) < base + 0.25 * step * decrement and step > 1e-12:
+                step *= 0.5
+            f = f + step * d
+            if it >= max_iter:
+                break
+        # 双対ギャップ ≒ μ × 不等式制約数
+        if mu * (n_valid + R + 1) < tol:
+            break
+        mu *= 0.1
+
+    W = 1.0 + (A @ f[:, :, None])[..., 0]
+    return np.where(mask, f, 0.0), float((P * np.log(W)).sum()), it
+
+
+def _round_units(
+    stake_yen: np.ndarray, race_of_b: np.ndarray, unit: int, race_cap_yen: float, total_cap_yen: float,
+) -> np.ndarray:
+    """最小単位へ切り捨て → 端数の大きい順に制約内で 1 単位ずつ戻す"""
+    units = np.floor(stake_yen / unit + 1e-9).astype(int)
+    remainder = stake_yen / unit - units
+    race_used = np.bincount(race_of_b, weights=units * unit).astype(float)
+    total_used = float(units.sum() * unit)
+    for b in np.argsort(-remainder, kind="stable"):
+        if remainder[b] < 0.5:
+            break
+        r = race_of_b[b]
+        if race_used[r] + unit <= race_cap_yen + 1e-6 and total_used + unit <= total_cap_yen + 1e-6:
+            units[b] += 1
+            race_used[r] += unit
+            total_used += unit
+    return units
+
+
+def optimize_portfolio(races: Sequence[PortfolioRace], config: PortfolioConfig) -> PortfolioResult:
+    """開催日の全レースを対象にフラクショナル・ケリー配分を解き、買い目行を返す"""
+    t0 = time.perf_counter()
+    bankroll = float(config.bankroll)
+    budget = float(config.budget if config.budget is not None else bankroll * 0.10)
+    race_limit = float(config.per_race_limit if config.per_race_limit is not None else bankroll * 0.035)
+    k = max(float(config.kelly_fraction), 1e-6)
+
+    cands = [c for c in (_race_candidates(r, config) for r in races) if c is not None]
+    if not cands or bankroll <= 0:
+        return PortfolioResult([], 0.0, 0, (time.perf_counter() - t0) * 1000, 0)
+
+    # フルケリー問題は上限を 1/k 倍して解き、解を k 倍する（= フラクショナル・ケリー）
+    A, P, mask = _pad_races(cands)
+    f, obj, iters = _solve(
+        A, P, mask,
+        min(race_limit / bankroll / k, 0.95), min(budget / bankroll / k, 0.95),
+        config.max_iter, config.tol,
+    )
+    stakes = f[mask]
+    race_of_b_arr = np.nonzero(mask)[0]
+    units = _round_units(stakes * k * bankroll, race_of_b_arr, config.unit, race_limit, budget)
+
+    rows: List[Dict[str, Any]] = []
+    b = 0
+    for c in cands:
+        race: PortfolioRace = c["race"]
+        info = race.race_info
+        n = len(c["odds"])
+        race_units = units[b:b + n]
+        best = int(np.argmax(race_units)) if race_units.any() else -1
+        for i in np.flatnonzero(race_units > 0):
+            horses = [int(h) for h in c["horses"][i]]
+            kind = c["kinds"][i]
+            rows.append({
+                "race_id": race.race_id,
+                "race_name": info.get("race_name", ""),
+                "venue": info.get("venue", ""),
+                "race_no": info.get("race_no", 0),
+                "post_time": info.get("post_time", ""),
+                "bet_type": BET_TYPE_LABELS[kind],
+                "bet_type_code": kind if kind != "tansho" else "tan",
+                "combination": format_combination(horses, kind),
+                "horse_names": [race.horse_names.get(h, f"#{h}") for h in horses],
+                "unit_price": config.unit,
+                "units": int(race_units[i]),
+                "total_cost": int(race_units[i]) * config.unit,
+                "expected_value": round(float(c["ev"][i]), 3),
+                "win_probability": round(float(c["prob"][i]), 4),
+                "odds": round(float(c["odds"][i]), 1),
+                "race_level": info.get("race_level", "normal"),
+                "is_best_bet": int(i) == best,
+            })
+        b += n
+
+    return PortfolioResult(
+        rows=rows,
+        expected_log_growth=float(obj) * k,
+        iterations=iters,
+        solve_ms=round((time.perf_counter() - t0) * 1000, 1),
+        total_cost=int(sum(r["total_cost"] for r in rows)),
+    )
+
+
+def races_from_analyze_results(analyze_results: Sequence[Dict[str, Any]]) -> List[PortfolioRace]:
+    """analyze_race レスポンスの配列から PortfolioRace を組み立てる"""
+    races: List[PortfolioRace] = []
+    for result in analyze_results:
+        if not result.get("success"):
+            continue
+        info = dict(result.get("race_info") or {})
+        info.setdefault("race_level", result.get("race_level") or "normal")
+        preds = [p for p in (result.get("predictions") or []) if (p.get("horse_number") or p.get("horse_no"))]
+        if not preds:
+            continue
+        nums = [int(p.get("horse_number") or p.get("horse_no")) for p in preds]
+        races.append(PortfolioRace(
+            race_id=str(info.get("race_id") or result.get("race_id", "")),
+            horse_numbers=nums,
+            win_probs=[p.get("p_norm") or p.get("win_probability") or 0.0 for p in preds],
+            win_odds=[p.get("odds") for p in preds],
+            combination_odds=dict(result.get("combination_odds") or {}),
+            race_info=info,
+            horse_names={n: p.get("horse_name", "") for n, p in zip(nums, preds)},
+        ))
+    return races
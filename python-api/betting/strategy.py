@@ -4,11 +4,18 @@ Streamlit 3_予測_batch.py の機能を完全移植
 """
 
 import math
-from typing import Dict, List, Tuple, Optional
-from itertools import combinations, permutations
+from typing import Dict, List, Mapping, Tuple, Optional
 import numpy as np
 from datetime import datetime
 
+from betting.combination import (  # type: ignore
+    estimated_odds,
+    harville_probabilities,
+    market_probabilities,
+    odds_tensor,
+    rank_combinations,
+)
+
 
 class ProBettingStrategy:
     """プロ資金管理戦略"""
@@ -205,90 +212,64 @@ class BettingCombinationGenerator:
         return candidates
     
     @staticmethod
-    def generate_umaren(predictions: List[Dict], top_n: int = 5) -> List[Dict]:
+    def _combination_candidates(
+        predictions: List[Dict],
+        kind: str,
+        top_n: Optional[int],
+        odds: Optional[Mapping] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Harville 確率（全頭）× オッズで組み合わせ候補を期待値順に返す。
+
+        top_n: 単勝期待値上位 top_n 頭どうしの組み合わせに限定（None で全頭）
+        odds: 組み合わせオッズ辞書。無い組み合わせは単勝オッズからの推定オッズを使う
+        """
+        if not predictions:
+            return []
+        probs = harville_probabilities(
+            [h.get('p_norm') or h.get('win_probability') or 0.0 for h in predictions],
+            [h['horse_no'] for h in predictions],
+        )
+        win_odds = [h.get('odds') for h in predictions]
+        if any(o is not None and o > 1.0 for o in win_odds):
+            odds_arr = estimated_odds(harville_probabilities(market_probabilities(win_odds)), kind)
+        else:
+            odds_arr = np.full(probs.matrix(kind).shape, np.nan)   # オッズ未取得 → 期待値 0
+        if odds:
+            real = odds_tensor(odds, probs.horse_numbers, kind)
+            odds_arr = np.where(np.isnan(real), odds_arr, real)
+
+        allowed = None
+        if top_n is not None:
+            ev = np.array([h.get('expected_value') or 0.0 for h in predictions])
+            allowed = np.zeros(len(predictions), dtype=bool)
+            allowed[np.argsort(-ev, kind='stable')[:top_n]] = True
+        return rank_combinations(probs, kind, odds_arr, allowed=allowed, limit=limit)
+
+    @staticmethod
+    def generate_umaren(predictions: List[Dict], top_n: int = 5, odds: Optional[Mapping] = None) -> List[Dict]:
         """馬連候補生成"""
-        sorted_preds = sorted(predictions, key=lambda x: (x['expected_value'] or 0.0), reverse=True)
-        top_horses = sorted_preds[:top_n]
-        
-        candidates = []
-        for h1, h2 in combinations(top_horses, 2):
-            combo = f"{h1['horse_no']}-{h2['horse_no']}"
-            # 期待値は積形式（簡易計算）
-            ev = ((h1['expected_value'] or 0.0) + (h2['expected_value'] or 0.0)) / 2
-            prob = h1.get('p_norm', h1.get('win_probability', 0)) * h2.get('p_norm', h2.get('win_probability', 0))
-            
-            candidates.append({
-                'combination': combo,
-                'expected_value': ev,
-                'probability': prob
-            })
-        
-        return sorted(candidates, key=lambda x: (x['expected_value'] or 0.0), reverse=True)
+        return BettingCombinationGenerator._combination_candidates(predictions, 'umaren', top_n, odds)
     
     @staticmethod
-    def generate_wide(predictions: List[Dict], top_n: int = 5) -> List[Dict]:
-        """ワイド候補生成（馬連と同様）"""
-        return BettingCombinationGenerator.generate_umaren(predictions, top_n)
+    def generate_wide(predictions: List[Dict], top_n: int = 5, odds: Optional[Mapping] = None) -> List[Dict]:
+        """ワイド候補生成"""
+        return BettingCombinationGenerator._combination_candidates(predictions, 'wide', top_n, odds)
     
     @staticmethod
-    def generate_sanrenpuku(predictions: List[Dict], top_n: int = 5) -> List[Dict]:
+    def generate_sanrenpuku(predictions: List[Dict], top_n: int = 5, odds: Optional[Mapping] = None) -> List[Dict]:
         """三連複候補生成"""
-        sorted_preds = sorted(predictions, key=lambda x: (x['expected_value'] or 0.0), reverse=True)
-        top_horses = sorted_preds[:top_n]
-        
-        candidates = []
-        for h1, h2, h3 in combinations(top_horses, 3):
-            combo = f"{h1['horse_no']}-{h2['horse_no']}-{h3['horse_no']}"
-            ev = ((h1['expected_value'] or 0.0) + (h2['expected_value'] or 0.0) + (h3['expected_value'] or 0.0)) / 3
-            prob = h1.get('p_norm', h1.get('win_probability', 0)) * h2.get('p_norm', h2.get('win_probability', 0)) * h3.get('p_norm', h3.get('win_probability', 0))
-            
-            candidates.append({
-                'combination': combo,
-                'expected_value': ev,
-                'probability': prob
-            })
-        
-        return sorted(candidates, key=lambda x: (x['expected_value'] or 0.0), reverse=True)
+        return BettingCombinationGenerator._combination_candidates(predictions, 'sanrenpuku', top_n, odds)
     
     @staticmethod
-    def generate_umatan(predictions: List[Dict], top_n: int = 5) -> List[Dict]:
+    def generate_umatan(predictions: List[Dict], top_n: int = 5, odds: Optional[Mapping] = None) -> List[Dict]:
         """馬単候補生成"""
-        sorted_preds = sorted(predictions, key=lambda x: (x['expected_value'] or 0.0), reverse=True)
-        top_horses = sorted_preds[:top_n]
-        
-        candidates = []
-        for h1, h2 in permutations(top_horses, 2):
-            combo = f"{h1['horse_no']}→{h2['horse_no']}"
-            ev = ((h1['expected_value'] or 0.0) + (h2['expected_value'] or 0.0)) / 2
-            prob = h1.get('p_norm', h1.get('win_probability', 0)) * h2.get('p_norm', h2.get('win_probability', 0)) * 0.5  # 順序考慮
-            
-            candidates.append({
-                'combination': combo,
-                'expected_value': ev,
-                'probability': prob
-            })
-        
-        return sorted(candidates, key=lambda x: (x['expected_value'] or 0.0), reverse=True)[:20]
+        return BettingCombinationGenerator._combination_candidates(predictions, 'umatan', top_n, odds, limit=20)
     
     @staticmethod
-    def generate_sanrentan(predictions: List[Dict], top_n: int = 5) -> List[Dict]:
+    def generate_sanrentan(predictions: List[Dict], top_n: int = 5, odds: Optional[Mapping] = None) -> List[Dict]:
         """三連単候補生成"""
-        sorted_preds = sorted(predictions, key=lambda x: (x['expected_value'] or 0.0), reverse=True)
-        top_horses = sorted_preds[:top_n]
-        
-        candidates = []
-        for h1, h2, h3 in permutations(top_horses, 3):
-            combo = f"{h1['horse_no']}→{h2['horse_no']}→{h3['horse_no']}"
-            ev = ((h1['expected_value'] or 0.0) + (h2['expected_value'] or 0.0) + (h3['expected_value'] or 0.0)) / 3
-            prob = h1.get('p_norm', h1.get('win_probability', 0)) * h2.get('p_norm', h2.get('win_probability', 0)) * h3.get('p_norm', h3.get('win_probability', 0)) * 0.3
-            
-            candidates.append({
-                'combination': combo,
-                'expected_value': ev,
-                'probability': prob
-            })
-        
-        return sorted(candidates, key=lambda x: (x['expected_value'] or 0.0), reverse=True)[:30]
+        return BettingCombinationGenerator._combination_candidates(predictions, 'sanrentan', top_n, odds, limit=30)
 
 
 class RaceAnalyzer:
@@ -487,7 +468,8 @@ class BettingRecommender:
     def analyze_and_recommend(
         self, 
         predictions: List[Dict], 
-        race_info: Dict
+        race_info: Dict,
+        combination_odds: Optional[Dict[str, Mapping]] = None
     ) -> Dict:
         """
         レース分析と購入推奨（メイン関数）
@@ -497,6 +479,9 @@ class BettingRecommender:
                 [{'horse_no': 1, 'win_probability': 0.25, 'odds': 4.5, ...}, ...]
             race_info: レース情報
                 {'race_id': '202401010101', 'race_name': '...', 'date': '2024-01-01', ...}
+            combination_odds: 券種別の組み合わせオッズ（任意）
+                {'umaren': {'01,02': 12.3, ...}, 'sanrentan': {...}, ...}
+                無い券種は単勝オッズからの推定オッズで期待値を計算する
         
         Returns:
             推奨情報辞書
@@ -511,13 +496,14 @@ class BettingRecommender:
         pro_eval = self.analyzer.evaluate_pro_strategy(predictions, race_info)
         
         # 馬券種別候補生成
+        _co = combination_odds or {}
         bet_types = {
             '単勝': self.generator.generate_tansho(predictions),
-            '馬連': self.generator.generate_umaren(predictions),
-            'ワイド': self.generator.generate_wide(predictions),
-            '三連複': self.generator.generate_sanrenpuku(predictions),
-            '馬単': self.generator.generate_umatan(predictions),
-            '三連単': self.generator.generate_sanrentan(predictions)
+            '馬連': self.generator.generate_umaren(predictions, odds=_co.get('umaren')),
+            'ワイド': self.generator.generate_wide(predictions, odds=_co.get('wide')),
+            '三連複': self.generator.generate_sanrenpuku(predictions, odds=_co.get('sanrenpuku')),
+            '馬単': self.generator.generate_umatan(predictions, odds=_co.get('umatan')),
+            '三連単': self.generator.generate_sanrentan(predictions, odds=_co.get('sanrentan'))
         }
         
         # ベスト馬券種選定
@@ -24,8 +24,10 @@ main.py (slim) - ルーターを機能ごとのモジュールに分割した版
       export.py        - GET /api/export-data, /api/export-db, DELETE /api/data/all
       backfill.py      - POST /api/backfill/*
       profiling.py     - POST /api/profiling/start, GET /api/profiling/*
+      metrics.py       - GET /metrics（Prometheus テキスト形式）
 """
 import sys
+import time
 
 # Windowsの cp932 エンコード環境で Unicode 文字列の print/log が失敗しないよう UTF-8 に固定
 for _s in (sys.stdout, sys.stderr):
@@ -53,6 +55,7 @@ from routers import (  # type: ignore
     feature_analysis,
     internal,
     live_validation,
+    metrics,
     models_mgmt,
     predict,
     prediction_history,
@@ -65,6 +68,7 @@ from routers import (  # type: ignore
     train,
 )
 from scheduler import start_scheduler, stop_scheduler  # type: ignore
+from services.metrics import HTTP_REQUEST_DURATION  # type: ignore
 from scraping.operational_saga_runtime import (  # type: ignore
     start_operational_saga_worker,
     stop_operational_saga_worker,
@@ -78,10 +82,13 @@ limiter = Limiter(key_func=get_remote_address, default_limits=["60/minute"])
 async def lifespan(app: FastAPI):
     start_scheduler()
     await start_operational_saga_worker()
+    await metrics.start_metrics()
     try:
         yield
     finally:
+        await metrics.stop_metrics()
         await stop_operational_saga_worker()
+        await realtime_odds.BROWSER_POOL.close()
         stop_scheduler()
 
 
@@ -126,6 +133,7 @@ app.include_router(realtime_odds.router)
 app.include_router(bet_export.router)
 app.include_router(feature_analysis.router)
 app.include_router(prediction_history.router)
+app.include_router(metrics.router)
 
 
 @app.middleware("http")
@@ -137,6 +145,23 @@ async def live_validation_no_store(request, call_next):
     return response
 
 
+@app.middleware("http")
+async def record_request_duration(request, call_next):
+    """API 処理時間を keiba_http_request_duration_seconds に記録する（ラベルはルートのパステンプレート）"""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - t0,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=status,
+        )
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -28,6 +28,17 @@ class TrainRequest(BaseModel):
     training_date_from: Optional[str] = None
     training_date_to: Optional[str] = None
     force_sync: bool = True
+    # ウォームスタート増分学習（アクティブモデルに新規レース分のみ追加ブースティング）
+    incremental: bool = False
+    base_model_id: Optional[str] = None  # 未指定時はアクティブモデル → 最新モデル
+    incremental_rounds: int = Field(100, ge=1, le=2000)
+    incremental_max_degradation: float = Field(0.01, ge=0.0, le=1.0)  # ホールドアウト損失の許容悪化率
+    # アウトオブコア学習（日付チャンク単位で特徴量生成し memmap / LightGBM binary から学習）
+    chunked: bool = False
+    chunk_months: int = Field(6, ge=1, le=60)
+    # 特徴量生成（履歴を使わないステージ）を開催日パーティション単位で並列実行するプロセス数
+    # API プロセスはマルチスレッドなので fork ではなく forkserver で起動し、分割フレームを pickle で渡す
+    fe_workers: int = Field(1, ge=1, le=32)
 
     @field_validator("training_date_from", "training_date_to", mode="before")
     @classmethod
@@ -55,6 +66,8 @@ class TrainResponse(BaseModel):
     optuna_executed: bool = False
     optuna_error: Optional[str] = None
     feature_columns: List[str] = []
+    training_mode: Literal["full", "incremental"] = "full"
+    fallback_reason: Optional[str] = None  # 増分学習から全期間再学習に切り替えた理由
 
 
 class PredictRequest(BaseModel):
@@ -37,6 +37,7 @@ IPAT馬券種コード対応:
 """
 from __future__ import annotations
 
+import asyncio
 import csv
 import io
 import json
@@ -156,6 +157,44 @@ def _build_bet_rows(
     return rows
 
 
+def _build_portfolio_rows(
+    analyze_results: list[dict],
+    body: dict,
+    bankroll: int,
+    min_ev: float,
+    min_prob: float = 0.0,
+) -> tuple[list[dict], dict]:
+    """開催日の全レースをまとめてフラクショナル・ケリー配分した購入推奨行を生成する
+
+    ニュートン法の最適化は CPU 処理なので、async エンドポイントからは asyncio.to_thread で呼ぶ。
+    """
+    from betting.portfolio import (  # type: ignore
+        PortfolioConfig,
+        optimize_portfolio,
+        races_from_analyze_results,
+    )
+
+    config = PortfolioConfig(
+        bankroll=bankroll,
+        budget=int(body["budget"]) if body.get("budget") else None,
+        per_race_limit=int(body["per_race_limit"]) if body.get("per_race_limit") else None,
+        kelly_fraction=float(body.get("kelly_fraction") or 0.25),
+        min_ev=min_ev,
+        min_prob=min_prob,
+    )
+    result = optimize_portfolio(races_from_analyze_results(analyze_results), config)
+    logger.info(
+        f"portfolio: {len(result.rows)} bets / {result.total_cost} yen "
+        f"({result.iterations} iter, {result.solve_ms} ms)"
+    )
+    return result.rows, {
+        "expected_log_growth": round(result.expected_log_growth, 6),
+        "iterations": result.iterations,
+        "solve_ms": result.solve_ms,
+        "kelly_fraction": config.kelly_fraction,
+    }
+
+
 import re  # noqa: E402 (上のimportブロック後に置く)
 
 
@@ -170,7 +209,11 @@ async def export_bet_list(body: dict):
         "bankroll": 100000,   # 総資金（任意、デフォルト100000）
         "min_ev": 1.0,        # 最低期待値フィルタ（任意）
         "min_prob": 0.0,      # 最低確率フィルタ（任意）
-        "max_bets_per_race": 5  # レースあたり最大買い目数（任意）
+        "max_bets_per_race": 5, # レースあたり最大買い目数（任意）
+        "mode": "portfolio",  # 任意。開催日全体でケリー配分を最適化する（betting/portfolio.py）
+        "budget": 10000,      # portfolio: 総投資上限（任意、デフォルト bankroll の 10%）
+        "per_race_limit": 3500, # portfolio: 1 レース上限（任意、デフォルト bankroll の 3.5%）
+        "kelly_fraction": 0.25  # portfolio: フラクショナル・ケリー係数（任意）
       }
     """
     analyze_results: list[dict] = body.get("results", [])
@@ -182,7 +225,13 @@ async def export_bet_list(body: dict):
     if not analyze_results:
         raise HTTPException(status_code=400, detail="results が空です")
 
-    rows = _build_bet_rows(analyze_results, bankroll, min_ev, min_prob, max_bets_per_race)
+    portfolio: dict | None = None
+    if body.get("mode") == "portfolio":
+        rows, portfolio = await asyncio.to_thread(
+            _build_portfolio_rows, analyze_results, body, bankroll, min_ev, min_prob,
+        )
+    else:
+        rows = _build_bet_rows(analyze_results, bankroll, min_ev, min_prob, max_bets_per_race)
 
     total_cost = sum(r["total_cost"] for r in rows)
     race_ids = list(dict.fromkeys(r["race_id"] for r in rows))
@@ -198,6 +247,7 @@ async def export_bet_list(body: dict):
             "expected_return": round(
                 sum(r["total_cost"] * r["expected_value"] for r in rows), 0
             ),
+            **({"portfolio": portfolio} if portfolio else {}),
         },
         "bets": rows,
     }
@@ -215,7 +265,12 @@ async def export_bet_list_csv(body: dict):
     if not analyze_results:
         raise HTTPException(status_code=400, detail="results が空です")
 
-    rows = _build_bet_rows(analyze_results, bankroll, min_ev, min_prob, max_bets_per_race)
+    if body.get("mode") == "portfolio":
+        rows, _ = await asyncio.to_thread(
+            _build_portfolio_rows, analyze_results, body, bankroll, min_ev, min_prob,
+        )
+    else:
+        rows = _build_bet_rows(analyze_results, bankroll, min_ev, min_prob, max_bets_per_race)
 
     output = io.StringIO()
     fieldnames = [
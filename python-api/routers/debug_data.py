@@ -60,7 +60,7 @@ def _load_raw_race(race_id: str) -> Dict[str, Any]:
 
 def _build_feature_df(race_id: str, race_info: Dict, horses: List[Dict]) -> pd.DataFrame:
     """predict.pyと同じ手順で特徴量エンジニアリングを適用する"""
-    from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+    from keiba_ai.feature_engineering import add_derived_features, parse_corner_columns  # type: ignore
     from keiba_ai.ultimate_features import UltimateFeatureCalculator  # type: ignore
 
     # DataFrame組み立て
@@ -119,16 +119,8 @@ def _build_feature_df(race_id: str, race_info: Dict, horses: List[Dict]) -> pd.D
         if "age" not in df.columns or df["age"].isna().all():
             df["age"] = pd.to_numeric(df["sex_age"].str.extract(r"(\d+)$")[0], errors="coerce")
 
-    # corner_positions_list
-    if "corner_positions" in df.columns and "corner_positions_list" not in df.columns:
-        def _parse_cp(s):
-            try:
-                if pd.isna(s) or s == "":
-                    return []
-                return [int(x) for x in str(s).split("-") if x.strip().isdigit()]
-            except Exception:
-                return []
-        df["corner_positions_list"] = df["corner_positions"].apply(_parse_cp)
+    # corner_positions → corner_1〜4
+    df = parse_corner_columns(df)
 
     # 特徴量エンジニアリング
     df = add_derived_features(df, full_history_df=df)
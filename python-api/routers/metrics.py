@@ -0,0 +1,130 @@
+"""
+メトリクスエンドポイント（Prometheus テキスト形式）
+GET /metrics
+
+取得レイテンシ（ホスト別）・キャッシュ参照（analyze / 特徴量 / オッズ / プリコンピュート /
+履歴スナップショット / HTTP 取得キャッシュ）・推論ステージ別処理時間・API 処理時間・
+イベントループ遅延・スレッドプール待ち行列・ジョブ数と所要時間を返す。
+
+KEIBA_METRICS_DIR を指定すると各ワーカーが 10 秒ごとに共有 SQLite へスナップショットを書き、
+/metrics は全ワーカーを集約した値を返す（未指定ならこのプロセスの値のみ）。
+KEIBA_LOOP_BLOCK_MS=100 のように指定すると、開発環境でループを 100 ms 以上止めた
+コールバックのスタックをログに出す（GET /api/profiling/loop でも確認できる）。
+KEIBA_METRICS_TOKEN を指定すると Authorization: Bearer <token> が必要
+（production では未設定なら 503）。/api/ 外のパスなので JWT ミドルウェアは通らない。
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import os
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+
+from services.loop_monitor import LOOP_MONITOR  # type: ignore
+from services.metrics import (  # type: ignore
+    CACHE_ENTRIES,
+    CACHE_REQUESTS,
+    CONTENT_TYPE,
+    JOBS,
+    REGISTRY,
+    MetricsFlusher,
+    SharedMetricsStore,
+    render_text,
+)
+
+router = APIRouter()
+
+_METRICS_DIR = os.environ.get("KEIBA_METRICS_DIR") or ""
+_METRICS_FLUSH_SEC = float(os.environ.get("KEIBA_METRICS_FLUSH_SEC") or 10.0)
+# ブロッキング検出の閾値（ミリ秒）。0 / 未指定なら無効、production では常に無効
+_LOOP_BLOCK_MS = float(os.environ.get("KEIBA_LOOP_BLOCK_MS") or 0)
+_SHARED_STORE: Optional[SharedMetricsStore] = None
+_FLUSHER: Optional[MetricsFlusher] = None
+
+
+def _cache_stats() -> list:
+    """(キャッシュ名, stats dict) の一覧。ルーター側は遅延 import（循環回避）"""
+    from routers import predict, realtime_odds  # type: ignore
+    return [
+        ("analyze_race", predict._ANALYZE_CACHE.stats()),
+        ("race_features", predict._FEATURE_CACHE.stats()),
+        ("precomputed", predict._PRECOMPUTED.stats()),
+        ("realtime_odds", realtime_odds._ODDS_CACHE.stats()),
+    ]
+
+
+def _collect_caches() -> None:
+    for name, stats in _cache_stats():
+        CACHE_REQUESTS.set(stats.get("hits", 0), cache=name, result="hit")
+        CACHE_REQUESTS.set(stats.get("misses", 0), cache=name, result="miss")
+        CACHE_ENTRIES.set(stats.get("entries", 0), cache=name)
+    from routers.predict import _HISTORY_STORE  # type: ignore
+    hist = _HISTORY_STORE.stats()
+    CACHE_REQUESTS.set(hist["hits"] + hist["stale"], cache="history_snapshot", result="hit")
+    CACHE_REQUESTS.set(hist["refreshes"], cache="history_snapshot", result="miss")
+
+
+def _collect_jobs() -> None:
+    from routers.profiling import _profiling_jobs  # type: ignore
+    from routers.train import _train_jobs  # type: ignore
+    from scraping.jobs import _scrape_jobs  # type: ignore
+    for kind, store in (("train", _train_jobs), ("scrape", _scrape_jobs), ("profiling", _profiling_jobs)):
+        counts: dict = {}
+        for job in list(store.values()):
+            status = str(job.get("status") or "unknown")
+            counts[status] = counts.get(status, 0) + 1
+        for status in ("queued", "running", "completed", "error"):
+            counts.setdefault(status, 0)
+        for status, n in counts.items():
+            JOBS.set(n, kind=kind, status=status)
+
+
+REGISTRY.register_collector(_collect_caches)
+REGISTRY.register_collector(_collect_jobs)
+
+
+async def start_metrics() -> None:
+    """ループ遅延モニタと（KEIBA_METRICS_DIR 指定時）共有ストアへの定期書き込みを開始する"""
+    global _SHARED_STORE, _FLUSHER
+    production = (os.environ.get("APP_ENV") or "development").strip().lower() == "production"
+    LOOP_MONITOR.start(block_ms=0.0 if production else _LOOP_BLOCK_MS)
+    if _METRICS_DIR and _FLUSHER is None:
+        _SHARED_STORE = SharedMetricsStore(Path(_METRICS_DIR))
+        _FLUSHER = MetricsFlusher(_SHARED_STORE, REGISTRY, interval_sec=_METRICS_FLUSH_SEC)
+        _FLUSHER.start()
+
+
+async def stop_metrics() -> None:
+    global _FLUSHER
+    await LOOP_MONITOR.stop()
+    if _FLUSHER is not None:
+        _FLUSHER.stop()
+        _FLUSHER = None
+
+
+def _verify_token(authorization: Optional[str]) -> None:
+    token = os.environ.get("KEIBA_METRICS_TOKEN", "")
+    if not token:
+        if (os.environ.get("APP_ENV") or "development").strip().lower() == "production":
+            raise HTTPException(status_code=503, detail="metrics token is not configured")
+        return
+    if not hmac.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+def _render() -> str:
+    if _SHARED_STORE is not None and _FLUSHER is not None:
+        _FLUSHER.flush()                     # 自ワーカーの最新値を書いてから全体を読む
+        return render_text(_SHARED_STORE.merge())
+    return render_text(REGISTRY.collect())
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """全メトリクスをテキスト形式で返す"""
+    _verify_token(authorization)
+    return Response(content=await asyncio.to_thread(_render), headers={"Content-Type": CONTENT_TYPE})
@@ -12,6 +12,7 @@ import joblib
 from fastapi import APIRouter, Depends, HTTPException
 
 from deps.auth import require_admin  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
 
 from app_config import (  # type: ignore
     SUPABASE_DATA_ENABLED,
@@ -27,6 +28,64 @@ from app_config import (  # type: ignore
 router = APIRouter()
 
 
+def _list_models_sync(ultimate: bool | None) -> dict:
+    """モデル一覧の本体（バンドルを joblib.load するため run_blocking から呼ぶ）"""
+    # ローカルモデルを優先スキャン
+    local_files = list(MODELS_DIR.glob("model_*.joblib"))
+
+    if not local_files and SUPABASE_DATA_ENABLED and get_supabase_client():
+        # ローカルに何もない場合のみ Supabase にフォールバック
+        from app_config import list_models_from_supabase  # type: ignore
+        sb_models = list_models_from_supabase()
+        if ultimate is not None:
+            sb_models = [m for m in sb_models if m.get("ultimate_mode", False) == ultimate]
+        return {"models": sb_models, "count": len(sb_models)}
+
+    # アクティブモデル ID を取得（未設定なら latest を使う）
+    active_id = get_active_model_id()
+    if active_id is None:
+        latest = get_latest_model()
+        active_id = latest.stem if latest else None
+
+    models = []
+    for model_path in local_files:
+        try:
+            bundle = joblib.load(model_path)
+            is_ultimate = bundle.get("ultimate_mode", False)
+            # ultimate フィルタ（None = 全件返す）
+            if ultimate is not None and is_ultimate != ultimate:
+                continue
+            feat_count = (
+                len(bundle.get("feature_columns") or [])
+                or len(bundle.get("feature_cols_num") or []) + len(bundle.get("feature_cols_cat") or [])
+            )
+            model_id = model_path.stem
+            models.append({
+                "model_id": model_id,
+                "model_path": str(model_path),
+                "created_at": bundle.get("created_at", "unknown"),
+                "target": bundle.get("target", "unknown"),
+                "model_type": bundle.get("model_type", "unknown"),
+                "ultimate_mode": is_ultimate,
+                "use_optimizer": bundle.get("use_optimizer", False),
+                "auc": bundle.get("metrics", {}).get("auc", 0.0),
+                "cv_auc_mean": bundle.get("metrics", {}).get("cv_auc_mean", 0.0),
+                "training_date_from": bundle.get("training_date_from"),
+                "training_date_to": bundle.get("training_date_to"),
+                "n_rows": bundle.get("data_count", 0),
+                "feature_count": feat_count,
+                "is_active": model_id == active_id,
+            })
+        except Exception as e:
+            print(f"モデル読み込みエラー {model_path}: {e}")
+            continue
+
+    # model_id は末尾に YYYYMMDD_HHMMSS を含む形式。
+    # 降順ソートで最新モデルが先頭に来る。
+    models.sort(key=lambda x: x.get("model_id", ""), reverse=True)
+    return {"models": models, "count": len(models)}
+
+
 @router.get("/api/models")
 async def list_models(ultimate: bool | None = None):
     """保存済みモデルの一覧を取得
@@ -36,61 +95,7 @@ async def list_models(ultimate: bool | None = None):
     - 未指定          : 全モデルを返す
     """
     try:
-        # ローカルモデルを優先スキャン
-        local_files = list(MODELS_DIR.glob("model_*.joblib"))
-
-        if not local_files and SUPABASE_DATA_ENABLED and get_supabase_client():
-            # ローカルに何もない場合のみ Supabase にフォールバック
-            from app_config import list_models_from_supabase  # type: ignore
-            sb_models = list_models_from_supabase()
-            if ultimate is not None:
-                sb_models = [m for m in sb_models if m.get("ultimate_mode", False) == ultimate]
-            return {"models": sb_models, "count": len(sb_models)}
-
-        # アクティブモデル ID を取得（未設定なら latest を使う）
-        active_id = get_active_model_id()
-        if active_id is None:
-            latest = get_latest_model()
-            active_id = latest.stem if latest else None
-
-        models = []
-        for model_path in local_files:
-            try:
-                bundle = joblib.load(model_path)
-                is_ultimate = bundle.get("ultimate_mode", False)
-                # ultimate フィルタ（None = 全件返す）
-                if ultimate is not None and is_ultimate != ultimate:
-                    continue
-                feat_count = (
-                    len(bundle.get("feature_columns") or [])
-                    or len(bundle.get("feature_cols_num") or []) + len(bundle.get("feature_cols_cat") or [])
-                )
-                model_id = model_path.stem
-                models.append({
-                    "model_id": model_id,
-                    "model_path": str(model_path),
-                    "created_at": bundle.get("created_at", "unknown"),
-                    "target": bundle.get("target", "unknown"),
-                    "model_type": bundle.get("model_type", "unknown"),
-                    "ultimate_mode": is_ultimate,
-                    "use_optimizer": bundle.get("use_optimizer", False),
-                    "auc": bundle.get("metrics", {}).get("auc", 0.0),
-                    "cv_auc_mean": bundle.get("metrics", {}).get("cv_auc_mean", 0.0),
-                    "training_date_from": bundle.get("training_date_from"),
-                    "training_date_to": bundle.get("training_date_to"),
-                    "n_rows": bundle.get("data_count", 0),
-                    "feature_count": feat_count,
-                    "is_active": model_id == active_id,
-                })
-            except Exception as e:
-                print(f"モデル読み込みエラー {model_path}: {e}")
-                continue
-
-        # model_id は末尾に YYYYMMDD_HHMMSS を含む形式。
-        # 降順ソートで最新モデルが先頭に来る。
-        models.sort(key=lambda x: x.get("model_id", ""), reverse=True)
-        return {"models": models, "count": len(models)}
-
+        return await run_blocking(_list_models_sync, ultimate)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"モデル一覧取得エラー: {str(e)}")
 
@@ -108,6 +113,9 @@ async def delete_model(model_id: str, _: dict = Depends(require_admin)):
         for f in MODELS_DIR.glob(f"*{model_id}*.joblib"):
             f.unlink()
             deleted.append(f.name)
+        # 増分学習用の特徴量行列キャッシュも併せて削除（deleted には含めない）
+        for f in MODELS_DIR.glob(f"*{model_id}*.features.pkl"):
+            f.unlink()
         if not deleted:
             raise HTTPException(status_code=404, detail=f"モデル {model_id} が見つかりません")
         return {"success": True, "deleted": deleted}
@@ -124,7 +132,7 @@ async def get_model_info(model_id: str):
         model_files = list(MODELS_DIR.glob(f"*{model_id}*.joblib"))
         if not model_files:
             raise HTTPException(status_code=404, detail=f"モデル {model_id} が見つかりません")
-        bundle = load_model_bundle(model_files[0])
+        bundle = await run_blocking(load_model_bundle, model_files[0])
         return {
             "success": True,
             "model_id": model_id,
@@ -161,7 +169,7 @@ async def get_active_model():
         raise HTTPException(status_code=404, detail=f"アクティブモデル {active_id} が見つかりません")
 
     try:
-        bundle = joblib.load(model_path)
+        bundle = await run_blocking(joblib.load, model_path)
         feat_count = (
             len(bundle.get("feature_columns") or [])
             or len(bundle.get("feature_cols_num") or []) + len(bundle.get("feature_cols_cat") or [])
@@ -2,16 +2,20 @@
 予測・レース分析エンドポイント
 POST /api/predict
 POST /api/analyze_race
+POST /api/analyze_race/precompute        - 出馬表の一括予測（発走前）
+GET  /api/analyze_race/precompute/status - 一括予測の進捗
 """
 from __future__ import annotations
 
+import copy
 import json
+import os
 import traceback
 from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
 
 from app_config import (  # type: ignore
     SUPABASE_DATA_ENABLED,
@@ -25,7 +29,14 @@ from app_config import (  # type: ignore
     get_active_model_id,
     logger,
 )
+from deps.auth import get_current_user, require_admin  # type: ignore
 from deps.pred_limit import check_and_consume_pred_count  # type: ignore
+from scraping.storage import _get_changed_race_ids, _get_data_version  # type: ignore
+from services.history_snapshot import HistorySnapshotStore, db_signature, replace_races  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
+from services.race_precompute import PrecomputedPredictions, PrecomputeRun, precompute_races  # type: ignore
+from services.stage_metrics import STAGE_HISTOGRAMS  # type: ignore
+from services.ttl_cache import SQLiteCacheTier, TTLCache  # type: ignore
 from models import (  # type: ignore
     PredictRequest,
     PredictResponse,
@@ -34,9 +45,9 @@ from models import (  # type: ignore
     BatchAnalyzeRequest,
 )
 from keiba_ai.constants import FUTURE_FIELDS  # type: ignore
+from keiba_ai.stage_profiler import run_stage, trace_stages  # type: ignore
 
 import asyncio
-import time as _time
 
 router = APIRouter()
 
@@ -109,30 +120,81 @@ def _save_prediction_log(
         conn.close()
 
 
-# ── インメモリ予測キャッシュ（race_id → (timestamp, response_dict)）
-_ANALYZE_CACHE: dict[str, tuple[float, dict]] = {}
+# ── レース単位の予測キャッシュ（race_id:モデル:オッズ版 → {race_info, predictions}）
+# LRU + TTL + single-flight。bankroll / risk_mode 別の買い目推奨はリクエストごとに計算する。
+# KEIBA_SHARED_CACHE_DB を指定するとワーカー間で SQLite 第 2 層を共有する
 _ANALYZE_CACHE_TTL = 300  # 5分
-_ANALYZE_CACHE_MAX = 200  # 最大エントリ数（超過時に最古から削除）
+_ANALYZE_CACHE_MAX = 200  # 最大エントリ数（超過時は最も参照の古いものから削除）
+_ANALYZE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_SHARED_CACHE_DB = os.environ.get("KEIBA_SHARED_CACHE_DB") or ""
+_ANALYZE_CACHE = TTLCache(
+    "analyze_race",
+    max_entries=_ANALYZE_CACHE_MAX,
+    ttl_sec=_ANALYZE_CACHE_TTL,
+    max_bytes=_ANALYZE_CACHE_MAX_BYTES,
+    second_tier=SQLiteCacheTier(Path(_SHARED_CACHE_DB), "analyze_race") if _SHARED_CACHE_DB else None,
+)
+# 発走前に一括予測した結果（(race_id, モデル) → 予測）。オッズ更新は再推論せず再スコアのみ
+_PRECOMPUTED = PrecomputedPredictions(shared_db=Path(_SHARED_CACHE_DB) if _SHARED_CACHE_DB else None)
+_PRECOMPUTE_RUN: "PrecomputeRun | None" = None
+_PRECOMPUTE_TASK: "asyncio.Task | None" = None
+_PRECOMPUTE_INTERVAL_SEC = 1.0  # INV-07: 出馬表再取得を伴うため 1 レースごとに間隔を空ける
+# 推論済み特徴量（optimizer 適用後の X とスコア）。キーはレース・モデル・オッズ以外の入力・履歴版で、
+# オッズ更新時は市場レイヤーの列だけを差し替えて再推論する（ModelPredictor.score_race）
+_FEATURE_CACHE = TTLCache("race_features", max_entries=256, ttl_sec=1800, max_bytes=256 * 1024 * 1024)
 # DB 全履歴キャッシュ（add_derived_features の full_history_df 用）
-# analyze_race / predict ごとに全 DB を再ロードするコストを削減（TTL=10分）
-_HISTORY_CACHE: "tuple[float, 'pd.DataFrame'] | None" = None
-_HISTORY_CACHE_TTL = 600  # 10分
+# 全ワーカーで 1 つの memory-mapped スナップショットを共有する（services.history_snapshot）。
+# scraping.storage の書き込み経路が進めるデータバージョンで無効化し、
+# 変更されたレースだけを差し替える。data_version_log が無い旧 DB は
+# ファイルの mtime / size + TTL=10分 で判定する。
+_HISTORY_CACHE_TTL = 600  # 10分（data_version_log が無い場合のみ）
+_HISTORY_SNAPSHOT_DIR = Path(
+    os.environ.get("KEIBA_HISTORY_SNAPSHOT_DIR") or ULTIMATE_DB.parent / "history_snapshot"
+)
+_HISTORY_STORE = HistorySnapshotStore(_HISTORY_SNAPSHOT_DIR, ttl_sec=_HISTORY_CACHE_TTL)
+# ステージ別プロファイル（keiba_ai.stage_profiler）。KEIBA_STAGE_PROFILING=1 で全リクエストを計測して
+# ヒストグラム（GET /api/profiling/stages）に積む。X-Debug-Stage-Trace: 1 のリクエストは個別に計測し、
+# 結果を X-Stage-Trace レスポンスヘッダで返す（メモリのピーク増分も含む）
+_STAGE_PROFILING = os.environ.get("KEIBA_STAGE_PROFILING", "") == "1"
+_STAGE_TRACE_HEADER = "X-Debug-Stage-Trace"
+
+
+def _hist_apply_delta(base: "pd.DataFrame", prev_source: dict) -> "pd.DataFrame | None":
+    """公開中の履歴に、データバージョン prev_source 以降に書き換えられたレースを反映する"""
+    from keiba_ai.db_ultimate_loader import load_ultimate_training_frame as _ltf  # type: ignore
+    since = prev_source.get("data_version")
+    if since is None:
+        return None
+    _, changed = _get_changed_race_ids(ULTIMATE_DB, int(since))
+    if changed is None:
+        return None   # 全件入れ替えを含む → 全件ロード
+    if not changed:
+        return base
+    delta = _ltf(ULTIMATE_DB, race_ids=changed)
+    logger.info(f"履歴キャッシュ差分更新: {len(changed)} レース / {len(delta)} 行")
+    return replace_races(base, delta, changed)
 
 
 def _load_hist_cached() -> "pd.DataFrame":
-    """DB 全履歴 DataFrame をキャッシュ付きで返す（TTL=10分）
+    """DB 全履歴 DataFrame を共有スナップショット経由で返す
 
-    race_results_ultimate の全データを読み込んで DataFrame として返す。
-    10 分以内に再呼び出された場合はキャッシュを利用する。
+    データバージョンが前回公開時から変わっていなければ公開済みスナップショットを
+    マップして返す。変わっていればファイルロックを取れた 1 ワーカーだけが
+    変更レースの行を読み直して差し替えた版を再公開し、他のワーカーは
+    公開済みの版で応答しつつ次回呼び出しで新しい版へ切り替える。
+    返す DataFrame の配列は読み取り専用（呼び出し側で copy してから加工すること）。
     """
-    global _HISTORY_CACHE
     try:
         from keiba_ai.db_ultimate_loader import load_ultimate_training_frame as _ltf  # type: ignore
-        if _HISTORY_CACHE is not None and (_time.time() - _HISTORY_CACHE[0]) < _HISTORY_CACHE_TTL:
-            return _HISTORY_CACHE[1]
-        _df = _ltf(ULTIMATE_DB)
-        _HISTORY_CACHE = (_time.time(), _df)
-        return _df
+        version = _get_data_version(ULTIMATE_DB)
+        if version is None:
+            return _HISTORY_STORE.get(lambda: _ltf(ULTIMATE_DB), db_signature(ULTIMATE_DB))
+        return _HISTORY_STORE.get(
+            lambda: _ltf(ULTIMATE_DB),
+            {"data_version": version},
+            updater=_hist_apply_delta,
+            ttl_sec=0,
+        )
     except Exception:
         import pandas as _pd
         return _pd.DataFrame()
@@ -183,18 +245,21 @@ def _drop_non_features(df: "pd.DataFrame") -> "pd.DataFrame":
 def _predict_sub_model(
     model_path: "Path",
     df: "pd.DataFrame",
-    full_hist: "pd.DataFrame | None" = None,
+    full_hist: "pd.DataFrame | Callable[[], pd.DataFrame] | None" = None,
+    cache_key: "str | None" = None,
+    odds_drift: "pd.DataFrame | None" = None,
 ) -> "tuple[np.ndarray, np.ndarray] | None":
     """サブモデル（place3 など）で確率を計算して返す。ModelPredictor を経由して推論。
 
+    cache_key を渡すと主モデルと同じく _FEATURE_CACHE で構築済み特徴量を再利用する。
+
     Returns:
         (raw_scores, proba_norm) または None（失敗時）
     """
     try:
         _bundle = load_model_bundle(model_path)
         _predictor = ModelPredictor(_bundle, model_path)
-        _X = _predictor.build_features(df, full_hist=full_hist)
-        return _predictor.predict_scores(_X)
+        return _predictor.score_race(df, full_hist, odds_drift, _FEATURE_CACHE, cache_key)
     except HTTPException:
         raise
     except Exception as _e:
@@ -226,6 +291,29 @@ def _compute_ensemble(
     return (_ens / _s) if _s > 0 else win_probs
 
 
+def _frame_fingerprint(df: "pd.DataFrame") -> str:
+    import hashlib as _hl
+    payload = df.reindex(columns=sorted(map(str, df.columns))).to_json(orient="split", default_handler=str)
+    return _hl.md5(payload.encode("utf-8")).hexdigest()
+
+
+def _market_fingerprint(df: "pd.DataFrame", odds_drift: "pd.DataFrame | None" = None) -> str:
+    """市場レイヤーの入力（オッズ・人気・オッズ時系列）の指紋"""
+    cols = [c for c in ("horse_number", "odds", "popularity") if c in df.columns]
+    fp = _frame_fingerprint(df.loc[:, cols])
+    if odds_drift is not None and not odds_drift.empty:
+        fp += _frame_fingerprint(odds_drift)
+    return fp
+
+
+def _feature_cache_key(race_id: str, model_name: str, df: "pd.DataFrame") -> str:
+    """オッズ非依存ブロックのキャッシュキー（レース・モデル・オッズ以外の入力・履歴スナップショット版）"""
+    from keiba_ai.feature_engineering import is_market_column  # type: ignore
+    base = df.loc[:, [c for c in df.columns if not is_market_column(c)]]
+    manifest = _HISTORY_STORE.read_manifest() or {}
+    return f"{race_id}:{model_name}:{_frame_fingerprint(base)}:{manifest.get('version', '')}"
+
+
 class ModelPredictor:
     """モデルバンドルを基点に推論パイプラインを管理するクラス。
 
@@ -249,12 +337,21 @@ class ModelPredictor:
         self.pipeline_config: dict = bundle.get("pipeline_config", {})
         self.is_ranker: bool = bool(bundle.get("_is_ranker", False))
 
+    @property
+    def uses_market_features(self) -> bool:
+        """モデルがオッズ・人気由来の特徴量を入力に使うか（feature_columns 不明なら使う扱い）"""
+        if not self.feature_columns:
+            return True
+        from keiba_ai.feature_engineering import is_market_column  # type: ignore
+        return any(is_market_column(c) for c in self.feature_columns)
+
     # ── 特徴量構築 ──────────────────────────────────────────────────────────
 
     def build_features(
         self,
         df: "pd.DataFrame",
         full_hist: "pd.DataFrame | None" = None,
+        odds_drift: "pd.DataFrame | None" = None,
     ) -> "pd.DataFrame":
         """推論用特徴量 DataFrame を構築し、feature_columns 順に整列して返す。
 
@@ -268,7 +365,7 @@ class ModelPredictor:
 
         # Step 1: 派生特徴量エンジニアリング（部分失敗は許容 → strict check で捕捉）
         try:
-            df = _adf(df, full_history_df=full_hist if full_hist is not None else df)
+            df = _adf(df, full_history_df=full_hist if full_hist is not None else df, odds_drift_df=odds_drift)
         except Exception as _e:
             logger.warning(f"[ModelPredictor:{self.target}] add_derived_features 部分失敗: {_e}")
         df = df.loc[:, ~df.columns.duplicated()]
@@ -326,6 +423,73 @@ class ModelPredictor:
             return verify_feature_columns(X, self.bundle)
         return X
 
+    def refresh_market_features(
+        self,
+        X: "pd.DataFrame",
+        df: "pd.DataFrame",
+        odds_drift: "pd.DataFrame | None" = None,
+    ) -> "pd.DataFrame":
+        """構築済みの X の市場レイヤー列だけを df の最新オッズ・人気で計算し直す（行順は df と同じ前提）"""
+        from keiba_ai.feature_engineering import add_market_features, is_market_column  # type: ignore
+        keep = [c for c in ("race_id", "horse_number", "horse_no", "odds", "popularity", "num_horses")
+                if c in df.columns]
+        market = add_market_features(df.loc[:, keep], odds_drift)
+        X = X.copy()
+        for c in X.columns:
+            if is_market_column(c) and c in market.columns:
+                X[c] = pd.to_numeric(market[c], errors="coerce").to_numpy(dtype=float)
+        return X
+
+    def score_race(
+        self,
+        df: "pd.DataFrame",
+        full_hist: "pd.DataFrame | Callable[[], pd.DataFrame] | None" = None,
+        odds_drift: "pd.DataFrame | None" = None,
+        cache: "TTLCache | None" = None,
+        cache_key: "str | None" = None,
+    ) -> "tuple[np.ndarray, np.ndarray]":
+        """1 レース分の (raw_scores, proba_norm) を返す。
+
+        cache / cache_key（オッズ以外の入力が同じなら同じキー）を渡すと、構築済み特徴量を再利用する。
+        オッズだけが変わった場合は市場レイヤーの列のみ再計算し、モデルが市場特徴量を使わなければ
+        スコアもそのまま返す。full_hist は呼び出し可能オブジェクトも受け付け、キャッシュミス時だけ評価する。
+        """
+        market_fp = _market_fingerprint(df, odds_drift)
+        entry = cache.get(cache_key) if cache is not None and cache_key else None
+        if entry is None:
+            hist = full_hist() if callable(full_hist) else full_hist
+            X = self.build_features(df, hist, odds_drift)
+            raw, proba = self.predict_scores(X)
+            self.log_feature_drift(X)
+        elif entry["market"] == market_fp or not self.uses_market_features:
+            return entry["raw"], entry["proba"]
+        else:
+            X = self.refresh_market_features(entry["X"], df, odds_drift)
+            raw, proba = self.predict_scores(X)
+            logger.info(f"[ModelPredictor:{self.target}] オッズ更新 → 市場レイヤーのみ再計算")
+        if cache is not None and cache_key:
+            cache.set(cache_key, {"X": X, "market": market_fp, "raw": raw, "proba": proba})
+        return raw, proba
+
+    def feature_drift(self, X: "pd.DataFrame") -> "pd.DataFrame | None":
+        """バンドルの drift_reference（学習時の分位ビン）に対する特徴量ドリフト。基準が無ければ None"""
+        reference = self.bundle.get("drift_reference")
+        if not reference:
+            return None
+        from keiba_ai.quality_gate import check_feature_drift  # type: ignore
+        return check_feature_drift(None, X, reference=reference)
+
+    def log_feature_drift(self, X: "pd.DataFrame") -> None:
+        """ドリフトフラグの立った特徴量をログに出す（推論は止めない）"""
+        try:
+            drift = self.feature_drift(X)
+        except Exception as e:
+            logger.warning(f"[ModelPredictor:{self.target}] ドリフト検査失敗: {e}")
+            return
+        if drift is not None and len(drift) and drift["drift_flag"].any():
+            flagged = drift.loc[drift["drift_flag"], "feature"].tolist()
+            logger.info(f"[ModelPredictor:{self.target}] ドリフト検出 {len(flagged)} 列: {flagged[:10]}")
+
     # ── 推論・スコア変換 ────────────────────────────────────────────────────
 
     def predict_scores(
@@ -341,7 +505,7 @@ class ModelPredictor:
             (raw_scores, proba_norm) — 両方 shape (n_horses,)
         """
         import numpy as _np_p
-        raw = _np_p.array(self.model.predict(X), dtype=float)
+        raw = _np_p.array(run_stage("model.predict", self.model.predict, X), dtype=float)
 
         if self.target in ("speed_deviation", "rank"):
             finite = _np_p.isfinite(raw)
@@ -373,7 +537,7 @@ async def predict(request: PredictRequest, http_req: Request):
     try:
         # モデルロード → ModelPredictor 初期化（モデル固有パイプラインを決定）
         model_path = _resolve_model_path(request.model_id)
-        bundle = load_model_bundle(model_path)
+        bundle = await run_blocking(load_model_bundle, model_path)
         predictor = ModelPredictor(bundle, model_path)
 
         # レース後フィールドを除去して DataFrame 化
@@ -451,454 +615,548 @@ async def predict(request: PredictRequest, http_req: Request):
         raise HTTPException(status_code=500, detail=f"予測中にエラーが発生: {str(e)}")
 
 
-async def _analyze_race_impl(request: AnalyzeRaceRequest):
-    """レース分析と購入推奨エンドポイント"""
-    # ── キャッシュチェック（TTL=5分、bankroll/risk_mode が同一の場合のみ）
-    _cache_key = f"{request.race_id}:{request.model_id}:{request.bankroll}:{request.risk_mode}"
-    _now = _time.time()
-    _cached = _ANALYZE_CACHE.get(_cache_key)
-    if _cached and (_now - _cached[0]) < _ANALYZE_CACHE_TTL:
-        logger.info(f"[cache hit] analyze_race {request.race_id} (age={(int(_now - _cached[0]))}s)")
-        return AnalyzeRaceResponse(**_cached[1])
+def _live_tansho(race_id: str) -> "tuple[str, dict[int, float]]":
+    """オッズストアの最新単勝オッズを (オッズ版, 馬番 → オッズ) で返す。未取得なら ("none", {})
 
+    メモリに無ければ SQLite を読むので run_blocking から呼ぶ。
+    """
     try:
-        from betting.strategy import BettingRecommender  # type: ignore
+        from routers.realtime_odds import ODDS_STORE  # type: ignore
+        m = ODDS_STORE.latest(race_id, "tansho")
+    except Exception as e:
+        logger.warning(f"[analyze] {race_id}: オッズストア参照失敗: {e}")
+        m = None
+    if m is None:
+        return "none", {}
+    odds = {int(h): float(v) for h, v in zip(m.horse_numbers, m.values) if v == v and v > 0}
+    return f"{m.captured_at:.3f}", odds
 
-        # Phase 0: 常に ultimate DB を使用（87特徴量モード固定）
-        db_path = ULTIMATE_DB
 
-        # モデルロード（model_id指定 → active model pointer → latest の順）
-        model_path = _resolve_model_path(request.model_id)
+def _read_race_rows(db_path: "Path", race_id: str) -> "tuple[dict | None, list[dict]]":
+    """races_ultimate / race_results_ultimate から (レース情報, 馬番順の出走馬) を JSON 解析して返す。
 
-        bundle = load_model_bundle(model_path)
-
-        # Phase 0: 常に ultimate モードでデータを取得（87特徴量固定）
-        if True:  # noqa (request.ultimate_mode は常に True)
-            # ── Ultimate DB から出走馬データを取得 ──
-            import sqlite3 as _sq3
-
-            _conn = _sq3.connect(str(db_path))
-            _cur = _conn.cursor()
-            _cur.execute("SELECT data FROM races_ultimate WHERE race_id = ?", (request.race_id,))
-            _rrow = _cur.fetchone()
-            if not _rrow:
-                _conn.close()
-                # DBにない場合 → オンデマンドスクレイプして保存してから再試行
-                logger.info(f"[analyze] レース {request.race_id} がDBに未登録 → オンデマンドスクレイプ開始")
-                try:
-                    import aiohttp as _aiohttp
-                    from scraping.race import scrape_race_full as _scrape_race_full  # type: ignore
-                    from scraping.storage import _save_race_to_ultimate_db  # type: ignore
-                    from scraping.constants import get_random_headers  # type: ignore
-                    _date_hint = request.race_id[0:4] + request.race_id[4:6] + request.race_id[6:8]
-                    _timeout = _aiohttp.ClientTimeout(total=60)
-                    async with _aiohttp.ClientSession(headers=get_random_headers(), timeout=_timeout) as _sess:
-                        _scraped = await _scrape_race_full(_sess, request.race_id, date_hint=_date_hint)
-                    if not _scraped or not _scraped.get("horses"):
-                        raise HTTPException(
-                            status_code=404,
-                            detail=f"レース {request.race_id} のスクレイプに失敗しました（データなし）",
-                        )
-                    _save_race_to_ultimate_db(_scraped, ULTIMATE_DB, overwrite=True)
-                    logger.info(f"[analyze] レース {request.race_id} をDBに保存完了 ({len(_scraped['horses'])}頭)")
-                except HTTPException:
-                    raise
-                except asyncio.TimeoutError:
-                    raise HTTPException(
-                        status_code=503,
-                        detail=f"レース {request.race_id} のスクレイプがタイムアウトしました",
-                    )
-                except Exception as _se:
-                    raise HTTPException(
-                        status_code=503,
-                        detail=f"レース {request.race_id} がDBに未登録で、スクレイプにも失敗しました: {_se}",
-                    )
-                # 保存後に再取得
-                _conn = _sq3.connect(str(db_path))
-                _cur = _conn.cursor()
-                _cur.execute("SELECT data FROM races_ultimate WHERE race_id = ?", (request.race_id,))
-                _rrow = _cur.fetchone()
-                if not _rrow:
-                    _conn.close()
-                    raise HTTPException(status_code=500, detail=f"レース {request.race_id} の保存後読み込みに失敗しました")
-            _race_data = json.loads(_rrow[0])
-            race_info = {
-                "race_id": request.race_id,
-                "race_name": _race_data.get("race_name", ""),
-                "venue": _race_data.get("venue", ""),
-                "date": _race_data.get("date", ""),
-                "distance": _race_data.get("distance", 0),
-                "track_type": _race_data.get("track_type", ""),
-                "weather": _race_data.get("weather", ""),
-                "field_condition": _race_data.get("field_condition", ""),
-                "num_horses": _race_data.get("num_horses", 0),
-            }
-            _cur.execute(
-                "SELECT data FROM race_results_ultimate WHERE race_id = ? ORDER BY json_extract(data, '$.horse_number')",
-                (request.race_id,),
-            )
-            _hrows = _cur.fetchall()
-            _conn.close()
-            if not _hrows:
-                # 馬データなし → レース情報はあるが horse データが未登録のためオンデマンド再スクレイプ
-                logger.info(f"[analyze] レース {request.race_id} は races_ultimate にあるが horse データなし → 再スクレイプ")
-                try:
-                    import aiohttp as _aiohttp
-                    from scraping.race import scrape_race_full as _scrape_race_full  # type: ignore
-                    from scraping.storage import _save_race_to_ultimate_db  # type: ignore
-                    from scraping.constants import get_random_headers  # type: ignore
-                    _timeout = _aiohttp.ClientTimeout(total=60)
-                    async with _aiohttp.ClientSession(headers=get_random_headers(), timeout=_timeout) as _sess:
-                        _scraped = await _scrape_race_full(_sess, request.race_id)
-                    if not _scraped or not _scraped.get("horses"):
-                        raise HTTPException(
-                            status_code=404,
-                            detail=f"レース {request.race_id} の馬データが見つかりません（スクレイプでも取得できませんでした）",
-                        )
-                    _save_race_to_ultimate_db(_scraped, ULTIMATE_DB, overwrite=True)
-                    logger.info(f"[analyze] レース {request.race_id} 馬データ再スクレイプ完了 ({len(_scraped['horses'])}頭)")
-                    # 再スクレイプ後に再取得
-                    _conn2 = _sq3.connect(str(db_path))
-                    _cur2 = _conn2.cursor()
-                    _cur2.execute(
-                        "SELECT data FROM race_results_ultimate WHERE race_id = ? ORDER BY json_extract(data, '$.horse_number')",
-                        (request.race_id,),
-                    )
-                    _hrows = _cur2.fetchall()
-                    _cur2.execute("SELECT data FROM races_ultimate WHERE race_id = ?", (request.race_id,))
-                    _rrow2 = _cur2.fetchone()
-                    if _rrow2:
-                        _race_data = json.loads(_rrow2[0])
-                    _conn2.close()
-                    if not _hrows:
-                        raise HTTPException(status_code=404, detail=f"レース {request.race_id} の馬データが見つかりません")
-                except HTTPException:
-                    raise
-                except asyncio.TimeoutError:
+    同期の SQLite 読み出しなので run_blocking から呼ぶ。レースが無ければ (None, [])。
+    """
+    import sqlite3 as _sq3
+
+    conn = _sq3.connect(str(db_path))
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT data FROM races_ultimate WHERE race_id = ?", (race_id,))
+        rrow = cur.fetchone()
+        if not rrow:
+            return None, []
+        cur.execute(
+            "SELECT data FROM race_results_ultimate WHERE race_id = ? ORDER BY json_extract(data, '$.horse_number')",
+            (race_id,),
+        )
+        hrows = cur.fetchall()
+    finally:
+        conn.close()
+    return json.loads(rrow[0]), [json.loads(h[0]) for h in hrows]
+
+
+async def _compute_race_prediction(race_id: str, model_path: "Path") -> dict:
+    """レース単位の予測（出走馬取得 → オッズ補完 → 特徴量 → スコア）。
+
+    bankroll / risk_mode などユーザーごとの設定には依存しないため、結果は
+    _race_prediction で同一レースの全リクエストに共有される。
+    """
+    db_path = ULTIMATE_DB
+    # joblib.load と SQLite 読み出しはブロッキング I/O 用スレッドプールで行う
+    bundle = await run_blocking(load_model_bundle, model_path)
+
+    # Phase 0: 常に ultimate モードでデータを取得（87特徴量固定）
+    if True:  # noqa (request.ultimate_mode は常に True)
+        # ── Ultimate DB から出走馬データを取得 ──
+        _race_data, _horse_list = await run_blocking(_read_race_rows, db_path, race_id)
+        if _race_data is None:
+            # DBにない場合 → オンデマンドスクレイプして保存してから再試行
+            logger.info(f"[analyze] レース {race_id} がDBに未登録 → オンデマンドスクレイプ開始")
+            try:
+                import aiohttp as _aiohttp
+                from scraping.race import scrape_race_full as _scrape_race_full  # type: ignore
+                from scraping.storage import _save_race_to_ultimate_db  # type: ignore
+                from scraping.constants import get_random_headers  # type: ignore
+                _date_hint = race_id[0:4] + race_id[4:6] + race_id[6:8]
+                _timeout = _aiohttp.ClientTimeout(total=60)
+                async with _aiohttp.ClientSession(headers=get_random_headers(), timeout=_timeout) as _sess:
+                    _scraped = await _scrape_race_full(_sess, race_id, date_hint=_date_hint)
+                if not _scraped or not _scraped.get("horses"):
                     raise HTTPException(
-                        status_code=503,
-                        detail=f"レース {request.race_id} の再スクレイプがタイムアウトしました",
+                        status_code=404,
+                        detail=f"レース {race_id} のスクレイプに失敗しました（データなし）",
                     )
-                except Exception as _se:
+                await run_blocking(_save_race_to_ultimate_db, _scraped, ULTIMATE_DB, overwrite=True)
+                logger.info(f"[analyze] レース {race_id} をDBに保存完了 ({len(_scraped['horses'])}頭)")
+            except HTTPException:
+                raise
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"レース {race_id} のスクレイプがタイムアウトしました",
+                )
+            except Exception as _se:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"レース {race_id} がDBに未登録で、スクレイプにも失敗しました: {_se}",
+                )
+            # 保存後に再取得
+            _race_data, _horse_list = await run_blocking(_read_race_rows, db_path, race_id)
+            if _race_data is None:
+                raise HTTPException(status_code=500, detail=f"レース {race_id} の保存後読み込みに失敗しました")
+        race_info = {
+            "race_id": race_id,
+            "race_name": _race_data.get("race_name", ""),
+            "venue": _race_data.get("venue", ""),
+            "date": _race_data.get("date", ""),
+            "distance": _race_data.get("distance", 0),
+            "track_type": _race_data.get("track_type", ""),
+            "weather": _race_data.get("weather", ""),
+            "field_condition": _race_data.get("field_condition", ""),
+            "num_horses": _race_data.get("num_horses", 0),
+        }
+        if not _horse_list:
+            # 馬データなし → レース情報はあるが horse データが未登録のためオンデマンド再スクレイプ
+            logger.info(f"[analyze] レース {race_id} は races_ultimate にあるが horse データなし → 再スクレイプ")
+            try:
+                import aiohttp as _aiohttp
+                from scraping.race import scrape_race_full as _scrape_race_full  # type: ignore
+                from scraping.storage import _save_race_to_ultimate_db  # type: ignore
+                from scraping.constants import get_random_headers  # type: ignore
+                _timeout = _aiohttp.ClientTimeout(total=60)
+                async with _aiohttp.ClientSession(headers=get_random_headers(), timeout=_timeout) as _sess:
+                    _scraped = await _scrape_race_full(_sess, race_id)
+                if not _scraped or not _scraped.get("horses"):
                     raise HTTPException(
                         status_code=404,
-                        detail=f"レース {request.race_id} の馬データが見つかりません（再スクレイプ失敗: {_se}）",
+                        detail=f"レース {race_id} の馬データが見つかりません（スクレイプでも取得できませんでした）",
                     )
+                await run_blocking(_save_race_to_ultimate_db, _scraped, ULTIMATE_DB, overwrite=True)
+                logger.info(f"[analyze] レース {race_id} 馬データ再スクレイプ完了 ({len(_scraped['horses'])}頭)")
+                # 再スクレイプ後に再取得
+                _race_data2, _horse_list = await run_blocking(_read_race_rows, db_path, race_id)
+                if _race_data2 is not None:
+                    _race_data = _race_data2
+                if not _horse_list:
+                    raise HTTPException(status_code=404, detail=f"レース {race_id} の馬データが見つかりません")
+            except HTTPException:
+                raise
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"レース {race_id} の再スクレイプがタイムアウトしました",
+                )
+            except Exception as _se:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"レース {race_id} の馬データが見つかりません（再スクレイプ失敗: {_se}）",
+                )
 
-            _horse_records = []
-            for _hr in _hrows:
-                _hd = json.loads(_hr[0])
-                _hd["race_id"] = request.race_id
-                for _k, _v in _race_data.items():
-                    if _k not in _hd or _hd[_k] is None:
-                        _hd[_k] = _v
-                _horse_records.append(_hd)
-
-            df_pred = pd.DataFrame(_horse_records)
-
-            # [S] 未来情報ブラックリスト列を推論入力から強制除外
-            _drop_future = [c for c in POST_RACE_FIELDS if c in df_pred.columns]
-            if _drop_future:
-                df_pred = df_pred.drop(columns=_drop_future)
-                logger.debug(f"[S] 未来情報列を除外: {_drop_future}")
-
-            _col_map = {
-                "finish_position": "finish", "finish_time": "time",
-                "track_type": "surface", "last_3f": "last_3f_time", "weight_kg": "horse_weight",
-                "weight_change": "horse_weight_change",
-            }
-            for _old, _new in _col_map.items():
-                if _old in df_pred.columns:
-                    if _new not in df_pred.columns:
-                        df_pred[_new] = df_pred[_old]
+        _horse_records = []
+        for _hd in _horse_list:
+            _hd["race_id"] = race_id
+            for _k, _v in _race_data.items():
+                if _k not in _hd or _hd[_k] is None:
+                    _hd[_k] = _v
+            _horse_records.append(_hd)
+
+        df_pred = pd.DataFrame(_horse_records)
+
+        # [S] 未来情報ブラックリスト列を推論入力から強制除外
+        _drop_future = [c for c in POST_RACE_FIELDS if c in df_pred.columns]
+        if _drop_future:
+            df_pred = df_pred.drop(columns=_drop_future)
+            logger.debug(f"[S] 未来情報列を除外: {_drop_future}")
+
+        _col_map = {
+            "finish_position": "finish", "finish_time": "time",
+            "track_type": "surface", "last_3f": "last_3f_time", "weight_kg": "horse_weight",
+            "weight_change": "horse_weight_change",
+        }
+        for _old, _new in _col_map.items():
+            if _old in df_pred.columns:
+                if _new not in df_pred.columns:
+                    df_pred[_new] = df_pred[_old]
+                else:
+                    # 列が存在するが全 NaN のケース（races_ultimate.data の surface=None など）
+                    # → track_type の値で NaN を補完する
+                    df_pred[_new] = df_pred[_new].fillna(df_pred[_old])
+
+        for _url_col, _id_col, _name_col in [
+            ("jockey_url", "jockey_id", "jockey_name"),
+            ("trainer_url", "trainer_id", "trainer_name"),
+            ("horse_url", "horse_id", "horse_name"),
+        ]:
+            if _id_col not in df_pred.columns:
+                if _url_col in df_pred.columns:
+                    df_pred[_id_col] = df_pred[_url_col].str.extract(r"/([^/]+)/?$")[0]
+                elif _name_col in df_pred.columns:
+                    df_pred[_id_col] = df_pred[_name_col]
+
+        _numeric_cols = [
+            "bracket_number", "horse_number", "jockey_weight", "odds", "popularity",
+            "horse_weight", "age", "distance", "num_horses",
+            "kai", "day", "corner_1", "corner_2", "corner_3", "corner_4",
+            "horse_total_runs", "horse_total_wins", "horse_total_prize_money",
+            "prev_race_distance", "prev_race_finish", "prev_race_weight",
+        ]
+        for _c in _numeric_cols:
+            if _c in df_pred.columns:
+                df_pred[_c] = pd.to_numeric(df_pred[_c], errors="coerce")
+
+        # オッズストアに当日のリアルタイム単勝オッズがあれば DB 保存時の値より優先する
+        # （予測キャッシュのキーに使うオッズ版と、実際に予測に使うオッズを一致させる）
+        _odds_version, _live_odds = await run_blocking(_live_tansho, race_id)
+        if _live_odds and "horse_number" in df_pred.columns:
+            _live = pd.to_numeric(df_pred["horse_number"], errors="coerce").map(_live_odds)
+            df_pred["odds"] = _live.fillna(df_pred["odds"]) if "odds" in df_pred.columns else _live
+            if _live.notna().all():
+                df_pred["popularity"] = df_pred["odds"].rank(method="min").astype("Int64")
+            logger.info(f"[analyze] {race_id}: オッズストアの単勝オッズを使用 ({int(_live.notna().sum())}頭)")
+
+        # [fix] DB保存時にodds=Noneだった出馬表データを再スクレイプして最新オッズを補完
+        # 過去レース・当日レース(race_date <= today)はdb.netkeiba.com結果ページから確定オッズを取得
+        # 未来レースはshutubaページから暫定オッズを取得
+        _odds_missing = (
+            "odds" not in df_pred.columns
+            or df_pred["odds"].isna().all()
+            or (df_pred["odds"].fillna(0) == 0).all()  # 全馬 0.0 もオッズ未取得扱い
+        )
+        if _odds_missing:
+            try:
+                import aiohttp as _aiohttp2
+                from scraping.storage import _save_race_to_ultimate_db as _srtud  # type: ignore
+                from scraping.constants import get_random_headers as _get_rh  # type: ignore
+                _today_str = datetime.now().strftime("%Y%m%d")
+                _race_date_str = race_info.get("date", "") or ""
+                # 当日レース（終了済み）も结果ページで確定オッズを取得できるため <= に変更
+                _is_past = _race_date_str and _race_date_str <= _today_str
+                _timeout2 = _aiohttp2.ClientTimeout(total=60)
+                _fresh = None
+                if _is_past:
+                    # 過去・当日レース → 結果ページ（確定オッズあり）
+                    from scraping.race import scrape_race_full as _srf2  # type: ignore
+                    async with _aiohttp2.ClientSession(headers=_get_rh(), timeout=_timeout2) as _sess2:
+                        _fresh = await _srf2(_sess2, race_id, date_hint=_race_date_str)
+                    # 結果ページにオッズがない場合（レース未了）→ 出馬表にフォールバック
+                    if not _fresh or not any(h.get("odds") for h in (_fresh or {}).get("horses", [])):
+                        from scraping.race import _scrape_shutuba_fallback as _ssf  # type: ignore
+                        async with _aiohttp2.ClientSession(headers=_get_rh(), timeout=_timeout2) as _sess2:
+                            _fresh = await _ssf(_sess2, race_id)
+                else:
+                    # 未来レース → 出馬表ページ（暫定オッズ）
+                    from scraping.race import _scrape_shutuba_fallback as _ssf  # type: ignore
+                    async with _aiohttp2.ClientSession(headers=_get_rh(), timeout=_timeout2) as _sess2:
+                        _fresh = await _ssf(_sess2, race_id)
+                if _fresh and _fresh.get("horses"):
+                    _odds_map = {
+                        h["horse_number"]: h.get("odds")
+                        for h in _fresh["horses"]
+                        if h.get("odds") is not None
+                    }
+                    if _odds_map:
+                        def _fill_odds(row):
+                            hn = row.get("horse_number") or row.get("bracket_number")
+                            return _odds_map.get(hn)
+                        df_pred["odds"] = df_pred.apply(_fill_odds, axis=1)
+                        _pop_map = {
+                            h["horse_number"]: h.get("popularity")
+                            for h in _fresh["horses"]
+                            if h.get("popularity") is not None
+                        }
+                        if _pop_map and ("popularity" not in df_pred.columns or df_pred["popularity"].isna().all()):
+                            df_pred["popularity"] = df_pred.apply(
+                                lambda r: _pop_map.get(r.get("horse_number") or r.get("bracket_number")), axis=1
+                            )
+                        # DBも更新して次回スクレイプ不要にする
+                        try:
+                            _srtud(_fresh, ULTIMATE_DB, overwrite=True)
+                        except Exception:
+                            pass
+                        _src = "結果ページ" if _is_past else "出馬表"
+                        logger.info(f"[analyze] {race_id}: {_src}再スクレイプでodds補完完了 ({len(_odds_map)}頭)")
                     else:
-                        # 列が存在するが全 NaN のケース（races_ultimate.data の surface=None など）
-                        # → track_type の値で NaN を補完する
-                        df_pred[_new] = df_pred[_new].fillna(df_pred[_old])
-
-            for _url_col, _id_col, _name_col in [
-                ("jockey_url", "jockey_id", "jockey_name"),
-                ("trainer_url", "trainer_id", "trainer_name"),
-                ("horse_url", "horse_id", "horse_name"),
-            ]:
-                if _id_col not in df_pred.columns:
-                    if _url_col in df_pred.columns:
-                        df_pred[_id_col] = df_pred[_url_col].str.extract(r"/([^/]+)/?$")[0]
-                    elif _name_col in df_pred.columns:
-                        df_pred[_id_col] = df_pred[_name_col]
-
-            _numeric_cols = [
-                "bracket_number", "horse_number", "jockey_weight", "odds", "popularity",
-                "horse_weight", "age", "distance", "num_horses",
-                "kai", "day", "corner_1", "corner_2", "corner_3", "corner_4",
-                "horse_total_runs", "horse_total_wins", "horse_total_prize_money",
-                "prev_race_distance", "prev_race_finish", "prev_race_weight",
-            ]
-            for _c in _numeric_cols:
-                if _c in df_pred.columns:
-                    df_pred[_c] = pd.to_numeric(df_pred[_c], errors="coerce")
-
-            # [fix] DB保存時にodds=Noneだった出馬表データを再スクレイプして最新オッズを補完
-            # 過去レース・当日レース(race_date <= today)はdb.netkeiba.com結果ページから確定オッズを取得
-            # 未来レースはshutubaページから暫定オッズを取得
-            _odds_missing = (
+                        logger.info(f"[analyze] {race_id}: shutuba再スクレイプ完了だがoddはまだ未公開")
+            except Exception as _roe:
+                logger.warning(f"[analyze] {race_id}: odds再スクレイプ失敗 → NaNのまま続行: {_roe}")
+
+            # Playwright フォールバック:
+            # netkeiba のオッズは JavaScript AJAX でロードされるため、静的 HTML では ---.- のまま
+            # 上記の通常スクレイプで odds が取れなかった場合のみ実行
+            _still_no_odds = (
                 "odds" not in df_pred.columns
                 or df_pred["odds"].isna().all()
-                or (df_pred["odds"].fillna(0) == 0).all()  # 全馬 0.0 もオッズ未取得扱い
+                or (df_pred["odds"].fillna(0) == 0).all()
             )
-            if _odds_missing:
+            if _still_no_odds:
                 try:
-                    import aiohttp as _aiohttp2
-                    from scraping.storage import _save_race_to_ultimate_db as _srtud  # type: ignore
-                    from scraping.constants import get_random_headers as _get_rh  # type: ignore
-                    _today_str = datetime.now().strftime("%Y%m%d")
-                    _race_date_str = race_info.get("date", "") or ""
-                    # 当日レース（終了済み）も结果ページで確定オッズを取得できるため <= に変更
-                    _is_past = _race_date_str and _race_date_str <= _today_str
-                    _timeout2 = _aiohttp2.ClientTimeout(total=60)
-                    _fresh = None
-                    if _is_past:
-                        # 過去・当日レース → 結果ページ（確定オッズあり）
-                        from scraping.race import scrape_race_full as _srf2  # type: ignore
-                        async with _aiohttp2.ClientSession(headers=_get_rh(), timeout=_timeout2) as _sess2:
-                            _fresh = await _srf2(_sess2, request.race_id, date_hint=_race_date_str)
-                        # 結果ページにオッズがない場合（レース未了）→ 出馬表にフォールバック
-                        if not _fresh or not any(h.get("odds") for h in (_fresh or {}).get("horses", [])):
-                            from scraping.race import _scrape_shutuba_fallback as _ssf  # type: ignore
-                            async with _aiohttp2.ClientSession(headers=_get_rh(), timeout=_timeout2) as _sess2:
-                                _fresh = await _ssf(_sess2, request.race_id)
+                    from routers.realtime_odds import _fetch_tansho_odds_playwright as _ftopl, _store as _odds_store  # type: ignore
+                    _pw_odds = await _ftopl(race_id)
+                    if _pw_odds:
+                        _pw_int = {int(k): v for k, v in _pw_odds.items()}
+                        df_pred["odds"] = df_pred.apply(
+                            lambda r: _pw_int.get(int(float(r.get("horse_number") or 0))), axis=1
+                        )
+                        # リアルタイムオッズキャッシュにも保存（オッズ更新ボタンで参照される）
+                        try:
+                            await _odds_store(race_id, {
+                                "race_id": race_id,
+                                "fetched_at": __import__("time").time(),
+                                "odds": {"tansho": _pw_odds},
+                                "horse_count": len(_pw_odds),
+                            })
+                            _odds_version = (await run_blocking(_live_tansho, race_id))[0]
+                        except Exception:
+                            pass
+                        logger.info(
+                            f"[analyze] {race_id}: Playwright でodds補完完了 ({len(_pw_int)}頭)"
+                        )
                     else:
-                        # 未来レース → 出馬表ページ（暫定オッズ）
-                        from scraping.race import _scrape_shutuba_fallback as _ssf  # type: ignore
-                        async with _aiohttp2.ClientSession(headers=_get_rh(), timeout=_timeout2) as _sess2:
-                            _fresh = await _ssf(_sess2, request.race_id)
-                    if _fresh and _fresh.get("horses"):
-                        _odds_map = {
-                            h["horse_number"]: h.get("odds")
-                            for h in _fresh["horses"]
-                            if h.get("odds") is not None
-                        }
-                        if _odds_map:
-                            def _fill_odds(row):
-                                hn = row.get("horse_number") or row.get("bracket_number")
-                                return _odds_map.get(hn)
-                            df_pred["odds"] = df_pred.apply(_fill_odds, axis=1)
-                            _pop_map = {
-                                h["horse_number"]: h.get("popularity")
-                                for h in _fresh["horses"]
-                                if h.get("popularity") is not None
-                            }
-                            if _pop_map and ("popularity" not in df_pred.columns or df_pred["popularity"].isna().all()):
-                                df_pred["popularity"] = df_pred.apply(
-                                    lambda r: _pop_map.get(r.get("horse_number") or r.get("bracket_number")), axis=1
-                                )
-                            # DBも更新して次回スクレイプ不要にする
-                            try:
-                                _srtud(_fresh, ULTIMATE_DB, overwrite=True)
-                            except Exception:
-                                pass
-                            _src = "結果ページ" if _is_past else "出馬表"
-                            logger.info(f"[analyze] {request.race_id}: {_src}再スクレイプでodds補完完了 ({len(_odds_map)}頭)")
-                        else:
-                            logger.info(f"[analyze] {request.race_id}: shutuba再スクレイプ完了だがoddはまだ未公開")
-                except Exception as _roe:
-                    logger.warning(f"[analyze] {request.race_id}: odds再スクレイプ失敗 → NaNのまま続行: {_roe}")
-
-                # Playwright フォールバック:
-                # netkeiba のオッズは JavaScript AJAX でロードされるため、静的 HTML では ---.- のまま
-                # 上記の通常スクレイプで odds が取れなかった場合のみ実行
-                _still_no_odds = (
-                    "odds" not in df_pred.columns
-                    or df_pred["odds"].isna().all()
-                    or (df_pred["odds"].fillna(0) == 0).all()
+                        logger.info(
+                            f"[analyze] {race_id}: Playwright でもオッズ未公開（---.-）"
+                        )
+                except Exception as _pe:
+                    logger.warning(f"[analyze] {race_id}: Playwright odds取得失敗: {_pe}")
+
+        # odds が揃っているのに popularity が欠損している場合、odds ランク順から自動計算
+        if (
+            "odds" in df_pred.columns
+            and not df_pred["odds"].isna().all()
+            and ("popularity" not in df_pred.columns or df_pred["popularity"].isna().all())
+        ):
+            df_pred["popularity"] = df_pred["odds"].rank(method="min", na_option="bottom").astype("Int64")
+            logger.info(f"[analyze] {race_id}: popularity を odds ランクから自動計算")
+
+        if "sex_age" in df_pred.columns:
+            if "sex" not in df_pred.columns or df_pred["sex"].isna().all():
+                df_pred["sex"] = df_pred["sex_age"].str.extract(r"^([牡牝セ])")[0]
+            if "age" not in df_pred.columns or df_pred["age"].isna().all():
+                df_pred["age"] = pd.to_numeric(df_pred["sex_age"].str.extract(r"(\d+)$")[0], errors="coerce")
+
+        from keiba_ai.feature_engineering import parse_corner_columns  # type: ignore
+        df_pred = parse_corner_columns(df_pred)
+
+        # [S: Quality Gate] /analyze 入力データ品質チェック
+        # Q2 (odds 欠損) はレース前・オッズ未公開時に発生するため WARNING 扱い。
+        # Q1 (distance=0) / Q3 (同一レース内の揺れ) のみ致命的エラーとする。
+        try:
+            from keiba_ai.quality_gate import validate_race_entries as _vqr  # type: ignore
+            _qr_a = _vqr(df_pred)
+            # Q2 (odds 欠損) / Q5 (popularity 欠損) はレース前のオッズ未公開時に発生 → WARNING 扱い
+            # Q1 (distance=0) / Q3 (同一レース内の揺れ) のみ致命的エラーとする
+            _fatal_ids = {
+                i.race_id for i in _qr_a.issues
+                if i.severity == "ERROR" and i.issue_code not in ("Q2", "Q5")
+            }
+            if _fatal_ids:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"[Quality Gate] レース {race_id} の入力データに問題があります:\n{_qr_a.summary()}",
                 )
-                if _still_no_odds:
-                    try:
-                        from routers.realtime_odds import _fetch_tansho_odds_playwright as _ftopl, _store as _odds_store  # type: ignore
-                        _pw_odds = await _ftopl(request.race_id)
-                        if _pw_odds:
-                            _pw_int = {int(k): v for k, v in _pw_odds.items()}
-                            df_pred["odds"] = df_pred.apply(
-                                lambda r: _pw_int.get(int(float(r.get("horse_number") or 0))), axis=1
-                            )
-                            # リアルタイムオッズキャッシュにも保存（オッズ更新ボタンで参照される）
-                            try:
-                                _odds_store(request.race_id, {
-                                    "race_id": request.race_id,
-                                    "fetched_at": __import__("time").time(),
-                                    "odds": {"tansho": _pw_odds},
-                                    "horse_count": len(_pw_odds),
-                                })
-                            except Exception:
-                                pass
-                            logger.info(
-                                f"[analyze] {request.race_id}: Playwright でodds補完完了 ({len(_pw_int)}頭)"
-                            )
-                        else:
-                            logger.info(
-                                f"[analyze] {request.race_id}: Playwright でもオッズ未公開（---.-）"
-                            )
-                    except Exception as _pe:
-                        logger.warning(f"[analyze] {request.race_id}: Playwright odds取得失敗: {_pe}")
-
-            # odds が揃っているのに popularity が欠損している場合、odds ランク順から自動計算
-            if (
-                "odds" in df_pred.columns
-                and not df_pred["odds"].isna().all()
-                and ("popularity" not in df_pred.columns or df_pred["popularity"].isna().all())
-            ):
-                df_pred["popularity"] = df_pred["odds"].rank(method="min", na_option="bottom").astype("Int64")
-                logger.info(f"[analyze] {request.race_id}: popularity を odds ランクから自動計算")
-
-            if "sex_age" in df_pred.columns:
-                if "sex" not in df_pred.columns or df_pred["sex"].isna().all():
-                    df_pred["sex"] = df_pred["sex_age"].str.extract(r"^([牡牝セ])")[0]
-                if "age" not in df_pred.columns or df_pred["age"].isna().all():
-                    df_pred["age"] = pd.to_numeric(df_pred["sex_age"].str.extract(r"(\d+)$")[0], errors="coerce")
-
-            if "corner_positions" in df_pred.columns and "corner_positions_list" not in df_pred.columns:
-                def _parse_cp(s):
-                    try:
-                        if pd.isna(s) or s == "":
-                            return []
-                        return [int(x) for x in str(s).split("-") if x.strip().isdigit()]
-                    except Exception:
-                        return []
-                df_pred["corner_positions_list"] = df_pred["corner_positions"].apply(_parse_cp)
-
-            # [S: Quality Gate] /analyze 入力データ品質チェック
-            # Q2 (odds 欠損) はレース前・オッズ未公開時に発生するため WARNING 扱い。
-            # Q1 (distance=0) / Q3 (同一レース内の揺れ) のみ致命的エラーとする。
-            try:
-                from keiba_ai.quality_gate import validate_race_entries as _vqr  # type: ignore
-                _qr_a = _vqr(df_pred)
-                # Q2 (odds 欠損) / Q5 (popularity 欠損) はレース前のオッズ未公開時に発生 → WARNING 扱い
-                # Q1 (distance=0) / Q3 (同一レース内の揺れ) のみ致命的エラーとする
-                _fatal_ids = {
-                    i.race_id for i in _qr_a.issues
-                    if i.severity == "ERROR" and i.issue_code not in ("Q2", "Q5")
-                }
-                if _fatal_ids:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"[Quality Gate] レース {request.race_id} の入力データに問題があります:\n{_qr_a.summary()}",
-                    )
-                if _qr_a.n_bad > 0 or _qr_a.n_warn > 0:
-                    logger.warning(f"[Quality Gate warn] /analyze {request.race_id}:\n{_qr_a.summary()}")
-            except HTTPException:
-                raise
-            except Exception as _qe_a:
-                logger.warning(f"[Quality Gate /analyze] スキップ: {_qe_a}")
+            if _qr_a.n_bad > 0 or _qr_a.n_warn > 0:
+                logger.warning(f"[Quality Gate warn] /analyze {race_id}:\n{_qr_a.summary()}")
+        except HTTPException:
+            raise
+        except Exception as _qe_a:
+            logger.warning(f"[Quality Gate /analyze] スキップ: {_qe_a}")
 
-            # [INV-01] full_history_df には対象レースの行を含めない（expanding window に確定結果が混入しないよう）
-            # NOTE: _load_hist_cached / build_features は CPU 集中型の同期処理のため
-            #       asyncio.to_thread でスレッドプールに移し、イベントループをブロックしない
+        # [INV-01] full_history_df には対象レースの行を含めない（expanding window に確定結果が混入しないよう）
+        # 特徴量キャッシュにヒットすれば履歴のロード・結合自体を行わないよう、必要になった時点で 1 回だけ作る
+        # NOTE: _load_hist_cached / build_features は CPU 集中型の同期処理のため
+        #       asyncio.to_thread でスレッドプールに移し、イベントループをブロックしない
+        _hist_memo: dict = {}
+
+        def _full_hist2() -> "pd.DataFrame":
+            if "df" in _hist_memo:
+                return _hist_memo["df"]
             try:
-                _hist_df2 = await asyncio.to_thread(_load_hist_cached)
+                _hist_df2 = _load_hist_cached()
                 # 対象レースの確定結果が expanding stats に混入しないよう hist から除外する（INV-01）
                 if 'race_id' in _hist_df2.columns:
-                    _hist_df2 = _hist_df2[_hist_df2['race_id'] != request.race_id]
+                    _hist_df2 = _hist_df2[_hist_df2['race_id'] != race_id]
                 # FutureWarning 回避: 全列が NaN の列を concat 前に除外
                 _df_pred_for_concat = df_pred.loc[:, ~df_pred.isna().all()]
                 _hist_df2_for_concat = _hist_df2.loc[:, ~_hist_df2.isna().all()]
-                _full_hist2 = pd.concat([_hist_df2_for_concat, _df_pred_for_concat], ignore_index=True)
+                _hist_memo["df"] = pd.concat([_hist_df2_for_concat, _df_pred_for_concat], ignore_index=True)
             except Exception:
-                _full_hist2 = df_pred
-
-            # ModelPredictor: per-model feature build（strict, NaN補間なし）
-            # NOTE: ModelPredictor.build_features が add_derived_features を内部で呼ぶため
-            #       ここでの手動呼び出しは不要（二重適用防止）。
-            predictor = ModelPredictor(bundle, model_path)
-            X_pred = await asyncio.to_thread(predictor.build_features, df_pred, _full_hist2)
-
-            # ModelPredictor: per-model scoring（ターゲット種別に応じて自動選択）
-            import numpy as _np2
-            _wp_raw, win_probs = predictor.predict_scores(X_pred)
-            _bundle_target = predictor.target
-            _wp_sum = win_probs.sum()
-            _wp_norm = (win_probs / _wp_sum) if _wp_sum > 0 else win_probs
-
-            # ── place3 モデルによる複勝圏確率 ──────────────────────────────────
-            _place3_probs: "_np2.ndarray | None" = None
-            _place3_norm: "_np2.ndarray | None" = None
-            try:
-                _place3_model_files = sorted(
-                    MODELS_DIR.glob("model_place3_*.joblib"),
-                    key=lambda _p: _p.stat().st_mtime, reverse=True,
+                _hist_memo["df"] = df_pred
+            return _hist_memo["df"]
+
+        # ModelPredictor: per-model feature build（strict, NaN補間なし）
+        # NOTE: ModelPredictor.build_features が add_derived_features を内部で呼ぶため
+        #       ここでの手動呼び出しは不要（二重適用防止）。
+        # オッズ時系列が記録されていればドリフト特徴量も渡す（未記録なら None）
+        try:
+            from routers.realtime_odds import ODDS_RECORDER  # type: ignore
+            _odds_drift = await run_blocking(ODDS_RECORDER.features, [race_id])
+            _odds_drift = None if _odds_drift.empty else _odds_drift
+        except Exception as _de:
+            logger.warning(f"[analyze] {race_id}: オッズ時系列参照失敗: {_de}")
+            _odds_drift = None
+
+        # オッズ以外の入力が前回と同じなら構築済み特徴量を再利用し、市場レイヤーだけ再計算する
+        predictor = ModelPredictor(bundle, model_path)
+        _wp_raw, win_probs = await asyncio.to_thread(
+            predictor.score_race, df_pred, _full_hist2, _odds_drift,
+            _FEATURE_CACHE, _feature_cache_key(race_id, model_path.name, df_pred),
+        )
+
+        # ModelPredictor: per-model scoring（ターゲット種別に応じて自動選択）
+        import numpy as _np2
+        _bundle_target = predictor.target
+        _wp_sum = win_probs.sum()
+        _wp_norm = (win_probs / _wp_sum) if _wp_sum > 0 else win_probs
+
+        # ── place3 モデルによる複勝圏確率 ──────────────────────────────────
+        _place3_probs: "_np2.ndarray | None" = None
+        _place3_norm: "_np2.ndarray | None" = None
+        try:
+            _place3_model_files = sorted(
+                MODELS_DIR.glob("model_place3_*.joblib"),
+                key=lambda _p: _p.stat().st_mtime, reverse=True,
+            )
+            if _place3_model_files:
+                _sub_result = await asyncio.to_thread(
+                    _predict_sub_model, _place3_model_files[0], df_pred, _full_hist2,
+                    _feature_cache_key(race_id, _place3_model_files[0].name, df_pred), _odds_drift,
                 )
-                if _place3_model_files:
-                    _sub_result = _predict_sub_model(_place3_model_files[0], df_pred, full_hist=_full_hist2)
-                    if _sub_result is not None:
-                        _place3_probs, _place3_norm = _sub_result
-                        logger.info(
-                            f"[analyze] place3モデル ({_place3_model_files[0].name}) 適用: "
-                            f"top={_place3_norm.max():.3f}"
-                        )
-            except Exception as _p3e:
-                logger.warning(f"[analyze] place3モデルロード失敗: {_p3e}")
-
-            # ── アンサンブルスコア（win/speed + place3 の加重平均）──────────────
-            # _place3_norm を使用（正規化済み分布で win_probs と整合）
-            ensemble_probs = _compute_ensemble(win_probs, _place3_norm, _bundle_target)
-
-            # [fix] 再スクレイプで df_pred["odds"] が更新された場合、
-            # _horse_records には反映されないため、horse_number をキーに逆引きマップを作成
-            import pandas as _pd_odds
-            _df_odds_lookup: dict = {}
-            if "odds" in df_pred.columns:
-                for _, _drow in df_pred.iterrows():
-                    _hn_key = _drow.get("horse_number") or _drow.get("horse_no")
-                    _ov = _drow.get("odds")
-                    if _hn_key is not None and _ov is not None and not _pd_odds.isna(_ov) and float(_ov) > 0:
-                        _df_odds_lookup[int(float(_hn_key))] = float(_ov)
-            _df_popularity_lookup: dict = {}
-            if "popularity" in df_pred.columns:
-                for _, _drow in df_pred.iterrows():
-                    _hn_key = _drow.get("horse_number") or _drow.get("horse_no")
-                    _pv = _drow.get("popularity")
-                    if _hn_key is not None and _pv is not None and not _pd_odds.isna(_pv) and float(_pv) > 0:
-                        _df_popularity_lookup[int(float(_hn_key))] = int(float(_pv))
-
-            predictions = []
-            for i, _hr in enumerate(_horse_records):
-                _horse_num = _hr.get("horse_number") or _hr.get("horse_no") or (i + 1)
-                # df_pred の再スクレイプ済みオッズを優先、なければ _horse_records から取得
-                _odds_float: float | None = _df_odds_lookup.get(int(_horse_num))
-                if _odds_float is None:
-                    _raw_odds = _hr.get("odds") if _hr.get("odds") is not None else _hr.get("win_odds")
-                    try:
-                        _odds_float = float(_raw_odds) if _raw_odds not in (None, "", "---", 0, 0.0) else None
-                    except (ValueError, TypeError):
-                        _odds_float = None
-                # 期待値: オッズ未取得の場合は p_norm のみ（暫定値）
-                _ev = float(_wp_norm[i] * _odds_float) if _odds_float is not None else None
-                predictions.append({
-                    "horse_number": _horse_num, "horse_no": _horse_num,
-                    "horse_id": _hr.get("horse_id", ""),
-                    "horse_name": _hr.get("horse_name") or f'[{_hr.get("horse_id","") or _horse_num}]',
-                    "jockey_name": _hr.get("jockey_name", ""),
-                    "trainer_name": _hr.get("trainer_name", ""),
-                    "sex": _hr.get("sex", ""), "age": _hr.get("age"),
-                    "horse_weight": _hr.get("weight_kg") or _hr.get("horse_weight"),
-                    "odds": _odds_float, "popularity": _df_popularity_lookup.get(int(_horse_num)) or _hr.get("popularity"),
-                    "win_probability": float(win_probs[i]),
-                    "p_raw": float(_wp_raw[i]),
-                    "p_norm": float(_wp_norm[i]),
-                    "p_place3": float(_place3_norm[i]) if _place3_norm is not None and i < len(_place3_norm) else None,
-                    "p_ensemble": float(ensemble_probs[i]) if i < len(ensemble_probs) else float(_wp_norm[i]),
-                    "expected_value": _ev,  # [A1] p_norm×odds（オッズ未取得時はNone）
-                })
-
-            # [A1] ソートは p_raw 降順、predicted_rank 割り当て
-            predictions.sort(key=lambda x: x.get("p_raw", 0), reverse=True)
-            for _rank, _pred in enumerate(predictions, 1):
-                _pred["predicted_rank"] = _rank
+                if _sub_result is not None:
+                    _place3_probs, _place3_norm = _sub_result
+                    logger.info(
+                        f"[analyze] place3モデル ({_place3_model_files[0].name}) 適用: "
+                        f"top={_place3_norm.max():.3f}"
+                    )
+        except Exception as _p3e:
+            logger.warning(f"[analyze] place3モデルロード失敗: {_p3e}")
+
+        # ── アンサンブルスコア（win/speed + place3 の加重平均）──────────────
+        # _place3_norm を使用（正規化済み分布で win_probs と整合）
+        ensemble_probs = _compute_ensemble(win_probs, _place3_norm, _bundle_target)
+
+        # [fix] 再スクレイプで df_pred["odds"] が更新された場合、
+        # _horse_records には反映されないため、horse_number をキーに逆引きマップを作成
+        import pandas as _pd_odds
+        _df_odds_lookup: dict = {}
+        if "odds" in df_pred.columns:
+            for _, _drow in df_pred.iterrows():
+                _hn_key = _drow.get("horse_number") or _drow.get("horse_no")
+                _ov = _drow.get("odds")
+                if _hn_key is not None and _ov is not None and not _pd_odds.isna(_ov) and float(_ov) > 0:
+                    _df_odds_lookup[int(float(_hn_key))] = float(_ov)
+        _df_popularity_lookup: dict = {}
+        if "popularity" in df_pred.columns:
+            for _, _drow in df_pred.iterrows():
+                _hn_key = _drow.get("horse_number") or _drow.get("horse_no")
+                _pv = _drow.get("popularity")
+                if _hn_key is not None and _pv is not None and not _pd_odds.isna(_pv) and float(_pv) > 0:
+                    _df_popularity_lookup[int(float(_hn_key))] = int(float(_pv))
+
+        predictions = []
+        for i, _hr in enumerate(_horse_records):
+            _horse_num = _hr.get("horse_number") or _hr.get("horse_no") or (i + 1)
+            # df_pred の再スクレイプ済みオッズを優先、なければ _horse_records から取得
+            _odds_float: float | None = _df_odds_lookup.get(int(_horse_num))
+            if _odds_float is None:
+                _raw_odds = _hr.get("odds") if _hr.get("odds") is not None else _hr.get("win_odds")
+                try:
+                    _odds_float = float(_raw_odds) if _raw_odds not in (None, "", "---", 0, 0.0) else None
+                except (ValueError, TypeError):
+                    _odds_float = None
+            # 期待値: オッズ未取得の場合は p_norm のみ（暫定値）
+            _ev = float(_wp_norm[i] * _odds_float) if _odds_float is not None else None
+            predictions.append({
+                "horse_number": _horse_num, "horse_no": _horse_num,
+                "horse_id": _hr.get("horse_id", ""),
+                "horse_name": _hr.get("horse_name") or f'[{_hr.get("horse_id","") or _horse_num}]',
+                "jockey_name": _hr.get("jockey_name", ""),
+                "trainer_name": _hr.get("trainer_name", ""),
+                "sex": _hr.get("sex", ""), "age": _hr.get("age"),
+                "horse_weight": _hr.get("weight_kg") or _hr.get("horse_weight"),
+                "odds": _odds_float, "popularity": _df_popularity_lookup.get(int(_horse_num)) or _hr.get("popularity"),
+                "win_probability": float(win_probs[i]),
+                "p_raw": float(_wp_raw[i]),
+                "p_norm": float(_wp_norm[i]),
+                "p_place3": float(_place3_norm[i]) if _place3_norm is not None and i < len(_place3_norm) else None,
+                "p_ensemble": float(ensemble_probs[i]) if i < len(ensemble_probs) else float(_wp_norm[i]),
+                "expected_value": _ev,  # [A1] p_norm×odds（オッズ未取得時はNone）
+            })
+
+        # [A1] ソートは p_raw 降順、predicted_rank 割り当て
+        predictions.sort(key=lambda x: x.get("p_raw", 0), reverse=True)
+        for _rank, _pred in enumerate(predictions, 1):
+            _pred["predicted_rank"] = _rank
+
+    # 予測ログをDBに非同期保存（レスポンスをブロックしない）
+    try:
+        _model_id_log = bundle.get("model_id", bundle.get("created_at", "unknown"))
+        asyncio.create_task(asyncio.to_thread(
+            _save_prediction_log,
+            race_id, race_info, predictions,
+            _model_id_log, str(ULTIMATE_DB)
+        ))
+    except Exception as _log_err:
+        logger.warning(f"[prediction_log] save failed: {_log_err}")
+    logger.info(f"[cache store] analyze_race {race_id} (odds={_odds_version})")
+    return {"race_info": race_info, "predictions": predictions, "odds_version": _odds_version,
+            "market_features": predictor.uses_market_features}
+
+
+async def _race_prediction(race_id: str, model_id: "str | None") -> dict:
+    """(race_id, モデル, オッズ版) 単位で予測を共有する。
+
+    発走前にプリコンピュート済みならそれを返す（オッズが進んでいれば、市場特徴量を使わないモデルは
+    オッズ依存部分だけ再スコアし、使うモデルはミス扱いで下の経路から再推論する）。
+    ミスした場合、同じキーの同時リクエストは 1 回の計算（スクレイプ・履歴ロード・特徴量・推論）を
+    待ち合わせる。オッズストアが更新されるとキーが変わり、次のリクエストで予測し直す。
+    """
+    model_path = _resolve_model_path(model_id)
+    odds_version, live_odds = await run_blocking(_live_tansho, race_id)
+    pre = await _PRECOMPUTED.aget(race_id, model_path.name, odds_version, live_odds)
+    if pre is not None:
+        logger.info(f"[precomputed hit] analyze_race {race_id} (odds={pre.get('odds_version')})")
+        return pre
+    # 市場特徴量を使うモデルのプリコンピュートがオッズ更新で古くなった場合もここで再推論する。
+    # 特徴量は _FEATURE_CACHE にあるので、score_race は市場レイヤーの列だけ作り直す
+    key = f"{race_id}:{model_path.name}:{odds_version}"
+    pred = await _ANALYZE_CACHE.get_or_compute(key, lambda: _compute_race_prediction(race_id, model_path))
+    # 計算中に Playwright 補完でオッズ版が進んだ場合は、その版のキーでも引けるようにする
+    used = pred.get("odds_version", odds_version)
+    if used != odds_version:
+        await _ANALYZE_CACHE.aset(f"{race_id}:{model_path.name}:{used}", pred)
+    if await _PRECOMPUTED.acontains(race_id, model_path.name):
+        await _PRECOMPUTED.aput(race_id, model_path.name, pred)   # 以降のリクエストは新しいオッズ版でヒット
+    return pred
+
+
+async def _analyze_race_impl(request: AnalyzeRaceRequest):
+    """レース分析と購入推奨エンドポイント
+
+    予測はレース単位で共有し（_race_prediction）、bankroll / risk_mode に依存する
+    買い目推奨だけをリクエストごとに計算する。
+    """
+    try:
+        from betting.strategy import BettingRecommender  # type: ignore
+
+        pred = await _race_prediction(request.race_id, request.model_id)
+        # 共有している予測を推奨ロジックが書き換えないようコピーして渡す
+        race_info = copy.deepcopy(pred["race_info"])
+        predictions = copy.deepcopy(pred["predictions"])
 
         recommender = BettingRecommender(
             bankroll=request.bankroll, risk_mode=request.risk_mode,
             use_kelly=request.use_kelly, dynamic_unit=request.dynamic_unit, min_ev=request.min_ev,
         )
-        result = recommender.analyze_and_recommend(predictions, race_info)
+        # オッズストアに組み合わせオッズがあれば推定オッズより優先して使う
+        try:
+            from routers.realtime_odds import ODDS_STORE  # type: ignore
+            _combo_odds = await run_blocking(ODDS_STORE.combination_odds, request.race_id, kinds=(
+                "umaren", "wide", "umatan", "sanrenpuku", "sanrentan",
+            ))
+        except Exception as _oe:
+            logger.warning(f"[analyze] {request.race_id}: オッズストア参照失敗: {_oe}")
+            _combo_odds = {}
+        result = recommender.analyze_and_recommend(predictions, race_info, combination_odds=_combo_odds)
 
         _resp_data = dict(
             success=True,
@@ -911,23 +1169,6 @@ async def _analyze_race_impl(request: AnalyzeRaceRequest):
             race_level=result["race_level"],
             recommendation=result["recommendation"],
         )
-        # 予測ログをDBに非同期保存（レスポンスをブロックしない）
-        try:
-            _model_id_log = bundle.get("model_id", bundle.get("created_at", "unknown"))
-            asyncio.create_task(asyncio.to_thread(
-                _save_prediction_log,
-                request.race_id, result["race_info"], result["predictions"],
-                _model_id_log, str(ULTIMATE_DB)
-            ))
-        except Exception as _log_err:
-            logger.warning(f"[prediction_log] save failed: {_log_err}")
-        # キャッシュに保存（上限超過時は最古エントリを削除）
-        if len(_ANALYZE_CACHE) >= _ANALYZE_CACHE_MAX:
-            _oldest_keys = sorted(_ANALYZE_CACHE.keys(), key=lambda k: _ANALYZE_CACHE[k][0])
-            for _ek in _oldest_keys[:len(_ANALYZE_CACHE) - _ANALYZE_CACHE_MAX + 1]:
-                del _ANALYZE_CACHE[_ek]
-        _ANALYZE_CACHE[_cache_key] = (_time.time(), _resp_data)
-        logger.info(f"[cache store] analyze_race {request.race_id}")
         return AnalyzeRaceResponse(**_resp_data)
 
     except HTTPException:
@@ -937,11 +1178,104 @@ async def _analyze_race_impl(request: AnalyzeRaceRequest):
         raise HTTPException(status_code=500, detail=f"レース分析に失敗: {str(e)}")
 
 
+async def precompute_race_card(
+    race_ids: "list[str]", model_id: "str | None" = None, run: "PrecomputeRun | None" = None,
+) -> PrecomputeRun:
+    """出馬表の全レースを発走前に予測して _PRECOMPUTED に保存する（既に保存済みのレースは飛ばす）"""
+    global _PRECOMPUTE_RUN
+    model_path = _resolve_model_path(model_id)
+    run = run or PrecomputeRun(race_ids=list(race_ids))
+    _PRECOMPUTE_RUN = run
+
+    async def _predict(race_id: str) -> None:
+        odds_version, _ = await run_blocking(_live_tansho, race_id)
+        # ライブ経路と同じキーで計算するので、同時に来たユーザーリクエストとも合流する
+        pred = await _ANALYZE_CACHE.get_or_compute(
+            f"{race_id}:{model_path.name}:{odds_version}",
+            lambda: _compute_race_prediction(race_id, model_path),
+        )
+        await _PRECOMPUTED.aput(race_id, model_path.name, pred)
+
+    return await precompute_races(
+        race_ids, _predict, is_cached=lambda rid: _PRECOMPUTED.acontains(rid, model_path.name),
+        request_interval_sec=_PRECOMPUTE_INTERVAL_SEC, run=run,
+    )
+
+
+async def _card_race_ids(date: str) -> "list[str]":
+    """DB 取得済みの指定日（YYYYMMDD）の出馬表レース ID"""
+    from routers.races import get_races_by_date  # type: ignore
+    card = await get_races_by_date(date=date)
+    return [r["race_id"] for r in card.get("races", [])]
+
+
+@router.post("/api/analyze_race/precompute")
+async def start_precompute(body: dict, _: dict = Depends(require_admin)):
+    """
+    出馬表の一括予測をバックグラウンドで開始する。
+    body: { "date": "20260516" } または { "race_ids": ["202605050811", ...] }, 任意で "model_id"
+    """
+    global _PRECOMPUTE_RUN, _PRECOMPUTE_TASK
+    if _PRECOMPUTE_RUN is not None and _PRECOMPUTE_RUN.finished_at is None:
+        raise HTTPException(status_code=409, detail="プリコンピュートは実行中です")
+    race_ids = [str(r) for r in body.get("race_ids") or []]
+    if not race_ids and body.get("date"):
+        race_ids = await _card_race_ids(str(body["date"]))
+    if not race_ids:
+        raise HTTPException(status_code=400, detail="date または race_ids を指定してください")
+    _resolve_model_path(body.get("model_id"))   # モデル未配置ならここで 404
+    _PRECOMPUTE_RUN = PrecomputeRun(race_ids=race_ids)
+    _PRECOMPUTE_TASK = asyncio.create_task(precompute_race_card(race_ids, body.get("model_id"), _PRECOMPUTE_RUN))
+    return {"started": True, "races": len(race_ids)}
+
+
+@router.get("/api/analyze_race/precompute/status")
+async def get_precompute_status(_: dict = Depends(require_admin)):
+    """直近のプリコンピュート実行の進捗と、保存済み予測のヒット率・再スコア回数"""
+    return {
+        "run": _PRECOMPUTE_RUN.to_dict() if _PRECOMPUTE_RUN is not None else None,
+        "store": _PRECOMPUTED.stats(),
+    }
+
+
+async def _stage_trace_allowed(http_req: Request) -> bool:
+    """X-Debug-Stage-Trace を受け付けるか（管理者のみ）
+
+    memory=True のトレースは tracemalloc をプロセス全体で有効にし、同時に処理中の
+    全リクエストを遅くする・重なったトレース同士のピーク値を壊すため、一般ユーザーには開放しない。
+    """
+    try:
+        await require_admin(await get_current_user(http_req))
+    except HTTPException:
+        logger.info("[stage_trace] 管理者以外の X-Debug-Stage-Trace を無視")
+        return False
+    return True
+
+
 @router.post("/api/analyze_race", response_model=AnalyzeRaceResponse)
-async def analyze_race(request: AnalyzeRaceRequest, http_req: Request):
-    """単一レース分析（1リクエスト = 1 quota unit）。"""
+async def analyze_race(
+    request: AnalyzeRaceRequest,
+    http_req: Request,
+    response: Response = None,
+    x_debug_stage_trace: str | None = Header(None, alias=_STAGE_TRACE_HEADER),
+):
+    """単一レース分析（1リクエスト = 1 quota unit）。
+
+    X-Debug-Stage-Trace: 1 を付けると、特徴量生成・optimizer・model.predict のステージ別
+    処理時間を X-Stage-Trace ヘッダ（JSON: [[name, ms, rows_out, cols_added, mem_mb], ...]）で返す。
+    管理者のみ有効（一般ユーザーのヘッダは無視する）。キャッシュ・プリコンピュートにヒットした
+    場合はステージが記録されない。
+    """
     await check_and_consume_pred_count(http_req, units=1)
-    return await _analyze_race_impl(request)
+    debug_trace = x_debug_stage_trace in ("1", "true") and await _stage_trace_allowed(http_req)
+    if not (debug_trace or _STAGE_PROFILING):
+        return await _analyze_race_impl(request)
+    with trace_stages(memory=debug_trace) as trace:
+        result = await _analyze_race_impl(request)
+    STAGE_HISTOGRAMS.observe("analyze", trace)
+    if debug_trace and response is not None:
+        response.headers["X-Stage-Trace"] = json.dumps(trace.compact(), separators=(",", ":"))
+    return result
 
 
 @router.post("/api/analyze_races_batch")
@@ -12,6 +12,7 @@ from fastapi import APIRouter, Depends, Query
 
 from app_config import ULTIMATE_DB  # type: ignore
 from deps.auth import require_premium  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
 
 router = APIRouter()
 
@@ -51,16 +52,13 @@ def _query_history(db_path: str, limit: int, race_date: Optional[str] = None) ->
                 pl.popularity,
                 pl.model_id,
                 pl.predicted_at,
-                CAST(json_extract(rr.value, '$.finish_position') AS INTEGER) AS actual_finish,
-                json_extract(rr.value, '$.finish_time')               AS finish_time,
-                CAST(json_extract(rr.value, '$.odds') AS REAL)         AS actual_odds
+                CAST(json_extract(rr.data, '$.finish_position') AS INTEGER) AS actual_finish,
+                json_extract(rr.data, '$.finish_time')               AS finish_time,
+                CAST(json_extract(rr.data, '$.odds') AS REAL)         AS actual_odds
             FROM prediction_log pl
-            LEFT JOIN (
-                SELECT rru.race_id, jj.value
-                FROM   race_results_ultimate rru, json_each(rru.data) jj
-            ) rr
+            LEFT JOIN race_results_ultimate rr
                 ON  rr.race_id = pl.race_id
-                AND json_extract(rr.value, '$.horse_id') = pl.horse_id
+                AND json_extract(rr.data, '$.horse_id') = pl.horse_id
             WHERE 1=1 {date_filter}
             ORDER BY pl.race_date DESC, pl.race_id DESC, pl.predicted_rank ASC
             LIMIT ?
@@ -175,8 +173,7 @@ async def prediction_history(
     current_user: dict = Depends(require_premium),
 ):
     """過去の予測と実際の着順をレース単位で返す"""
-    import asyncio
-    rows = await asyncio.to_thread(_query_history, str(ULTIMATE_DB), limit, race_date)
+    rows = await run_blocking(_query_history, str(ULTIMATE_DB), limit, race_date)
     races = _group_by_race(rows)
     stats = _calc_stats(races)
     return {"races": races, "stats": stats}
@@ -188,7 +185,6 @@ async def prediction_history_by_race(
     current_user: dict = Depends(require_premium),
 ):
     """特定レースの予測 vs 実際の着順を返す"""
-    import asyncio
 
     def _query_one(db_path: str, rid: str) -> list[dict]:
         conn = sqlite3.connect(db_path)
@@ -213,10 +209,10 @@ async def prediction_history_by_race(
                     pl.popularity,
                     pl.model_id,
                     pl.predicted_at,
-                    CAST(json_extract(rr.value, '$.finish_position') AS INTEGER) AS actual_finish,
-                    json_extract(rr.value, '$.finish_time')               AS finish_time,
-                    CAST(json_extract(rr.value, '$.last3f') AS REAL)       AS actual_last3f,
-                    CAST(json_extract(rr.value, '$.odds') AS REAL)         AS actual_odds
+                    CAST(json_extract(rr.data, '$.finish_position') AS INTEGER) AS actual_finish,
+                    json_extract(rr.data, '$.finish_time')               AS finish_time,
+                    CAST(json_extract(rr.data, '$.last_3f') AS REAL)       AS actual_last3f,
+                    CAST(json_extract(rr.data, '$.odds') AS REAL)         AS actual_odds
                 FROM prediction_log pl
                 INNER JOIN (
                     SELECT horse_id, MAX(predicted_at) AS latest_at
@@ -225,12 +221,9 @@ async def prediction_history_by_race(
                     GROUP BY horse_id
                 ) latest ON pl.horse_id = latest.horse_id
                          AND pl.predicted_at = latest.latest_at
-                LEFT JOIN (
-                    SELECT rru.race_id, jj.value
-                    FROM   race_results_ultimate rru, json_each(rru.data) jj
-                ) rr
+                LEFT JOIN race_results_ultimate rr
                     ON  rr.race_id = pl.race_id
-                    AND json_extract(rr.value, '$.horse_id') = pl.horse_id
+                    AND json_extract(rr.data, '$.horse_id') = pl.horse_id
                 WHERE pl.race_id = ?
                 ORDER BY pl.predicted_rank ASC
                 """,
@@ -240,7 +233,7 @@ async def prediction_history_by_race(
         finally:
             conn.close()
 
-    rows = await asyncio.to_thread(_query_one, str(ULTIMATE_DB), race_id)
+    rows = await run_blocking(_query_one, str(ULTIMATE_DB), race_id)
 
     # 結果が確定しているかどうか
     has_result = any(r["actual_finish"] is not None for r in rows)
@@ -3,10 +3,13 @@
 POST /api/profiling/start
 GET  /api/profiling/status/{job_id}
 GET  /api/profiling/html/{job_id}
+GET  /api/profiling/stages          - ステージ別処理時間ヒストグラム（analyze / train）
+GET  /api/profiling/loop            - イベントループ遅延のパーセンタイル・ブロッキング検出・スレッドプール
 """
 from __future__ import annotations
 
 import threading
+import time
 import uuid
 from pathlib import Path
 
@@ -15,6 +18,9 @@ from fastapi.responses import HTMLResponse
 
 from app_config import SUPABASE_ENABLED, ULTIMATE_DB, get_supabase_client, logger  # type: ignore
 from deps.auth import require_admin  # type: ignore
+from services.loop_monitor import LOOP_MONITOR  # type: ignore
+from services.metrics import JOB_DURATION  # type: ignore
+from services.stage_metrics import STAGE_HISTOGRAMS  # type: ignore
 
 router = APIRouter()
 
@@ -23,6 +29,7 @@ _profiling_jobs: dict = {}  # job_id → {status, message, html}
 
 def _run_profiling_sync(job_id: str, use_optimized: bool) -> None:
     """バックグラウンドスレッドで ydata-profiling レポートを生成"""
+    started = time.monotonic()
     try:
         def _update(msg: str):
             _profiling_jobs[job_id]["message"] = msg
@@ -95,6 +102,9 @@ def _run_profiling_sync(job_id: str, use_optimized: bool) -> None:
     except Exception as e:
         logger.error(f"[profiling:{job_id}] エラー: {e}", exc_info=True)
         _profiling_jobs[job_id] = {"status": "error", "message": str(e), "html": None}
+    finally:
+        JOB_DURATION.observe(time.monotonic() - started, kind="profiling",
+                             status=_profiling_jobs.get(job_id, {}).get("status", "unknown"))
 
 
 @router.post("/api/profiling/start")
@@ -125,3 +135,15 @@ async def get_profiling_html(job_id: str, _: dict = Depends(require_admin)):
     if job["status"] != "completed" or not job["html"]:
         raise HTTPException(status_code=202, detail=f"レポート未完成: {job['status']}")
     return HTMLResponse(content=job["html"], media_type="text/html")
+
+
+@router.get("/api/profiling/stages")
+async def get_stage_histograms(kind: str | None = None, _: dict = Depends(require_admin)):
+    """analyze_race / 学習ジョブで計測したステージ別処理時間のヒストグラム（kind="analyze" / "train" で絞り込み）"""
+    return STAGE_HISTOGRAMS.snapshot(kind)
+
+
+@router.get("/api/profiling/loop")
+async def get_loop_status(_: dict = Depends(require_admin)):
+    """イベントループ遅延（直近サンプルの p50 / p90 / p99）・ブロッキング検出結果・スレッドプールの状態"""
+    return LOOP_MONITOR.status()
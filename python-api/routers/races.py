@@ -3,6 +3,9 @@
 GET /api/races/by_date           - 指定日のDB取得済みレース一覧
 GET /api/races/recent            - 最近取得したレース一覧（直近N件）
 GET /api/races/{race_id}/horses  - 特定レースの出走馬一覧（ML推論なし）
+
+SQLite の読み出しと JSON 解析は同期関数にまとめ、run_blocking（ブロッキング I/O 用
+スレッドプール）で実行してイベントループを止めない。
 """
 from __future__ import annotations
 
@@ -12,6 +15,7 @@ import sqlite3
 from fastapi import APIRouter, Query
 
 from app_config import ULTIMATE_DB, logger  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
 
 router = APIRouter()
 
@@ -45,9 +49,7 @@ def _parse_race_row(race_id: str, data_str: str) -> dict:
     }
 
 
-@router.get("/api/races/recent")
-async def get_races_recent(limit: int = Query(50, ge=1, le=500)):
-    """最近取得したレース一覧を返す（limit件、race_id降順）"""
+def _races_recent(limit: int) -> dict:
     try:
         conn = sqlite3.connect(str(ULTIMATE_DB))
         cur = conn.cursor()
@@ -71,9 +73,13 @@ async def get_races_recent(limit: int = Query(50, ge=1, le=500)):
     return {"races": result, "count": len(result)}
 
 
-@router.get("/api/races/{race_id}/horses")
-async def get_race_horses(race_id: str):
-    """指定レースの出走馬一覧を返す（ML推論なし・軽量）"""
+@router.get("/api/races/recent")
+async def get_races_recent(limit: int = Query(50, ge=1, le=500)):
+    """最近取得したレース一覧を返す（limit件、race_id降順）"""
+    return await run_blocking(_races_recent, limit)
+
+
+def _race_horses(race_id: str) -> dict:
     try:
         conn = sqlite3.connect(str(ULTIMATE_DB))
         cur = conn.cursor()
@@ -131,11 +137,13 @@ async def get_race_horses(race_id: str):
     }
 
 
-@router.get("/api/races/by_date")
-async def get_races_by_date(
-    date: str = Query(..., description="日付 YYYYMMDD形式 (例: 20260316)"),
-):
-    """指定日のDB取得済みレース一覧を返す（馬データが存在するレースのみ）"""
+@router.get("/api/races/{race_id}/horses")
+async def get_race_horses(race_id: str):
+    """指定レースの出走馬一覧を返す（ML推論なし・軽量）"""
+    return await run_blocking(_race_horses, race_id)
+
+
+def _races_by_date(date: str) -> dict:
     try:
         conn = sqlite3.connect(str(ULTIMATE_DB))
         cur = conn.cursor()
@@ -169,3 +177,11 @@ async def get_races_by_date(
 
     result.sort(key=lambda x: x["race_id"])
     return {"races": result, "count": len(result), "date": date}
+
+
+@router.get("/api/races/by_date")
+async def get_races_by_date(
+    date: str = Query(..., description="日付 YYYYMMDD形式 (例: 20260316)"),
+):
+    """指定日のDB取得済みレース一覧を返す（馬データが存在するレースのみ）"""
+    return await run_blocking(_races_by_date, date)
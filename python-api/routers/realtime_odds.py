@@ -2,6 +2,9 @@
 リアルタイムオッズ取得エンドポイント
 GET  /api/realtime-odds/{race_id}   - 単レース最新オッズ（単勝・馬連・三連複）
 POST /api/realtime-odds/refresh     - 複数レース一括更新（最大10レース）
+POST /api/realtime-odds/recorder/start - 発走までのオッズ時系列の記録を開始
+GET  /api/realtime-odds/browser-pool/stats - Playwright 常駐ブラウザプールの状態
+GET  /api/realtime-odds/{race_id}/drift - 記録済み時系列からのドリフト特徴量
 
 出典: race.netkeiba.com/odds/index.html?race_id=...
 レース締切前のみ有効（締切済みは netkeiba が 302 → 結果ページへリダイレクト）
@@ -9,39 +12,59 @@ POST /api/realtime-odds/refresh     - 複数レース一括更新（最大10レ
 from __future__ import annotations
 
 import asyncio
+import os
 import re
 import time
+from pathlib import Path
 from typing import Any
 
 import aiohttp
 from fastapi import APIRouter, Depends
 
-from app_config import logger  # type: ignore
+from app_config import ULTIMATE_DB, logger  # type: ignore
 from deps.auth import require_admin  # type: ignore
 from scraping.constants import SCRAPE_HEADERS  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
+from services.browser_pool import BrowserPool  # type: ignore
+from services.odds_store import OddsStore  # type: ignore
+from services.odds_timeseries import OddsRecorder  # type: ignore
+from services.ttl_cache import TTLCache  # type: ignore
 
 router = APIRouter()
 
-# ── インメモリキャッシュ（当日レースは 5 分 TTL / 旧レースは 60 秒 TTL）
-_ODDS_CACHE: dict[str, tuple[float, dict]] = {}
+# ── インメモリキャッシュ（LRU + TTL・最大 200 レース）
 _CACHE_TTL = 300.0  # 秒（analyze_race → キャッシュ → オッズ更新ボタン GET の間が最大 5 分以内であれば再取得不要）
+_ODDS_CACHE = TTLCache("realtime_odds", max_entries=200, ttl_sec=_CACHE_TTL)
+
+
+# ── コンパクトなオッズ行列ストア（券種別 float32 パック配列・スナップショットは SQLite に蓄積）
+_ODDS_STORE_DB = Path(os.environ.get("KEIBA_ODDS_STORE_DB") or ULTIMATE_DB.parent / "odds_store.db")
+ODDS_STORE = OddsStore(_ODDS_STORE_DB)
+
+
+# ── Playwright フォールバック用の常駐ブラウザ（初回使用時に起動・lifespan 終了時に close）
+_PW_ODDS_SEMAPHORE_LIMIT = 3  # 同時 Playwright ページ数の上限
+BROWSER_POOL = BrowserPool(
+    max_pages=_PW_ODDS_SEMAPHORE_LIMIT,
+    max_uses=int(os.environ.get("KEIBA_BROWSER_CONTEXT_MAX_USES") or 50),
+)
 
 
 def _cached(race_id: str) -> dict | None:
-    if race_id in _ODDS_CACHE:
-        ts, data = _ODDS_CACHE[race_id]
-        if time.time() - ts < _CACHE_TTL:
-            return data
-    return None
+    return _ODDS_CACHE.get(race_id)
 
 
-def _store(race_id: str, data: dict) -> None:
-    _ODDS_CACHE[race_id] = (time.time(), data)
-    # 古いエントリを掃除（最大200件）
-    if len(_ODDS_CACHE) > 200:
-        oldest = sorted(_ODDS_CACHE.items(), key=lambda x: x[1][0])[:50]
-        for k, _ in oldest:
-            del _ODDS_CACHE[k]
+def _store_sync(race_id: str, data: dict) -> None:
+    _ODDS_CACHE.set(race_id, data)
+    try:
+        ODDS_STORE.ingest(race_id, data.get("odds") or {}, captured_at=data.get("fetched_at"))
+    except Exception as e:
+        logger.warning(f"[odds] オッズストア保存失敗 {race_id}: {e}")
+
+
+async def _store(race_id: str, data: dict) -> None:
+    # オッズストアの SQLite 書き込みはイベントループの外で行う
+    await run_blocking(_store_sync, race_id, data)
 
 
 async def _fetch_tansho_odds(session: aiohttp.ClientSession, race_id: str) -> dict[str, float]:
@@ -56,46 +79,82 @@ async def _fetch_tansho_odds(session: aiohttp.ClientSession, race_id: str) -> di
                 logger.warning(f"[odds] 単勝 HTTP {resp.status}: {race_id}")
                 return {}
             html = (await resp.read()).decode("euc-jp", errors="replace")
-        # 新フォーマット: <span id="odds-1_01">3.5</span>（2024年以降の netkeiba）
-        pattern = re.compile(r'id="odds-1_(\d+)"[^>]*>([0-9.]+)<', re.IGNORECASE)
-        result = {str(int(m.group(1))): float(m.group(2)) for m in pattern.finditer(html)}
-        if result:
-            return result
-        # 旧フォーマット: <td id="odds_dl_b1_1">3.5</td>（フォールバック）
-        pattern_old = re.compile(r'id="odds_dl_b1_(\d+)"[^>]*>([0-9.]+)<', re.IGNORECASE)
-        return {m.group(1): float(m.group(2)) for m in pattern_old.finditer(html)}
+        return _parse_tansho_html(html)
     except Exception as e:
         logger.warning(f"[odds] 単勝取得失敗 {race_id}: {e}")
         return {}
 
 
+def _parse_tansho_html(html: str) -> dict[str, float]:
+    # 新フォーマット: <span id="odds-1_01">3.5</span>（2024年以降の netkeiba）
+    pattern = re.compile(r'id="odds-1_(\d+)"[^>]*>([0-9.]+)<', re.IGNORECASE)
+    result = {str(int(m.group(1))): float(m.group(2)) for m in pattern.finditer(html)}
+    if result:
+        return result
+    # 旧フォーマット: <td id="odds_dl_b1_1">3.5</td>（フォールバック）
+    pattern_old = re.compile(r'id="odds_dl_b1_(\d+)"[^>]*>([0-9.]+)<', re.IGNORECASE)
+    return {m.group(1): float(m.group(2)) for m in pattern_old.finditer(html)}
+
+
+def _parse_fukusho_html(html: str) -> dict[str, float]:
+    """複勝オッズ（下限値）: 単勝と同じページの <span id="odds-2_01">1.2 - 1.6</span>"""
+    pattern = re.compile(r'id="odds-2_(\d+)"[^>]*>\s*([0-9.]+)', re.IGNORECASE)
+    return {str(int(m.group(1))): float(m.group(2)) for m in pattern.finditer(html)}
+
+
+async def _fetch_win_place_odds(session: aiohttp.ClientSession, race_id: str) -> dict[str, dict[str, float]]:
+    """単勝・複勝オッズを 1 リクエストで取得する（オッズ時系列レコーダー用）"""
+    url = f"https://race.netkeiba.com/odds/index.html?type=b1&race_id={race_id}"
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                logger.warning(f"[odds] 単複 HTTP {resp.status}: {race_id}")
+                return {}
+            html = (await resp.read()).decode("euc-jp", errors="replace")
+        return {"tansho": _parse_tansho_html(html), "fukusho": _parse_fukusho_html(html)}
+    except Exception as e:
+        logger.warning(f"[odds] 単複取得失敗 {race_id}: {e}")
+        return {}
+
+
+_PW_WAIT_ODDS_JS = (
+    "() => { const s=document.querySelectorAll('span.Odds'); "
+    "return s.length > 0 && !Array.from(s).every(x => x.textContent.includes('---')); }"
+)
+
+
+_PW_INTERVAL_SEC = 1.0  # INV-07 スクレイピングインターバル（バッチ取得時）
+
+
+async def _playwright_tansho(race_id: str, interval_sec: float = 0.0) -> dict[str, float]:
+    """共有ブラウザプールから Page を借りて JavaScript 実行後の単勝オッズを読む（例外は呼び出し側へ）
+    interval_sec > 0 なら Page を借りたまま待ってから返却する（同じ枠の次のアクセスとの間隔を保証）。
+    """
+    url = f"https://race.netkeiba.com/odds/index.html?type=b1&race_id={race_id}"
+    async with BROWSER_POOL.page() as page:
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=20_000)
+            # JavaScript がオッズを ---.- から実値に置換するまで最大 8 秒待機
+            try:
+                await page.wait_for_function(_PW_WAIT_ODDS_JS, timeout=8_000)
+            except Exception:
+                pass  # タイムアウト時はそのまま進む（---.- のまま → 空 dict 返却）
+            html = await page.content()
+        finally:
+            if interval_sec > 0:
+                await asyncio.sleep(interval_sec)
+    pattern = re.compile(r'id="odds-1_(\d+)"[^>]*>([0-9.]+)<')
+    return {str(int(m.group(1))): float(m.group(2)) for m in pattern.finditer(html)}
+
+
 async def _fetch_tansho_odds_playwright(race_id: str) -> dict[str, float]:
     """Playwright（ヘッドレスブラウザ）で JavaScript 実行後の単勝オッズを取得する。
     netkeiba のオッズは JavaScript AJAX でロードされるため、静的 HTML では ---.- のまま。
     静的 HTML 取得が失敗したレースの当日オッズ補完に使用すること。
+    ブラウザは BROWSER_POOL で常駐させるため、呼び出しごとの起動コストはかからない。
     """
     try:
-        from playwright.async_api import async_playwright  # type: ignore
-        url = f"https://race.netkeiba.com/odds/index.html?type=b1&race_id={race_id}"
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            try:
-                page = await browser.new_page()
-                await page.goto(url, wait_until="domcontentloaded", timeout=20_000)
-                # JavaScript がオッズを ---.- から実値に置換するまで最大 8 秒待機
-                try:
-                    await page.wait_for_function(
-                        "() => { const s=document.querySelectorAll('span.Odds'); "
-                        "return s.length > 0 && !Array.from(s).every(x => x.textContent.includes('---')); }",
-                        timeout=8_000,
-                    )
-                except Exception:
-                    pass  # タイムアウト時はそのまま進む（---.- のまま → 空 dict 返却）
-                html = await page.content()
-            finally:
-                await browser.close()
-        pattern = re.compile(r'id="odds-1_(\d+)"[^>]*>([0-9.]+)<')
-        result = {str(int(m.group(1))): float(m.group(2)) for m in pattern.finditer(html)}
+        result = await _playwright_tansho(race_id)
         if result:
             logger.info(f"[odds_playwright] {race_id}: {len(result)} 頭のオッズ取得成功")
         else:
@@ -106,69 +165,31 @@ async def _fetch_tansho_odds_playwright(race_id: str) -> dict[str, float]:
         return {}
 
 
-_PW_ODDS_SEMAPHORE: asyncio.Semaphore | None = None
-_PW_ODDS_SEMAPHORE_LIMIT = 3  # 同時 Playwright ページ数の上限
-
-
-def _get_pw_semaphore() -> asyncio.Semaphore:
-    global _PW_ODDS_SEMAPHORE
-    if _PW_ODDS_SEMAPHORE is None:
-        _PW_ODDS_SEMAPHORE = asyncio.Semaphore(_PW_ODDS_SEMAPHORE_LIMIT)
-    return _PW_ODDS_SEMAPHORE
-
-
 async def _fetch_tansho_odds_playwright_batch(
     race_ids: list[str],
 ) -> dict[str, dict[str, float]]:
-    """複数レースの単勝オッズを Playwright で一括取得（ブラウザ 1 インスタンス・最大 3 並列ページ）。
-    ブラウザの起動/終了コストを 1 回にまとめることで、36 レースを ~60 秒以内で処理できる。
-    INV-07 に準拠: ページ間に 1.0 秒スリープを挟む。
+    """複数レースの単勝オッズを Playwright で一括取得（共有ブラウザプール・最大 3 並列ページ）。
+    同時ページ数は BROWSER_POOL の max_pages で制限される。
+    INV-07 に準拠: Page を保持したまま 1.0 秒スリープしてから返却する（失敗時も同じ）。
     """
     if not race_ids:
         return {}
-    try:
-        from playwright.async_api import async_playwright  # type: ignore
-        pattern = re.compile(r'id="odds-1_(\d+)"[^>]*>([0-9.]+)<')
-        sem = _get_pw_semaphore()
-        results: dict[str, dict[str, float]] = {}
-
-        async def _fetch_one(browser: Any, race_id: str) -> None:
-            async with sem:
-                try:
-                    page = await browser.new_page()
-                    url = f"https://race.netkeiba.com/odds/index.html?type=b1&race_id={race_id}"
-                    await page.goto(url, wait_until="domcontentloaded", timeout=20_000)
-                    try:
-                        await page.wait_for_function(
-                            "() => { const s=document.querySelectorAll('span.Odds'); "
-                            "return s.length > 0 && !Array.from(s).every(x => x.textContent.includes('---')); }",
-                            timeout=8_000,
-                        )
-                    except Exception:
-                        pass
-                    html = await page.content()
-                    await page.close()
-                    r = {str(int(m.group(1))): float(m.group(2)) for m in pattern.finditer(html)}
-                    results[race_id] = r
-                    if r:
-                        logger.info(f"[odds_pw_batch] {race_id}: {len(r)} 頭")
-                    else:
-                        logger.info(f"[odds_pw_batch] {race_id}: ---.-（未公開）")
-                except Exception as e:
-                    logger.warning(f"[odds_pw_batch] {race_id}: {e}")
-                    results[race_id] = {}
-                await asyncio.sleep(1.0)  # INV-07 スクレイピングインターバル
-
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            try:
-                await asyncio.gather(*[_fetch_one(browser, rid) for rid in race_ids])
-            finally:
-                await browser.close()
-        return results
-    except Exception as e:
-        logger.warning(f"[odds_pw_batch] 一括取得失敗: {e}")
-        return {}
+    results: dict[str, dict[str, float]] = {}
+
+    async def _fetch_one(race_id: str) -> None:
+        try:
+            r = await _playwright_tansho(race_id, interval_sec=_PW_INTERVAL_SEC)
+            results[race_id] = r
+            if r:
+                logger.info(f"[odds_pw_batch] {race_id}: {len(r)} 頭")
+            else:
+                logger.info(f"[odds_pw_batch] {race_id}: ---.-（未公開）")
+        except Exception as e:
+            logger.warning(f"[odds_pw_batch] {race_id}: {e}")
+            results[race_id] = {}
+
+    await asyncio.gather(*[_fetch_one(rid) for rid in race_ids])
+    return results
 
 
 async def _fetch_umaren_odds(session: aiohttp.ClientSession, race_id: str) -> dict[str, float]:
@@ -210,8 +231,11 @@ async def _fetch_sanrenpuku_odds(session: aiohttp.ClientSession, race_id: str) -
         return {}
 
 
-async def _scrape_odds(race_id: str, bet_types: list[str]) -> dict[str, Any]:
-    """指定馬券種のオッズを並列取得して返す"""
+async def _scrape_odds(race_id: str, bet_types: list[str], playwright_fallback: bool = True) -> dict[str, Any]:
+    """指定馬券種のオッズを並列取得して返す
+    playwright_fallback=False の場合、単勝が取れなくても Playwright 補完は行わない
+    （refresh_realtime_odds のように後段でまとめて補完する呼び出し元向け）。
+    """
     timeout = aiohttp.ClientTimeout(total=8, connect=4)
     headers = {**SCRAPE_HEADERS, "Referer": f"https://race.netkeiba.com/race/shutuba.html?race_id={race_id}"}
     async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
@@ -234,7 +258,7 @@ async def _scrape_odds(race_id: str, bet_types: list[str]) -> dict[str, Any]:
 
         # 静的 HTML でオッズが取れなかった場合（netkeiba は JS AJAX で動的ロード）
         # Playwright（ヘッドレスブラウザ）でフォールバック取得
-        if "tansho" in bet_types and not data["odds"].get("tansho"):
+        if playwright_fallback and "tansho" in bet_types and not data["odds"].get("tansho"):
             pw_odds = await _fetch_tansho_odds_playwright(race_id)
             if pw_odds:
                 data["odds"]["tansho"] = pw_odds
@@ -243,6 +267,111 @@ async def _scrape_odds(race_id: str, bet_types: list[str]) -> dict[str, Any]:
         return data
 
 
+async def _fetch_series_odds(race_id: str) -> dict[str, dict[str, float]]:
+    """オッズ時系列用: 単勝・複勝・馬連を取得する（Playwright フォールバックは使わない）"""
+    timeout = aiohttp.ClientTimeout(total=8, connect=4)
+    headers = {**SCRAPE_HEADERS, "Referer": f"https://race.netkeiba.com/race/shutuba.html?race_id={race_id}"}
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+        win_place, umaren = await asyncio.gather(
+            _fetch_win_place_odds(session, race_id), _fetch_umaren_odds(session, race_id),
+        )
+    return {**win_place, "umaren": umaren}
+
+
+def _on_series_snapshot(race_id: str, odds: dict, captured_at: float) -> None:
+    # 最新値は通常のキャッシュ / オッズストアにも反映する（オッズ更新ボタン・analyze_race 用）
+    _store_sync(race_id, {"race_id": race_id, "fetched_at": captured_at, "odds": dict(odds),
+                     "horse_count": len(odds.get("tansho") or {})})
+
+
+# ── オッズ時系列レコーダー（発走までのオッズ推移を差分圧縮して odds_series に蓄積）
+ODDS_RECORDER = OddsRecorder(
+    _fetch_series_odds,
+    db_path=_ODDS_STORE_DB,
+    interval_sec=float(os.environ.get("KEIBA_ODDS_RECORD_INTERVAL_SEC") or 300),
+    final_interval_sec=float(os.environ.get("KEIBA_ODDS_RECORD_FINAL_INTERVAL_SEC") or 60),
+    on_snapshot=_on_series_snapshot,
+)
+
+
+def _parse_post_time(value: Any, race_date: str | None = None) -> float | None:
+    """発走時刻（epoch 秒 / ISO 文字列 / "HH:MM"）を epoch 秒に変換する"""
+    from datetime import datetime as _dt
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        if re.fullmatch(r"\d{1,2}:\d{2}", text):
+            day = race_date or _dt.now().strftime("%Y-%m-%d")
+            return _dt.strptime(f"{day} {text}", "%Y-%m-%d %H:%M").timestamp()
+        return _dt.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+@router.post("/api/realtime-odds/recorder/start")
+async def start_odds_recorder(body: dict, _: dict = Depends(require_admin)):
+    """
+    オッズ時系列の記録を開始する。
+    body: {
+      "races": [{"race_id": "202605051211", "post_time": "15:40"}, ...],
+      "race_date": "2026-05-05",       # post_time が "HH:MM" の場合の日付（省略時は当日）
+      "interval_sec": 300,             # 任意: 通常の取得間隔
+      "final_interval_sec": 60         # 任意: 締切 15 分前からの取得間隔
+    }
+    """
+    if body.get("interval_sec"):
+        ODDS_RECORDER.interval_sec = max(60.0, float(body["interval_sec"]))
+    if body.get("final_interval_sec"):
+        ODDS_RECORDER.final_interval_sec = max(30.0, float(body["final_interval_sec"]))
+    post_times: dict[str, float] = {}
+    for race in body.get("races", [])[:36]:
+        ts = _parse_post_time(race.get("post_time"), body.get("race_date"))
+        if race.get("race_id") and ts is not None:
+            post_times[str(race["race_id"])] = ts
+    ODDS_RECORDER.add_races(post_times)
+    started = ODDS_RECORDER.start()
+    return {"started": started, "running": ODDS_RECORDER.running, "pending": ODDS_RECORDER.pending()}
+
+
+@router.post("/api/realtime-odds/recorder/stop")
+async def stop_odds_recorder(_: dict = Depends(require_admin)):
+    ODDS_RECORDER.stop()
+    return {"running": ODDS_RECORDER.running}
+
+
+@router.get("/api/realtime-odds/recorder/status")
+async def get_odds_recorder_status(race_ids: str = "", _: dict = Depends(require_admin)):
+    """記録中のレースと、odds_series の圧縮後ディスク使用量（race_ids はカンマ区切りで絞り込み）"""
+    ids = [r for r in race_ids.split(",") if r] or None
+    return {
+        "running": ODDS_RECORDER.running,
+        "pending": ODDS_RECORDER.pending(),
+        "disk": await run_blocking(ODDS_RECORDER.disk_usage, ids),
+    }
+
+
+@router.get("/api/realtime-odds/{race_id}/drift")
+async def get_odds_drift(race_id: str):
+    """記録済みオッズ時系列からのドリフト特徴量（馬ごと）"""
+    df = await run_blocking(ODDS_RECORDER.features, [race_id])
+    return {"race_id": race_id, "features": df.astype(object).where(df.notna(), None).to_dict("records")}
+
+
+@router.get("/api/realtime-odds/store/stats")
+async def get_odds_store_stats(_: dict = Depends(require_admin)):
+    """オッズストアのメモリ使用量（レース別バイト数）と最新オッズキャッシュのヒット率"""
+    return {**ODDS_STORE.memory_usage(), "cache": _ODDS_CACHE.stats()}
+
+
+@router.get("/api/realtime-odds/browser-pool/stats")
+async def get_browser_pool_stats(_: dict = Depends(require_admin)):
+    """Playwright 常駐ブラウザプールの状態（起動回数・コンテキスト再生成数・待ち時間）"""
+    return BROWSER_POOL.stats()
+
+
 @router.get("/api/realtime-odds/{race_id}")
 async def get_realtime_odds(race_id: str, types: str = "tansho,umaren"):
     """
@@ -258,7 +387,7 @@ async def get_realtime_odds(race_id: str, types: str = "tansho,umaren"):
         bet_types = ["tansho"]
 
     data = await _scrape_odds(race_id, bet_types)
-    _store(race_id, data)
+    await _store(race_id, data)
     return {**data, "cache_hit": False}
 
 
@@ -271,7 +400,7 @@ async def refresh_realtime_odds(body: dict, _: dict = Depends(require_admin)):
     フロー:
     1. キャッシュヒットしているレースはスキップ
     2. 静的 HTML で取得できたレースはそのままキャッシュ
-    3. 静的 HTML で ---.- だったレースは Playwright バッチ取得（3 並列・ブラウザ共有）
+    3. 静的 HTML で ---.- だったレースは Playwright バッチ取得（3 並列・常駐ブラウザプール）
     """
     from datetime import datetime as _dt
     _today_str = _dt.now().strftime("%Y%m%d")
@@ -294,8 +423,8 @@ async def refresh_realtime_odds(body: dict, _: dict = Depends(require_admin)):
             results[race_id] = {"success": False, "error": "past_race", "skipped": True}
             continue
         try:
-            data = await _scrape_odds(race_id, bet_types)
-            _store(race_id, data)
+            data = await _scrape_odds(race_id, bet_types, playwright_fallback=False)
+            await _store(race_id, data)
             if data["horse_count"] > 0:
                 results[race_id] = {"success": True, "horse_count": data["horse_count"]}
             else:
@@ -317,7 +446,7 @@ async def refresh_realtime_odds(body: dict, _: dict = Depends(require_admin)):
                 "odds": {"tansho": tansho},
                 "horse_count": len(tansho),
             }
-            _store(race_id, data)
+            await _store(race_id, data)
             results[race_id] = {"success": True, "horse_count": len(tansho), "via_playwright": True}
 
     return {"results": results, "refreshed": len(race_ids)}
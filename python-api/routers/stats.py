@@ -27,6 +27,7 @@ from app_config import (  # type: ignore
 from models import TrainRequest  # type: ignore
 from scraping.jobs import _scrape_jobs  # type: ignore
 from scraping.constants import SCRAPE_HEADERS  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
 
 router = APIRouter()
 
@@ -99,6 +100,83 @@ async def test_optuna_request(request: TrainRequest):
     }
 
 
+def _local_data_stats(ultimate: bool) -> Optional[dict]:
+    """ローカル SQLite の統計（DB が無ければ None）。run_blocking から呼ぶ同期処理"""
+    if ultimate:
+        db_path = ULTIMATE_DB
+    else:
+        cfg = load_config(CONFIG_PATH)
+        db_path = cfg.storage.sqlite_path
+        if not db_path.is_absolute():
+            db_path = CONFIG_PATH.parent / db_path
+
+    if not db_path.exists():
+        return None
+
+    con = sqlite3.connect(db_path)
+    cursor = con.cursor()
+
+    if ultimate:
+        try:
+            cursor.execute("SELECT COUNT(DISTINCT race_id) FROM races_ultimate")
+            total_races = cursor.fetchone()[0]
+        except Exception:
+            total_races = 0
+        try:
+            cursor.execute("SELECT COUNT(*) FROM race_results_ultimate")
+            total_horses = cursor.fetchone()[0]
+        except Exception:
+            total_horses = 0
+        try:
+            # race_id は YYYYVVKKNNRR 形式（会場コード込み）のため race_id DESC では
+            # 最新日付が得られない。JSON の date フィールド(YYYYMMDD)で降順ソートする。
+            cursor.execute(
+                "SELECT data FROM races_ultimate"
+                " ORDER BY json_extract(data, '$.date') DESC LIMIT 1"
+            )
+            row = cursor.fetchone()
+            if row:
+                import json as _json
+                d = _json.loads(row[0])
+                raw_date = d.get("date", "")
+                if raw_date and len(str(raw_date)) == 8:
+                    latest_date = f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:8]}"
+                else:
+                    latest_date = raw_date or None
+            else:
+                latest_date = None
+        except Exception:
+            latest_date = None
+    else:
+        try:
+            cursor.execute("SELECT COUNT(DISTINCT race_id) FROM races")
+            total_races = cursor.fetchone()[0]
+        except Exception:
+            total_races = 0
+        try:
+            cursor.execute("SELECT COUNT(DISTINCT horse_id) FROM entries")
+            total_horses = cursor.fetchone()[0]
+        except Exception:
+            try:
+                cursor.execute("SELECT COUNT(*) FROM entries")
+                total_horses = cursor.fetchone()[0]
+            except Exception:
+                total_horses = 0
+        latest_date = None
+
+    con.close()
+
+    total_models = len(list(MODELS_DIR.glob("model_*.joblib")))
+
+    return {
+        "total_races": total_races,
+        "total_horses": total_horses,
+        "total_models": total_models,
+        "latest_date": latest_date,
+        "db_exists": True,
+    }
+
+
 @router.get("/api/data_stats")
 async def get_data_stats(ultimate: bool = False):
     """
@@ -109,86 +187,17 @@ async def get_data_stats(ultimate: bool = False):
     """
     try:
         # ローカル DB を優先。存在しない場合のみ Supabase にフォールバック
-        if ultimate:
-            db_path = ULTIMATE_DB
-        else:
-            cfg = load_config(CONFIG_PATH)
-            db_path = cfg.storage.sqlite_path
-            if not db_path.is_absolute():
-                db_path = CONFIG_PATH.parent / db_path
-
-        if not db_path.exists():
-            if SUPABASE_DATA_ENABLED and get_supabase_client():
-                return await asyncio.to_thread(get_data_stats_from_supabase)
-            return {
-                "total_races": 0,
-                "total_horses": 0,
-                "total_models": 0,
-                "latest_date": None,
-                "db_exists": False,
-            }
-
-        con = sqlite3.connect(db_path)
-        cursor = con.cursor()
-
-        if ultimate:
-            try:
-                cursor.execute("SELECT COUNT(DISTINCT race_id) FROM races_ultimate")
-                total_races = cursor.fetchone()[0]
-            except Exception:
-                total_races = 0
-            try:
-                cursor.execute("SELECT COUNT(*) FROM race_results_ultimate")
-                total_horses = cursor.fetchone()[0]
-            except Exception:
-                total_horses = 0
-            try:
-                # race_id は YYYYVVKKNNRR 形式（会場コード込み）のため race_id DESC では
-                # 最新日付が得られない。JSON の date フィールド(YYYYMMDD)で降順ソートする。
-                cursor.execute(
-                    "SELECT data FROM races_ultimate"
-                    " ORDER BY json_extract(data, '$.date') DESC LIMIT 1"
-                )
-                row = cursor.fetchone()
-                if row:
-                    import json as _json
-                    d = _json.loads(row[0])
-                    raw_date = d.get("date", "")
-                    if raw_date and len(str(raw_date)) == 8:
-                        latest_date = f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:8]}"
-                    else:
-                        latest_date = raw_date or None
-                else:
-                    latest_date = None
-            except Exception:
-                latest_date = None
-        else:
-            try:
-                cursor.execute("SELECT COUNT(DISTINCT race_id) FROM races")
-                total_races = cursor.fetchone()[0]
-            except Exception:
-                total_races = 0
-            try:
-                cursor.execute("SELECT COUNT(DISTINCT horse_id) FROM entries")
-                total_horses = cursor.fetchone()[0]
-            except Exception:
-                try:
-                    cursor.execute("SELECT COUNT(*) FROM entries")
-                    total_horses = cursor.fetchone()[0]
-                except Exception:
-                    total_horses = 0
-            latest_date = None
-
-        con.close()
-
-        total_models = len(list(MODELS_DIR.glob("model_*.joblib")))
-
+        stats = await run_blocking(_local_data_stats, ultimate)
+        if stats is not None:
+            return stats
+        if SUPABASE_DATA_ENABLED and get_supabase_client():
+            return await asyncio.to_thread(get_data_stats_from_supabase)
         return {
-            "total_races": total_races,
-            "total_horses": total_horses,
-            "total_models": total_models,
-            "latest_date": latest_date,
-            "db_exists": True,
+            "total_races": 0,
+            "total_horses": 0,
+            "total_models": 0,
+            "latest_date": None,
+            "db_exists": False,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"統計取得エラー: {str(e)}")
@@ -7,6 +7,7 @@ GET  /api/train/status/{job_id}
 from __future__ import annotations
 
 import asyncio
+import time
 import traceback
 import uuid
 from datetime import datetime
@@ -29,7 +30,10 @@ from deps.auth import require_premium  # type: ignore
 from models import TrainRequest, TrainResponse  # type: ignore
 from keiba_ai.constants import FUTURE_FIELDS  # type: ignore
 from keiba_ai.feature_catalog import FeatureCatalog  # type: ignore
+from keiba_ai.stage_profiler import trace_stages  # type: ignore
 from scraping.jobs import _purge_old_jobs, _MAX_JOBS  # type: ignore
+from services.metrics import JOB_DURATION  # type: ignore
+from services.stage_metrics import STAGE_HISTOGRAMS  # type: ignore
 
 router = APIRouter()
 
@@ -48,6 +52,18 @@ class BCWrap:
 
 
 
+# 分類 / 回帰の LightGBM 基本パラメータ（全期間学習・チャンク学習で共通）
+_LGB_BINARY_PARAMS: dict = {
+    "objective": "binary", "metric": "binary_logloss",
+    "max_cat_to_onehot": 4, "learning_rate": 0.05,
+    "num_leaves": 31, "min_data_in_leaf": 20,
+    "feature_fraction": 0.8, "bagging_fraction": 0.8,
+    "bagging_freq": 5, "reg_alpha": 0.1, "reg_lambda": 0.1,
+    "verbose": -1, "random_state": 42,
+}
+_LGB_REGRESSION_PARAMS: dict = {**_LGB_BINARY_PARAMS, "objective": "regression", "metric": "rmse"}
+
+
 # ジョブストア（インメモリ）
 _train_jobs: dict = {}
 
@@ -108,6 +124,484 @@ def _get_date8_to(df: "pd.DataFrame") -> str:  # noqa: F821
     return datetime.now().strftime("%Y%m%d")
 
 
+def _fit_calibrator(y_pred_proba: "np.ndarray", y_true: "pd.Series", logloss: float):  # noqa: F821
+    """ホールドアウト予測で確率キャリブレータを学習する。
+
+    BetaCalibration 優先、betacal 未インストール時は IsotonicRegression。
+    Returns: (calibrator | None, キャリブレーション後 logloss)
+    """
+    calibrator = None
+    logloss_calibrated = logloss
+    try:
+        from sklearn.isotonic import IsotonicRegression as _IR
+        _ir = _IR(out_of_bounds="clip")
+        _ir.fit(y_pred_proba, y_true.values)
+        calibrator = _ir
+        # betacal が利用可能なら BetaCalibration で置き換える（より良い確率推定）
+        try:
+            from betacal import BetaCalibration as _BC  # type: ignore
+
+            _bc = _BC(parameters="abm")
+            _bc.fit(np.asarray(y_pred_proba).reshape(-1, 1), y_true.values)
+            calibrator = BCWrap(_bc)
+            logger.info("BetaCalibration を使用してキャリブレーション学習完了")
+        except ImportError:
+            logger.info("betacal 未インストール。IsotonicRegression でキャリブレーション学習完了")
+        # キャリブレーション後の logloss を計算
+        from sklearn.metrics import log_loss as _ll_fn
+        _y_cal = calibrator.predict(y_pred_proba)
+        logloss_calibrated = float(_ll_fn(y_true, _y_cal))
+    except Exception as _cal_err:
+        logger.warning(f"キャリブレーション学習失敗: {_cal_err}")
+    return calibrator, logloss_calibrated
+
+
+def _fit_drift_reference(X, feature_columns: "List[str] | None" = None) -> "dict | None":
+    """学習特徴量の分位ビンと基準分布（推論時の PSI ドリフト検査用）。失敗しても学習は止めない"""
+    try:
+        from keiba_ai.quality_gate import fit_drift_reference  # type: ignore
+        return fit_drift_reference(X, feature_columns)
+    except Exception as _e:
+        logger.warning(f"ドリフト基準分布の作成スキップ: {_e}")
+        return None
+
+
+async def _do_incremental_train(
+    request: TrainRequest,
+    current_user: dict,
+    df_all: "pd.DataFrame",  # noqa: F821
+    progress_cb,
+    start_time: datetime,
+) -> TrainResponse:
+    """ウォームスタート増分学習。
+
+    アクティブモデル（または base_model_id）のバンドルと特徴量行列キャッシュを読み込み、
+    キャッシュ以降の新規レースだけ特徴量を生成して追記 → ローリングホールドアウトで
+    未学習区間を init_model で追加ブースティング → 旧モデルと同一ホールドアウトで比較 →
+    キャリブレータを再学習して新バンドルとして保存する。
+
+    以下の場合は IncrementalFallback を送出し、呼び出し元で全期間再学習に切り替える:
+      - ベースモデル / 特徴量キャッシュが無い、ターゲット不一致、ランカー
+      - feature_engineering ハッシュが学習時から変わっている
+      - ホールドアウト損失が incremental_max_degradation を超えて悪化
+    """
+    import pandas as pd
+    from app_config import get_active_model_id, get_latest_model, _ensure_model_local  # type: ignore
+    from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+    from keiba_ai.train import _make_target  # type: ignore
+    from keiba_ai.training.incremental import (  # type: ignore
+        IncrementalFallback,
+        continue_boosting,
+        continue_params,
+        degradation_exceeded,
+        feature_cache_path,
+        feature_engineering_hash,
+        holdout_loss,
+        load_feature_cache,
+        rolling_holdout_split,
+        save_feature_cache,
+        select_new_rows,
+        training_window_conflict,
+    )
+
+    progress_cb("増分学習: ベースモデル読み込み中...", 18)
+    base_path = None
+    if request.base_model_id:
+        base_path = _ensure_model_local(request.base_model_id)
+    else:
+        _active = get_active_model_id()
+        base_path = (MODELS_DIR / f"{_active}.joblib") if _active else get_latest_model()
+    if base_path is None or not Path(base_path).exists():
+        raise IncrementalFallback("ベースモデルが見つかりません")
+    base_path = Path(base_path)
+    base_bundle = joblib.load(base_path)
+
+    if base_bundle.get("target") != request.target:
+        raise IncrementalFallback(
+            f"ターゲット不一致 (base={base_bundle.get('target')}, request={request.target})"
+        )
+    if base_bundle.get("_is_ranker") or request.target == "rank":
+        raise IncrementalFallback("LambdaRank モデルは増分学習非対応")
+    optimizer = base_bundle.get("optimizer")
+    feature_columns: List[str] = list(base_bundle.get("feature_columns") or [])
+    if optimizer is None or not feature_columns:
+        raise IncrementalFallback("ベースモデルに optimizer / feature_columns がありません")
+    _hash_trained = (base_bundle.get("pipeline_config") or {}).get("feature_engineering_hash")
+    _hash_now = feature_engineering_hash()
+    if _hash_trained != _hash_now:
+        raise IncrementalFallback(
+            f"feature_engineering ハッシュ変更 (学習時={_hash_trained} / 現在={_hash_now})"
+        )
+    cache = load_feature_cache(feature_cache_path(base_path))
+    if cache is None:
+        raise IncrementalFallback(f"特徴量キャッシュがありません: {feature_cache_path(base_path).name}")
+    if not cache.get("train_cutoff"):
+        raise IncrementalFallback("ベースモデルが時系列分割で学習されていません")
+    if list(cache["X"].columns) != feature_columns:
+        raise IncrementalFallback("特徴量キャッシュの列がベースモデルと一致しません")
+
+    # 学習期間: 学習済みのキャッシュ行は外せないので、守れない期間指定は全期間再学習で反映する
+    _window_conflict = training_window_conflict(
+        cache["race_date"], request.training_date_from, request.training_date_to
+    )
+    if _window_conflict:
+        raise IncrementalFallback(_window_conflict)
+
+    # ── 新規レースのみ特徴量生成（履歴統計は DB 全体を full_history として参照） ──
+    _since = str(cache["race_date"].max())
+    df_new = select_new_rows(df_all, _since, request.training_date_to)
+    if df_new.empty:
+        _until = f"〜{request.training_date_to} " if request.training_date_to else ""
+        raise HTTPException(status_code=400, detail=f"{_since} 以降{_until}の新規レースがありません")
+    progress_cb(f"増分学習: 新規 {len(df_new):,} 行の特徴量生成中...", 25)
+
+    _is_regression = request.target == "speed_deviation"
+    y_new = _make_target(df_new, request.target)
+    df_new = add_derived_features(df_new, full_history_df=df_all)
+    df_new = df_new.loc[:, ~df_new.columns.duplicated()]
+    df_new = df_new.drop(columns=[c for c in FUTURE_FIELDS if c in df_new.columns])
+    _race_date_new = df_new["race_date"] if "race_date" in df_new.columns else pd.Series([""] * len(df_new))
+    _race_id_new = df_new["race_id"] if "race_id" in df_new.columns else pd.Series([""] * len(df_new))
+    df_opt = optimizer.transform(df_new)
+    _missing = [c for c in feature_columns if c not in df_opt.columns]
+    if len(_missing) > len(feature_columns) * 0.5:
+        raise IncrementalFallback(f"新規行で特徴量が {len(_missing)} 列不足")
+    X_new = df_opt.reindex(columns=feature_columns)
+    if _missing:
+        logger.warning(f"増分学習: 不足特徴量 {len(_missing)} 列を NaN で補完: {_missing[:10]}")
+
+    X_new = X_new.reset_index(drop=True)
+    y_new = pd.Series(y_new).reset_index(drop=True)
+    _race_date_new = _race_date_new.reset_index(drop=True)
+    _race_id_new = _race_id_new.reset_index(drop=True)
+    if _is_regression:
+        _valid = y_new.notna().values
+        X_new, y_new = X_new.loc[_valid], y_new.loc[_valid]
+        _race_date_new, _race_id_new = _race_date_new.loc[_valid], _race_id_new.loc[_valid]
+
+    X = pd.concat([cache["X"], X_new.astype(cache["X"].dtypes.to_dict(), errors="ignore")], ignore_index=True)
+    y = pd.concat([cache["y"], y_new], ignore_index=True)
+    race_date = pd.concat([cache["race_date"], _race_date_new.astype(str).str[:8]], ignore_index=True)
+    _cached_race_id = cache.get("race_id")
+    race_id = pd.concat(
+        [_cached_race_id if _cached_race_id is not None else pd.Series([""] * len(cache["X"])),
+         _race_id_new.astype(str)],
+        ignore_index=True,
+    )
+
+    # ── ローリングホールドアウト分割 → 未学習区間を追加ブースティング ──
+    boost_mask, hold_mask, new_cutoff = rolling_holdout_split(race_date, request.test_size, cache["train_cutoff"])
+    if int(boost_mask.sum()) == 0 or int(hold_mask.sum()) < 50:
+        raise IncrementalFallback(
+            f"ローリング分割が不十分 (追加学習 {int(boost_mask.sum())} 行 / ホールドアウト {int(hold_mask.sum())} 行)"
+        )
+    X_boost, y_boost = X.loc[boost_mask], y.loc[boost_mask]
+    X_hold, y_hold = X.loc[hold_mask], y.loc[hold_mask]
+    if not _is_regression and y_hold.nunique() < 2:
+        raise IncrementalFallback("ホールドアウトに 2 クラス以上がありません")
+
+    base_model = base_bundle["model"]
+    categorical_features = list(base_bundle.get("categorical_features") or [])
+    categorical_indices = [X.columns.get_loc(c) for c in categorical_features if c in X.columns]
+    params = continue_params(base_model, _LGB_REGRESSION_PARAMS if _is_regression else _LGB_BINARY_PARAMS)
+    progress_cb(
+        f"増分学習: {int(boost_mask.sum()):,} 行で {request.incremental_rounds} ラウンド追加学習中...", 55
+    )
+    model = await asyncio.to_thread(
+        continue_boosting, base_model, X_boost, y_boost, params,
+        request.incremental_rounds, categorical_indices,
+    )
+
+    # ── ガードレール: 旧モデルと同一ホールドアウトで損失比較 ──
+    progress_cb("増分学習: ローリングホールドアウトで再検証中...", 80)
+    base_loss = holdout_loss(base_model, X_hold, y_hold, _is_regression)
+    new_loss = holdout_loss(model, X_hold, y_hold, _is_regression)
+    logger.info(f"増分学習ホールドアウト損失: base={base_loss:.5f} → new={new_loss:.5f}")
+    if degradation_exceeded(base_loss, new_loss, request.incremental_max_degradation):
+        raise IncrementalFallback(
+            f"ホールドアウト損失が悪化 (base={base_loss:.5f} → new={new_loss:.5f}, "
+            f"許容 {request.incremental_max_degradation:.1%})"
+        )
+
+    y_pred_proba = model.predict(X_hold)
+    if _is_regression:
+        from scipy.stats import spearmanr as _spearmanr
+        _sp, _ = _spearmanr(y_hold, y_pred_proba)
+        auc = float(_sp) if not np.isnan(_sp) else 0.0
+        logloss = new_loss
+    else:
+        from sklearn.metrics import roc_auc_score, log_loss
+        auc = float(roc_auc_score(y_hold, y_pred_proba))
+        logloss = float(log_loss(y_hold, y_pred_proba))
+
+    progress_cb("確率キャリブレーション中...", 88)
+    calibrator = None
+    logloss_calibrated = logloss
+    if not _is_regression:
+        calibrator, logloss_calibrated = _fit_calibrator(y_pred_proba, y_hold, logloss)
+
+    # ── 保存（バンドル構造は全期間学習と同一 + incremental メタ情報） ──
+    progress_cb("モデルを保存中...", 93)
+    _df_dates = pd.DataFrame({"race_date": race_date})
+    date_from_8 = _get_date8_from(_df_dates)
+    date_to_8 = _get_date8_to(_df_dates)
+    saved_at = datetime.now().strftime("%Y%m%d_%H%M")
+    model_id = f"{date_from_8}_{date_to_8}_{saved_at}"
+    model_filename = f"model_{request.target}_lightgbm_{model_id}.joblib"
+    model_path = MODELS_DIR / model_filename
+    race_count = int(race_id[race_id != ""].nunique())
+    metrics = {
+        "auc": float(auc), "logloss": float(logloss),
+        "logloss_calibrated": float(logloss_calibrated),
+        "cv_auc_mean": float(auc), "cv_auc_std": 0.0,
+        "holdout_loss_base": float(base_loss), "holdout_loss_new": float(new_loss),
+    }
+    bundle = dict(base_bundle)
+    bundle.update({
+        "model": model,
+        "calibrator": calibrator,
+        "metrics": metrics,
+        "data_count": len(X),
+        "race_count": race_count,
+        "created_at": saved_at,
+        "training_date_to": _get_actual_date_to(_df_dates, request.training_date_to),
+        # 全期間・チャンク学習と同じく学習行だけで作る（ローリングホールドアウトは含めない）
+        "drift_reference": _fit_drift_reference(X.loc[~hold_mask]),
+        "incremental": {
+            "base_model": base_path.stem,
+            "added_rows": int(len(X_new)),
+            "boost_rows": int(boost_mask.sum()),
+            "holdout_rows": int(hold_mask.sum()),
+            "added_rounds": int(model.num_trees() - base_model.num_trees()),
+            "train_cutoff": new_cutoff,
+        },
+    })
+    joblib.dump(bundle, model_path)
+    try:
+        save_feature_cache(feature_cache_path(model_path), X, y, race_date, race_id, new_cutoff)
+    except Exception as _e:
+        logger.warning(f"特徴量キャッシュ保存スキップ: {_e}")
+
+    if SUPABASE_DATA_ENABLED and get_supabase_client():
+        from app_config import upload_model_to_supabase  # type: ignore
+        await asyncio.to_thread(
+            upload_model_to_supabase,
+            model_path,
+            model_id,
+            {
+                "user_id": current_user.get("user_id"),
+                "model_id": model_id,
+                "target": request.target,
+                "model_type": "lightgbm",
+                "ultimate_mode": True,
+                "use_optimizer": True,
+                "auc": float(auc),
+                "cv_auc_mean": float(auc),
+                "data_count": len(X),
+                "race_count": race_count,
+                "created_at": saved_at,
+                "training_date_from": bundle.get("training_date_from"),
+                "training_date_to": bundle.get("training_date_to"),
+            },
+        )
+
+    progress_cb("学習完了", 98)
+    training_time = (datetime.now() - start_time).total_seconds()
+    return TrainResponse(
+        success=True,
+        model_id=model_id,
+        model_path=str(model_path),
+        metrics=metrics,
+        data_count=len(X),
+        race_count=race_count,
+        feature_count=len(feature_columns),
+        training_time=training_time,
+        message=(
+            f"増分学習完了 (+{len(X_new):,} 行, +{bundle['incremental']['added_rounds']} ラウンド, "
+            f"ホールドアウト損失 {base_loss:.4f} → {new_loss:.4f})"
+        ),
+        feature_columns=feature_columns,
+        training_mode="incremental",
+    )
+
+
+async def _do_chunked_train(
+    request: TrainRequest,
+    current_user: dict,
+    df: "pd.DataFrame",  # noqa: F821
+    progress_cb,
+    start_time: datetime,
+) -> TrainResponse:
+    """アウトオブコア学習（日付チャンク → float32 memmap → LightGBM binary からブースティング）。
+
+    全期間の特徴量フレーム / optimizer 出力 / X_train・X_test コピーを同時に保持しないため、
+    ピークメモリは生の履歴フレーム + 1 チャンク分に収まる。分類・回帰のみ対応（CV → 最終学習 →
+    キャリブレーションは全期間学習と同じ手順）。Optuna・LambdaRank は非対応。
+    """
+    import tempfile
+    import lightgbm as lgb
+    import pandas as pd
+    from keiba_ai.training.chunked import build_chunked_dataset  # type: ignore
+    from keiba_ai.training.incremental import feature_engineering_hash  # type: ignore
+
+    if request.target == "rank":
+        raise HTTPException(status_code=400, detail="chunked 学習は target='rank' に対応していません")
+    if request.use_optuna:
+        logger.warning("chunked 学習では Optuna をスキップします")
+    _is_regression = request.target == "speed_deviation"
+    params = dict(_LGB_REGRESSION_PARAMS if _is_regression else _LGB_BINARY_PARAMS)
+
+    workdir = Path(tempfile.mkdtemp(prefix="keiba_chunked_"))
+    ds = None
+    try:
+        ds = await asyncio.to_thread(
+            build_chunked_dataset, df, request.target, workdir, request.chunk_months,
+            progress_cb=progress_cb,
+        )
+        n_train = ds.time_split_index(request.test_size)
+        n_test = ds.n_rows - n_train
+        if n_train < 200 or n_test < 50:
+            raise HTTPException(
+                status_code=400,
+                detail=f"chunked 学習には時系列分割が必要です (学習 {n_train} 行 / テスト {n_test} 行)",
+            )
+        logger.info(f"chunked 時系列分割: 学習 {n_train}行, テスト {n_test}行 ({len(ds.chunk_rows)} チャンク)")
+        y_test = pd.Series(ds.y[n_train:])
+        if not _is_regression and y_test.nunique() < 2:
+            raise HTTPException(status_code=400, detail="テスト期間に 2 クラス以上が必要です")
+
+        progress_cb("LightGBM binary データセット構築中...", 50)
+        train_bin = await asyncio.to_thread(ds.to_lgb_binary, 0, n_train, "train", params)
+
+        def _boost() -> tuple:
+            cv_result = lgb.cv(
+                params, lgb.Dataset(str(train_bin)),
+                num_boost_round=1000, nfold=request.cv_folds,
+                stratified=(not _is_regression),
+                callbacks=[
+                    lgb.early_stopping(stopping_rounds=50, verbose=False),
+                    lgb.log_evaluation(period=0),
+                ],
+            )
+            _key = "valid rmse" if _is_regression else "valid binary_logloss"
+            best_round = int(len(cv_result[f"{_key}-mean"]) * request.cv_folds / (request.cv_folds - 1))
+            booster = lgb.train(params, lgb.Dataset(str(train_bin)), num_boost_round=best_round)
+            return cv_result, _key, booster
+
+        progress_cb(f"CV学習中 ({request.cv_folds}折, binary データセット)...", 55)
+        cv_result, _key, model = await asyncio.to_thread(_boost)
+        cv_auc_mean = 1.0 - cv_result[f"{_key}-mean"][-1]
+        cv_auc_std = cv_result[f"{_key}-stdv"][-1]
+
+        y_pred_proba = ds.predict(model, n_train, ds.n_rows)
+        if _is_regression:
+            from scipy.stats import spearmanr as _spearmanr
+            _sp, _ = _spearmanr(y_test, y_pred_proba)
+            auc = float(_sp) if not np.isnan(_sp) else 0.0
+            logloss = float(np.sqrt(np.nanmean((y_test.values - y_pred_proba) ** 2)))
+            cv_auc_mean = auc
+        else:
+            from sklearn.metrics import roc_auc_score, log_loss
+            y_test = y_test.astype(int)
+            auc = float(roc_auc_score(y_test, y_pred_proba))
+            logloss = float(log_loss(y_test, y_pred_proba))
+
+        progress_cb("確率キャリブレーション中...", 88)
+        calibrator = None
+        logloss_calibrated = logloss
+        if not _is_regression:
+            calibrator, logloss_calibrated = _fit_calibrator(y_pred_proba, y_test, logloss)
+
+        progress_cb("モデルを保存中...", 93)
+        _df_dates = pd.DataFrame({"race_date": ds.race_date})
+        date_from_8 = _get_date8_from(_df_dates)
+        date_to_8 = _get_date8_to(_df_dates)
+        saved_at = datetime.now().strftime("%Y%m%d_%H%M")
+        model_id = f"{date_from_8}_{date_to_8}_{saved_at}"
+        model_path = MODELS_DIR / f"model_{request.target}_lightgbm_{model_id}.joblib"
+        race_count = int(pd.Series(ds.race_id).replace("", np.nan).nunique())
+        metrics = {
+            "auc": float(auc), "logloss": float(logloss),
+            "logloss_calibrated": float(logloss_calibrated),
+            "cv_auc_mean": float(cv_auc_mean), "cv_auc_std": float(cv_auc_std),
+        }
+        bundle = {
+            "model": model,
+            "calibrator": calibrator,
+            "optimizer": ds.optimizer,
+            "categorical_features": ds.categorical_features,
+            "feature_cols_num": None,
+            "feature_cols_cat": None,
+            "feature_columns": ds.feature_columns,
+            "target": request.target,
+            "model_type": "lightgbm",
+            "ultimate_mode": True,
+            "use_optimizer": True,
+            "pipeline_config": {
+                "use_feature_engineering": True,
+                "use_optimizer": True,
+                "optimizer_type": type(ds.optimizer).__name__,
+                "requires_full_history": True,
+                "feature_engineering_hash": feature_engineering_hash(),
+                "chunked": {"chunk_months": request.chunk_months, "chunks": len(ds.chunk_rows)},
+            },
+            "metrics": metrics,
+            "data_count": ds.n_rows,
+            "race_count": race_count,
+            "created_at": saved_at,
+            "training_date_from": _get_actual_date_from(_df_dates, request.training_date_from),
+            "training_date_to": _get_actual_date_to(_df_dates, request.training_date_to),
+            "drift_reference": _fit_drift_reference(ds.X[:n_train], ds.feature_columns),
+        }
+        joblib.dump(bundle, model_path)
+
+        if SUPABASE_DATA_ENABLED and get_supabase_client():
+            from app_config import upload_model_to_supabase  # type: ignore
+            await asyncio.to_thread(
+                upload_model_to_supabase,
+                model_path,
+                model_id,
+                {
+                    "user_id": current_user.get("user_id"),
+                    "model_id": model_id,
+                    "target": request.target,
+                    "model_type": "lightgbm",
+                    "ultimate_mode": True,
+                    "use_optimizer": True,
+                    "auc": float(auc),
+                    "cv_auc_mean": float(cv_auc_mean),
+                    "data_count": ds.n_rows,
+                    "race_count": race_count,
+                    "created_at": saved_at,
+                    "training_date_from": bundle["training_date_from"],
+                    "training_date_to": bundle["training_date_to"],
+                },
+            )
+
+        progress_cb("学習完了", 98)
+        return TrainResponse(
+            success=True,
+            model_id=model_id,
+            model_path=str(model_path),
+            metrics=metrics,
+            data_count=ds.n_rows,
+            race_count=race_count,
+            feature_count=len(ds.feature_columns),
+            training_time=(datetime.now() - start_time).total_seconds(),
+            message=(
+                f"モデル学習完了 [chunked {len(ds.chunk_rows)} チャンク] "
+                f"(AUC: {auc:.4f}, LogLoss: {logloss:.4f}, LogLoss(Cal): {logloss_calibrated:.4f})"
+            ),
+            feature_columns=ds.feature_columns,
+        )
+    finally:
+        if ds is not None:
+            ds.cleanup()
+        else:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
 # レース後確定フィールド（keiba_ai.constants.FUTURE_FIELDS を参照）
 
 
@@ -123,6 +617,11 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
             prepare_for_lightgbm_ultimate,
         )
         from keiba_ai.optuna_optimizer import OptunaLightGBMOptimizer  # type: ignore
+        from keiba_ai.training.incremental import (  # type: ignore
+            feature_cache_path,
+            feature_engineering_hash,
+            save_feature_cache,
+        )
 
         # Phase 0: 87特徴量モード固定（入力値に関わらず常に ultimate LightGBM）
         request = request.model_copy(update={
@@ -173,6 +672,17 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
         print(f"DEBUG: Loaded {len(df)} rows from database")
         progress_cb(f"データ読み込み完了 ({len(df):,} 行)", 15)
 
+        # ウォームスタート増分学習（ガードレールに掛かったら全期間再学習へフォールバック）
+        fallback_reason = None
+        if request.incremental:
+            from keiba_ai.training.incremental import IncrementalFallback  # type: ignore
+            try:
+                return await _do_incremental_train(request, current_user, df, progress_cb, start_time)
+            except IncrementalFallback as _fb:
+                fallback_reason = str(_fb)
+                logger.warning(f"増分学習を中止し全期間再学習にフォールバック: {fallback_reason}")
+                progress_cb(f"全期間再学習にフォールバック: {fallback_reason}", 16)
+
         # 学習期間フィルタ
         # race_date(YYYYMMDD, 100%充填)を優先。一致しない場合は race_id[:6] にフォールバック
         if request.training_date_from or request.training_date_to:
@@ -208,6 +718,10 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
                 detail=f"訓練データが見つかりません。DB: {db_path}",
             )
 
+        # アウトオブコア学習（日付チャンク単位で特徴量生成 → memmap → LightGBM binary）
+        if request.chunked:
+            return await _do_chunked_train(request, current_user, df, progress_cb, start_time)
+
         # ターゲット変数を先に取得（FUTURE_FIELDSのdrop前にfinish列が必要）
         from keiba_ai.train import _make_target  # type: ignore
         y = _make_target(df, request.target)
@@ -216,7 +730,7 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
             raise HTTPException(status_code=400, detail="2クラス以上が必要です")
         # 特徴量エンジニアリング（finish等を使うのでdrop前に実施）
         progress_cb("特徴量エンジニアリング中...", 20)
-        df = add_derived_features(df, full_history_df=df)
+        df = add_derived_features(df, full_history_df=df, n_jobs=request.fe_workers)
         # NOTE: UltimateFeatureCalculator は feature_engineering.py で同等の特徴量を
         # ベクトル化计算済みのため除去（zero-variance 問題も解消）
         df = df.loc[:, ~df.columns.duplicated()]
@@ -383,23 +897,9 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
                 if _is_ranking:
                     pass  # 上のブロックで学習完了
                 elif _is_regression:
-                    params = {
-                        "objective": "regression", "metric": "rmse",
-                        "max_cat_to_onehot": 4, "learning_rate": 0.05,
-                        "num_leaves": 31, "min_data_in_leaf": 20,
-                        "feature_fraction": 0.8, "bagging_fraction": 0.8,
-                        "bagging_freq": 5, "reg_alpha": 0.1, "reg_lambda": 0.1,
-                        "verbose": -1, "random_state": 42,
-                    }
+                    params = dict(_LGB_REGRESSION_PARAMS)
                 else:
-                    params = {
-                        "objective": "binary", "metric": "binary_logloss",
-                        "max_cat_to_onehot": 4, "learning_rate": 0.05,
-                        "num_leaves": 31, "min_data_in_leaf": 20,
-                        "feature_fraction": 0.8, "bagging_fraction": 0.8,
-                        "bagging_freq": 5, "reg_alpha": 0.1, "reg_lambda": 0.1,
-                        "verbose": -1, "random_state": 42,
-                    }
+                    params = dict(_LGB_BINARY_PARAMS)
 
                 if not _is_ranking:
                     # CV で最適ラウンド探索
@@ -579,27 +1079,7 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
         calibrator = None
         logloss_calibrated = logloss
         if request.target not in ("speed_deviation", "rank"):
-            try:
-                from sklearn.isotonic import IsotonicRegression as _IR
-                _ir = _IR(out_of_bounds="clip")
-                _ir.fit(y_pred_proba, y_test.values)
-                calibrator = _ir
-                # betacal が利用可能なら BetaCalibration で置き換える（より良い確率推定）
-                try:
-                    from betacal import BetaCalibration as _BC  # type: ignore
-
-                    _bc = _BC(parameters="abm")
-                    _bc.fit(y_pred_proba.reshape(-1, 1), y_test.values)
-                    calibrator = BCWrap(_bc)
-                    logger.info("BetaCalibration を使用してキャリブレーション学習完了")
-                except ImportError:
-                    logger.info("betacal 未インストール。IsotonicRegression でキャリブレーション学習完了")
-                # キャリブレーション後の logloss を計算
-                from sklearn.metrics import log_loss as _ll_fn
-                _y_cal = calibrator.predict(y_pred_proba)
-                logloss_calibrated = float(_ll_fn(y_test, _y_cal))
-            except Exception as _cal_err:
-                logger.warning(f"キャリブレーション学習失敗: {_cal_err}")
+            calibrator, logloss_calibrated = _fit_calibrator(y_pred_proba, y_test, logloss)
 
         # モデル保存 — IDはデータ日付範囲 + 作成日時（一意性を保証）
         progress_cb("モデルを保存中...", 93)
@@ -627,11 +1107,7 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
                 "use_optimizer": request.use_optimizer,
                 "optimizer_type": type(optimizer).__name__ if optimizer is not None else None,
                 "requires_full_history": True,
-                "feature_engineering_hash": __import__("hashlib").md5(
-                    __import__("inspect").getsource(
-                        __import__("keiba_ai.feature_engineering", fromlist=["add_derived_features"])
-                    ).encode()
-                ).hexdigest()[:12],
+                "feature_engineering_hash": feature_engineering_hash(),
             },
             "metrics": {
                 "auc": float(auc), "logloss": float(logloss),
@@ -643,12 +1119,26 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
             "created_at": saved_at,
             "training_date_from": _get_actual_date_from(df, request.training_date_from),
             "training_date_to": _get_actual_date_to(df, request.training_date_to),
+            "drift_reference": _fit_drift_reference(locals().get("X_train", X)) if model is not None else None,
         }
         # LambdaRank はランカー固有フラグを保存
         if request.target == "rank" and locals().get("_is_ranker_model"):
             bundle["_is_ranker"] = True
         joblib.dump(bundle, model_path)
 
+        # 増分学習用に特徴量行列をキャッシュ（時系列分割時のみ: 学習カットオフが必要）
+        if not bundle.get("_is_ranker") and locals().get("_time_split"):
+            try:
+                save_feature_cache(
+                    feature_cache_path(model_path),
+                    X, y,
+                    df["race_date"].reset_index(drop=True),
+                    df["race_id"].reset_index(drop=True) if "race_id" in df.columns else None,
+                    _cutoff.strftime("%Y%m%d"),
+                )
+            except Exception as _e:
+                logger.warning(f"特徴量キャッシュ保存スキップ: {_e}")
+
         # カタログをモデルの特徴量で自動同期（新規特徴量を auto_synced ステージに追記）
         try:
             _catalog_path = Path(__file__).parent.parent.parent / "keiba" / "feature_catalog.yaml"
@@ -704,6 +1194,7 @@ async def _do_train(request: TrainRequest, current_user: dict, progress_cb=None)
             optuna_executed=optuna_executed,
             optuna_error=optuna_error,
             feature_columns=_all_feature_columns,
+            fallback_reason=fallback_reason,
         )
 
     except HTTPException:
@@ -726,6 +1217,7 @@ async def _run_train_job(job_id: str, request: TrainRequest, current_user: dict)
     job = _train_jobs[job_id]
     job["status"] = "running"
     job["pct"] = 0
+    started = time.monotonic()
 
     def _cb(msg: str, pct: int = None) -> None:
         job["progress"] = msg
@@ -733,9 +1225,12 @@ async def _run_train_job(job_id: str, request: TrainRequest, current_user: dict)
             job["pct"] = pct
 
     try:
-        train_result = await _do_train(request, current_user, progress_cb=_cb)
+        # 特徴量生成・optimizer のステージ別処理時間をジョブ結果に残す
+        with trace_stages() as trace:
+            train_result = await _do_train(request, current_user, progress_cb=_cb)
+        STAGE_HISTOGRAMS.observe("train", trace)
         job["status"] = "completed"
-        job["result"] = train_result.dict()
+        job["result"] = {**train_result.dict(), "stage_trace": trace.to_dict()}
         job["progress"] = "完了"
         job["pct"] = 100
     except HTTPException as e:
@@ -747,6 +1242,8 @@ async def _run_train_job(job_id: str, request: TrainRequest, current_user: dict)
         job["error"] = str(e)
         job["progress"] = f"エラー: {str(e)}"
         logger.error(f"学習ジョブ {job_id} 失敗:\n{traceback.format_exc()}")
+    finally:
+        JOB_DURATION.observe(time.monotonic() - started, kind="train", status=job.get("status", "unknown"))
 
 
 @router.post("/api/train/start")
@@ -7,6 +7,7 @@
   - 毎朝 6:00 JST   : 前日分（昨日）の結果を取り込む
   - 9:00 〜 22:00 JST, 2時間おき: 当日分のレースをスクレイプ
     （発走前は shutuba フォールバックで出走表、レース後は結果を上書き）
+    続けて未予測のレースを一括予測し、analyze_race がプリコンピュート結果を返せるようにする
 
 環境変数:
   SCHEDULER_ENABLED  : "true" を明示した場合だけスケジューラを有効化
@@ -97,11 +98,27 @@ async def _job_scrape_yesterday() -> None:
     await _run_scrape_for_date(yesterday)
 
 
+async def _precompute_card(date_str: str) -> None:
+    """出馬表が揃ったレースを発走前に一括予測しておく（analyze_race の初回待ちをなくす）。"""
+    try:
+        from routers.predict import _card_race_ids, precompute_race_card  # type: ignore
+        race_ids = await _card_race_ids(date_str)
+        if race_ids:
+            run = await precompute_race_card(race_ids)
+            logger.info(
+                f"[scheduler] {date_str}: precomputed {len(run.done)} races "
+                f"(skipped={len(run.skipped)}, failed={len(run.failed)})"
+            )
+    except Exception as e:
+        logger.error(f"[scheduler] precompute {date_str} failed: {e}")
+
+
 async def _job_scrape_today() -> None:
-    """日中ジョブ: 当日分を取得（出走表→結果で上書き）。"""
+    """日中ジョブ: 当日分を取得（出走表→結果で上書き）し、未予測のレースを事前予測する。"""
     today = datetime.now().strftime("%Y%m%d")
     logger.info(f"[scheduler] 当日スクレイプ: {today}")
     await _run_scrape_for_date(today)
+    await _precompute_card(today)
 
 
 # ---------------------------------------------------------------------------
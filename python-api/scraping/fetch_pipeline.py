@@ -18,6 +18,8 @@ except ImportError:
     import logging
     logger = logging.getLogger(__name__)
 
+from services.metrics import CACHE_REQUESTS, FETCH_EVENTS, FETCH_LATENCY, FETCH_REQUESTS  # type: ignore
+
 _CACHE_DB_PATH = Path(__file__).parent.parent.parent / "keiba" / "data" / "fetch_cache.db"
 _SUMMARY_JSON_PATH = Path(__file__).parent.parent.parent / "reports" / "fetch_summary.json"
 
@@ -250,6 +252,7 @@ def _write_resume(
 def _metrics_inc(key: str, delta: int = 1) -> None:
     with _STATE_LOCK:
         _METRICS[key] = int(_METRICS.get(key, 0)) + delta
+    FETCH_EVENTS.inc(delta, event=key)
 
 
 async def _respect_rate_limit(host: str, min_interval_sec: float) -> None:
@@ -279,6 +282,7 @@ def _record_failure(host: str, circuit_threshold: int, circuit_cooldown_sec: flo
         if _FAILURE_COUNTS[host] >= max(1, circuit_threshold):
             _CIRCUIT_UNTIL[host] = time.monotonic() + max(5.0, circuit_cooldown_sec)
             _METRICS["circuit_open_count"] = int(_METRICS.get("circuit_open_count", 0)) + 1
+            FETCH_EVENTS.inc(event="circuit_open_count")
 
 
 def _record_success(host: str) -> None:
@@ -308,6 +312,7 @@ async def _network_fetch(
     for attempt in range(1, max(1, max_retries) + 1):
         await _respect_rate_limit(host, min_interval_sec)
         _record_request_start(host)
+        started = time.perf_counter()
 
         try:
             # Keep the legacy call shape for default callers and simple test
@@ -318,6 +323,8 @@ async def _network_fetch(
                 headers = {k: v for k, v in resp.headers.items()}
                 body, body_too_large = await _read_response_body(resp, max_body_bytes)
                 _metrics_inc("network_requests", 1)
+                FETCH_LATENCY.observe(time.perf_counter() - started, host=host)
+                FETCH_REQUESTS.inc(host=host, status=status)
                 if status == 429:
                     _metrics_inc("status_429", 1)
                 elif status == 403:
@@ -367,6 +374,8 @@ async def _network_fetch(
                 )
         except asyncio.TimeoutError:
             _metrics_inc("timeout_count", 1)
+            FETCH_LATENCY.observe(time.perf_counter() - started, host=host)
+            FETCH_REQUESTS.inc(host=host, status="timeout")
             last_error = "timeout"
             if attempt < max_retries:
                 _record_failure(host, circuit_threshold, circuit_cooldown_sec)
@@ -377,6 +386,7 @@ async def _network_fetch(
                 continue
         except Exception as e:  # pragma: no cover - network stack dependent
             last_error = f"{type(e).__name__}: {e}"
+            FETCH_REQUESTS.inc(host=host, status="error")
             if attempt < max_retries:
                 _record_failure(host, circuit_threshold, circuit_cooldown_sec)
                 backoff = retry_base_sec * (2 ** (attempt - 1)) + random.uniform(0.0, max(0.0, retry_jitter_sec))
@@ -468,6 +478,7 @@ async def fetch_bytes(
 
     if use_cache and not force_refresh:
         cached = await asyncio.to_thread(_read_cache, normalized_url)
+        CACHE_REQUESTS.inc(cache="http_fetch", result="miss" if cached is None else "hit")
         if cached is not None:
             _metrics_inc("cache_hits", 1)
             if resume_key:
@@ -509,6 +520,7 @@ async def fetch_bytes(
         existing = inflight.get(normalized_url)
         if existing is not None:
             _METRICS["dedup_waits"] = int(_METRICS.get("dedup_waits", 0)) + 1
+            FETCH_EVENTS.inc(event="dedup_waits")
             waiter = existing
         else:
             waiter = loop.create_future()
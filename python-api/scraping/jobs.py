@@ -9,6 +9,7 @@ import json
 import re
 import sqlite3
 import threading
+import time
 from pathlib import Path
 from typing import Literal
 
@@ -31,6 +32,7 @@ from scraping.storage import (
     _get_scraped_dates_sqlite,
     _save_scraped_date_sqlite,
 )
+from services.metrics import JOB_DURATION  # type: ignore
 
 try:
     from app_config import logger  # type: ignore
@@ -434,6 +436,7 @@ async def _run_scrape_job(
     dry_run: bool = False,
 ):
     """バックグラウンドでスクレイピングを実行しジョブストアを更新する"""
+    started = time.monotonic()
     try:
         import time as _time
         job = _scrape_jobs[job_id]
@@ -818,3 +821,6 @@ async def _run_scrape_job(
                 current = _scrape_jobs.get(job_id)
                 if current is not None:
                     current["_store_unavailable"] = True
+    finally:
+        JOB_DURATION.observe(time.monotonic() - started, kind="scrape",
+                             status=_scrape_jobs.get(job_id, {}).get("status", "unknown"))
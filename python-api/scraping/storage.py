@@ -11,6 +11,62 @@ from app_config import logger  # type: ignore
 
 # Supabase 連携は削除済み。データは SQLite (keiba_ultimate.db) のみに保存する。
 
+# ── データバージョン（履歴キャッシュのイベント駆動無効化用） ─────────────
+# race_results_ultimate / races_ultimate / return_tables_ultimate を書き換える経路は
+# 同一トランザクション内で _bump_data_version を呼ぶ。version は単調増加で、
+# race_id が NULL の行は「全件入れ替え（差分不可）」を表す。
+_DATA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS data_version_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        race_id TEXT,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def _bump_data_version(cur: "sqlite3.Cursor | sqlite3.Connection", race_id: "str | None") -> None:
+    """データバージョンを 1 つ進める（race_id=None は全件再ロードを要求）"""
+    cur.execute(_DATA_VERSION_DDL)
+    cur.execute("INSERT INTO data_version_log (race_id) VALUES (?)", (race_id,))
+
+
+def _get_data_version(db_path: Path) -> "int | None":
+    """現在のデータバージョンを返す（テーブル未作成・DB 不在時は None）"""
+    try:
+        if not db_path.exists():
+            return None
+        conn = sqlite3.connect(str(db_path))
+        try:
+            row = conn.execute("SELECT MAX(version) FROM data_version_log").fetchone()
+        finally:
+            conn.close()
+        return int(row[0] or 0)
+    except sqlite3.Error:
+        return None
+
+
+def _get_changed_race_ids(db_path: Path, since: int) -> "tuple[int, set[str] | None]":
+    """since より後に書き換えられた race_id 集合を (最新バージョン, 集合) で返す。
+
+    全件入れ替えが含まれる場合・取得に失敗した場合は集合の代わりに None を返す。
+    """
+    try:
+        conn = sqlite3.connect(str(db_path))
+        try:
+            rows = conn.execute(
+                "SELECT version, race_id FROM data_version_log WHERE version > ?", (since,)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return since, None
+    if not rows:
+        return since, set()
+    latest = max(v for v, _ in rows)
+    if any(rid is None for _, rid in rows):
+        return latest, None
+    return latest, {rid for _, rid in rows}
+
 
 def _init_sqlite_db(db_path: Path) -> None:
     """WALモード設定 + テーブル事前作成（毎レースのDDL重複を削減）"""
@@ -45,6 +101,7 @@ def _init_sqlite_db(db_path: Path) -> None:
             )
         """)
         conn.execute("CREATE INDEX IF NOT EXISTS idx_return_race_id ON return_tables_ultimate (race_id)")
+        conn.execute(_DATA_VERSION_DDL)
         conn.execute("""
             CREATE TABLE IF NOT EXISTS scraped_dates (
                 date TEXT PRIMARY KEY,
@@ -123,6 +180,7 @@ def _save_race_sqlite_only(race_data: dict, db_path: Path, overwrite: bool = Tru
                     rt.get("popularity"),
                 ),
             )
+        _bump_data_version(cur, race_id)
         conn.commit()
         conn.close()
         return True
@@ -167,6 +225,7 @@ def _save_race_to_ultimate_db(race_data: dict, db_path: Path, overwrite: bool =
                 "INSERT INTO race_results_ultimate (race_id, data) VALUES (?, ?)",
                 (race_id, json.dumps(h, ensure_ascii=False)),
             )
+        _bump_data_version(cur, race_id)
         conn.commit()
         conn.close()
         return True
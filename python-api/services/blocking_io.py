@@ -0,0 +1,30 @@
+"""
+ブロッキング I/O 専用のスレッドプール
+
+SQLite の読み書き・JSON 解析・joblib.load のような短い同期処理を async エンドポイントから
+呼ぶときに使う。asyncio.to_thread の既定スレッドプールは特徴量生成・推論のような
+長い CPU 処理でも使うため、短い DB 読み出しがその後ろに並ばないよう実行先を分ける。
+
+  rows = await run_blocking(_query_rows, db_path, race_id)
+
+contextvars（stage_profiler のトレースなど）は asyncio.to_thread と同じく引き継ぐ。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+BLOCKING_IO_WORKERS = 8
+BLOCKING_IO_EXECUTOR = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="keiba-io")
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """fn(*args, **kwargs) を BLOCKING_IO_EXECUTOR で実行して結果を待つ"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(BLOCKING_IO_EXECUTOR, functools.partial(ctx.run, fn, *args, **kwargs))
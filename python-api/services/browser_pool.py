@@ -0,0 +1,208 @@
+"""
+プロセス共有の Playwright ブラウザプール
+
+netkeiba のオッズは JavaScript で描画されるため、静的 HTML で取れなかったレースは
+Playwright で補完している。従来は呼び出しごとに Chromium を起動していたため、
+analyze_race の 1 レースあたり数秒が起動コストに消えていた。本モジュールでは
+
+  1. 最初の借用時に Chromium を 1 つだけ起動し、プロセス終了（lifespan）まで使い回す
+  2. BrowserContext + Page の組を最大 max_pages 個まで保持し、借用を待ち合わせる
+     （同時ページ数の上限を兼ねる）
+  3. max_uses 回使ったコンテキストや、例外・クローズ・ブラウザ切断を検知した
+     コンテキストは破棄して作り直す（Cookie・メモリの肥大化対策）
+
+使い方:
+    async with BROWSER_POOL.page() as page:
+        await page.goto(url)
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from app_config import logger  # type: ignore
+
+
+@dataclass
+class _Slot:
+    context: Any
+    page: Any
+    uses: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+def _default_playwright_factory() -> Any:
+    from playwright.async_api import async_playwright  # type: ignore
+    return async_playwright()
+
+
+class BrowserPool:
+    """ヘッドレス Chromium 1 個と、使い回す Context/Page の組を管理する"""
+
+    def __init__(
+        self,
+        max_pages: int = 3,
+        max_uses: int = 50,
+        launch_kwargs: Optional[Dict[str, Any]] = None,
+        context_kwargs: Optional[Dict[str, Any]] = None,
+        playwright_factory: Callable[[], Any] = _default_playwright_factory,
+    ) -> None:
+        self.max_pages = max(1, int(max_pages))
+        self.max_uses = max(1, int(max_uses))
+        self._launch_kwargs = {"headless": True, **(launch_kwargs or {})}
+        self._context_kwargs = dict(context_kwargs or {})
+        self._factory = playwright_factory
+        self._pw: Any = None
+        self._browser: Any = None
+        self._idle: List[_Slot] = []
+        self._in_use = 0
+        # asyncio プリミティブはイベントループに紐づくため初回借用時に生成する
+        self._lock: Optional[asyncio.Lock] = None
+        self._cond: Optional[asyncio.Condition] = None
+        self._stats = {"launches": 0, "contexts_created": 0, "contexts_recycled": 0,
+                       "unhealthy": 0, "borrows": 0, "wait_sec": 0.0}
+
+    # ── 起動 / 停止 ───────────────────────────────────────────────
+
+    def _primitives(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._lock = asyncio.Lock()
+            self._cond = asyncio.Condition(self._lock)
+        return self._cond
+
+    def _browser_alive(self) -> bool:
+        if self._browser is None:
+            return False
+        try:
+            return bool(self._browser.is_connected())
+        except Exception:
+            return False
+
+    async def _ensure_browser(self) -> Any:
+        """ブラウザを遅延起動する（切断されていれば起動し直す）。ロック保持中に呼ぶこと"""
+        if self._browser_alive():
+            return self._browser
+        if self._browser is not None:
+            logger.warning("[browser_pool] ブラウザ切断を検知 → 再起動")
+            self._stats["unhealthy"] += 1
+            await self._discard_idle()
+            await self._close_browser()
+        t0 = time.perf_counter()
+        self._pw = await self._factory().start()
+        self._browser = await self._pw.chromium.launch(**self._launch_kwargs)
+        self._stats["launches"] += 1
+        logger.info(f"[browser_pool] Chromium 起動 {time.perf_counter() - t0:.2f}s")
+        return self._browser
+
+    async def _close_browser(self) -> None:
+        browser, pw = self._browser, self._pw
+        self._browser = self._pw = None
+        for closer in (getattr(browser, "close", None), getattr(pw, "stop", None)):
+            if closer is None:
+                continue
+            try:
+                await closer()
+            except Exception as e:
+                logger.debug(f"[browser_pool] 終了処理で例外: {e}")
+
+    async def _discard_idle(self) -> None:
+        slots, self._idle = self._idle, []
+        for slot in slots:
+            await self._close_slot(slot)
+
+    async def close(self) -> None:
+        """全コンテキストとブラウザを閉じる（lifespan 終了時）。再度借用すれば起動し直す"""
+        cond = self._primitives()
+        async with cond:
+            await self._discard_idle()
+            await self._close_browser()
+            cond.notify_all()
+
+    # ── コンテキスト管理 ─────────────────────────────────────────
+
+    async def _new_slot(self) -> _Slot:
+        browser = await self._ensure_browser()
+        context = await browser.new_context(**self._context_kwargs)
+        try:
+            page = await context.new_page()
+        except Exception:
+            await context.close()
+            raise
+        self._stats["contexts_created"] += 1
+        return _Slot(context=context, page=page)
+
+    async def _close_slot(self, slot: _Slot) -> None:
+        try:
+            await slot.context.close()
+        except Exception as e:
+            logger.debug(f"[browser_pool] コンテキスト破棄で例外: {e}")
+
+    def _healthy(self, slot: _Slot) -> bool:
+        try:
+            return self._browser_alive() and not slot.page.is_closed()
+        except Exception:
+            return False
+
+    async def _acquire(self) -> _Slot:
+        cond = self._primitives()
+        t0 = time.perf_counter()
+        async with cond:
+            await cond.wait_for(lambda: self._in_use < self.max_pages)
+            self._in_use += 1
+            try:
+                while self._idle:
+                    slot = self._idle.pop()
+                    if self._healthy(slot):
+                        break
+                    self._stats["unhealthy"] += 1
+                    await self._close_slot(slot)
+                else:
+                    slot = await self._new_slot()
+            except BaseException:
+                self._in_use -= 1
+                cond.notify()
+                raise
+        self._stats["borrows"] += 1
+        self._stats["wait_sec"] += time.perf_counter() - t0
+        return slot
+
+    async def _release(self, slot: _Slot, failed: bool) -> None:
+        cond = self._primitives()
+        slot.uses += 1
+        async with cond:
+            self._in_use -= 1
+            recycle = failed or slot.uses >= self.max_uses or not self._healthy(slot)
+            if recycle:
+                self._stats["contexts_recycled"] += 1
+            else:
+                self._idle.append(slot)
+            cond.notify()
+        if recycle:
+            await self._close_slot(slot)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Any]:
+        """温めておいた Page を借りる。ブロック内で例外が出たコンテキストは作り直す"""
+        slot = await self._acquire()
+        failed = False
+        try:
+            yield slot.page
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            await self._release(slot, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "wait_sec": round(self._stats["wait_sec"], 3),
+            "running": self._browser_alive(),
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "max_pages": self.max_pages,
+            "max_uses": self.max_uses,
+        }
@@ -0,0 +1,305 @@
+"""
+ワーカー間共有の DB 全履歴スナップショット（memory-mapped NumPy）
+
+Uvicorn を複数ワーカーで動かすと、各プロセスが race_results_ultimate の全履歴を
+個別にロードして _HISTORY_CACHE に保持するため、RAM がワーカー数倍になり
+DB のパースも N 回走る。本モジュールでは
+
+  1. ファイルロックを取れた 1 プロセス（リーダー）だけが DB をロードし、
+     列ごとの .npy ファイル + meta.json としてバージョン付きディレクトリへ書き出す
+  2. 書き出し完了後に CURRENT マニフェストを os.replace で差し替える（アトミック公開）
+  3. 全ワーカーは np.load(mmap_mode="r") で列をマップし、ページキャッシュを共有する
+     （コピーなしで DataFrame を組み立てる）
+  4. CURRENT のバージョンが変わったらマップし直し、参照を差し替える
+  5. 差分更新関数（updater）が渡された場合、リーダーは公開中の版に
+     変更レースだけを差し替えた版を公開する（DB 全体の再パースを避ける）
+
+列の格納形式:
+  - 数値 / bool / datetime64 列 → そのまま .npy
+  - category 列・文字列列 → コード（pandas と同じ最小整数幅）を .npy、カテゴリを meta.json
+  - 上記以外（型混在の object 列など）→ extras.pkl（各ワーカーのヒープに載る）
+
+pyarrow は依存に含まれていないため Arrow IPC ではなく NumPy 形式を採用している。
+"""
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl  # type: ignore
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+FORMAT_VERSION = 1
+_CURRENT = "CURRENT"
+_LOCK = ".lock"
+_META = "meta.json"
+_EXTRAS = "extras.pkl"
+_KEEP_VERSIONS = 2
+
+
+def _codes_dtype(n_categories: int) -> np.dtype:
+    """pandas.Categorical が内部で使うコード dtype（一致させないと from_codes がコピーする）"""
+    for dt in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dt).max:
+            return np.dtype(dt)
+    return np.dtype(np.int64)
+
+
+def _as_category(s: pd.Series) -> Optional[pd.Categorical]:
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.array  # type: ignore[return-value]
+    if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+        if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+            return pd.Categorical(s.astype(object))
+    return None
+
+
+def write_snapshot(df: pd.DataFrame, dest: Path, source: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """DataFrame を列ごとの .npy として dest に書き出し、meta を返す"""
+    dest.mkdir(parents=True, exist_ok=True)
+    df = df.reset_index(drop=True)
+    columns: List[Dict[str, Any]] = []
+    extras: Dict[str, pd.Series] = {}
+    for i, name in enumerate(df.columns):
+        s = df.iloc[:, i]
+        entry: Dict[str, Any] = {"name": name}
+        cat = _as_category(s)
+        if cat is not None and all(isinstance(c, str) for c in cat.categories):
+            fname = f"c{i:04d}.npy"
+            np.save(dest / fname, np.asarray(cat.codes, dtype=_codes_dtype(len(cat.categories))))
+            entry.update(kind="category", file=fname, categories=[str(c) for c in cat.categories])
+        elif s.dtype.kind in "biufM" and not pd.api.types.is_extension_array_dtype(s):
+            fname = f"c{i:04d}.npy"
+            np.save(dest / fname, s.to_numpy())
+            entry.update(kind="array", file=fname)
+        else:
+            extras[name] = s
+            entry.update(kind="extra")
+        columns.append(entry)
+    if extras:
+        with open(dest / _EXTRAS, "wb") as f:
+            pickle.dump(extras, f, protocol=pickle.HIGHEST_PROTOCOL)
+    meta = {
+        "format": FORMAT_VERSION,
+        "rows": int(len(df)),
+        "columns": columns,
+        "source": source or {},
+        "created_at": time.time(),
+    }
+    (dest / _META).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    return meta
+
+
+def read_snapshot(src: Path) -> pd.DataFrame:
+    """write_snapshot の出力を memory-map して DataFrame を組み立てる（配列はコピーしない）"""
+    meta = json.loads((src / _META).read_text(encoding="utf-8"))
+    extras: Dict[str, pd.Series] = {}
+    if (src / _EXTRAS).exists():
+        with open(src / _EXTRAS, "rb") as f:
+            extras = pickle.load(f)
+    data: Dict[str, Any] = {}
+    for entry in meta["columns"]:
+        name = entry["name"]
+        if entry["kind"] == "category":
+            codes = np.load(src / entry["file"], mmap_mode="r")
+            dtype = pd.CategoricalDtype(pd.Index(entry["categories"], dtype=object))
+            data[name] = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+        elif entry["kind"] == "array":
+            data[name] = np.load(src / entry["file"], mmap_mode="r")
+        else:
+            data[name] = extras[name].to_numpy()
+    return pd.DataFrame(data, index=pd.RangeIndex(meta["rows"]), copy=False)
+
+
+class HistorySnapshotStore:
+    """バージョン付きスナップショットの公開とワーカー側のマップを管理する"""
+
+    def __init__(self, root: Path, ttl_sec: float = 600.0) -> None:
+        self.root = Path(root)
+        self.ttl_sec = ttl_sec
+        self._mapped: Optional[Tuple[str, pd.DataFrame]] = None
+        self._cond = threading.Condition(threading.Lock())
+        self._refreshing = False   # このプロセス内で再公開中のスレッドがいる
+        # hits: 公開済みをそのまま返した / stale: 再公開中の他スレッド・他プロセスを待たず古い版を返した / refreshes: 再公開した
+        self._stats = {"hits": 0, "stale": 0, "refreshes": 0}
+
+    # ── マニフェスト ─────────────────────────────────────────────
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self.root / _CURRENT).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def publish(self, df: pd.DataFrame, source: Optional[Dict[str, Any]] = None) -> str:
+        """新しいバージョンを書き出して CURRENT をアトミックに差し替え、バージョン名を返す"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        version = f"v{time.time_ns()}_{os.getpid()}"
+        tmp = self.root / f"{version}.tmp"
+        meta = write_snapshot(df, tmp, source)
+        os.replace(tmp, self.root / version)
+        manifest = {"version": version, "rows": meta["rows"], "source": meta["source"],
+                    "created_at": meta["created_at"]}
+        tmp_manifest = self.root / f"{_CURRENT}.{os.getpid()}.tmp"
+        tmp_manifest.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_manifest, self.root / _CURRENT)
+        self._gc(keep=version)
+        return version
+
+    def _gc(self, keep: str) -> None:
+        """古いバージョンを削除（直近 _KEEP_VERSIONS 個は残す。マップ中の削除は POSIX では安全）"""
+        versions = sorted(
+            (p for p in self.root.iterdir() if p.is_dir() and p.name.startswith("v")),
+            key=lambda p: p.name,   # v{time_ns}_{pid} は作成順に並ぶ
+        )
+        for p in versions[:-_KEEP_VERSIONS]:
+            if p.name != keep:
+                shutil.rmtree(p, ignore_errors=True)
+
+    # ── リーダー選出（プロセス間ファイルロック） ──────────────────────
+    def _acquire(self, blocking: bool) -> Optional[Any]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        fh = open(self.root / _LOCK, "a+")
+        if fcntl is None:
+            return fh
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return fh
+        except OSError:
+            fh.close()
+            return None
+
+    @staticmethod
+    def _release(fh: Any) -> None:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+    def _is_fresh(self, manifest: Optional[Dict[str, Any]], source: Dict[str, Any], ttl_sec: float) -> bool:
+        if not manifest:
+            return False
+        if manifest.get("source") == source:
+            return True
+        return (time.time() - float(manifest.get("created_at", 0))) < ttl_sec
+
+    # ── ワーカー側 ───────────────────────────────────────────────
+    def _map(self, manifest: Dict[str, Any]) -> pd.DataFrame:
+        version = manifest["version"]
+        mapped = self._mapped
+        if mapped is not None and mapped[0] == version:
+            return mapped[1]
+        df = read_snapshot(self.root / version)
+        self._mapped = (version, df)  # 参照の差し替えはアトミック
+        return df
+
+    def get(
+        self,
+        loader: Callable[[], pd.DataFrame],
+        source: Dict[str, Any],
+        updater: Optional[Callable[[pd.DataFrame, Dict[str, Any]], Optional[pd.DataFrame]]] = None,
+        ttl_sec: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """最新スナップショットを返す。古ければリーダーとして再公開する。
+
+        Args:
+            loader: DB から全履歴をロードする関数（リーダーのみ呼ぶ）
+            source: DB の状態シグネチャ（データバージョン / mtime 等）。一致すれば再利用
+            updater: (公開中の DataFrame, その source) → 差分適用後の DataFrame。
+                None を返した場合は loader で全件ロードする
+            ttl_sec: source 不一致でも再利用する猶予秒数（省略時はインスタンスの ttl_sec）
+        """
+        ttl = self.ttl_sec if ttl_sec is None else ttl_sec
+        # スレッドロックで守るのは鮮度判定とプロセス内のリーダー選出だけ。再公開は外で行い、
+        # 同じプロセスの他スレッドは公開済みの版があればそれ（古くても）で即応答する
+        with self._cond:
+            while True:
+                manifest = self.read_manifest()
+                if self._is_fresh(manifest, source, ttl):
+                    self._stats["hits"] += 1
+                    break
+                if not self._refreshing:
+                    self._refreshing = True
+                    manifest = None
+                    break
+                if manifest:
+                    self._stats["stale"] += 1
+                    break
+                self._cond.wait()   # 初回公開中で返せる版が無い
+        if manifest is not None:
+            return self._map(manifest)
+        try:
+            return self._refresh(loader, source, updater, ttl)
+        finally:
+            with self._cond:
+                self._refreshing = False
+                self._cond.notify_all()
+
+    def _refresh(
+        self,
+        loader: Callable[[], pd.DataFrame],
+        source: Dict[str, Any],
+        updater: Optional[Callable[[pd.DataFrame, Dict[str, Any]], Optional[pd.DataFrame]]],
+        ttl: float,
+    ) -> pd.DataFrame:
+        """プロセス内リーダーとして、プロセス間ロックを取って再公開する"""
+        # 既に公開済みのものがあれば、ロック競合時（他プロセスが再公開中）はそれで応答する
+        fallback = self.read_manifest()
+        fh = self._acquire(blocking=not fallback)
+        if fh is None:
+            with self._cond:
+                self._stats["stale"] += 1
+            return self._map(fallback)  # type: ignore[arg-type]
+        try:
+            manifest = self.read_manifest()   # 待機中に他プロセスが公開した可能性
+            if self._is_fresh(manifest, source, ttl):
+                with self._cond:
+                    self._stats["hits"] += 1
+                return self._map(manifest)  # type: ignore[arg-type]
+            with self._cond:
+                self._stats["refreshes"] += 1
+            df = None
+            if updater is not None and manifest:
+                df = updater(self._map(manifest), manifest.get("source") or {})
+            self.publish(loader() if df is None else df, source)
+            return self._map(self.read_manifest())  # type: ignore[arg-type]
+        finally:
+            self._release(fh)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "version": (self._mapped or (None,))[0], "refreshing": self._refreshing}
+
+
+def replace_races(base: pd.DataFrame, delta: pd.DataFrame, race_ids: Any) -> pd.DataFrame:
+    """base から race_ids の行を除き、delta（同 race_id の再ロード結果）を末尾に追加する"""
+    race_ids = {str(r) for r in race_ids}
+    if "race_id" in base.columns and race_ids:
+        base = base.loc[~base["race_id"].astype(object).isin(race_ids)]
+    if delta is None or delta.empty:
+        return base.reset_index(drop=True)
+    return pd.concat([base, delta], ignore_index=True)
+
+
+def db_signature(db_path: Path) -> Dict[str, Any]:
+    """DB ファイル（+ WAL）の mtime / size から状態シグネチャを作る"""
+    sig: Dict[str, Any] = {"path": str(db_path)}
+    for suffix in ("", "-wal"):
+        try:
+            st = os.stat(f"{db_path}{suffix}")
+            sig[f"mtime{suffix}"] = st.st_mtime_ns
+            sig[f"size{suffix}"] = st.st_size
+        except OSError:
+            pass
+    return sig
@@ -0,0 +1,155 @@
+"""
+イベントループ遅延モニタとブロッキング検出
+
+  1. 遅延計測: interval_sec ごとに asyncio.sleep し、予定時刻からの遅れ（= その間ループを
+     占有していたコールバックの影響）を keiba_event_loop_lag_seconds と直近サンプルの
+     リングバッファに記録する（percentiles() で p50 / p90 / p99 / max）
+  2. ブロッキング検出（開発用・block_ms > 0 のとき）: 監視スレッドがループの心拍を見張り、
+     block_ms を超えて心拍が止まったら、その時点のループスレッドのスタックを
+     ログに出して blocking_events に残す。検出中は心拍間隔を block_ms / 2 まで縮める
+  3. スレッドプール: 既定スレッドプール（asyncio.to_thread）と BLOCKING_IO_EXECUTOR の
+     待ち行列長・スレッド数を collector で gauge に入れる
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from app_config import logger  # type: ignore
+from services.blocking_io import BLOCKING_IO_EXECUTOR  # type: ignore
+from services.metrics import EXECUTOR_QUEUE, EXECUTOR_THREADS, LOOP_BLOCKED, LOOP_LAG, REGISTRY  # type: ignore
+
+_STACK_LIMIT = 30          # 報告するスタックの最大フレーム数
+_MAX_EVENTS = 50           # 保持するブロッキング検出の件数
+
+
+class LoopLagMonitor:
+    """イベントループ上で動く遅延計測タスクと、ブロッキング検出用の監視スレッド"""
+
+    def __init__(self, interval_sec: float = 0.5, window: int = 2400) -> None:
+        self.interval_sec = interval_sec
+        self.block_ms = 0.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.last_lag_sec = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.blocking_events: Deque[Dict[str, Any]] = deque(maxlen=_MAX_EVENTS)
+        self._task: Optional[asyncio.Task] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat = time.perf_counter()
+        self._open_event: Optional[Dict[str, Any]] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ── 遅延計測 ────────────────────────────────────────────────────
+    async def _run(self) -> None:
+        while True:
+            interval = min(self.interval_sec, self.block_ms / 2000.0) if self.block_ms > 0 else self.interval_sec
+            t0 = time.perf_counter()
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - t0 - interval)
+            self._heartbeat(now)
+            self.last_lag_sec = lag
+            self.samples.append(lag)
+            LOOP_LAG.observe(lag)
+
+    def _heartbeat(self, now: float) -> None:
+        self._beat = now
+        event, self._open_event = self._open_event, None
+        if event is not None:
+            event["blocked_ms"] = round((now - event["_started"]) * 1000.0, 1)
+            logger.warning(f"[loop] ブロッキング終了: {event['blocked_ms']:.0f} ms")
+
+    def percentiles(self) -> Dict[str, Any]:
+        """直近サンプルの遅延パーセンタイル（ミリ秒）"""
+        lags = np.fromiter(self.samples, dtype=float) * 1000.0
+        if not len(lags):
+            return {"samples": 0, "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+        p50, p90, p99 = np.percentile(lags, [50, 90, 99])
+        return {"samples": int(len(lags)), "p50_ms": round(float(p50), 3), "p90_ms": round(float(p90), 3),
+                "p99_ms": round(float(p99), 3), "max_ms": round(float(lags.max()), 3)}
+
+    # ── ブロッキング検出 ─────────────────────────────────────────────
+    def _watch(self) -> None:
+        threshold = self.block_ms / 1000.0
+        while not self._stop.wait(min(threshold / 4, 0.05)):
+            started = self._beat
+            blocked = time.perf_counter() - started
+            if blocked <= threshold or self._open_event is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id or -1)
+            stack = "".join(traceback.format_stack(frame, limit=_STACK_LIMIT)) if frame is not None else ""
+            if self._beat != started:           # スタック取得中に復帰した
+                continue
+            event = {"at": time.time(), "blocked_ms": round(blocked * 1000.0, 1), "stack": stack,
+                     "_started": started}
+            self._open_event = event
+            self.blocking_events.append(event)
+            LOOP_BLOCKED.inc()
+            logger.warning(f"[loop] イベントループが {blocked * 1000:.0f} ms 以上ブロック中:\n{stack}")
+
+    def events(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in e.items() if not k.startswith("_")} for e in list(self.blocking_events)]
+
+    # ── 起動・停止 ──────────────────────────────────────────────────
+    def start(self, block_ms: float = 0.0) -> None:
+        """実行中のループでタスクを開始する（lifespan から呼ぶ）。block_ms > 0 でブロッキング検出も開始"""
+        if self._task is None or self._task.done():
+            self.loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._beat = time.perf_counter()
+            self._task = self.loop.create_task(self._run(), name="loop-lag-monitor")
+        if block_ms > 0 and self._watchdog is None:
+            self.block_ms = float(block_ms)
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, daemon=True, name="loop-block-watchdog")
+            self._watchdog.start()
+            logger.info(f"[loop] ブロッキング検出を開始（閾値 {self.block_ms:.0f} ms）")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._stop.set()
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+            self.block_ms = 0.0
+
+    # ── スレッドプール ──────────────────────────────────────────────
+    def collect_executor(self) -> None:
+        """スレッドプールの待ち行列長・スレッド数を gauge に入れる（collector）"""
+        default = getattr(self.loop, "_default_executor", None) if self.loop is not None else None
+        for name, executor in (("default", default), ("blocking_io", BLOCKING_IO_EXECUTOR)):
+            queue = getattr(executor, "_work_queue", None)
+            EXECUTOR_QUEUE.set(queue.qsize() if queue is not None else 0, executor=name)
+            EXECUTOR_THREADS.set(len(getattr(executor, "_threads", ()) or ()), executor=name)
+
+    def status(self) -> Dict[str, Any]:
+        self.collect_executor()
+        return {
+            "lag": {"interval_sec": self.interval_sec, "last_ms": round(self.last_lag_sec * 1000.0, 3),
+                    **self.percentiles()},
+            "block_detector_ms": self.block_ms or None,
+            "blocking_events": self.events(),
+            "executors": {
+                name: {"queue": EXECUTOR_QUEUE.snapshot().get((name,), 0.0),
+                       "threads": EXECUTOR_THREADS.snapshot().get((name,), 0.0)}
+                for name in ("default", "blocking_io")
+            },
+        }
+
+
+LOOP_MONITOR = LoopLagMonitor()
+REGISTRY.register_collector(LOOP_MONITOR.collect_executor)
@@ -0,0 +1,437 @@
+"""
+Prometheus テキスト形式のメトリクス（counter / gauge / histogram）
+
+運用カウンタは fetch_pipeline._METRICS・TTLCache.stats()・各ジョブ dict に散らばっていて、
+スクレイプできず処理時間の分布も取れなかった。本モジュールは
+
+  1. プロセス内レジストリ（MetricsRegistry）と Counter / Gauge / Histogram
+     - ラベルはメトリクス作成時に名前を固定し、inc / set / observe にキーワードで渡す
+     - 外部で数えている累積値（TTLCache の hit 数など）は collector で Counter.set する
+  2. テキスト形式（version 0.0.4）への出力 render_text
+  3. 複数ワーカーの集約 SharedMetricsStore（共有ディレクトリの SQLite にワーカーごとの
+     スナップショットを書き、読み出し時に counter / histogram は合算、gauge は mode で集約）
+
+を提供する。prometheus_client には依存しない。各メトリクスはモジュール変数として定義し、
+計測箇所からは REGISTRY を意識せずに METRIC.inc(...) などで使う。
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from app_config import logger  # type: ignore
+except ImportError:
+    import logging
+    logger = logging.getLogger(__name__)
+
+# 秒単位の既定バケット（+Inf は自動で付く）
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ラベル {sorted(labels)} != {list(self.labelnames)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        with self._lock:
+            return {k: (list(v) if isinstance(v, list) else v) for k, v in self._values.items()}
+
+    def meta(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """単調増加カウンタ（名前は *_total にする）"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: Any) -> None:
+        """外部で数えている累積値を取り込む（collector 用）"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Gauge(_Metric):
+    """現在値。mode は複数ワーカー集約時の扱い（all: worker ラベル付きで全部 / sum / max）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), mode: str = "all") -> None:
+        super().__init__(name, help, labelnames)
+        if mode not in ("all", "sum", "max"):
+            raise ValueError(f"{name}: 不明な mode {mode}")
+        self.mode = mode
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def meta(self) -> Dict[str, Any]:
+        return {**super().meta(), "mode": self.mode}
+
+
+class Histogram(_Metric):
+    """累積バケットのヒストグラム。値は [bucket_0, ..., bucket_+Inf, sum, count]"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        bounds = sorted(float(b) for b in buckets if not math.isinf(b))
+        self.buckets: Tuple[float, ...] = tuple(bounds) + (math.inf,)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        n = len(self.buckets)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (n + 2)
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    state[i] += 1
+            state[n] += value
+            state[n + 1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def meta(self) -> Dict[str, Any]:
+        return {**super().meta(), "buckets": [b for b in self.buckets if not math.isinf(b)]}
+
+
+class MetricsRegistry:
+    """メトリクスと collector（収集直前に呼ぶ関数）の登録先"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _get_or_create(self, cls: type, name: str, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} は {metric.kind} として登録済みです")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), mode: str = "all") -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames, mode=mode)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, fn: Callable[[], None]) -> None:
+        with self._lock:
+            if fn not in self._collectors:
+                self._collectors.append(fn)
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """collector を実行してから {name: {**meta, "values": {labels: value}}} を返す"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for fn in collectors:
+            try:
+                fn()
+            except Exception as e:
+                logger.warning(f"[metrics] collector {getattr(fn, '__name__', fn)} 失敗: {e}")
+        return {m.name: {**m.meta(), "values": m.snapshot()} for m in metrics}
+
+
+# ── テキスト形式 ────────────────────────────────────────────────────────
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_text(families: Dict[str, Dict[str, Any]]) -> str:
+    """collect() / SharedMetricsStore.merge() の結果をテキスト形式にする"""
+    lines: List[str] = []
+    for name in sorted(families):
+        fam = families[name]
+        names = list(fam["labelnames"])
+        lines.append(f"# HELP {name} {fam['help'].replace(chr(92), chr(92) * 2).replace(chr(10), '  ')}")
+        lines.append(f"# TYPE {name} {fam['kind']}")
+        for key in sorted(fam["values"]):
+            value = fam["values"][key]
+            if fam["kind"] == "histogram":
+                bounds = list(fam["buckets"]) + [math.inf]
+                for le, count in zip(bounds, value):
+                    lines.append(f"{name}_bucket{_labels(names, key, ('le', _fmt(le)))} {_fmt(count)}")
+                lines.append(f"{name}_sum{_labels(names, key)} {_fmt(value[len(bounds)])}")
+                lines.append(f"{name}_count{_labels(names, key)} {_fmt(value[len(bounds) + 1])}")
+            else:
+                lines.append(f"{name}{_labels(names, key)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ── 複数ワーカーの集約 ──────────────────────────────────────────────────
+
+# 終了したワーカーの counter / histogram を畳み込む行の worker 列
+_RETIRED_WORKER = "retired"
+
+
+def _accumulate(kind: str, prev: Any, value: Any) -> Any:
+    """counter は和、histogram はバケットごとの和（バケット構成が変わっていたら新しい方）"""
+    if kind == "histogram":
+        return value if prev is None or len(prev) != len(value) else [a + b for a, b in zip(prev, value)]
+    return (prev or 0.0) + value
+
+
+class SharedMetricsStore:
+    """共有ディレクトリの SQLite にワーカーごとのスナップショットを置き、合算して読む
+
+    counter / histogram は終了したワーカーの値も残して合算する（再起動しても単調増加を保つ）。
+    gauge は stale_sec 以内に書き込んだワーカーだけを mode に従って集約する。
+
+    worker_id は起動ごとに一意（PID + 起動時刻）。PID が再利用されても前のワーカーの累積値を上書きしない。
+    retire_sec 以上書き込みの無いワーカーの counter / histogram は "retired" 行へ畳み込み、
+    行数が再起動のたびに増え続けないようにする。
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        worker_id: Optional[str] = None,
+        stale_sec: float = 60.0,
+        retire_sec: float = 3600.0,
+    ) -> None:
+        self.db_path = Path(directory) / "metrics.db"
+        self.worker_id = worker_id or f"{os.getpid()}-{int(time.time() * 1000)}"
+        self.stale_sec = stale_sec
+        self.retire_sec = retire_sec
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS metric_meta (
+                    name TEXT PRIMARY KEY, meta TEXT NOT NULL)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS metric_values (
+                    worker TEXT NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL,
+                    value TEXT NOT NULL, updated_at REAL NOT NULL,
+                    PRIMARY KEY (worker, name, labels))""")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def flush(self, families: Dict[str, Dict[str, Any]]) -> None:
+        """このワーカーの collect() 結果を書き込む"""
+        now = time.time()
+        meta_rows, value_rows = [], []
+        for name, fam in families.items():
+            meta_rows.append((name, json.dumps({k: v for k, v in fam.items() if k != "values"})))
+            for key, value in fam["values"].items():
+                value_rows.append((self.worker_id, name, json.dumps(list(key)), json.dumps(value), now))
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO metric_meta (name, meta) VALUES (?, ?)", meta_rows)
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO metric_values (worker, name, labels, value, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?)", value_rows)
+                    self._retire(conn, now)
+            finally:
+                conn.close()
+
+    def _retire(self, conn: sqlite3.Connection, now: float) -> None:
+        """retire_sec 以上書き込みの無いワーカーの行を "retired" 行へ畳み込む（gauge は捨てる）"""
+        stale = conn.execute(
+            "SELECT worker, name, labels, value FROM metric_values"
+            " WHERE updated_at < ? AND worker NOT IN (?, ?)",
+            (now - self.retire_sec, _RETIRED_WORKER, self.worker_id)).fetchall()
+        if not stale:
+            return
+        kinds = {n: json.loads(m)["kind"] for n, m in conn.execute("SELECT name, meta FROM metric_meta")}
+        retired = {
+            (name, labels): json.loads(value)
+            for name, labels, value in conn.execute(
+                "SELECT name, labels, value FROM metric_values WHERE worker = ?", (_RETIRED_WORKER,))
+        }
+        for _worker, name, labels, value in stale:
+            kind = kinds.get(name)
+            if kind in ("counter", "histogram"):
+                retired[(name, labels)] = _accumulate(kind, retired.get((name, labels)), json.loads(value))
+        conn.executemany(
+            "DELETE FROM metric_values WHERE worker = ? AND name = ? AND labels = ?",
+            [(worker, name, labels) for worker, name, labels, _value in stale])
+        conn.executemany(
+            "INSERT OR REPLACE INTO metric_values (worker, name, labels, value, updated_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [(_RETIRED_WORKER, name, labels, json.dumps(value), now) for (name, labels), value in retired.items()])
+
+    def merge(self) -> Dict[str, Dict[str, Any]]:
+        """全ワーカーの値を集約した collect() と同じ形の dict を返す"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                metas = {n: json.loads(m) for n, m in conn.execute("SELECT name, meta FROM metric_meta")}
+                rows = conn.execute("SELECT worker, name, labels, value, updated_at FROM metric_values").fetchall()
+            finally:
+                conn.close()
+        families = {n: {**m, "values": {}} for n, m in metas.items()}
+        cutoff = time.time() - self.stale_sec
+        for worker, name, labels, value, updated_at in rows:
+            fam = families.get(name)
+            if fam is None:
+                continue
+            key, value = tuple(json.loads(labels)), json.loads(value)
+            values = fam["values"]
+            if fam["kind"] in ("counter", "histogram"):
+                values[key] = _accumulate(fam["kind"], values.get(key), value)
+            elif updated_at >= cutoff:
+                mode = fam.get("mode", "all")
+                if mode == "sum":
+                    values[key] = values.get(key, 0.0) + value
+                elif mode == "max":
+                    values[key] = max(values.get(key, value), value)
+                else:
+                    values[key + (worker,)] = value
+        for fam in families.values():
+            if fam["kind"] == "gauge" and fam.get("mode", "all") == "all":
+                fam["labelnames"] = list(fam["labelnames"]) + ["worker"]
+        return families
+
+
+class MetricsFlusher:
+    """interval_sec ごとに REGISTRY.collect() を SharedMetricsStore へ書くデーモンスレッド"""
+
+    def __init__(self, store: SharedMetricsStore, registry: "MetricsRegistry", interval_sec: float = 10.0) -> None:
+        self.store = store
+        self.registry = registry
+        self.interval_sec = interval_sec
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="metrics-flusher")
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            self.flush()
+
+    def flush(self) -> None:
+        try:
+            self.store.flush(self.registry.collect())
+        except Exception as e:
+            logger.warning(f"[metrics] 共有ストアへの書き込み失敗: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.flush()
+
+
+REGISTRY = MetricsRegistry()
+
+# ── 共通メトリクス ──────────────────────────────────────────────────────
+FETCH_REQUESTS = REGISTRY.counter(
+    "keiba_fetch_requests_total", "ネットワーク取得のレスポンス数（ホスト・HTTP ステータス別）", ("host", "status"))
+FETCH_LATENCY = REGISTRY.histogram(
+    "keiba_fetch_latency_seconds", "ネットワーク取得 1 試行の所要時間（ホスト別）", ("host",))
+FETCH_EVENTS = REGISTRY.counter(
+    "keiba_fetch_events_total", "fetch_pipeline のイベント数（リトライ・タイムアウト・サーキット等）", ("event",))
+CACHE_REQUESTS = REGISTRY.counter(
+    "keiba_cache_requests_total", "キャッシュ参照数（result=hit / miss）", ("cache", "result"))
+CACHE_ENTRIES = REGISTRY.gauge(
+    "keiba_cache_entries", "キャッシュのエントリ数", ("cache",))
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "keiba_http_request_duration_seconds", "API リクエストの処理時間（ルート・ステータス別）",
+    ("method", "route", "status"))
+STAGE_DURATION = REGISTRY.histogram(
+    "keiba_stage_duration_seconds", "特徴量生成・optimizer・model.predict のステージ別処理時間",
+    ("kind", "stage"), buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+LOOP_LAG = REGISTRY.histogram(
+    "keiba_event_loop_lag_seconds", "イベントループの遅延（予定時刻からの遅れ）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_BLOCKED = REGISTRY.counter(
+    "keiba_event_loop_blocked_total", "ブロッキング検出（閾値超えでループが止まった回数・開発用）")
+EXECUTOR_QUEUE = REGISTRY.gauge(
+    "keiba_executor_queue_depth", "スレッドプールの待ち行列長（default: asyncio.to_thread / blocking_io）",
+    ("executor",))
+EXECUTOR_THREADS = REGISTRY.gauge(
+    "keiba_executor_threads", "スレッドプールのスレッド数", ("executor",))
+JOB_DURATION = REGISTRY.histogram(
+    "keiba_job_duration_seconds", "バックグラウンドジョブの所要時間（種類・終了状態別）", ("kind", "status"),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600))
+JOBS = REGISTRY.gauge(
+    "keiba_jobs", "メモリ上のジョブ数（種類・状態別）", ("kind", "status"), mode="sum")
@@ -0,0 +1,294 @@
+"""
+コンパクトなオッズ行列ストア（NumPy パック配列 + SQLite 永続化）
+
+realtime_odds の _fetch_* や keiba_ai.extract_odds.RealtimeOdds は
+オッズを {"1-2-3": 12.3} 形式の dict で返す。18 頭立ての三連単 4,896 通りを
+dict で持つと 1 レースで数百 KB になり、Harville エンジンに渡すたびに
+キー文字列のパースも走る。本モジュールでは
+
+  - 券種ごとに、馬番の組（着順なしは i<j<k の三角部分のみ）を
+    betting.combination.index_tuples と同じ順に並べた float32 の 1 次元配列で保持する
+    （未掲載は NaN。三連単 18 頭でも 19.6 KB）
+  - 取得時刻つきスナップショットとして SQLite に BLOB で保存する
+    （読み出しは np.frombuffer でコピーなし）
+  - まとめて持ち出す場合は np.savez（非圧縮）で 1 ファイルにする
+
+betting.combination.candidate_arrays は OddsMatrix.packed() をコピーせずに参照でき、
+odds_tensor() に OddsMatrix を渡せば従来どおりのテンソルも得られる。
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from contextlib import closing
+import time
+from dataclasses import dataclass
+from itertools import permutations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from betting.combination import _KIND_SPEC, _SPLIT_RE, index_tuples, odds_tensor  # type: ignore
+
+KINDS = tuple(_KIND_SPEC)
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS odds_snapshots (
+    race_id       TEXT NOT NULL,
+    kind          TEXT NOT NULL,
+    captured_at   REAL NOT NULL,
+    horse_numbers BLOB NOT NULL,
+    odds          BLOB NOT NULL,
+    PRIMARY KEY (race_id, kind, captured_at)
+)
+"""
+
+
+def _horse_numbers_from_keys(odds: Mapping[Any, Any]) -> np.ndarray:
+    nums: set = set()
+    for key in odds:
+        try:
+            nums.update(int(x) for x in _SPLIT_RE.split(str(key).strip()) if x)
+        except ValueError:
+            continue
+    return np.asarray(sorted(nums), dtype=np.int16)
+
+
+@dataclass(frozen=True)
+class OddsMatrix:
+    """1 レース・1 券種・1 時点のオッズ（values は index_tuples(n, kind) の並び）"""
+
+    race_id: str
+    kind: str
+    captured_at: float
+    horse_numbers: np.ndarray   # (n,) int16 昇順
+    values: np.ndarray          # (m,) float32、未掲載は NaN
+
+    @classmethod
+    def from_mapping(
+        cls,
+        race_id: str,
+        kind: str,
+        odds: Mapping[Any, Any],
+        horse_numbers: Optional[Sequence[int]] = None,
+        captured_at: Optional[float] = None,
+    ) -> "OddsMatrix":
+        """{"1-2": 12.3} / {"01,02": 12.3} / {3: 4.5} 形式の dict からパック配列を作る"""
+        nums = (
+            np.asarray(sorted(int(h) for h in horse_numbers), dtype=np.int16)
+            if horse_numbers is not None else _horse_numbers_from_keys(odds)
+        )
+        dense = odds_tensor(odds, nums, kind)
+        tuples = index_tuples(len(nums), kind)
+        values = dense[tuple(tuples.T)].astype(np.float32)
+        values.setflags(write=False)
+        nums.setflags(write=False)
+        return cls(str(race_id), kind, float(captured_at if captured_at is not None else time.time()),
+                   nums, values)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.values.nbytes + self.horse_numbers.nbytes)
+
+    def packed(self, horse_numbers: Optional[Sequence[int]] = None) -> np.ndarray:
+        """horse_numbers の並びに合わせたパック配列。馬番が一致すれば values をそのまま返す"""
+        if horse_numbers is None or np.array_equal(np.asarray(horse_numbers), self.horse_numbers):
+            return self.values
+        nums = np.asarray(horse_numbers, dtype=int)
+        dense = self.tensor(nums)
+        return dense[tuple(index_tuples(len(nums), self.kind).T)]
+
+    def tensor(self, horse_numbers: Optional[Sequence[int]] = None) -> np.ndarray:
+        """(n,)*size の密テンソル（float64、未掲載 NaN）。添字は horse_numbers の並び"""
+        size, ordered = _KIND_SPEC[self.kind]
+        target = self.horse_numbers if horse_numbers is None else np.asarray(horse_numbers, dtype=int)
+        pos = {int(h): i for i, h in enumerate(target)}
+        src_to_dst = np.asarray([pos.get(int(h), -1) for h in self.horse_numbers], dtype=int)
+        out = np.full((len(target),) * size, np.nan)
+        if len(self.horse_numbers) < size:
+            return out
+        idx = src_to_dst[index_tuples(len(self.horse_numbers), self.kind)]
+        keep = (idx >= 0).all(axis=1) & ~np.isnan(self.values)
+        idx, vals = idx[keep], self.values[keep].astype(float)
+        for perm in ([tuple(range(size))] if ordered else permutations(range(size))):
+            out[tuple(idx[:, list(perm)].T)] = vals
+        return out
+
+    def to_dict(self) -> Dict[str, float]:
+        """RealtimeOdds 互換の {"01,02": 12.3} 形式に戻す（未掲載は除く）"""
+        tuples = index_tuples(len(self.horse_numbers), self.kind)
+        nums = self.horse_numbers
+        return {
+            ",".join(f"{int(nums[i]):02d}" for i in t): round(float(v), 1)
+            for t, v in zip(tuples, self.values) if not np.isnan(v)
+        }
+
+
+class OddsStore:
+    """レース × 券種の最新 OddsMatrix をメモリに持ち、全スナップショットを SQLite に残す
+
+    SQLite を読み書きするメソッド（ingest / put / latest / snapshots）は同期 I/O なので、
+    async エンドポイントからは run_blocking 経由で呼ぶ。
+    """
+
+    def __init__(self, db_path: Optional[Path] = None, max_races: int = 200) -> None:
+        self.db_path = Path(db_path) if db_path is not None else None
+        self.max_races = max_races
+        self._latest: Dict[str, Dict[str, OddsMatrix]] = {}
+        self._lock = threading.Lock()
+        self._db_ready = False
+
+    # ── 書き込み ─────────────────────────────────────────────────
+    def put(self, matrix: OddsMatrix, persist: bool = True) -> OddsMatrix:
+        with self._lock:
+            race = self._latest.setdefault(matrix.race_id, {})
+            prev = race.get(matrix.kind)
+            if prev is None or prev.captured_at <= matrix.captured_at:
+                race[matrix.kind] = matrix
+            self._evict()
+        if persist and self.db_path is not None:
+            self._persist([matrix])
+        return matrix
+
+    def ingest(
+        self,
+        race_id: str,
+        odds_by_kind: Mapping[str, Mapping[Any, Any]],
+        captured_at: Optional[float] = None,
+        persist: bool = True,
+    ) -> Dict[str, OddsMatrix]:
+        """{"tansho": {...}, "umaren": {...}} をまとめて取り込む（空の券種は無視）。
+
+        単勝があればその馬番を全券種の馬番として使う（三連複の上位 50 組だけ等でも同じ並びになる）。
+        """
+        ts = float(captured_at if captured_at is not None else time.time())
+        tansho = odds_by_kind.get("tansho") or {}
+        nums = _horse_numbers_from_keys(tansho) if tansho else None
+        out: Dict[str, OddsMatrix] = {}
+        for kind, odds in odds_by_kind.items():
+            if kind not in _KIND_SPEC or not odds:
+                continue
+            kind_nums = nums if nums is not None and len(nums) else None
+            out[kind] = OddsMatrix.from_mapping(race_id, kind, odds, kind_nums, ts)
+        for m in out.values():
+            self.put(m, persist=False)
+        if persist and self.db_path is not None and out:
+            self._persist(list(out.values()))
+        return out
+
+    def ingest_realtime_odds(self, realtime_odds: Any, persist: bool = True) -> Dict[str, OddsMatrix]:
+        """keiba_ai.extract_odds.RealtimeOdds（extract_* 済み）を取り込む"""
+        return self.ingest(
+            realtime_odds.race_id,
+            {kind: getattr(realtime_odds, kind, None) or {} for kind in KINDS},
+            persist=persist,
+        )
+
+    def _evict(self) -> None:
+        if len(self._latest) <= self.max_races:
+            return
+        by_age = sorted(self._latest, key=lambda r: max(m.captured_at for m in self._latest[r].values()))
+        for race_id in by_age[: len(self._latest) - self.max_races]:
+            del self._latest[race_id]
+
+    # ── 読み出し ─────────────────────────────────────────────────
+    def latest(self, race_id: str, kind: str) -> Optional[OddsMatrix]:
+        m = self._latest.get(str(race_id), {}).get(kind)
+        if m is not None or self.db_path is None:
+            return m
+        snaps = self.snapshots(race_id, kind, limit=1)
+        return snaps[-1] if snaps else None
+
+    def combination_odds(self, race_id: str, kinds: Iterable[str] = KINDS) -> Dict[str, OddsMatrix]:
+        """analyze_and_recommend(combination_odds=...) に渡せる券種 → OddsMatrix"""
+        out = {}
+        for kind in kinds:
+            m = self.latest(race_id, kind)
+            if m is not None:
+                out[kind] = m
+        return out
+
+    def snapshots(self, race_id: str, kind: str, limit: Optional[int] = None) -> List[OddsMatrix]:
+        """SQLite に残っているスナップショットを取得時刻の昇順で返す（limit は新しい側から）"""
+        if self.db_path is None or not self.db_path.exists():
+            return []
+        sql = ("SELECT captured_at, horse_numbers, odds FROM odds_snapshots "
+               "WHERE race_id = ? AND kind = ? ORDER BY captured_at DESC")
+        params: List[Any] = [str(race_id), kind]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        try:
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                rows = conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        return [
+            OddsMatrix(str(race_id), kind, float(ts),
+                       np.frombuffer(nums, dtype=np.int16), np.frombuffer(vals, dtype=np.float32))
+            for ts, nums, vals in reversed(rows)
+        ]
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """メモリ上の最新行列のバイト数（レース別・合計）"""
+        with self._lock:
+            per_race = {
+                race_id: {kind: m.nbytes for kind, m in kinds.items()}
+                for race_id, kinds in self._latest.items()
+            }
+        totals = {race_id: sum(k.values()) for race_id, k in per_race.items()}
+        return {
+            "races": len(per_race),
+            "total_bytes": int(sum(totals.values())),
+            "per_race_bytes": totals,
+            "per_race_kind_bytes": per_race,
+        }
+
+    # ── 永続化 ───────────────────────────────────────────────────
+    def _persist(self, matrices: Sequence[OddsMatrix]) -> None:
+        assert self.db_path is not None
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            if not self._db_ready:
+                conn.execute(_DDL)
+                self._db_ready = True
+            conn.executemany(
+                "INSERT OR REPLACE INTO odds_snapshots VALUES (?, ?, ?, ?, ?)",
+                [
+                    (m.race_id, m.kind, m.captured_at,
+                     m.horse_numbers.astype(np.int16).tobytes(), m.values.astype(np.float32).tobytes())
+                    for m in matrices
+                ],
+            )
+
+    def save_npz(self, path: Path, race_ids: Optional[Iterable[str]] = None) -> Path:
+        """最新行列を 1 つの .npz（非圧縮）に書き出す"""
+        arrays: Dict[str, np.ndarray] = {}
+        wanted = set(map(str, race_ids)) if race_ids is not None else None
+        with self._lock:
+            for race_id, kinds in self._latest.items():
+                if wanted is not None and race_id not in wanted:
+                    continue
+                for kind, m in kinds.items():
+                    prefix = f"{race_id}/{kind}"
+                    arrays[f"{prefix}/horse_numbers"] = m.horse_numbers
+                    arrays[f"{prefix}/values"] = m.values
+                    arrays[f"{prefix}/captured_at"] = np.asarray(m.captured_at)
+        path = Path(path)
+        np.savez(path, **arrays)
+        return path if path.suffix == ".npz" else path.with_suffix(path.suffix + ".npz")
+
+    def load_npz(self, path: Path) -> int:
+        """save_npz の出力をメモリへ取り込み、取り込んだ行列数を返す"""
+        n = 0
+        with np.load(path) as z:
+            for key in z.files:
+                if not key.endswith("/values"):
+                    continue
+                race_id, kind, _ = key.split("/")
+                prefix = f"{race_id}/{kind}"
+                self.put(OddsMatrix(race_id, kind, float(z[f"{prefix}/captured_at"]),
+                                    z[f"{prefix}/horse_numbers"], z[key]), persist=False)
+                n += 1
+        return n
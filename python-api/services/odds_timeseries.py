@@ -0,0 +1,394 @@
+"""
+オッズ時系列レコーダー（差分符号化）とレイトマネー特徴量
+
+realtime_odds のキャッシュは 5 分で捨てられるため、締切直前のオッズの動き
+（いわゆるレイトマネー）を特徴量にできなかった。本モジュールでは
+
+  1. OddsRecorder が開催日の全レースについて、発走時刻まで一定間隔
+     （締切前 final_window_sec 秒間は final_interval_sec 間隔）で
+     単勝・複勝・馬連オッズを取得する。リクエストは 1 本ずつ直列に、
+     間に request_interval_sec（INV-07 と同じ 1 秒）を挟む
+  2. スナップショットはレース × 券種ごとに OddsSeries として保持し、
+     オッズを 0.1 刻みの整数にした上で「先頭行 + 行間差分」を zlib で圧縮して
+     odds_series テーブルへ 1 行で保存する（変化しない馬はほぼ 0 バイト）
+  3. drift_features / odds_drift_frame が直近 N 分の変化率・ボラティリティ・
+     人気順位の変化をレース単位の配列演算で計算し、
+     add_derived_features(odds_drift_df=...) に渡せる DataFrame を返す
+"""
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.blocking_io import run_blocking  # type: ignore
+from services.odds_store import OddsMatrix  # type: ignore
+
+SERIES_KINDS = ("tansho", "fukusho", "umaren")
+DRIFT_WINDOWS_MIN = (5, 15)
+
+_SCALE = 10          # オッズは 0.1 刻み
+_MISSING = -1
+_HEADER = struct.Struct("<II")
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS odds_series (
+    race_id          TEXT NOT NULL,
+    kind             TEXT NOT NULL,
+    horse_numbers    BLOB NOT NULL,
+    n_snapshots      INTEGER NOT NULL,
+    last_captured_at REAL NOT NULL,
+    payload          BLOB NOT NULL,
+    PRIMARY KEY (race_id, kind)
+)
+"""
+
+
+# ── 差分符号化 ─────────────────────────────────────────────────────
+
+def encode_series(times: np.ndarray, values: np.ndarray) -> bytes:
+    """(T,) 秒と (T, m) オッズを「時刻差分 int64 + 整数オッズ差分 int32」→ zlib に圧縮する"""
+    values = np.asarray(values, dtype=float).reshape(len(times), -1)
+    q = np.where(np.isnan(values), _MISSING, np.rint(values * _SCALE)).astype(np.int32)
+    dq = np.diff(q, axis=0, prepend=np.zeros((1, q.shape[1]), dtype=np.int32))
+    dt = np.diff(np.rint(np.asarray(times, dtype=float)).astype(np.int64), prepend=0)
+    raw = _HEADER.pack(*q.shape) + dt.tobytes() + dq.tobytes()
+    return zlib.compress(raw, 6)
+
+
+def decode_series(payload: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """encode_series の逆変換。(times float64 (T,), values float32 (T, m)、欠損 NaN)"""
+    raw = zlib.decompress(payload)
+    t, m = _HEADER.unpack_from(raw)
+    off = _HEADER.size
+    times = np.cumsum(np.frombuffer(raw, dtype=np.int64, count=t, offset=off)).astype(float)
+    dq = np.frombuffer(raw, dtype=np.int32, count=t * m, offset=off + 8 * t).reshape(t, m)
+    q = np.cumsum(dq, axis=0, dtype=np.int64)
+    values = np.where(q == _MISSING, np.nan, q / _SCALE).astype(np.float32)
+    return times, values
+
+
+@dataclass
+class OddsSeries:
+    """1 レース・1 券種のスナップショット列（列の並びは最初の取得時の馬番で固定）"""
+
+    race_id: str
+    kind: str
+    horse_numbers: np.ndarray
+    times: List[float] = field(default_factory=list)
+    rows: List[np.ndarray] = field(default_factory=list)
+
+    def append(self, matrix: OddsMatrix) -> None:
+        if self.times and matrix.captured_at <= self.times[-1]:
+            return
+        self.times.append(float(matrix.captured_at))
+        self.rows.append(np.asarray(matrix.packed(self.horse_numbers), dtype=np.float32))
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        m = len(self.rows[0]) if self.rows else 0
+        return np.asarray(self.times), (np.vstack(self.rows) if self.rows else np.empty((0, m), np.float32))
+
+    def encode(self) -> bytes:
+        return encode_series(*self.arrays())
+
+
+# ── ドリフト特徴量 ───────────────────────────────────────────────────
+
+def _rank(odds: np.ndarray) -> np.ndarray:
+    """オッズ昇順の順位（1 始まり、欠損は最下位）"""
+    filled = np.where(np.isnan(odds), np.inf, odds)
+    return np.argsort(np.argsort(filled, kind="stable"), kind="stable") + 1.0
+
+
+def drift_features(
+    times: np.ndarray,
+    values: np.ndarray,
+    as_of: Optional[float] = None,
+    windows_min: Sequence[int] = DRIFT_WINDOWS_MIN,
+) -> Dict[str, np.ndarray]:
+    """(T,) 時刻と (T, n) 単勝系オッズから馬ごとのドリフト特徴量を計算する。
+
+    odds_drift_{w}m       : log(最新 / w 分前) — 負ならオッズ低下（資金流入）
+    odds_share_change_{w}m: 正規化暗黙確率の変化（最新 - w 分前）
+    odds_rank_change_{w}m : 人気順位の上昇幅（w 分前の順位 - 最新の順位）
+    odds_volatility       : 最大窓内の対数リターンの標準偏差
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if as_of is not None:
+        keep = times <= as_of
+        times, values = times[keep], values[keep]
+    n = values.shape[1] if values.ndim == 2 else 0
+    out: Dict[str, np.ndarray] = {}
+    if len(times) == 0:
+        for w in windows_min:
+            for name in ("odds_drift", "odds_share_change", "odds_rank_change"):
+                out[f"{name}_{w}m"] = np.full(n, np.nan)
+        out["odds_volatility"] = np.full(n, np.nan)
+        return out
+
+    now = times[-1]
+    last = values[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_v = np.log(np.where(values > 0, values, np.nan))
+        implied = np.where(values > 0, 1.0 / values, 0.0)
+        share = implied / implied.sum(axis=1, keepdims=True)
+    rank_last = _rank(last)
+    for w in windows_min:
+        # w 分前以前で最も新しいスナップショット（無ければ先頭）
+        ref = max(int(np.searchsorted(times, now - w * 60, side="right")) - 1, 0)
+        out[f"odds_drift_{w}m"] = log_v[-1] - log_v[ref]
+        out[f"odds_share_change_{w}m"] = share[-1] - share[ref]
+        out[f"odds_rank_change_{w}m"] = np.where(np.isnan(last), np.nan, _rank(values[ref]) - rank_last)
+    start = max(int(np.searchsorted(times, now - max(windows_min) * 60, side="left")), 0)
+    returns = np.diff(log_v[start:], axis=0)
+    if len(returns) >= 2:
+        with np.errstate(invalid="ignore"):
+            out["odds_volatility"] = np.nanstd(returns, axis=0, ddof=1)
+    else:
+        out["odds_volatility"] = np.full(n, np.nan)
+    return out
+
+
+def odds_drift_frame(
+    series: Iterable[OddsSeries],
+    as_of: Optional[float] = None,
+    windows_min: Sequence[int] = DRIFT_WINDOWS_MIN,
+) -> pd.DataFrame:
+    """単勝（+ 複勝）の OddsSeries から add_derived_features に渡す DataFrame を作る。
+
+    列: race_id, horse_number, odds_drift_{w}m, odds_share_change_{w}m,
+        odds_rank_change_{w}m, odds_volatility, place_odds_drift_{w}m, odds_snapshot_count
+    """
+    by_race: Dict[str, Dict[str, OddsSeries]] = {}
+    for s in series:
+        by_race.setdefault(s.race_id, {})[s.kind] = s
+    frames: List[pd.DataFrame] = []
+    for race_id, kinds in by_race.items():
+        win = kinds.get("tansho")
+        if win is None or not win.times:
+            continue
+        times, values = win.arrays()
+        feats = drift_features(times, values, as_of, windows_min)
+        frame = pd.DataFrame({"race_id": race_id, "horse_number": win.horse_numbers.astype(int), **feats})
+        frame["odds_snapshot_count"] = int((times <= as_of).sum()) if as_of is not None else len(times)
+        place = kinds.get("fukusho")
+        if place is not None and place.times:
+            pt, pv = place.arrays()
+            pf = drift_features(pt, pv, as_of, windows_min)
+            pos = {int(h): i for i, h in enumerate(place.horse_numbers)}
+            idx = np.asarray([pos.get(int(h), -1) for h in win.horse_numbers])
+            for w in windows_min:
+                col = pf[f"odds_drift_{w}m"]
+                frame[f"place_odds_drift_{w}m"] = np.where(idx >= 0, col[np.maximum(idx, 0)], np.nan)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["race_id", "horse_number"])
+    return pd.concat(frames, ignore_index=True)
+
+
+# ── レコーダー ─────────────────────────────────────────────────────
+
+class OddsRecorder:
+    """開催日のレースを発走時刻までポーリングし、オッズ時系列を蓄積する
+
+    取得以外（系列への追記・SQLite 書き込み・on_snapshot）は run_blocking のスレッドで行う。
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Mapping[str, Mapping[Any, Any]]]],
+        db_path: Optional[Path] = None,
+        interval_sec: float = 300.0,
+        final_interval_sec: float = 60.0,
+        final_window_sec: float = 900.0,
+        request_interval_sec: float = 1.0,
+        kinds: Sequence[str] = SERIES_KINDS,
+        on_snapshot: Optional[Callable[[str, Mapping[str, Mapping[Any, Any]], float], None]] = None,
+    ) -> None:
+        self.fetch = fetch
+        self.db_path = Path(db_path) if db_path is not None else None
+        self.interval_sec = interval_sec
+        self.final_interval_sec = final_interval_sec
+        self.final_window_sec = final_window_sec
+        self.request_interval_sec = request_interval_sec
+        self.kinds = tuple(kinds)
+        self.on_snapshot = on_snapshot
+        self.series: Dict[Tuple[str, str], OddsSeries] = {}
+        self._post_times: Dict[str, float] = {}
+        self._next_due: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._db_ready = False
+
+    # ── スケジュール ─────────────────────────────────────────────
+    def add_races(self, post_times: Mapping[str, float], now: Optional[float] = None) -> None:
+        """{race_id: 発走時刻 (epoch 秒)} を登録する（発走済みは無視）"""
+        now = time.time() if now is None else now
+        for race_id, post in post_times.items():
+            if post > now:
+                self._post_times[str(race_id)] = float(post)
+                self._next_due.setdefault(str(race_id), now)
+
+    def pending(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        return [r for r, post in self._post_times.items() if post > now]
+
+    def _interval(self, race_id: str, now: float) -> float:
+        remaining = self._post_times[race_id] - now
+        return self.final_interval_sec if remaining <= self.final_window_sec else self.interval_sec
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        return sorted(
+            (r for r in self.pending(now) if self._next_due.get(r, now) <= now),
+            key=lambda r: self._post_times[r],
+        )
+
+    # ── 取得と記録 ───────────────────────────────────────────────
+    def record(self, race_id: str, odds_by_kind: Mapping[str, Mapping[Any, Any]], captured_at: float) -> int:
+        """1 時点分のオッズを追記して永続化し、追記した券種数を返す"""
+        race_id = str(race_id)
+        tansho = odds_by_kind.get("tansho") or {}
+        nums = sorted({int(k) for k in tansho}) if tansho else None
+        touched: List[OddsSeries] = []
+        with self._lock:
+            for kind in self.kinds:
+                odds = odds_by_kind.get(kind)
+                if not odds:
+                    continue
+                m = OddsMatrix.from_mapping(race_id, kind, odds, nums, captured_at)
+                s = self.series.get((race_id, kind))
+                if s is None:
+                    s = self.series[(race_id, kind)] = OddsSeries(race_id, kind, m.horse_numbers)
+                s.append(m)
+                touched.append(s)
+            # 行はロック内で作る（ワーカースレッドから呼ばれても追記途中の系列を書かない）
+            rows = [
+                (s.race_id, s.kind, s.horse_numbers.astype(np.int16).tobytes(), len(s.times), s.times[-1],
+                 s.encode())
+                for s in touched
+            ]
+        if rows and self.db_path is not None:
+            self._persist(rows)
+        return len(touched)
+
+    def _record_snapshot(self, race_id: str, odds: Mapping[str, Mapping[Any, Any]], captured_at: float) -> int:
+        n = self.record(race_id, odds, captured_at)
+        if n and self.on_snapshot is not None:
+            self.on_snapshot(race_id, odds, captured_at)
+        return n
+
+    async def tick(self, now: Optional[float] = None) -> int:
+        """期限の来たレースを 1 本ずつ取得する。取得したレース数を返す"""
+        count = 0
+        for i, race_id in enumerate(self.due(now)):
+            if i:
+                await asyncio.sleep(self.request_interval_sec)
+            ts = time.time() if now is None else now
+            try:
+                odds = await self.fetch(race_id)
+            except Exception:
+                odds = {}
+            self._next_due[race_id] = ts + self._interval(race_id, ts)
+            # 系列の圧縮・SQLite 書き込み・on_snapshot はイベントループの外で行う
+            if odds and await run_blocking(self._record_snapshot, race_id, odds, ts):
+                count += 1
+        return count
+
+    async def run(self) -> None:
+        while self.pending():
+            await self.tick()
+            now = time.time()
+            upcoming = [self._next_due[r] for r in self.pending(now)]
+            if upcoming:
+                await asyncio.sleep(max(1.0, min(upcoming) - now))
+
+    def start(self) -> bool:
+        if self._task is not None and not self._task.done():
+            return False
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return True
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ── 永続化 ───────────────────────────────────────────────────
+    def _persist(self, rows: Sequence[Tuple[Any, ...]]) -> None:
+        assert self.db_path is not None
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            if not self._db_ready:
+                conn.execute(_DDL)
+                self._db_ready = True
+            conn.executemany("INSERT OR REPLACE INTO odds_series VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def load(self, race_ids: Iterable[str]) -> List[OddsSeries]:
+        """SQLite から時系列を復元する（メモリにあればそちらを使う）
+
+        SQLite の読み出しと復号を伴うので、async エンドポイントからは run_blocking 経由で呼ぶ。
+        """
+        wanted = [str(r) for r in race_ids]
+        with self._lock:
+            found = [s for s in self.series.values() if s.race_id in wanted]
+        missing = [r for r in wanted if not any(s.race_id == r for s in found)]
+        if not missing or self.db_path is None or not self.db_path.exists():
+            return found
+        marks = ",".join("?" * len(missing))
+        try:
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                rows = conn.execute(
+                    f"SELECT race_id, kind, horse_numbers, payload FROM odds_series WHERE race_id IN ({marks})",
+                    missing,
+                ).fetchall()
+        except sqlite3.OperationalError:
+            return found
+        for race_id, kind, nums, payload in rows:
+            times, values = decode_series(payload)
+            found.append(OddsSeries(race_id, kind, np.frombuffer(nums, dtype=np.int16),
+                                    list(times), list(values)))
+        return found
+
+    def features(self, race_ids: Iterable[str], as_of: Optional[float] = None) -> pd.DataFrame:
+        series = self.load(race_ids)
+        with self._lock:                  # record が別スレッドで追記中の系列を読まない
+            return odds_drift_frame(series, as_of)
+
+    def disk_usage(self, race_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """odds_series に保存された圧縮後バイト数（race_ids で開催日のレースに絞れる）"""
+        empty: Dict[str, Any] = {"races": 0, "snapshots": 0, "payload_bytes": 0, "per_race_bytes": {}}
+        if self.db_path is None or not self.db_path.exists():
+            return empty
+        sql = ("SELECT race_id, SUM(n_snapshots), SUM(LENGTH(payload) + LENGTH(horse_numbers)) "
+               "FROM odds_series")
+        params: List[str] = []
+        if race_ids is not None:
+            params = [str(r) for r in race_ids]
+            sql += f" WHERE race_id IN ({','.join('?' * len(params))})"
+        try:
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                rows = conn.execute(sql + " GROUP BY race_id", params).fetchall()
+        except sqlite3.OperationalError:
+            return empty
+        return {
+            "races": len(rows),
+            "snapshots": int(sum(r[1] for r in rows)),
+            "payload_bytes": int(sum(r[2] for r in rows)),
+            "per_race_bytes": {r[0]: int(r[2]) for r in rows},
+        }
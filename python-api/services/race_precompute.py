@@ -0,0 +1,186 @@
+"""
+発走前の出馬表一括予測（プリコンピュート）
+
+analyze_race は最初のリクエストで出馬表スクレイプ・履歴ロード・特徴量・推論を
+行うため、1 人目のユーザーは最大 60 秒待たされていた。本モジュールでは
+
+  1. 当日の出馬表が揃った時点で全レースを直列に予測し（INV-07 の 1 秒間隔）、
+     (race_id, モデル) をキーに PrecomputedPredictions へ発走まで保持する
+  2. 新しいオッズスナップショットが来たとき、市場特徴量を使わないモデルは再推論せず
+     オッズ依存部分（odds / popularity / expected_value）だけを rescore_prediction で差し替える。
+     市場特徴量（implied_prob など）を使うモデルは確率自体が変わるため、ミス扱いにして
+     ModelPredictor.score_race（構築済み特徴量の市場レイヤーだけ再計算）に回す
+  3. analyze_race はまずここを引き、ミスした場合だけ従来のライブ経路に落ちる
+
+買い目推奨（bankroll / risk_mode 依存）は従来どおりリクエストごとに計算する。
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from app_config import logger  # type: ignore
+from services.ttl_cache import SQLiteCacheTier, TTLCache  # type: ignore
+
+
+def rescore_prediction(prediction: Dict[str, Any], odds: Mapping[int, float], odds_version: str) -> Dict[str, Any]:
+    """単勝オッズだけを差し替えた予測を返す（モデルのスコアはそのまま・元の dict は変更しない）
+
+    スコアがオッズに依存しないモデル（prediction["market_features"] が False）専用。
+    """
+    preds = [dict(p) for p in prediction.get("predictions") or []]
+    for p in preds:
+        o = odds.get(int(p.get("horse_number") or 0))
+        if o is not None and o > 0:
+            p["odds"] = float(o)
+        if p.get("odds") is not None and p.get("p_norm") is not None:
+            p["expected_value"] = float(p["p_norm"]) * float(p["odds"])
+    # 人気は全馬のオッズが揃っている場合だけオッズ順で付け直す（同オッズは同順位 = ライブ経路の rank(method="min")）
+    if preds and all(p.get("odds") for p in preds):
+        ranks = pd.Series([float(p["odds"]) for p in preds]).rank(method="min")
+        for p, rank in zip(preds, ranks):
+            p["popularity"] = int(rank)
+    return {**prediction, "predictions": preds, "odds_version": odds_version}
+
+
+class PrecomputedPredictions:
+    """(race_id, モデル) → レース単位の予測。オッズ版が進んでいれば読み出し時に再スコアする
+
+    市場特徴量を使うモデルの予測（market_features が True または不明）はオッズ版が進むと
+    None を返し、呼び出し側に再推論させる。
+
+    get / put / in はメモリ層だけを見る。ワーカー間共有の第 2 層（shared_db）も使う場合は
+    イベントループから aget / aput / acontains を呼ぶ（SQLite I/O は keiba-io スレッドで行う）。
+    """
+
+    def __init__(self, ttl_sec: float = 18 * 3600, max_entries: int = 1000,
+                 shared_db: Optional[Path] = None) -> None:
+        self._cache = TTLCache(
+            "precomputed_predictions",
+            max_entries=max_entries,
+            ttl_sec=ttl_sec,
+            second_tier=SQLiteCacheTier(shared_db, "precomputed_predictions") if shared_db else None,
+        )
+        self._rescored = 0
+        self._stale = 0
+
+    @staticmethod
+    def _key(race_id: str, model_key: str) -> str:
+        return f"{race_id}:{model_key}"
+
+    def put(self, race_id: str, model_key: str, prediction: Dict[str, Any]) -> None:
+        self._cache.set(self._key(race_id, model_key), prediction)
+
+    async def aput(self, race_id: str, model_key: str, prediction: Dict[str, Any]) -> None:
+        await self._cache.aset(self._key(race_id, model_key), prediction)
+
+    def get(
+        self,
+        race_id: str,
+        model_key: str,
+        odds_version: str = "none",
+        odds: Optional[Mapping[int, float]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        key = self._key(race_id, model_key)
+        pred, rescored = self._refresh(self._cache.get(key), odds_version, odds)
+        if rescored:
+            self._cache.set(key, pred)
+        return pred
+
+    async def aget(
+        self,
+        race_id: str,
+        model_key: str,
+        odds_version: str = "none",
+        odds: Optional[Mapping[int, float]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        key = self._key(race_id, model_key)
+        pred, rescored = self._refresh(await self._cache.aget(key), odds_version, odds)
+        if rescored:
+            await self._cache.aset(key, pred)
+        return pred
+
+    def _refresh(
+        self, pred: Optional[Dict[str, Any]], odds_version: str, odds: Optional[Mapping[int, float]],
+    ) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """(返す予測, 再スコアしたか)。オッズ版が進んだ市場特徴量モデルの予測は None（再推論させる）"""
+        if pred is None or not odds or pred.get("odds_version") == odds_version:
+            return pred, False
+        if pred.get("market_features", True):
+            self._stale += 1
+            return None, False
+        self._rescored += 1
+        return rescore_prediction(pred, odds, odds_version), True
+
+    def __contains__(self, key: Any) -> bool:
+        race_id, model_key = key
+        return self._key(race_id, model_key) in self._cache
+
+    async def acontains(self, race_id: str, model_key: str) -> bool:
+        return await self._cache.aget_entry(self._key(race_id, model_key), count=False) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "rescored": self._rescored, "stale": self._stale}
+
+
+@dataclass
+class PrecomputeRun:
+    """1 回のプリコンピュート実行の進捗"""
+
+    race_ids: List[str]
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": len(self.race_ids),
+            "done": len(self.done),
+            "skipped": len(self.skipped),
+            "failed": self.failed,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "running": self.finished_at is None,
+        }
+
+
+async def precompute_races(
+    race_ids: Sequence[str],
+    predict: Callable[[str], Awaitable[Any]],
+    is_cached: Optional[Callable[[str], "bool | Awaitable[bool]"]] = None,
+    request_interval_sec: float = 1.0,
+    run: Optional[PrecomputeRun] = None,
+) -> PrecomputeRun:
+    """race_ids を 1 レースずつ predict する（スクレイプを伴うため直列・間隔を空ける）
+
+    is_cached(race_id) が True のレースは飛ばす。1 レースの失敗で全体は止めない。
+    """
+    run = run or PrecomputeRun(race_ids=list(race_ids))
+    for i, race_id in enumerate(race_ids):
+        cached = is_cached(race_id) if is_cached is not None else False
+        if inspect.isawaitable(cached):
+            cached = await cached
+        if cached:
+            run.skipped.append(race_id)
+            continue
+        t0 = time.perf_counter()
+        try:
+            await predict(race_id)
+            run.done.append(race_id)
+            logger.info(f"[precompute] {race_id}: {time.perf_counter() - t0:.1f}s")
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            run.failed[race_id] = str(detail)
+            logger.warning(f"[precompute] {race_id}: 失敗 {detail}")
+        if request_interval_sec > 0 and i < len(race_ids) - 1:
+            await asyncio.sleep(request_interval_sec)  # INV-07 スクレイピングインターバル
+    run.finished_at = time.time()
+    return run
@@ -0,0 +1,80 @@
+"""
+ステージ別処理時間のヒストグラム集計（keiba_ai.stage_profiler のトレースを蓄積する）
+
+/api/analyze_race（kind="analyze"）と学習ジョブ（kind="train"）で記録した StageTrace を
+(kind, ステージ名) ごとの累積バケットに積み上げる。バケット境界は Prometheus の
+histogram と同じく「上限以下の件数（le）」で、/api/profiling/stages でそのまま返す。
+同じ値は /metrics の keiba_stage_duration_seconds（秒単位）にも記録する。
+"""
+from __future__ import annotations
+
+import math
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from services.metrics import STAGE_DURATION  # type: ignore
+
+# バケット上限（ミリ秒）。最後は +Inf
+STAGE_BUCKETS_MS: Tuple[float, ...] = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, math.inf,
+)
+
+
+class StageHistograms:
+    """(kind, ステージ名) → 処理時間ヒストグラム。observe / snapshot はスレッドセーフ"""
+
+    def __init__(self, buckets_ms: Iterable[float] = STAGE_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        if not self.buckets_ms or self.buckets_ms[-1] != math.inf:
+            self.buckets_ms += (math.inf,)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _observe_one(self, kind: str, name: str, ms: float) -> None:
+        s = self._series.get((kind, name))
+        if s is None:
+            s = self._series[(kind, name)] = {
+                "count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * len(self.buckets_ms),
+            }
+        s["count"] += 1
+        s["sum_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+        for i, le in enumerate(self.buckets_ms):
+            if ms <= le:
+                s["buckets"][i] += 1      # 累積バケット: 上限以上のバケットすべてに数える
+
+    def observe(self, kind: str, trace: Any) -> None:
+        """StageTrace（または to_dict() の結果）の各ステージと合計時間（"total"）を記録する"""
+        data = trace.to_dict() if hasattr(trace, "to_dict") else trace
+        if not data:
+            return
+        with self._lock:
+            for st in data.get("stages") or []:
+                if st.get("wall_ms") is not None:
+                    self._observe_one(kind, st["name"], float(st["wall_ms"]))
+                    STAGE_DURATION.observe(float(st["wall_ms"]) / 1000.0, kind=kind, stage=st["name"])
+            if data.get("total_ms") is not None:
+                self._observe_one(kind, "total", float(data["total_ms"]))
+                STAGE_DURATION.observe(float(data["total_ms"]) / 1000.0, kind=kind, stage="total")
+
+    def snapshot(self, kind: Optional[str] = None) -> Dict[str, Any]:
+        """{"buckets_ms": [...], "stages": {kind: {name: {count, sum_ms, mean_ms, max_ms, buckets}}}}"""
+        with self._lock:
+            items = [(k, dict(v, buckets=list(v["buckets"]))) for k, v in self._series.items()
+                     if kind is None or k[0] == kind]
+        stages: Dict[str, Dict[str, Any]] = {}
+        for (k, name), s in sorted(items):
+            s["sum_ms"] = round(s["sum_ms"], 3)
+            s["mean_ms"] = round(s["sum_ms"] / s["count"], 3) if s["count"] else None
+            stages.setdefault(k, {})[name] = s
+        return {
+            "buckets_ms": ["+Inf" if math.isinf(b) else b for b in self.buckets_ms],
+            "stages": stages,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+STAGE_HISTOGRAMS = StageHistograms()
@@ -0,0 +1,383 @@
+"""
+容量・TTL 付き LRU キャッシュ（analyze_race / リアルタイムオッズ共通）
+
+従来の _ANALYZE_CACHE / _ODDS_CACHE は素の dict で、上限超過のたびに全キーを
+タイムスタンプでソートして古いものを消していた（挿入 O(n log n)）。期限切れの
+エントリも上限に達するまで残り、スレッドセーフでもなくワーカー間でも共有されない。
+TTLCache は
+
+  1. OrderedDict による O(1) の LRU（参照で末尾へ移動・先頭から追い出し）
+  2. エントリごとの期限。期限切れは参照時に破棄し、書き込み時には期限順ヒープから
+     まとめて回収する（上限に達するまで溜まらない）
+  3. エントリ数と概算バイト数の両方の上限
+  4. get_or_compute による同一キーの single-flight（同時ミスでも計算は 1 回）
+  5. hit / miss / eviction / expiration のカウンタ
+  6. 任意の第 2 層 SQLiteCacheTier（同一ホストのワーカー間で JSON 値を共有）
+
+を提供する。ロックは threading.RLock で、to_thread から触っても安全。
+同期 API（get / set / delete / clear）はメモリ層だけを触る。第 2 層の SQLite 読み書きと
+JSON 変換はイベントループを止めないよう、非同期 API（aget / aset / adelete / aclear と
+get_or_compute）から services.blocking_io.run_blocking で実行する。
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from app_config import logger  # type: ignore
+from services.blocking_io import run_blocking  # type: ignore
+
+_MISSING = object()
+
+
+def approx_nbytes(obj: Any, _depth: int = 0) -> int:
+    """値の概算メモリサイズ（dict / list を再帰的にたどる。numpy / pandas は nbytes）"""
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    memory_usage = getattr(obj, "memory_usage", None)
+    if memory_usage is not None and hasattr(obj, "columns"):
+        try:
+            return int(memory_usage(deep=False).sum())
+        except Exception:
+            pass
+    size = sys.getsizeof(obj)
+    if _depth >= 6:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approx_nbytes(k, _depth + 1) + approx_nbytes(v, _depth + 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approx_nbytes(v, _depth + 1) for v in obj)
+    return size
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    stored_at: float
+    expires_at: float
+    nbytes: int
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class SQLiteCacheTier:
+    """ワーカー間共有用の第 2 層（キー → JSON 値 + 期限）。値は JSON 化できるものに限る"""
+
+    _DDL = """
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace  TEXT NOT NULL,
+        key        TEXT NOT NULL,
+        stored_at  REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        value      TEXT NOT NULL,
+        PRIMARY KEY (namespace, key)
+    )
+    """
+
+    def __init__(self, db_path: Path, namespace: str) -> None:
+        self.db_path = Path(db_path)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(self._DDL)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=5.0)
+
+    def get(self, key: str) -> Optional[Tuple[Any, float, float]]:
+        """(value, stored_at, expires_at) または None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, stored_at, expires_at FROM cache_entries WHERE namespace=? AND key=?",
+                (self.namespace, key),
+            ).fetchone()
+        if row is None or row[2] <= time.time():
+            return None
+        return json.loads(row[0]), float(row[1]), float(row[2])
+
+    def set(self, key: str, value: Any, stored_at: float, expires_at: float) -> None:
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, stored_at, expires_at, value) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, stored_at, expires_at, payload),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:   # 期限切れ行の回収は書き込み 100 回に 1 回
+                conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, key: Optional[str] = None) -> None:
+        with self._lock, self._connect() as conn:
+            if key is None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace=?", (self.namespace,))
+            else:
+                conn.execute("DELETE FROM cache_entries WHERE namespace=? AND key=?", (self.namespace, key))
+
+
+def _consume_result(task: "asyncio.Task[Any]") -> None:
+    """待機者がいなくても "exception was never retrieved" 警告を出さない"""
+    if not task.cancelled():
+        task.exception()
+
+
+class TTLCache:
+    """エントリ数・バイト数上限付きの LRU + TTL キャッシュ"""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 200,
+        ttl_sec: float = 300.0,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = approx_nbytes,
+        second_tier: Optional[SQLiteCacheTier] = None,
+    ) -> None:
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_sec = float(ttl_sec)
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._tier = second_tier
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._expiry: List[Tuple[float, int, Hashable]] = []   # (expires_at, 連番, key)
+        self._seq = 0
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                       "tier_hits": 0, "coalesced": 0}
+
+    # ── 基本操作 ───────────────────────────────────────────────────
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get_entry(key, count=False) is not None
+
+    def get_entry(self, key: Hashable, count: bool = True) -> Optional[CacheEntry]:
+        """メモリ層の期限内エントリを返す（LRU 位置を更新）。第 2 層は見ない"""
+        entry = self._get_local(key)
+        if count:
+            self._stats["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.get_entry(key)
+        return default if entry is None else entry.value
+
+    def set(self, key: Hashable, value: Any, ttl_sec: Optional[float] = None) -> None:
+        """メモリ層だけに書き込む（第 2 層へは aset）"""
+        now = time.time()
+        self._put_local(key, value, now, now + (self.ttl_sec if ttl_sec is None else float(ttl_sec)))
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._expiry.clear()
+            self._bytes = 0
+
+    async def aget_entry(self, key: Hashable, count: bool = True) -> Optional[CacheEntry]:
+        """get_entry と同じ。メモリ層に無ければ第 2 層を keiba-io スレッドで読む"""
+        entry = self._get_local(key)
+        if entry is None:
+            entry = await self._tier_get(key, count)
+        elif count:
+            self._stats["hits"] += 1
+        if entry is None and count:
+            self._stats["misses"] += 1
+        return entry
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        entry = await self.aget_entry(key)
+        return default if entry is None else entry.value
+
+    async def aset(self, key: Hashable, value: Any, ttl_sec: Optional[float] = None) -> None:
+        """メモリ層に書き込み、第 2 層へは keiba-io スレッドで書き込む"""
+        now = time.time()
+        expires_at = now + (self.ttl_sec if ttl_sec is None else float(ttl_sec))
+        self._put_local(key, value, now, expires_at)
+        if self._tier is not None:
+            try:
+                await run_blocking(self._tier.set, str(key), value, now, expires_at)
+            except Exception as e:
+                logger.warning(f"[cache:{self.name}] 第 2 層への書き込み失敗: {e}")
+
+    async def adelete(self, key: Hashable) -> None:
+        self.delete(key)
+        if self._tier is not None:
+            await run_blocking(self._tier.delete, str(key))
+
+    async def aclear(self) -> None:
+        self.clear()
+        if self._tier is not None:
+            await run_blocking(self._tier.delete)
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """期限切れエントリを期限順ヒープから回収し、回収数を返す"""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, _, key = heapq.heappop(self._expiry)
+                entry = self._data.get(key)
+                if entry is not None and entry.expires_at == expires_at:
+                    self._remove(key)
+                    removed += 1
+            # 上書きで無効になったヒープ要素が溜まりすぎたら作り直す
+            if len(self._expiry) > 2 * len(self._data) + 64:
+                self._expiry = [(e.expires_at, i, k) for i, (k, e) in enumerate(self._data.items())]
+                heapq.heapify(self._expiry)
+            self._stats["expirations"] += removed
+        return removed
+
+    # ── 内部 ───────────────────────────────────────────────────────
+
+    def _get_local(self, key: Hashable) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at > now:
+                self._data.move_to_end(key)
+                return entry
+            self._remove(key)
+            self._stats["expirations"] += 1
+        return None
+
+    async def _tier_get(self, key: Hashable, count: bool) -> Optional[CacheEntry]:
+        """第 2 層を読み、あればメモリ層にも載せる（ヒット時だけ hits / tier_hits を数える）"""
+        if self._tier is None:
+            return None
+        try:
+            found = await run_blocking(self._tier.get, str(key))
+        except Exception as e:
+            logger.warning(f"[cache:{self.name}] 第 2 層の読み込み失敗: {e}")
+            return None
+        if found is None:
+            return None
+        value, stored_at, expires_at = found
+        entry = self._put_local(key, value, stored_at, expires_at)
+        if count:
+            self._stats["hits"] += 1
+            self._stats["tier_hits"] += 1
+        return entry
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        self._bytes -= entry.nbytes
+
+    def _put_local(self, key: Hashable, value: Any, stored_at: float, expires_at: float) -> CacheEntry:
+        try:
+            nbytes = int(self._sizeof(value))
+        except Exception:
+            nbytes = 0
+        entry = CacheEntry(value, stored_at, expires_at, nbytes)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = entry
+            self._bytes += nbytes
+            self._seq += 1
+            heapq.heappush(self._expiry, (expires_at, self._seq, key))
+            self.purge_expired(stored_at)
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes and len(self._data) > 1
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+        return entry
+
+    # ── single-flight ──────────────────────────────────────────────
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        ttl_sec: Optional[float] = None,
+    ) -> Any:
+        """キャッシュ値を返す。ミス時は compute を 1 回だけ実行し、同時に来た呼び出しは結果を待つ
+
+        compute は呼び出し元とは別のタスクで動かし、待機者全員で共有する。ある呼び出しが
+        キャンセルされても（クライアント切断など）他の待機者には影響せず、待機者が 0 になった
+        時点で compute 自体をキャンセルする。
+        compute が例外を送出した場合は待機中の呼び出しにも同じ例外が伝わり、何もキャッシュしない。
+        第 2 層の読み書きも共有タスクの中で keiba-io スレッドから行う。
+        """
+        entry = self._get_local(key)
+        if entry is not None:
+            self._stats["hits"] += 1
+            return entry.value
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["misses"] += 1
+            self._stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._compute_and_store(key, compute, ttl_sec))
+            task.add_done_callback(_consume_result)
+            self._inflight[key] = task
+            self._waiters[key] = 0
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0 and not task.done():
+                    task.cancel()        # 誰も待っていない計算は止める
+
+    async def _compute_and_store(
+        self, key: Hashable, compute: Callable[[], Awaitable[Any]], ttl_sec: Optional[float]
+    ) -> Any:
+        try:
+            entry = await self._tier_get(key, count=True)
+            if entry is not None:
+                return entry.value
+            self._stats["misses"] += 1
+            value = await compute()
+            await self.aset(key, value, ttl_sec)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+            self._waiters.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "name": self.name,
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_sec": self.ttl_sec,
+                "inflight": len(self._inflight),
+                "second_tier": str(self._tier.db_path) if self._tier is not None else None,
+            }
@@ -332,6 +332,8 @@ def sync_supabase_to_sqlite(db_path: Path) -> int:
             if len(rows) < page_size:
                 break
 
+        from scraping.storage import _bump_data_version  # type: ignore
+        _bump_data_version(cur, None)   # 全件入れ替え → 履歴キャッシュは再ロード
         conn.commit()
         conn.close()
         logger.info(f"Supabase → SQLite 同期完了: {total_races} レース")
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from models import AnalyzeRaceRequest  # type: ignore  # noqa: E402
+from routers import predict as predict_router  # type: ignore  # noqa: E402
+from services.ttl_cache import TTLCache  # type: ignore  # noqa: E402
+
+
+def _prediction(race_id: str, market_features: bool = False) -> dict:
+    probs = [0.30, 0.22, 0.16, 0.12, 0.09, 0.06, 0.05]
+    odds = [2.8, 4.1, 6.5, 9.0, 14.2, 25.0, 40.3]
+    preds = [
+        {"horse_number": i + 1, "horse_no": i + 1, "horse_id": f"h{i + 1}", "horse_name": f"H{i + 1}",
+         "odds": o, "popularity": i + 1, "win_probability": p, "p_raw": p, "p_norm": p,
+         "p_place3": min(1.0, p * 2.5), "p_ensemble": p, "expected_value": p * o, "predicted_rank": i + 1}
+        for i, (p, o) in enumerate(zip(probs, odds))
+    ]
+    race_info = {"race_id": race_id, "race_name": "テスト", "venue": "東京", "date": "20260101",
+                 "distance": 1600, "track_type": "芝", "num_horses": len(preds)}
+    return {"race_info": race_info, "predictions": preds, "odds_version": "none",
+            "market_features": market_features}
+
+
+def test_concurrent_analyze_shares_one_prediction(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[str] = []
+    version = ["none"]
+
+    async def _compute(race_id: str, model_path: Path) -> dict:
+        calls.append(race_id)
+        await asyncio.sleep(0.05)
+        return _prediction(race_id)
+
+    monkeypatch.setattr(predict_router, "_ANALYZE_CACHE", TTLCache("analyze_test", ttl_sec=60))
+    monkeypatch.setattr(predict_router, "_compute_race_prediction", _compute)
+    monkeypatch.setattr(predict_router, "_resolve_model_path", lambda _mid: Path("model_win_test.joblib"))
+    monkeypatch.setattr(predict_router, "_live_tansho", lambda _rid: (version[0], {}))
+
+    async def run(bankrolls: list[int]) -> list:
+        return await asyncio.gather(*[
+            predict_router._analyze_race_impl(AnalyzeRaceRequest(race_id="202601010101", bankroll=b))
+            for b in bankrolls
+        ])
+
+    out = asyncio.run(run([10_000, 10_000, 50_000, 100_000, 3_000]))
+    assert calls == ["202601010101"]                 # 同時 5 リクエストで予測は 1 回
+    assert all(r.success for r in out)
+    assert out[0].predictions == out[1].predictions
+
+    asyncio.run(run([20_000]))                       # bankroll 違いでも再予測しない
+    assert len(calls) == 1
+    version[0] = "1767225600.000"                    # オッズ更新 → 次のリクエストで予測し直す
+    asyncio.run(run([20_000]))
+    assert len(calls) == 2
+
+
+def test_precomputed_card_is_served_and_rescored_on_odds_update(monkeypatch: pytest.MonkeyPatch) -> None:
+    from services.race_precompute import PrecomputedPredictions
+
+    calls: list[str] = []
+    live = ["none", {}]
+
+    async def _compute(race_id: str, model_path: Path) -> dict:
+        calls.append(race_id)
+        if race_id.endswith("99"):
+            raise RuntimeError("shutuba not published")
+        return _prediction(race_id)
+
+    monkeypatch.setattr(predict_router, "_ANALYZE_CACHE", TTLCache("analyze_test", ttl_sec=60))
+    monkeypatch.setattr(predict_router, "_PRECOMPUTED", PrecomputedPredictions())
+    monkeypatch.setattr(predict_router, "_PRECOMPUTE_INTERVAL_SEC", 0)
+    monkeypatch.setattr(predict_router, "_compute_race_prediction", _compute)
+    monkeypatch.setattr(predict_router, "_resolve_model_path", lambda _mid: Path("model_win_test.joblib"))
+    monkeypatch.setattr(predict_router, "_live_tansho", lambda _rid: (live[0], live[1]))
+
+    card = ["202605050801", "202605050802", "202605050899"]
+    run = asyncio.run(predict_router.precompute_race_card(card))
+    assert run.done == card[:2] and list(run.failed) == ["202605050899"]
+    assert asyncio.run(predict_router.precompute_race_card(card)).skipped == card[:2]
+
+    # オッズ更新: 再推論せずオッズ・期待値・人気だけ差し替える
+    live[0], live[1] = "1767225600.000", {1: 5.0, 2: 2.0, 3: 6.5, 4: 9.0, 5: 14.2, 6: 25.0, 7: 40.3}
+    resp = asyncio.run(predict_router._analyze_race_impl(AnalyzeRaceRequest(race_id=card[0])))
+    assert calls == card + ["202605050899"]
+    top = next(p for p in resp.predictions if p["horse_number"] == 1)
+    assert top["odds"] == 5.0 and top["popularity"] == 2
+    assert predict_router._PRECOMPUTED.stats()["rescored"] == 1
+
+
+def test_precomputed_rescore_only_for_market_free_models() -> None:
+    from services.race_precompute import PrecomputedPredictions
+
+    store = PrecomputedPredictions()
+    store.put("r1", "m", _prediction("r1", market_features=False))
+    store.put("r2", "m", _prediction("r2", market_features=True))
+    odds = {1: 5.0, 2: 2.0}
+    assert store.get("r1", "m", "v2", odds)["predictions"][0]["odds"] == 5.0
+    assert store.get("r2", "m", "none", odds) is not None       # オッズ版が同じならそのまま返す
+    assert store.get("r2", "m", "v2", odds) is None              # 確率が古いので再推論させる
+    assert store.stats()["rescored"] == 1 and store.stats()["stale"] == 1
+
+
+def test_rescore_popularity_ties_share_min_rank() -> None:
+    from services.race_precompute import rescore_prediction
+
+    odds = {1: 5.0, 2: 2.0, 3: 5.0, 4: 9.0, 5: 2.0, 6: 25.0, 7: 40.3}
+    pred = rescore_prediction(_prediction("r1", market_features=False), odds, "v2")
+    pop = {p["horse_number"]: p["popularity"] for p in pred["predictions"]}
+    # ライブ経路と同じ rank(method="min")
+    expected = pd.Series(odds).rank(method="min").astype(int).to_dict()
+    assert pop == expected
+    assert pop[2] == pop[5] == 1 and pop[1] == pop[3] == 3 and pop[4] == 5
+
+
+def test_market_feature_model_rescored_through_model_after_odds_update(monkeypatch: pytest.MonkeyPatch) -> None:
+    from services.race_precompute import PrecomputedPredictions
+
+    calls: list[str] = []
+    live = ["none", {}]
+
+    async def _compute(race_id: str, model_path: Path) -> dict:
+        # score_race の代わり: 確率がオッズ（implied_prob）に依存するモデル
+        calls.append(live[0])
+        pred = _prediction(race_id, market_features=True)
+        odds = live[1] or {p["horse_number"]: p["odds"] for p in pred["predictions"]}
+        total = sum(1.0 / o for o in odds.values())
+        for p in pred["predictions"]:
+            p["odds"] = odds[p["horse_number"]]
+            p["p_norm"] = p["win_probability"] = p["p_raw"] = (1.0 / p["odds"]) / total
+            p["expected_value"] = p["p_norm"] * p["odds"]
+        pred["odds_version"] = live[0]
+        return pred
+
+    monkeypatch.setattr(predict_router, "_ANALYZE_CACHE", TTLCache("analyze_test", ttl_sec=60))
+    monkeypatch.setattr(predict_router, "_PRECOMPUTED", PrecomputedPredictions())
+    monkeypatch.setattr(predict_router, "_PRECOMPUTE_INTERVAL_SEC", 0)
+    monkeypatch.setattr(predict_router, "_compute_race_prediction", _compute)
+    monkeypatch.setattr(predict_router, "_resolve_model_path", lambda _mid: Path("model_win_test.joblib"))
+    monkeypatch.setattr(predict_router, "_live_tansho", lambda _rid: (live[0], live[1]))
+
+    race_id = "202605050801"
+    asyncio.run(predict_router.precompute_race_card([race_id]))
+    before = asyncio.run(predict_router._race_prediction(race_id, None))
+    assert calls == ["none"]
+
+    live[0], live[1] = "1767225600.000", {1: 9.0, 2: 1.8, 3: 6.5, 4: 9.0, 5: 14.2, 6: 25.0, 7: 40.3}
+    after = asyncio.run(predict_router._race_prediction(race_id, None))
+    assert calls == ["none", "1767225600.000"]                  # 古い確率を流用せずモデルを通す
+    p_after = {p["horse_number"]: p["p_norm"] for p in after["predictions"]}
+    p_before = {p["horse_number"]: p["p_norm"] for p in before["predictions"]}
+    assert p_after[2] > p_before[2] and p_after[1] < p_before[1]
+
+    again = asyncio.run(predict_router._race_prediction(race_id, None))   # 新しい版でプリコンピュートにヒット
+    assert calls == ["none", "1767225600.000"] and again is after
+    stats = predict_router._PRECOMPUTED.stats()
+    assert stats["stale"] == 1 and stats["rescored"] == 0
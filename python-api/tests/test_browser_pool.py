@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+import routers.realtime_odds as realtime_odds  # type: ignore  # noqa: E402
+from services.browser_pool import BrowserPool  # noqa: E402
+
+
+class _FakePage:
+    def __init__(self, log: dict) -> None:
+        self.log = log
+        self.closed = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def goto(self, url: str, **_: object) -> None:
+        self.log["active"] += 1
+        self.log["peak"] = max(self.log["peak"], self.log["active"])
+        self.log.setdefault("gotos", []).append(time.monotonic())
+        await asyncio.sleep(0.01)
+        self.log["active"] -= 1
+
+    async def wait_for_function(self, *_: object, **__: object) -> None:
+        pass
+
+    async def content(self) -> str:
+        return '<span id="odds-1_01">3.4</span>'
+
+
+class _FakeContext:
+    def __init__(self, log: dict) -> None:
+        self.log = log
+
+    async def new_page(self) -> _FakePage:
+        return _FakePage(self.log)
+
+    async def close(self) -> None:
+        self.log["contexts_closed"] += 1
+
+
+class _FakeBrowser:
+    def __init__(self, log: dict) -> None:
+        self.log = log
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def new_context(self, **_: object) -> _FakeContext:
+        return _FakeContext(self.log)
+
+    async def close(self) -> None:
+        self.connected = False
+        self.log["browser_closed"] += 1
+
+
+class _FakePlaywright:
+    def __init__(self, log: dict) -> None:
+        self.log = log
+        self.chromium = self
+
+    async def start(self) -> "_FakePlaywright":
+        return self
+
+    async def launch(self, **_: object) -> _FakeBrowser:
+        self.log["launches"] += 1
+        self.log["browser"] = _FakeBrowser(self.log)
+        return self.log["browser"]
+
+    async def stop(self) -> None:
+        pass
+
+
+def _pool(**kwargs: object) -> tuple[BrowserPool, dict]:
+    log = {"launches": 0, "contexts_closed": 0, "browser_closed": 0, "active": 0, "peak": 0}
+    return BrowserPool(playwright_factory=lambda: _FakePlaywright(log), **kwargs), log
+
+
+def test_browser_launched_once_and_pages_bounded() -> None:
+    pool, log = _pool(max_pages=3)
+
+    async def fetch() -> None:
+        async with pool.page() as page:
+            await page.goto("https://example.invalid/")
+
+    async def run() -> None:
+        await asyncio.gather(*[fetch() for _ in range(12)])
+        await asyncio.gather(*[fetch() for _ in range(12)])
+        await pool.close()
+
+    asyncio.run(run())
+    assert log["launches"] == 1
+    assert log["peak"] == 3
+    stats = pool.stats()
+    assert stats["borrows"] == 24 and stats["contexts_created"] == 3
+    assert log["browser_closed"] == 1 and not stats["running"]
+
+
+def test_contexts_recycled_after_max_uses_errors_and_crash() -> None:
+    pool, log = _pool(max_pages=1, max_uses=2)
+
+    async def run() -> None:
+        for _ in range(4):
+            async with pool.page():
+                pass
+        assert pool.stats()["contexts_created"] == 2    # 2 回ごとに作り直す
+
+        with pytest.raises(RuntimeError):
+            async with pool.page():
+                raise RuntimeError("boom")
+        async with pool.page() as page:
+            page.closed = True                          # ページが閉じられた → 返却時に破棄
+        assert pool.stats()["contexts_created"] == 4
+
+        log["browser"].connected = False                # ブラウザ切断 → 次回借用で再起動
+        async with pool.page():
+            pass
+        await pool.close()
+
+    asyncio.run(run())
+    assert log["launches"] == 2
+    assert pool.stats()["contexts_recycled"] == 4
+
+
+def test_playwright_batch_keeps_interval_while_holding_page(monkeypatch: pytest.MonkeyPatch) -> None:
+    # INV-07: Page を保持したままスリープするので、同じ枠の次のアクセスは interval 以上空く
+    pool, log = _pool(max_pages=1)
+    monkeypatch.setattr(realtime_odds, "BROWSER_POOL", pool)
+    monkeypatch.setattr(realtime_odds, "_PW_INTERVAL_SEC", 0.1)
+
+    async def run() -> dict:
+        try:
+            return await realtime_odds._fetch_tansho_odds_playwright_batch(["r1", "r2", "r3"])
+        finally:
+            await pool.close()
+
+    results = asyncio.run(run())
+    assert results == {rid: {"1": 3.4} for rid in ("r1", "r2", "r3")}
+    gaps = [b - a for a, b in zip(log["gotos"], log["gotos"][1:])]
+    assert len(gaps) == 2 and min(gaps) >= 0.1
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import sys
+import time
+from itertools import combinations, permutations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from betting.combination import (  # noqa: E402
+    estimated_odds,
+    harville_probabilities,
+    market_probabilities,
+    odds_tensor,
+    rank_combinations,
+)
+from betting.strategy import BettingCombinationGenerator, BettingRecommender  # noqa: E402
+
+
+def _field(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    p = rng.dirichlet(np.ones(n) * 2)
+    market = rng.dirichlet(np.ones(n) * 2)
+    return p, np.round(0.8 / market, 1)
+
+
+def _predictions(n: int, seed: int = 0) -> list[dict]:
+    p, odds = _field(n, seed)
+    return [
+        {"horse_no": i + 1, "p_norm": float(p[i]), "win_probability": float(p[i]),
+         "odds": float(odds[i]), "expected_value": float(p[i] * odds[i])}
+        for i in range(n)
+    ]
+
+
+def _brute_trifecta(p: np.ndarray, i: int, j: int, k: int) -> float:
+    return p[i] * p[j] / (1 - p[i]) * p[k] / (1 - p[i] - p[j])
+
+
+def test_harville_matches_brute_force_and_sums() -> None:
+    p, _ = _field(7)
+    hp = harville_probabilities(p)
+
+    for i, j, k in permutations(range(7), 3):
+        assert hp.trifecta[i, j, k] == pytest.approx(_brute_trifecta(p, i, j, k))
+    for i, j, k in combinations(range(7), 3):
+        expected = sum(_brute_trifecta(p, *perm) for perm in permutations((i, j, k)))
+        assert hp.trio[i, j, k] == pytest.approx(expected)
+    for i, j in combinations(range(7), 2):
+        expected = sum(
+            _brute_trifecta(p, *perm)
+            for k in range(7) if k not in (i, j)
+            for perm in permutations((i, j, k))
+        )
+        assert hp.wide[i, j] == pytest.approx(expected)
+
+    iu = np.triu_indices(7, 1)
+    assert hp.exacta.sum() == pytest.approx(1.0)
+    assert hp.trifecta.sum() == pytest.approx(1.0)
+    assert hp.quinella[iu].sum() == pytest.approx(1.0)
+    assert hp.wide[iu].sum() == pytest.approx(3.0)
+    assert hp.place.sum() == pytest.approx(3.0)
+    assert hp.trio.sum() / 6 == pytest.approx(1.0)
+
+
+def test_odds_tensor_parses_realtime_and_generator_keys() -> None:
+    nums = [3, 5, 8]
+    t = odds_tensor({"03,05,08": 120.5, "5-8-3": 99.0}, nums, "sanrenpuku")
+    assert {float(t[perm]) for perm in permutations((0, 1, 2))} == {99.0}
+    assert np.isnan(t[0, 0, 1])
+    ex = odds_tensor({"05,03": 12.0, "8→5": 30.0, "bad": 1.0}, nums, "umatan")
+    assert ex[1, 0] == 12.0 and ex[2, 1] == 30.0 and np.isnan(ex[0, 1])
+    wide = odds_tensor({"03,08": (2.1, 3.4)}, nums, "wide")
+    assert wide[0, 2] == wide[2, 0] == 2.1
+
+
+def test_rank_uses_real_odds_when_given() -> None:
+    p, win_odds = _field(6)
+    hp = harville_probabilities(p, [1, 2, 3, 4, 5, 6])
+    est = estimated_odds(harville_probabilities(market_probabilities(win_odds)), "umaren")
+    real = odds_tensor({"1-2": 500.0}, hp.horse_numbers, "umaren")
+    odds = np.where(np.isnan(real), est, real)
+    top = rank_combinations(hp, "umaren", odds)
+    assert len(top) == 15
+    evs = [c["expected_value"] for c in top]
+    assert evs == sorted(evs, reverse=True)
+    row = next(c for c in top if c["combination"] == "1-2")
+    assert row["odds"] == 500.0
+    assert row["expected_value"] == pytest.approx(hp.quinella[0, 1] * 500.0)
+
+
+def test_generators_keep_return_shape() -> None:
+    preds = _predictions(12)
+    sizes = {
+        "generate_umaren": 10, "generate_wide": 10, "generate_sanrenpuku": 10,
+        "generate_umatan": 20, "generate_sanrentan": 30,
+    }
+    for name, size in sizes.items():
+        cands = getattr(BettingCombinationGenerator, name)(preds)
+        assert len(cands) == size, name
+        assert {"combination", "expected_value", "probability"} <= set(cands[0])
+        evs = [c["expected_value"] for c in cands]
+        assert evs == sorted(evs, reverse=True)
+    assert "→" in BettingCombinationGenerator.generate_sanrentan(preds)[0]["combination"]
+    first, second = BettingCombinationGenerator.generate_umaren(preds)[0]["combination"].split("-")
+    assert int(first) < int(second)
+
+
+def test_recommender_accepts_combination_odds_and_no_odds() -> None:
+    preds = _predictions(10)
+    top = BettingCombinationGenerator.generate_umaren(preds, top_n=None, odds={"01,02": 9999.0})
+    assert top[0]["combination"] == "1-2" and top[0]["odds"] == 9999.0
+    result = BettingRecommender(100_000).analyze_and_recommend(
+        preds, {"race_id": "x", "date": "2024-04-01"},
+        combination_odds={"sanrentan": {"01,02,03": 9999.0}},
+    )
+    assert len(result["bet_types"]["三連単"]) == 30
+
+    for pr in preds:
+        pr["odds"] = None
+    cands = BettingCombinationGenerator.generate_sanrenpuku(preds)
+    assert all(c["expected_value"] == 0.0 and c["odds"] is None for c in cands)
+
+
+def test_full_field_trifecta_is_fast() -> None:
+    preds = _predictions(18)
+    BettingCombinationGenerator._combination_candidates(preds, "sanrentan", None, limit=30)
+    t0 = time.perf_counter()
+    for _ in range(10):
+        top = BettingCombinationGenerator._combination_candidates(preds, "sanrentan", None, limit=30)
+    per_race_ms = (time.perf_counter() - t0) * 100
+    assert len(top) == 30
+    assert per_race_ms < 50
+    hp = harville_probabilities([p["p_norm"] for p in preds])
+    assert np.count_nonzero(hp.trifecta) == 18 * 17 * 16 == 4896
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import mmap
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from services.history_snapshot import (  # noqa: E402
+    HistorySnapshotStore,
+    db_signature,
+    read_snapshot,
+    write_snapshot,
+)
+
+
+def _frame(n: int = 50) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "race_id": [f"2024050101{i % 12:02d}" for i in range(n)],
+        "horse_id": [f"h{i:03d}" for i in range(n)],
+        "venue": pd.Categorical(rng.choice(["東京", "中山"], n)),
+        "sire": [None if i % 7 == 0 else f"s{i % 5}" for i in range(n)],
+        "odds": rng.gamma(2, 5, n).astype(np.float32),
+        "horse_number": (np.arange(n) % 16 + 1).astype(np.int8),
+        "mixed": [1 if i % 2 else "x" for i in range(n)],
+    })
+
+
+def _is_mapped(arr: np.ndarray) -> bool:
+    while arr is not None:
+        if isinstance(arr, (np.memmap, mmap.mmap)):
+            return True
+        arr = getattr(arr, "base", None)
+    return False
+
+
+def test_roundtrip_preserves_values_and_maps_arrays(tmp_path: Path) -> None:
+    df = _frame()
+    write_snapshot(df, tmp_path / "v1")
+    out = read_snapshot(tmp_path / "v1")
+
+    assert list(out.columns) == list(df.columns)
+    assert out["odds"].dtype == np.float32
+    assert out["horse_number"].dtype == np.int8
+    np.testing.assert_array_equal(out["odds"].to_numpy(), df["odds"].to_numpy())
+    for col in ("race_id", "horse_id", "venue", "sire"):
+        assert out[col].astype(object).where(out[col].notna(), None).tolist() == \
+            df[col].astype(object).where(df[col].notna(), None).tolist()
+    assert out["mixed"].tolist() == df["mixed"].tolist()
+
+    # numeric columns and category codes stay backed by the read-only memmap
+    assert _is_mapped(out["odds"].to_numpy())
+    assert _is_mapped(out["venue"].array._codes)
+
+
+def test_second_store_reuses_published_version(tmp_path: Path) -> None:
+    calls = []
+
+    def loader() -> pd.DataFrame:
+        calls.append(1)
+        return _frame()
+
+    source = {"mtime": 1}
+    a = HistorySnapshotStore(tmp_path, ttl_sec=600)
+    b = HistorySnapshotStore(tmp_path, ttl_sec=600)
+    df_a = a.get(loader, source)
+    df_b = b.get(loader, source)
+    assert len(calls) == 1
+    assert len(df_a) == len(df_b) == 50
+    assert b.get(loader, source) is df_b
+
+
+def test_source_change_publishes_and_swaps_after_ttl(tmp_path: Path) -> None:
+    a = HistorySnapshotStore(tmp_path, ttl_sec=0)
+    b = HistorySnapshotStore(tmp_path, ttl_sec=0)
+    v1 = a.get(lambda: _frame(10), {"mtime": 1})
+    assert len(b.get(lambda: _frame(99), {"mtime": 1})) == 10
+
+    v2 = b.get(lambda: _frame(20), {"mtime": 2})
+    assert len(v2) == 20
+    assert len(a.get(lambda: _frame(99), {"mtime": 2})) == 20
+    assert len(v1) == 10  # the old mapping stays readable after the swap
+    versions = [p for p in tmp_path.iterdir() if p.is_dir() and p.name.startswith("v")]
+    assert len(versions) <= 2
+
+
+def test_within_ttl_source_change_keeps_current_version(tmp_path: Path) -> None:
+    store = HistorySnapshotStore(tmp_path, ttl_sec=600)
+    store.get(lambda: _frame(10), {"mtime": 1})
+    assert len(store.get(lambda: _frame(20), {"mtime": 2})) == 10
+
+
+def test_other_threads_get_stale_version_while_refreshing(tmp_path: Path) -> None:
+    store = HistorySnapshotStore(tmp_path, ttl_sec=0)
+    store.get(lambda: _frame(10), {"mtime": 1})
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_loader() -> pd.DataFrame:
+        loading.set()
+        release.wait(5)
+        return _frame(20)
+
+    result: list = []
+    leader = threading.Thread(target=lambda: result.append(len(store.get(slow_loader, {"mtime": 2}))))
+    leader.start()
+    assert loading.wait(5)
+    # リーダーがロード中でも、同じプロセスの他スレッドはスレッドロックで待たされず公開済みの版を返す
+    t0 = time.perf_counter()
+    assert len(store.get(lambda: _frame(99), {"mtime": 2})) == 10
+    assert time.perf_counter() - t0 < 1.0
+    assert store.stats()["stale"] == 1 and store.stats()["refreshing"]
+    release.set()
+    leader.join(5)
+    assert result == [20]
+    assert len(store.get(lambda: _frame(99), {"mtime": 2})) == 20
+    assert store.stats()["refreshes"] == 2 and not store.stats()["refreshing"]
+
+
+def _worker(root: str, marker: str, queue) -> None:
+    def loader() -> pd.DataFrame:
+        with open(marker, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        return _frame(30)
+
+    df = HistorySnapshotStore(Path(root)).get(loader, {"mtime": 1})
+    queue.put(len(df))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_concurrent_workers_load_once(tmp_path: Path) -> None:
+    ctx = mp.get_context("fork")
+    queue = ctx.Queue()
+    marker = tmp_path / "loads.txt"
+    procs = [ctx.Process(target=_worker, args=(str(tmp_path / "snap"), str(marker), queue)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=30)
+    assert [p.exitcode for p in procs] == [0, 0, 0, 0]
+    assert sorted(queue.get() for _ in procs) == [30, 30, 30, 30]
+    assert len(marker.read_text().splitlines()) == 1
+
+
+def test_db_signature_tracks_file_changes(tmp_path: Path) -> None:
+    db = tmp_path / "x.db"
+    assert db_signature(db) == {"path": str(db)}
+    db.write_bytes(b"a")
+    first = db_signature(db)
+    db.write_bytes(b"abc")
+    assert db_signature(db) != first
+
+
+def _race(race_id: str, date: str, n: int = 4, odds_base: float = 2.0) -> dict:
+    return {
+        "race_info": {"race_id": race_id, "date": date, "distance": 1600, "track_type": "芝",
+                      "venue": "東京", "race_class": "OP", "num_horses": n},
+        "horses": [
+            {"horse_id": f"h{race_id[-2:]}{i}", "horse_name": f"馬{i}", "finish_position": i + 1,
+             "horse_number": i + 1, "odds": odds_base + i, "jockey_id": f"j{i}"}
+            for i in range(n)
+        ],
+        "return_tables": [{"bet_type": "単勝", "combinations": "1", "payout": 200}],
+    }
+
+
+def test_storage_write_paths_bump_data_version(tmp_path: Path) -> None:
+    from scraping.storage import (  # noqa: E402
+        _bump_data_version,
+        _get_changed_race_ids,
+        _get_data_version,
+        _init_sqlite_db,
+        _save_race_sqlite_only,
+        _save_race_to_ultimate_db,
+    )
+
+    db = tmp_path / "keiba_ultimate.db"
+    assert _get_data_version(db) is None
+    _init_sqlite_db(db)
+    assert _get_data_version(db) == 0
+
+    assert _save_race_to_ultimate_db(_race("202405010101", "20240101"), db)
+    assert _save_race_sqlite_only(_race("202405010102", "20240101"), db)
+    assert _get_data_version(db) == 2
+    assert _get_changed_race_ids(db, 0) == (2, {"202405010101", "202405010102"})
+    assert _get_changed_race_ids(db, 2) == (2, set())
+
+    import sqlite3
+
+    conn = sqlite3.connect(db)
+    _bump_data_version(conn, None)
+    conn.commit()
+    conn.close()
+    assert _get_changed_race_ids(db, 2) == (3, None)
+
+
+def test_delta_update_matches_full_reload(tmp_path: Path, capsys) -> None:
+    sys.path.insert(0, str(ROOT / "keiba"))
+    from keiba_ai.db_ultimate_loader import load_ultimate_training_frame  # noqa: E402
+    from scraping.storage import (  # noqa: E402
+        _get_changed_race_ids,
+        _get_data_version,
+        _save_race_sqlite_only,
+        _save_race_to_ultimate_db,
+    )
+    from services.history_snapshot import replace_races  # noqa: E402
+
+    db = tmp_path / "keiba_ultimate.db"
+    _save_race_to_ultimate_db(_race("202405010101", "20240101"), db)
+    _save_race_to_ultimate_db(_race("202405010102", "20240101"), db)
+    loads = []
+
+    def loader() -> pd.DataFrame:
+        loads.append(1)
+        return load_ultimate_training_frame(db)
+
+    def updater(base: pd.DataFrame, prev: dict):
+        _, changed = _get_changed_race_ids(db, prev["data_version"])
+        if changed is None:
+            return None
+        return replace_races(base, load_ultimate_training_frame(db, race_ids=changed), changed)
+
+    store = HistorySnapshotStore(tmp_path / "snap")
+    first = store.get(loader, {"data_version": _get_data_version(db)}, updater=updater, ttl_sec=0)
+    assert len(first) == 8
+
+    # 1 レースを上書き、1 レースを追加
+    _save_race_to_ultimate_db(_race("202405010102", "20240101", n=3, odds_base=9.0), db)
+    _save_race_sqlite_only(_race("202405010201", "20240108"), db)
+    updated = store.get(loader, {"data_version": _get_data_version(db)}, updater=updater, ttl_sec=0)
+    assert loads == [1]
+
+    full = load_ultimate_training_frame(db)
+    key = ["race_id", "horse_number"]
+    got = updated.astype(object).sort_values(key).reset_index(drop=True)
+    exp = full.astype(object).sort_values(key).reset_index(drop=True)
+    assert len(got) == len(exp) == 11
+    for col in ("race_id", "horse_id", "odds", "tansho_payout", "num_horses", "race_date"):
+        pd.testing.assert_series_equal(got[col], exp[col], check_dtype=False)
+    assert got["tansho_payout"].notna().sum() == 4
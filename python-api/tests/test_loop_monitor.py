@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from services.blocking_io import run_blocking  # type: ignore  # noqa: E402
+from services.loop_monitor import LoopLagMonitor  # type: ignore  # noqa: E402
+from routers import races  # type: ignore  # noqa: E402
+
+
+def _block_loop_for_test(sec: float) -> None:
+    time.sleep(sec)
+
+
+def test_block_detector_reports_loop_thread_stack() -> None:
+    async def scenario() -> LoopLagMonitor:
+        monitor = LoopLagMonitor(interval_sec=0.02)
+        monitor.start(block_ms=50)
+        try:
+            await asyncio.sleep(0.1)
+            _block_loop_for_test(0.3)          # ループを直接止める
+            await asyncio.sleep(0.1)
+        finally:
+            await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    events = monitor.events()
+    assert len(events) == 1
+    assert events[0]["blocked_ms"] >= 250
+    assert "_block_loop_for_test" in events[0]["stack"]
+
+    pct = monitor.percentiles()
+    assert pct["samples"] >= 3
+    assert pct["max_ms"] >= 250
+    assert pct["p50_ms"] <= pct["p99_ms"] <= pct["max_ms"]
+    assert monitor.block_ms == 0.0
+
+
+def test_run_blocking_uses_dedicated_executor() -> None:
+    async def scenario() -> tuple:
+        return await run_blocking(lambda x, y=0: (threading.current_thread().name, x + y), 1, y=2)
+
+    name, value = asyncio.run(scenario())
+    assert name.startswith("keiba-io")
+    assert value == 3
+
+
+def _run_handler_under_monitor(handler, *args) -> LoopLagMonitor:
+    async def scenario() -> LoopLagMonitor:
+        monitor = LoopLagMonitor(interval_sec=0.02)
+        monitor.start(block_ms=100)
+        try:
+            await asyncio.sleep(0.05)
+            assert await handler(*args) == []
+            await asyncio.sleep(0.05)
+        finally:
+            await monitor.stop()
+        return monitor
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("handler, sync_name, arg", [
+    (races.get_races_recent, "_races_recent", 50),
+    (races.get_race_horses, "_race_horses", "202405020511"),
+    (races.get_races_by_date, "_races_by_date", "20240505"),
+])
+def test_moved_handlers_do_not_block_loop(monkeypatch, handler, sync_name, arg) -> None:
+    # 遅い SQLite 読み出しを模す。keiba-io で動くのでループは止まらない
+    monkeypatch.setattr(races, sync_name, lambda *_: time.sleep(0.3) or [])
+    monitor = _run_handler_under_monitor(handler, arg)
+    assert monitor.events() == []
+    assert monitor.percentiles()["max_ms"] < 100
+
+    # 対照: ループ上で直接呼ぶ（移動前の状態）と検出される
+    async def _inline(fn, *args):
+        return fn(*args)
+
+    monkeypatch.setattr(races, "run_blocking", _inline)
+    monitor = _run_handler_under_monitor(handler, arg)
+    assert len(monitor.events()) == 1
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from routers import predict as predict_router  # type: ignore  # noqa: E402
+from services.ttl_cache import TTLCache  # type: ignore  # noqa: E402
+
+
+class _ColumnModel:
+    """指定列の値をそのままスコアにする（どの列を使うかで市場依存を切り替える）"""
+
+    def __init__(self, col: str) -> None:
+        self.col = col
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        return X[self.col].to_numpy(dtype=float)
+
+
+def _race(odds: list[float]) -> pd.DataFrame:
+    n = len(odds)
+    return pd.DataFrame({
+        "race_id": ["202605050811"] * n,
+        "horse_id": [f"H{i}" for i in range(n)],
+        "horse_number": list(range(1, n + 1)),
+        "age": [3 + i % 3 for i in range(n)],
+        "distance": [1600] * n,
+        "surface": ["芝"] * n,
+        "race_date": ["20260505"] * n,
+        "odds": odds,
+        "popularity": pd.Series(odds).rank(method="min").astype(int).tolist(),
+        "num_horses": [n] * n,
+        "finish": [np.nan] * n,   # 発走前（履歴統計の計算に列だけは必要）
+    })
+
+
+@pytest.mark.parametrize("col, uses_market", [("implied_prob_norm", True), ("age", False)])
+def test_odds_update_reuses_cached_features(monkeypatch: pytest.MonkeyPatch, col: str, uses_market: bool) -> None:
+    builds: list[int] = []
+    original = predict_router.ModelPredictor.build_features
+
+    def _counting_build(self, df, full_hist=None, odds_drift=None):
+        builds.append(len(df))
+        return original(self, df, full_hist, odds_drift)
+
+    monkeypatch.setattr(predict_router.ModelPredictor, "build_features", _counting_build)
+    bundle = {"model": _ColumnModel(col), "feature_columns": [col, "distance"], "target": "rank"}
+    predictor = predict_router.ModelPredictor(bundle, Path("model_rank_test.joblib"))
+    assert predictor.uses_market_features is uses_market
+
+    cache = TTLCache("features_test", ttl_sec=60)
+    before, after = _race([2.5, 6.0, 11.0, 30.0]), _race([8.0, 2.2, 11.0, 30.0])
+    key_before = predict_router._feature_cache_key("r", predictor.model_name, before)
+    assert key_before == predict_router._feature_cache_key("r", predictor.model_name, after)
+    hist_calls: list[int] = []
+
+    def _hist() -> pd.DataFrame:
+        hist_calls.append(1)
+        return before
+
+    _, p1 = predictor.score_race(before, _hist, None, cache, key_before)
+    _, p2 = predictor.score_race(after, _hist, None, cache, key_before)
+    assert builds == [4] and hist_calls == [1]   # 2 回目は特徴量構築も履歴ロードもしない
+
+    _, full = predictor.score_race(after, after, None)   # キャッシュなしの全再計算
+    np.testing.assert_allclose(p2, full)
+    if uses_market:
+        assert p2.argmax() == 1 and p1.argmax() == 0
+    else:
+        np.testing.assert_array_equal(p1, p2)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from routers import metrics as metrics_router  # type: ignore  # noqa: E402
+from services.metrics import MetricsRegistry, SharedMetricsStore, render_text  # type: ignore  # noqa: E402
+
+
+def _registry() -> MetricsRegistry:
+    reg = MetricsRegistry()
+    reg.counter("t_requests_total", "requests", ("host",)).inc(2, host='a"b')
+    reg.gauge("t_queue", "queue depth", mode="sum").set(3)
+    h = reg.histogram("t_latency_seconds", "latency", buckets=(0.1, 1))
+    for v in (0.05, 0.5, 5):
+        h.observe(v)
+    return reg
+
+
+def test_render_text_exposition_format() -> None:
+    text = render_text(_registry().collect())
+    lines = text.splitlines()
+    assert "# TYPE t_requests_total counter" in lines
+    assert 't_requests_total{host="a\\"b"} 2.0' in lines
+    assert "t_queue 3.0" in lines
+    assert 't_latency_seconds_bucket{le="0.1"} 1.0' in lines
+    assert 't_latency_seconds_bucket{le="1.0"} 2.0' in lines
+    assert 't_latency_seconds_bucket{le="+Inf"} 3.0' in lines
+    assert "t_latency_seconds_count 3.0" in lines and "t_latency_seconds_sum 5.55" in lines
+
+    with pytest.raises(ValueError):
+        _registry().counter("t_requests_total", "requests", ("host",)).inc(1)
+
+
+def test_shared_store_merges_workers(tmp_path: Path) -> None:
+    reg_a, reg_b = _registry(), _registry()
+    reg_b.gauge("t_queue", "queue depth", mode="sum").set(4)
+    SharedMetricsStore(tmp_path, worker_id="a").flush(reg_a.collect())
+    store_b = SharedMetricsStore(tmp_path, worker_id="b", stale_sec=60)
+    store_b.flush(reg_b.collect())
+
+    merged = store_b.merge()
+    assert merged["t_requests_total"]["values"][('a"b',)] == 4.0
+    assert merged["t_queue"]["values"][()] == 7.0
+    assert merged["t_latency_seconds"]["values"][()][-1] == 6.0     # count
+
+    # 書き込みが止まったワーカーの gauge は集約しない（counter は残す）
+    store_b.stale_sec = 0.0
+    time.sleep(0.01)
+    merged = store_b.merge()
+    assert merged["t_queue"]["values"] == {}
+    assert merged["t_requests_total"]["values"][('a"b',)] == 4.0
+
+
+def test_shared_store_retires_dead_workers(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # PID が再利用されても起動ごとに別の worker_id になり、前のワーカーの累積値を上書きしない
+    monkeypatch.setattr("services.metrics.os.getpid", lambda: 4242)
+    first = SharedMetricsStore(tmp_path)
+    time.sleep(0.01)
+    second = SharedMetricsStore(tmp_path, retire_sec=3600)
+    assert first.worker_id != second.worker_id and first.worker_id.startswith("4242-")
+    first.flush(_registry().collect())
+    second.flush(_registry().collect())
+    assert second.merge()["t_requests_total"]["values"][('a"b',)] == 4.0
+
+    # 書き込みの止まったワーカーは retired 行へ畳み込まれ、合計は減らない
+    for boot in range(3):
+        SharedMetricsStore(tmp_path, worker_id=f"dead-{boot}").flush(_registry().collect())
+    time.sleep(0.01)
+    live = SharedMetricsStore(tmp_path, worker_id="live", retire_sec=0.005)
+    live.flush(_registry().collect())
+    merged = live.merge()
+    assert merged["t_requests_total"]["values"][('a"b',)] == 12.0
+    assert merged["t_latency_seconds"]["values"][()][-1] == 18.0     # count
+    with sqlite3.connect(str(live.db_path)) as conn:
+        workers = {w for (w,) in conn.execute("SELECT DISTINCT worker FROM metric_values")}
+    assert workers == {"retired", "live"}
+
+    # 2 回目の畳み込みは既存の retired 行に加算する
+    SharedMetricsStore(tmp_path, worker_id="dead-3").flush(_registry().collect())
+    time.sleep(0.01)
+    live.flush(_registry().collect())
+    assert live.merge()["t_requests_total"]["values"][('a"b',)] == 14.0
+
+
+def test_metrics_endpoint_and_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("KEIBA_METRICS_TOKEN", raising=False)
+    monkeypatch.setenv("APP_ENV", "development")
+    resp = asyncio.run(metrics_router.metrics(None))
+    body = resp.body.decode("utf-8")
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE keiba_cache_requests_total counter" in body
+    assert 'keiba_jobs{kind="train",status="running"}' in body
+
+    monkeypatch.setenv("KEIBA_METRICS_TOKEN", "s3cret")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(metrics_router.metrics("Bearer wrong"))
+    assert exc.value.status_code == 401
+    assert asyncio.run(metrics_router.metrics("Bearer s3cret")).status_code == 200
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import sys
+import threading
+from itertools import combinations, permutations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from betting.combination import candidate_arrays, harville_probabilities, odds_tensor  # noqa: E402
+from routers import realtime_odds  # type: ignore  # noqa: E402
+from services.odds_store import OddsMatrix, OddsStore  # noqa: E402
+from services.ttl_cache import TTLCache  # type: ignore  # noqa: E402
+
+
+def _sanrentan(n: int = 18) -> dict[str, float]:
+    rng = np.random.default_rng(0)
+    return {
+        f"{a}-{b}-{c}": float(np.round(rng.gamma(2, 200), 1))
+        for a, b, c in permutations(range(1, n + 1), 3)
+    }
+
+
+def test_matrix_matches_dict_parser_and_roundtrips() -> None:
+    umaren = {"1-2": 5.5, "03,01": 12.0, "2-4": 80.1}
+    m = OddsMatrix.from_mapping("r1", "umaren", umaren, horse_numbers=[1, 2, 3, 4])
+    assert len(m.values) == 6 and m.values.dtype == np.float32   # 三角部分のみ
+    nums = [1, 2, 3, 4]
+    np.testing.assert_allclose(m.tensor(), odds_tensor(umaren, nums, "umaren"), equal_nan=True)
+    assert m.to_dict() == {"01,02": 5.5, "01,03": 12.0, "02,04": 80.1}
+    # 別の馬番並び（取消馬あり）へのアライン
+    t = m.tensor([4, 2, 1])
+    assert t[0, 1] == t[1, 0] == pytest.approx(80.1) and t[2, 1] == pytest.approx(5.5)
+    assert np.isnan(t[0, 2])
+
+
+def test_candidate_arrays_reads_packed_values_without_copy() -> None:
+    odds = _sanrentan(18)
+    m = OddsMatrix.from_mapping("r1", "sanrentan", odds)
+    probs = harville_probabilities(np.linspace(1, 2, 18), m.horse_numbers)
+    tuples, prob, odd, ev = candidate_arrays(probs, "sanrentan", m.packed(probs.horse_numbers))
+    assert np.shares_memory(odd, m.values)
+    _, _, odd_dense, ev_dense = candidate_arrays(probs, "sanrentan", odds_tensor(odds, m.horse_numbers, "sanrentan"))
+    np.testing.assert_allclose(odd, odd_dense, rtol=1e-6)
+    np.testing.assert_allclose(ev, ev_dense, rtol=1e-6)
+    assert m.nbytes == 4896 * 4 + 18 * 2
+
+
+def test_store_persists_snapshots_and_reports_memory(tmp_path: Path) -> None:
+    store = OddsStore(tmp_path / "odds.db")
+    tansho = {str(i): 2.0 + i for i in range(1, 9)}
+    trio = {f"{a}-{b}-{c}": 100.0 + a + b + c for a, b, c in combinations(range(1, 9), 3)}
+    store.ingest("r1", {"tansho": tansho, "sanrenpuku": trio}, captured_at=100.0)
+    store.ingest("r1", {"tansho": {**tansho, "1": 2.5}}, captured_at=160.0)
+
+    assert store.latest("r1", "tansho").values[0] == pytest.approx(2.5)
+    snaps = OddsStore(tmp_path / "odds.db").snapshots("r1", "tansho")
+    assert [s.captured_at for s in snaps] == [100.0, 160.0]
+    assert not snaps[0].values.flags.owndata   # np.frombuffer（BLOB をコピーしない）
+    fresh = OddsStore(tmp_path / "odds.db").combination_odds("r1")
+    assert set(fresh) == {"tansho", "sanrenpuku"}
+    assert fresh["sanrenpuku"].to_dict()["01,02,03"] == pytest.approx(106.0)
+
+    usage = store.memory_usage()
+    assert usage["races"] == 1
+    assert usage["per_race_kind_bytes"]["r1"] == {"tansho": 8 * 4 + 8 * 2, "sanrenpuku": 56 * 4 + 8 * 2}
+    assert usage["total_bytes"] == usage["per_race_bytes"]["r1"]
+
+
+def test_npz_roundtrip_and_eviction(tmp_path: Path) -> None:
+    store = OddsStore(max_races=2)
+    for i in range(3):
+        store.ingest(f"r{i}", {"umaren": {"1-2": 3.0 + i, "2-3": 9.0}}, captured_at=float(i))
+    assert set(store.memory_usage()["per_race_bytes"]) == {"r1", "r2"}
+    path = store.save_npz(tmp_path / "day")
+    other = OddsStore()
+    assert other.load_npz(path) == 2
+    assert other.latest("r2", "umaren").to_dict() == {"01,02": 5.0, "02,03": 9.0}
+
+
+def test_realtime_store_writes_off_loop_and_closes_connections(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = OddsStore(tmp_path / "odds.db")
+    threads: list[str] = []
+    opened: list[sqlite3.Connection] = []
+    original_ingest, original_connect = store.ingest, sqlite3.connect
+
+    def _ingest(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return original_ingest(*args, **kwargs)
+
+    def _connect(*args, **kwargs):
+        opened.append(original_connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(store, "ingest", _ingest)
+    monkeypatch.setattr("services.odds_store.sqlite3.connect", _connect)
+    monkeypatch.setattr(realtime_odds, "ODDS_STORE", store)
+    monkeypatch.setattr(realtime_odds, "_ODDS_CACHE", TTLCache("odds_test", ttl_sec=60))
+
+    data = {"race_id": "r1", "fetched_at": 100.0, "odds": {"tansho": {"1": 2.4, "2": 5.1}}}
+    asyncio.run(realtime_odds._store("r1", data))
+    assert threads and threads[0].startswith("keiba-io")      # SQLite 書き込みはループ外
+    assert len(store.snapshots("r1", "tansho")) == 1
+    assert len(opened) == 2
+    for conn in opened:                                       # 書き込み・読み出しとも接続を閉じる
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import sys
+import threading
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from services.odds_timeseries import (  # noqa: E402
+    OddsRecorder,
+    decode_series,
+    drift_features,
+    encode_series,
+)
+
+
+def _odds_path(n: int, steps: int, seed: int) -> np.ndarray:
+    """締切に向けて一部の馬だけオッズが動く (steps, n) の単勝オッズ"""
+    rng = np.random.default_rng(seed)
+    base = np.round(0.8 / rng.dirichlet(np.ones(n) * 2), 1)
+    moving = rng.random(n) < 0.3
+    drift = np.cumsum(rng.normal(0, 0.03, (steps, n)) * moving, axis=0)
+    return np.round(np.maximum(base * np.exp(drift), 1.0), 1)
+
+
+def _fetch_from(paths: dict[str, np.ndarray], calls: list[str]):
+    async def fetch(race_id: str) -> dict:
+        step = sum(c == race_id for c in calls)
+        calls.append(race_id)
+        win = paths[race_id][min(step, len(paths[race_id]) - 1)]
+        n = len(win)
+        return {
+            "tansho": {str(i + 1): float(o) for i, o in enumerate(win)},
+            "fukusho": {str(i + 1): float(max(1.0, np.round(o / 3, 1))) for i, o in enumerate(win)},
+            "umaren": {f"{a}-{b}": float(np.round(win[a - 1] * win[b - 1] / 2, 1))
+                       for a, b in combinations(range(1, n + 1), 2)},
+        }
+    return fetch
+
+
+def test_encode_roundtrip_keeps_missing() -> None:
+    times = np.array([1_700_000_000, 1_700_000_300, 1_700_000_360], dtype=float)
+    values = np.array([[2.5, np.nan, 10.1], [2.4, 55.0, 10.1], [2.2, 60.3, np.nan]])
+    t, v = decode_series(encode_series(times, values))
+    np.testing.assert_array_equal(t, times)
+    np.testing.assert_allclose(v, values.astype(np.float32), equal_nan=True)
+
+
+def test_drift_features_windows_and_ranks() -> None:
+    t0 = 1_700_000_000.0
+    times = t0 + np.array([0, 600, 900, 1140, 1200])
+    values = np.array([
+        [2.0, 5.0, 10.0],
+        [2.0, 5.0, 9.0],
+        [2.2, 5.0, 6.0],
+        [2.4, 5.0, 4.0],
+        [2.5, 5.0, 3.0],
+    ])
+    f = drift_features(times, values)
+    # 5 分前 = t0+900 の行、15 分前 = t0+300 以前で最新の t0 の行
+    np.testing.assert_allclose(f["odds_drift_5m"], np.log(values[-1] / values[2]))
+    np.testing.assert_allclose(f["odds_drift_15m"], np.log(values[-1] / values[0]))
+    assert f["odds_rank_change_15m"].tolist() == [0.0, -1.0, 1.0]
+    assert f["odds_share_change_15m"].sum() == pytest.approx(0.0)
+    assert f["odds_volatility"][1] == 0.0 and f["odds_volatility"][2] > 0
+    # as_of で未来のスナップショットを使わない
+    past = drift_features(times, values, as_of=t0 + 900)
+    np.testing.assert_allclose(past["odds_drift_5m"], np.log(values[2] / values[1]))
+
+
+def test_recorder_cadence_persistence_and_features(tmp_path: Path) -> None:
+    t0 = 1_700_000_000.0
+    paths = {"r1": _odds_path(12, 40, 1), "r2": _odds_path(16, 40, 2)}
+    calls: list[str] = []
+    rec = OddsRecorder(_fetch_from(paths, calls), db_path=tmp_path / "odds.db",
+                       interval_sec=300, final_interval_sec=60, final_window_sec=600,
+                       request_interval_sec=0)
+    rec.add_races({"r1": t0 + 1800, "r2": t0 + 3600, "old": t0 - 10}, now=t0)
+    assert rec.pending(t0) == ["r1", "r2"]
+
+    now = t0
+    while now < t0 + 3600:
+        asyncio.run(rec.tick(now))
+        now += 60
+    # r1: 20 分間は 5 分おき、締切 10 分前から 1 分おき → 発走後は取得しない
+    assert calls.count("r1") == 4 + 10
+    assert calls.count("r2") == 10 + 10
+
+    fresh = OddsRecorder(_fetch_from(paths, []), db_path=tmp_path / "odds.db")
+    series = {(s.race_id, s.kind): s for s in fresh.load(["r1", "r2"])}
+    assert set(series) == {(r, k) for r in ("r1", "r2") for k in ("tansho", "fukusho", "umaren")}
+    t, v = series[("r1", "tansho")].arrays()
+    np.testing.assert_allclose(v, paths["r1"][:14], rtol=1e-6)
+
+    feats = fresh.features(["r1", "r2"])
+    assert len(feats) == 12 + 16
+    assert {"odds_drift_5m", "odds_volatility", "place_odds_drift_15m", "odds_snapshot_count"} <= set(feats.columns)
+    assert feats.loc[feats["race_id"] == "r1", "odds_snapshot_count"].iloc[0] == 14
+
+    usage = fresh.disk_usage(["r1", "r2"])
+    assert usage["races"] == 2 and usage["snapshots"] == 3 * (14 + 20)
+    raw = sum(s.arrays()[1].nbytes for s in series.values())
+    assert usage["payload_bytes"] < raw / 2   # 差分 + zlib で素の float32 の半分未満
+
+
+def test_recorder_writes_off_loop_and_closes_connections(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    t0 = 1_700_000_000.0
+    threads: list[str] = []
+    opened: list[sqlite3.Connection] = []
+    original_connect = sqlite3.connect
+
+    def _connect(*args, **kwargs):
+        opened.append(original_connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr("services.odds_timeseries.sqlite3.connect", _connect)
+    rec = OddsRecorder(_fetch_from({"r1": _odds_path(8, 5, 3)}, []), db_path=tmp_path / "odds.db",
+                       request_interval_sec=0,
+                       on_snapshot=lambda *_: threads.append(threading.current_thread().name))
+    rec.add_races({"r1": t0 + 600}, now=t0)
+    assert asyncio.run(rec.tick(t0)) == 1
+    assert threads and threads[0].startswith("keiba-io")     # 追記・書き込み・コールバックはループ外
+
+    fresh = OddsRecorder(_fetch_from({}, []), db_path=tmp_path / "odds.db")
+    assert len(fresh.features(["r1"])) == 8 and fresh.disk_usage()["races"] == 1
+    assert len(opened) == 3
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -340,6 +340,36 @@ def test_realtime_refresh_direct_access_authz(monkeypatch: pytest.MonkeyPatch):
     assert admin.status_code == 200
 
 
+@pytest.mark.parametrize("path", [
+    "/api/realtime-odds/store/stats",
+    "/api/realtime-odds/recorder/status",
+    "/api/realtime-odds/browser-pool/stats",
+    "/api/analyze_race/precompute/status",
+])
+def test_operational_status_direct_access_authz(monkeypatch: pytest.MonkeyPatch, path: str):
+    monkeypatch.setattr(
+        deps_auth,
+        "_get_profile_from_db",
+        lambda uid: {"role": "admin", "subscription_tier": "premium"} if uid == "user-admin" else {"role": "user", "subscription_tier": "free"},
+    )
+
+    no_jwt = _run_request("GET", path)
+    user = _run_request("GET", path, token="free")
+    admin = _run_request("GET", path, token="admin")
+
+    assert no_jwt.status_code == 401
+    assert user.status_code == 403
+    assert admin.status_code == 200
+
+
+def test_odds_drift_is_open_to_signed_in_users():
+    no_jwt = _run_request("GET", "/api/realtime-odds/202405020511/drift")
+    user = _run_request("GET", "/api/realtime-odds/202405020511/drift", token="free")
+
+    assert no_jwt.status_code == 401
+    assert user.status_code == 200
+
+
 def test_profiling_status_html_direct_access_authz(monkeypatch: pytest.MonkeyPatch):
     monkeypatch.setattr(
         deps_auth,
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from betting.portfolio import (  # noqa: E402
+    PortfolioConfig,
+    PortfolioRace,
+    _pad_races,
+    _race_candidates,
+    _solve,
+    optimize_portfolio,
+)
+
+
+def _race(race_id: str, n: int, seed: int, edge: float = 2.0) -> PortfolioRace:
+    """モデル確率 p に対し、一部の馬だけ市場が過小評価しているレース"""
+    rng = np.random.default_rng(seed)
+    p = rng.dirichlet(np.ones(n) * 2)
+    market = p / np.where(rng.random(n) < 0.25, edge, 1.0)
+    market /= market.sum()
+    odds = np.round(0.8 / market, 1)
+    return PortfolioRace(
+        race_id=race_id,
+        horse_numbers=list(range(1, n + 1)),
+        win_probs=p.tolist(),
+        win_odds=odds.tolist(),
+        race_info={"race_name": f"R{race_id}", "race_no": int(seed)},
+        horse_names={i: f"horse{i}" for i in range(1, n + 1)},
+    )
+
+
+def _card(n_races: int = 36) -> list[PortfolioRace]:
+    return [_race(f"2024{i:04d}", 10 + i % 9, seed=i) for i in range(n_races)]
+
+
+def test_single_bet_matches_closed_form_kelly() -> None:
+    # 単勝 1 点だけが期待値 > 1 のとき、最適額は f* = (p·o - 1) / (o - 1)
+    race = PortfolioRace("k", [1, 2, 3, 4], [0.4, 0.3, 0.2, 0.1], [3.0, 2.5, 3.5, 7.0])
+    cand = _race_candidates(race, PortfolioConfig(bankroll=1, bet_types=("tansho",)))
+    assert cand is not None and len(cand["odds"]) == 1
+    A, P, mask = _pad_races([cand])
+    f, obj, _ = _solve(A, P, mask, race_cap=0.9, total_cap=0.9, max_iter=200, tol=1e-12)
+    assert f.sum() == pytest.approx((0.4 * 3.0 - 1) / (3.0 - 1), abs=1e-6)
+    f_capped, _, _ = _solve(A, P, mask, race_cap=0.05, total_cap=0.9, max_iter=200, tol=1e-12)
+    assert f_capped.sum() == pytest.approx(0.05, abs=1e-6)
+
+
+def test_allocation_respects_budget_caps_and_units() -> None:
+    cfg = PortfolioConfig(bankroll=100_000, budget=10_000, per_race_limit=1_500, kelly_fraction=0.5)
+    result = optimize_portfolio(_card(12), cfg)
+    assert result.rows
+    assert result.total_cost <= 10_000
+    per_race: dict[str, int] = {}
+    for row in result.rows:
+        assert row["total_cost"] % 100 == 0 and row["units"] >= 1
+        assert row["expected_value"] > 1.0
+        per_race[row["race_id"]] = per_race.get(row["race_id"], 0) + row["total_cost"]
+    assert max(per_race.values()) <= 1_500
+    assert sum(r["is_best_bet"] for r in result.rows) == len(per_race)
+    assert result.expected_log_growth > 0
+
+
+def test_no_bets_without_edge() -> None:
+    race = _race("x", 12, seed=3)
+    race.win_odds = list(np.round(0.8 / np.asarray(race.win_probs), 1))  # 市場 = モデル
+    result = optimize_portfolio([race], PortfolioConfig(bankroll=100_000))
+    assert result.rows == [] and result.total_cost == 0
+
+
+def test_kelly_fraction_scales_stakes() -> None:
+    # 上限が効かない設定では、フラクショナル・ケリーはフルケリーの定数倍
+    races = _card(6)
+    loose = dict(bankroll=1_000_000, budget=1_000_000, per_race_limit=1_000_000)
+    full = optimize_portfolio(races, PortfolioConfig(kelly_fraction=1.0, **loose))
+    quarter = optimize_portfolio(races, PortfolioConfig(kelly_fraction=0.25, **loose))
+    assert quarter.total_cost == pytest.approx(full.total_cost * 0.25, rel=0.05)
+
+
+def test_full_card_solves_under_a_second() -> None:
+    cfg = PortfolioConfig(bankroll=300_000, kelly_fraction=0.25)
+    result = optimize_portfolio(_card(36), cfg)
+    assert result.rows
+    assert result.solve_ms < 1000
+    assert result.total_cost <= 30_000
+
+
+def test_bet_export_portfolio_mode() -> None:
+    from routers.bet_export import export_bet_list
+
+    results = []
+    for race in _card(4):
+        results.append({
+            "success": True,
+            "race_info": {"race_id": race.race_id, "race_name": race.race_info["race_name"]},
+            "race_level": "decisive",
+            "predictions": [
+                {"horse_number": h, "horse_name": race.horse_names[h], "p_norm": p, "odds": o}
+                for h, p, o in zip(race.horse_numbers, race.win_probs, race.win_odds)
+            ],
+        })
+    body = {"results": results, "bankroll": 100_000, "mode": "portfolio", "budget": 8_000}
+    out = asyncio.run(export_bet_list(body))
+    assert out["bets"] and out["summary"]["total_cost"] <= 8_000
+    assert "portfolio" in out["summary"]
+    row = out["bets"][0]
+    assert row["race_level"] == "decisive"
+    assert row["horse_names"][0].startswith("horse")
+
+
+def test_bet_export_portfolio_mode_applies_min_prob() -> None:
+    from routers.bet_export import export_bet_list
+
+    results = [{
+        "success": True,
+        "race_info": {"race_id": race.race_id, "race_name": race.race_info["race_name"]},
+        "predictions": [
+            {"horse_number": h, "horse_name": race.horse_names[h], "p_norm": p, "odds": o}
+            for h, p, o in zip(race.horse_numbers, race.win_probs, race.win_odds)
+        ],
+    } for race in _card(4)]
+    body = {"results": results, "bankroll": 100_000, "mode": "portfolio", "budget": 8_000}
+    loose = asyncio.run(export_bet_list(body))["bets"]
+    strict = asyncio.run(export_bet_list({**body, "min_prob": 0.05}))["bets"]
+    assert any(r["win_probability"] < 0.05 for r in loose)
+    assert strict and all(r["win_probability"] >= 0.05 for r in strict)
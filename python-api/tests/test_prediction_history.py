@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from routers.prediction_history import _query_history  # type: ignore  # noqa: E402
+from routers.predict import _save_prediction_log  # type: ignore  # noqa: E402
+from scraping.storage import _save_race_sqlite_only  # type: ignore  # noqa: E402
+
+
+def test_query_history_joins_per_horse_result_rows(tmp_path: Path) -> None:
+    # race_results_ultimate.data は 1 行 1 頭の JSON オブジェクト（スクレイパーの保存形式）
+    db = tmp_path / "keiba_ultimate.db"
+    horses = [
+        {"horse_id": "2021100001", "horse_name": "A", "horse_number": 1, "finish_position": 2,
+         "finish_time": "1:34.8", "odds": 3.4},
+        {"horse_id": "2021100002", "horse_name": "B", "horse_number": 2, "finish_position": 1,
+         "finish_time": "1:34.5", "odds": 5.1},
+    ]
+    race_info = {"race_id": "202405010101", "race_name": "テスト", "venue": "東京", "date": "20240501"}
+    assert _save_race_sqlite_only({"race_info": race_info, "horses": horses}, db)
+    predictions = [
+        {"horse_id": h["horse_id"], "horse_name": h["horse_name"], "horse_number": h["horse_number"],
+         "predicted_rank": rank, "win_probability": 0.5, "p_raw": 0.5, "odds": h["odds"]}
+        for rank, h in enumerate(horses, 1)
+    ]
+    _save_prediction_log("202405010101", race_info, predictions, "m1", str(db))
+
+    rows = _query_history(str(db), limit=10)
+    assert [(r["horse_id"], r["actual_finish"], r["actual_odds"]) for r in rows] == [
+        ("2021100001", 2, 3.4),
+        ("2021100002", 1, 5.1),
+    ]
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from models import AnalyzeRaceRequest  # type: ignore  # noqa: E402
+from routers import predict as predict_router  # type: ignore  # noqa: E402
+from services.stage_metrics import StageHistograms  # type: ignore  # noqa: E402
+from keiba_ai.stage_profiler import run_stage  # type: ignore  # noqa: E402
+
+
+def test_histograms_are_cumulative_per_kind_and_stage() -> None:
+    h = StageHistograms(buckets_ms=(10, 100))
+    h.observe("analyze", {"total_ms": 120.0, "stages": [{"name": "model.predict", "wall_ms": 5.0},
+                                                         {"name": "model.predict", "wall_ms": 50.0}]})
+    h.observe("train", {"total_ms": 9.0, "stages": []})
+
+    snap = h.snapshot()
+    assert snap["buckets_ms"] == [10, 100, "+Inf"]
+    pred = snap["stages"]["analyze"]["model.predict"]
+    assert pred["count"] == 2 and pred["buckets"] == [1, 2, 2]
+    assert pred["mean_ms"] == 27.5 and pred["max_ms"] == 50.0
+    assert snap["stages"]["analyze"]["total"]["buckets"] == [0, 0, 1]
+    assert set(h.snapshot("train")["stages"]) == {"train"}
+
+
+class _Response:
+    def __init__(self) -> None:
+        self.headers: dict = {}
+
+
+def test_analyze_debug_header_returns_stage_trace(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def _no_quota(req, units=1):
+        return None
+
+    async def _impl(request):
+        run_stage("model.predict", lambda: None)
+        return {"race_id": request.race_id}
+
+    admin = [True]
+
+    async def _allowed(http_req) -> bool:
+        return admin[0]
+
+    memory_flags: list[bool] = []
+    original_trace = predict_router.trace_stages
+
+    def _recording_trace(memory: bool = False):
+        memory_flags.append(memory)
+        return original_trace(memory=memory)
+
+    hist = StageHistograms()
+    monkeypatch.setattr(predict_router, "_stage_trace_allowed", _allowed)
+    monkeypatch.setattr(predict_router, "trace_stages", _recording_trace)
+    monkeypatch.setattr(predict_router, "check_and_consume_pred_count", _no_quota)
+    monkeypatch.setattr(predict_router, "_analyze_race_impl", _impl)
+    monkeypatch.setattr(predict_router, "STAGE_HISTOGRAMS", hist)
+    monkeypatch.setattr(predict_router, "_STAGE_PROFILING", False)
+    req = AnalyzeRaceRequest(race_id="202605050811")
+
+    plain = _Response()
+    asyncio.run(predict_router.analyze_race(req, object(), plain, None))
+    assert "X-Stage-Trace" not in plain.headers and hist.snapshot()["stages"] == {}
+
+    debug = _Response()
+    out = asyncio.run(predict_router.analyze_race(req, object(), debug, "1"))
+    assert out == {"race_id": "202605050811"}
+    (stage,) = json.loads(debug.headers["X-Stage-Trace"])
+    assert stage[0] == "model.predict"
+    assert hist.snapshot("analyze")["stages"]["analyze"]["model.predict"]["count"] == 1
+
+    admin[0] = False                                  # 一般ユーザーのヘッダは無視（tracemalloc も起動しない）
+    ignored = _Response()
+    asyncio.run(predict_router.analyze_race(req, object(), ignored, "1"))
+    assert "X-Stage-Trace" not in ignored.headers
+    assert memory_flags == [True]
+
+
+def test_stage_trace_header_requires_admin() -> None:
+    from types import SimpleNamespace
+
+    def _req(role: str) -> SimpleNamespace:
+        return SimpleNamespace(state=SimpleNamespace(user_id="u1", user_role=role, subscription_tier="free"))
+
+    assert asyncio.run(predict_router._stage_trace_allowed(_req("admin"))) is True
+    assert asyncio.run(predict_router._stage_trace_allowed(_req("user"))) is False
+    assert asyncio.run(predict_router._stage_trace_allowed(SimpleNamespace(state=SimpleNamespace()))) is False
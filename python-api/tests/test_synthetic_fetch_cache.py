@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+sys.path.insert(0, str(ROOT / "keiba"))
+
+from keiba_ai.synthetic_data import generate_races, write_fetch_cache  # type: ignore  # noqa: E402
+from scraping import fetch_pipeline, horse as horse_mod, race as race_mod  # type: ignore  # noqa: E402
+
+
+async def _no_sleep(*_args, **_kwargs) -> None:
+    return None
+
+
+def test_scrape_race_full_round_trips_synthetic_pages(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # 合成 HTML をパースすると生成元と同じ JSON に戻る（馬ページは最終出走時点のスナップショット）
+    cache = tmp_path / "fetch_cache.db"
+    monkeypatch.setattr(fetch_pipeline, "_CACHE_DB_PATH", cache)
+    monkeypatch.setattr(horse_mod, "_PEDIGREE_DB_PATH", tmp_path / "pedigree.db")
+    monkeypatch.setattr(race_mod.asyncio, "sleep", _no_sleep)
+    horse_mod._init_pedigree_table()
+
+    kwargs = {"scratch_share": 0.05, "invalid_share": 0.05}
+    races = list(generate_races(400, seed=5, **kwargs))
+    summary = write_fetch_cache(cache, 400, seed=5, **kwargs)
+    assert summary["races"] == len(races)
+
+    expected = races[-1]
+    got = asyncio.run(race_mod.scrape_race_full(None, expected["race_info"]["race_id"], quick_mode=True))
+    assert got["race_info"] == expected["race_info"]
+    assert got["return_tables"] == expected["return_tables"]
+    assert got["horses"] == expected["horses"]
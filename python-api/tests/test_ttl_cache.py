@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "python-api"))
+
+from services.ttl_cache import SQLiteCacheTier, TTLCache  # noqa: E402
+
+
+def test_lru_eviction_ttl_and_byte_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("services.ttl_cache.time.time", lambda: now[0])
+
+    cache = TTLCache("t", max_entries=3, ttl_sec=60)
+    for k in "abc":
+        cache.set(k, k.upper())
+    assert cache.get("a") == "A"          # a を最近参照 → b が最古
+    cache.set("d", "D")
+    assert "b" not in cache and cache.get("a") == "A"
+
+    cache.set("short", 1, ttl_sec=5)
+    now[0] += 10
+    assert cache.get("short") is None
+    now[0] += 60
+    cache.set("e", "E")                   # 書き込み時に期限切れをまとめて回収
+    assert len(cache) == 1
+    stats = cache.stats()
+    assert stats["evictions"] == 2 and stats["expirations"] >= 3 and stats["misses"] == 1
+
+    sized = TTLCache("bytes", max_entries=100, max_bytes=3 * 8000 + 500)
+    for i in range(5):
+        sized.set(i, np.zeros(1000))
+    assert len(sized) == 3 and sized.stats()["bytes"] == 3 * 8000
+
+
+def test_get_or_compute_coalesces_and_propagates_errors() -> None:
+    cache = TTLCache("sf", ttl_sec=60)
+    calls: list[str] = []
+
+    async def compute() -> dict:
+        calls.append("x")
+        await asyncio.sleep(0.01)
+        return {"v": len(calls)}
+
+    async def failing() -> dict:
+        calls.append("err")
+        await asyncio.sleep(0.01)
+        raise ValueError("scrape failed")
+
+    async def run() -> None:
+        out = await asyncio.gather(*[cache.get_or_compute("race", compute) for _ in range(10)])
+        assert out == [{"v": 1}] * 10
+        assert await cache.get_or_compute("race", compute) == {"v": 1}
+        errs = await asyncio.gather(*[cache.get_or_compute("bad", failing) for _ in range(4)],
+                                    return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errs)
+
+    asyncio.run(run())
+    assert calls == ["x", "err"]
+    assert "bad" not in cache
+    assert cache.stats()["coalesced"] == 9 + 3
+
+
+def test_cancelled_caller_does_not_fail_coalesced_waiters() -> None:
+    cache = TTLCache("cancel", ttl_sec=60)
+    calls: list[str] = []
+
+    async def compute() -> dict:
+        calls.append("x")
+        await asyncio.sleep(0.05)
+        return {"v": 1}
+
+    async def run() -> None:
+        first = asyncio.create_task(cache.get_or_compute("race", compute))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_compute("race", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()                                   # 先頭の呼び出しだけクライアント切断
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == {"v": 1}
+
+        alone = asyncio.create_task(cache.get_or_compute("solo", compute))
+        await asyncio.sleep(0.01)
+        alone.cancel()                                   # 待機者がいなくなった計算は止まる
+        with pytest.raises(asyncio.CancelledError):
+            await alone
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert calls == ["x", "x"]
+    assert cache.get("race") == {"v": 1} and "solo" not in cache
+    assert cache.stats()["inflight"] == 0
+
+
+def test_second_tier_shares_values_between_workers(tmp_path: Path) -> None:
+    db = tmp_path / "cache.db"
+    w1 = TTLCache("analyze", second_tier=SQLiteCacheTier(db, "analyze"))
+    w2 = TTLCache("analyze", second_tier=SQLiteCacheTier(db, "analyze"))
+    other = TTLCache("odds", second_tier=SQLiteCacheTier(db, "odds"))
+    value = {"predictions": [{"horse_number": 1, "p": 0.25}]}
+
+    async def run() -> None:
+        await w1.aset("r1:m", value)
+        assert w2.get("r1:m") is None                # 同期 API はメモリ層だけ
+        assert await w2.aget("r1:m") == value
+        assert w2.get("r1:m") == value               # 第 2 層から読んだ値はメモリ層にも載る
+        assert w2.stats()["tier_hits"] == 1
+        assert await other.aget("r1:m") is None      # 名前空間は分離
+        await w1.adelete("r1:m")
+        assert await TTLCache("analyze", second_tier=SQLiteCacheTier(db, "analyze")).aget("r1:m") is None
+
+    asyncio.run(run())
+
+
+def test_second_tier_io_runs_off_event_loop(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    tier = SQLiteCacheTier(tmp_path / "cache.db", "analyze")
+    threads: list = []
+    for name in ("get", "set"):
+        orig = getattr(tier, name)
+
+        def _traced(*args, _orig=orig, **kwargs):
+            threads.append(threading.current_thread().name)
+            return _orig(*args, **kwargs)
+        monkeypatch.setattr(tier, name, _traced)
+    cache = TTLCache("analyze", second_tier=tier)
+
+    async def _compute() -> dict:
+        return {"v": 1}
+
+    async def run() -> None:
+        assert await cache.get_or_compute("race", _compute) == {"v": 1}
+        cache.clear()
+        assert await cache.get_or_compute("race", _compute) == {"v": 1}   # 第 2 層ヒット
+
+    asyncio.run(run())
+    cache.set("sync", {"v": 2})                         # 同期 API は第 2 層に触れない
+    assert cache.get("missing") is None
+    assert len(threads) == 3 and all(t.startswith("keiba-io") for t in threads)
+    assert cache.stats()["tier_hits"] == 1
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Offline load test for the prediction API (no network, no Supabase).
+
+What it does:
+1. Build a synthetic keiba_ultimate.db (--rows / --nar-share, keiba_ai.synthetic_data) in a work dir
+2. Train a small LightGBM win model on it through add_derived_features and save a bundle
+3. Boot python-api/main.py in-process (httpx ASGITransport, no lifespan) with
+   KEIBA_ULTIMATE_DB / KEIBA_MODELS_DIR pointing at the work dir, auth dependencies
+   overridden and the prediction quota stubbed out
+4. Drive /api/analyze_race, /api/analyze_races_batch, /api/races/* and
+   /api/prediction-history at --concurrency, weighted by --mix
+5. Report p50/p95/p99 latency and throughput per endpoint, RSS and event-loop lag,
+   and save a JSON result; --compare prints deltas against an earlier result
+
+Client and server share one event loop, so latency includes time spent queued behind
+other requests' blocking work (exactly what the loop-lag numbers show).
+
+Example:
+    python scripts/benchmark_api_load.py --requests 400 --concurrency 8
+    python scripts/benchmark_api_load.py --compare reports/api_load_benchmark.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+API_DIR = ROOT_DIR / "python-api"
+KEIBA_DIR = ROOT_DIR / "keiba"
+DEFAULT_OUTPUT = ROOT_DIR / "reports" / "api_load_benchmark.json"
+DEFAULT_MIX = "analyze=4,batch=1,races_recent=2,race_horses=2,races_by_date=1,history=1"
+
+
+# ── 合成データ ──────────────────────────────────────────────────────
+
+def build_synthetic_db(db_path: Path, rows: int, seed: int, nar_share: float) -> None:
+    """keiba_ai.synthetic_data で scrape_race_full と同じ JSON 形の keiba_ultimate.db を作る"""
+    from keiba_ai.synthetic_data import write_ultimate_db  # type: ignore
+
+    write_ultimate_db(db_path, rows, seed, nar_share=nar_share)
+
+
+def _read_targets(db_path: Path) -> Dict[str, Any]:
+    """日付順の race_id・開催日・行数（距離パース失敗レースは出走表の対象から外す）"""
+    with sqlite3.connect(str(db_path)) as conn:
+        races = conn.execute(
+            "SELECT race_id, json_extract(data, '$.date') FROM races_ultimate"
+            " WHERE json_extract(data, '$._invalid_distance') IS NULL"
+        ).fetchall()
+        n_rows = conn.execute("SELECT COUNT(*) FROM race_results_ultimate").fetchone()[0]
+    races.sort(key=lambda r: (r[1], r[0]))
+    return {"races": len(races), "rows": n_rows, "race_ids": [r[0] for r in races],
+            "dates": sorted({r[1] for r in races})}
+
+
+def build_model_bundle(db_path: Path, models_dir: Path, seed: int) -> str:
+    """合成 DB で add_derived_features → LightGBM（binary, win）を学習し、推論と同じ形のバンドルを保存する"""
+    import joblib
+    import lightgbm as lgb
+    import pandas as pd
+
+    from keiba_ai.db_ultimate_loader import load_ultimate_training_frame  # type: ignore
+    from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+    from routers.predict import _drop_non_features  # type: ignore
+
+    df = load_ultimate_training_frame(db_path)
+    y = (pd.to_numeric(df["finish_position"], errors="coerce") == 1).astype(int).to_numpy()
+    X = _drop_non_features(add_derived_features(df, full_history_df=df))
+    X = X.select_dtypes(include=["number", "bool"]).astype(float)
+    model = lgb.train({"objective": "binary", "num_leaves": 15, "learning_rate": 0.1, "verbose": -1, "seed": seed},
+                      lgb.Dataset(X, y), num_boost_round=50)
+    model_id = "model_win_lightgbm_synthetic_loadtest"
+    joblib.dump({
+        "model": model, "calibrator": None, "optimizer": None, "feature_columns": list(X.columns),
+        "target": "win", "model_type": "lightgbm", "ultimate_mode": True, "use_optimizer": False,
+        "pipeline_config": {"use_feature_engineering": True, "use_optimizer": False, "requires_full_history": True},
+        "metrics": {}, "data_count": len(df), "race_count": int(df["race_id"].nunique()),
+        "created_at": datetime.now().strftime("%Y%m%d_%H%M"), "model_id": model_id,
+    }, models_dir / f"{model_id}.joblib")
+    return model_id
+
+
+# ── アプリ起動 ──────────────────────────────────────────────────────
+
+def configure_env(work_dir: Path) -> None:
+    """DB / モデル置き場 / スナップショットを作業ディレクトリに向ける（python-api の import 前に呼ぶ）"""
+    os.environ["KEIBA_ULTIMATE_DB"] = str(work_dir / "keiba_ultimate.db")
+    os.environ["KEIBA_MODELS_DIR"] = str(work_dir / "models")
+    os.environ["KEIBA_HISTORY_SNAPSHOT_DIR"] = str(work_dir / "history_snapshot")
+    os.environ["KEIBA_ODDS_STORE_DB"] = str(work_dir / "odds_store.db")
+    os.environ["APP_ENV"] = "development"
+    for name in ("SUPABASE_URL", "SUPABASE_SERVICE_KEY", "KEIBA_SHARED_CACHE_DB", "KEIBA_METRICS_DIR"):
+        os.environ.pop(name, None)
+    sys.path.insert(0, str(API_DIR))
+    sys.path.insert(0, str(KEIBA_DIR))
+
+
+def boot_app(verbose: bool):
+    """main.app を import し、認証依存を固定ユーザーに差し替えて予測回数の消費を止める"""
+    import logging
+    import warnings
+
+    import main  # type: ignore
+    from deps import auth  # type: ignore
+    from routers import predict  # type: ignore
+
+    if not verbose:
+        logging.getLogger().setLevel(logging.ERROR)
+        warnings.simplefilter("ignore")
+
+    user = {"user_id": "loadtest", "role": "admin", "subscription_tier": "premium"}
+
+    async def _user() -> dict:
+        return user
+
+    async def _no_quota(request, units: int = 1) -> None:
+        return None
+
+    for dep in (auth.get_current_user, auth.require_admin, auth.require_premium):
+        main.app.dependency_overrides[dep] = _user
+    predict.check_and_consume_pred_count = _no_quota
+    return main.app
+
+
+# ── 負荷生成 ──────────────────────────────────────────────────────
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"analyze", "batch", "races_recent", "race_horses", "races_by_date", "history"}
+    if unknown:
+        raise SystemExit(f"unknown endpoints in --mix: {sorted(unknown)}")
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def _request_for(kind: str, rng: random.Random, targets: List[str], dates: List[str],
+                 model_id: str, batch_size: int) -> tuple:
+    rid = rng.choice(targets)
+    if kind == "analyze":
+        return "POST", "/api/analyze_race", {"race_id": rid, "model_id": model_id}
+    if kind == "batch":
+        return "POST", "/api/analyze_races_batch", {"race_ids": rng.sample(targets, min(batch_size, len(targets))),
+                                                    "model_id": model_id}
+    if kind == "races_recent":
+        return "GET", "/api/races/recent?limit=50", None
+    if kind == "race_horses":
+        return "GET", f"/api/races/{rid}/horses", None
+    if kind == "races_by_date":
+        return "GET", f"/api/races/by_date?date={rng.choice(dates)}", None
+    return "GET", "/api/prediction-history?limit=200", None
+
+
+def inline_blocking_io() -> None:
+    """run_blocking を呼び出し元（イベントループ）でそのまま実行させる
+
+    keiba-io executor へ移す前（ループ上で同期 I/O を呼んでいた状態）との比較用。
+    ルーターは run_blocking を名前で import しているので、読み込み済みモジュールごとに差し替える。
+    """
+    from services import blocking_io  # type: ignore
+
+    async def _inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    original = blocking_io.run_blocking
+    for module in list(sys.modules.values()):
+        if getattr(module, "run_blocking", None) is original:
+            module.run_blocking = _inline
+
+
+async def run_load(app, plan: List[tuple], concurrency: int, warmup: List[tuple]) -> Dict[str, Any]:
+    import httpx
+
+    from services.loop_monitor import LoopLagMonitor  # type: ignore
+
+    samples: List[tuple] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=600.0) as client:
+        async def _send(kind, method, path, body) -> tuple:
+            t0 = time.perf_counter()
+            resp = await client.request(method, path, json=body)
+            return kind, resp.status_code, time.perf_counter() - t0
+
+        for kind, method, path, body in warmup:            # 履歴スナップショット・特徴量キャッシュを温める
+            _, status, _ = await _send(kind, method, path, body)
+            if status != 200:
+                raise RuntimeError(f"warmup {path} returned HTTP {status}")
+
+        monitor = LoopLagMonitor(interval_sec=0.05)
+        monitor.start()
+        queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+        for item in plan:
+            queue.put_nowait(item)
+
+        async def _worker() -> None:
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                samples.append(await _send(*item))
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        await monitor.stop()
+    return {"samples": samples, "elapsed_sec": elapsed, "loop_lag": monitor.percentiles()}
+
+
+def _rss_mb() -> Dict[str, Optional[float]]:
+    try:
+        import psutil  # type: ignore
+        rss = psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        rss = None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+    except ImportError:
+        peak = None
+    if rss is None and Path("/proc/self/statm").exists():
+        rss = int(Path("/proc/self/statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    return {"rss_mb": None if rss is None else round(rss, 1), "peak_rss_mb": None if peak is None else round(peak, 1)}
+
+
+def summarize(samples: List[tuple], elapsed: float) -> Dict[str, Any]:
+    by_kind: Dict[str, list] = {}
+    for kind, status, sec in samples:
+        by_kind.setdefault(kind, []).append((status, sec))
+    endpoints = {}
+    for kind in sorted(by_kind):
+        rows = by_kind[kind]
+        ms = np.array([sec for _, sec in rows]) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        endpoints[kind] = {
+            "requests": len(rows), "errors": sum(1 for status, _ in rows if status != 200),
+            "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(ms.max()), 2), "mean_ms": round(float(ms.mean()), 2),
+            "throughput_rps": round(len(rows) / elapsed, 2),
+        }
+    ms = np.array([sec for _, _, sec in samples]) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    return {
+        "endpoints": endpoints,
+        "total": {"requests": len(samples), "errors": sum(1 for _, s, _ in samples if s != 200),
+                  "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+                  "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0},
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\ncompare with {baseline.get('git_commit') or '?'} ({baseline.get('started_at', '?')}):")
+    rows = [("total", current["total"], baseline.get("total") or {})]
+    rows += [(k, v, (baseline.get("endpoints") or {}).get(k) or {}) for k, v in current["endpoints"].items()]
+    for name, cur, base in rows:
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if base.get(key):
+                parts.append(f"{key} {base[key]:.1f}->{cur[key]:.1f} ({(cur[key] / base[key] - 1) * 100:+.0f}%)")
+        print(f"  {name:>14}: " + (", ".join(parts) or "no baseline"))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="synthetic race_results_ultimate rows")
+    parser.add_argument("--nar-share", type=float, default=0.3, help="share of NAR races in the synthetic DB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--target-races", type=int, default=24,
+                        help="analyze the latest N races (smaller = more cache hits)")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--work-dir", default="", help="reuse a work dir (keeps the synthetic DB and model)")
+    parser.add_argument("--compare", default="", help="earlier JSON result to print deltas against")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT))
+    parser.add_argument("--verbose", action="store_true", help="keep the API's INFO/DEBUG logging")
+    parser.add_argument("--inline-blocking-io", action="store_true",
+                        help="run run_blocking calls on the event loop (baseline before the keiba-io executor)")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    tmp = None if args.work_dir else tempfile.TemporaryDirectory(prefix="keiba_loadtest_")
+    work_dir = Path(args.work_dir or tmp.name)
+    (work_dir / "models").mkdir(parents=True, exist_ok=True)
+    db_path = work_dir / "keiba_ultimate.db"
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    try:
+        configure_env(work_dir)
+        t0 = time.perf_counter()
+        if not db_path.exists():
+            build_synthetic_db(db_path, args.rows, args.seed, args.nar_share)
+        data = _read_targets(db_path)
+        t_db = time.perf_counter() - t0
+        print(f"synthetic db: {data['races']} races / {data['rows']} rows ({t_db:.1f} s) -> {db_path}")
+
+        app = boot_app(args.verbose)
+        if args.inline_blocking_io:
+            inline_blocking_io()
+        t0 = time.perf_counter()
+        model_id = next((p.stem for p in (work_dir / "models").glob("model_*.joblib")), None)
+        if model_id is None:
+            model_id = build_model_bundle(db_path, work_dir / "models", args.seed)
+        t_model = time.perf_counter() - t0
+        print(f"model bundle: {model_id} ({t_model:.1f} s)")
+
+        # 出走表として扱うのは最新 N レース（過去分は履歴として特徴量に使われる）
+        by_date = data["race_ids"]
+        targets = by_date[-args.target_races:] if args.target_races > 0 else by_date
+        mix = _parse_mix(args.mix)
+        rng = random.Random(args.seed)
+        kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+        plan = [(k, *_request_for(k, rng, targets, data["dates"], model_id, args.batch_size)) for k in kinds]
+        warmup = [("analyze", "POST", "/api/analyze_race", {"race_id": targets[0], "model_id": model_id})]
+
+        rss_before = _rss_mb()
+        result = asyncio.run(run_load(app, plan, args.concurrency, warmup))
+        summary = summarize(result["samples"], result["elapsed_sec"])
+        report = {
+            "started_at": started_at,
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "cpus": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "verbose")},
+            "data": {"races": data["races"], "rows": data["rows"], "build_sec": round(t_db, 2),
+                     "model_sec": round(t_model, 2), "target_races": len(targets)},
+            "elapsed_sec": round(result["elapsed_sec"], 3),
+            **summary,
+            "loop_lag_ms": result["loop_lag"],
+            "memory": {"before_load": rss_before, "after_load": _rss_mb()},
+        }
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    print(f"\n{'endpoint':>14} {'n':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for name, e in [*report["endpoints"].items(), ("total", report["total"])]:
+        print(f"{name:>14} {e['requests']:>5} {e['errors']:>4} {e['p50_ms']:>9.1f} {e['p95_ms']:>9.1f} "
+              f"{e['p99_ms']:>9.1f} {e['throughput_rps']:>8.2f}")
+    lag = report["loop_lag_ms"]
+    print(f"loop lag: p50 {lag['p50_ms']} ms / p99 {lag['p99_ms']} ms / max {lag['max_ms']} ms")
+    print(f"memory: {report['memory']['after_load']}")
+    if baseline is not None:
+        compare(report, baseline)
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"saved: {out}")
+    return 1 if report["total"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Peak-memory benchmark: in-memory vs chunked (out-of-core) training dataset construction.
+
+Each mode runs in its own spawned process so peak RSS is isolated:
+- in-memory: add_derived_features over the whole frame -> optimizer.fit_transform -> X_train/X_test
+  copies (the construction path of routers/train.py::_do_train).
+- chunked:   keiba_ai.training.chunked.build_chunked_dataset for each --chunk-months value
+  followed by LightGBM binary construction of the train split.
+
+Memory is reported two ways: tracemalloc peak (Python allocations) and sampled RSS
+(/proc/self/status VmRSS every --sample-ms, falling back to ru_maxrss).
+
+--synthetic-rows N runs on a keiba_ai.synthetic_data DB of N rows (built in a temp dir) instead of --db.
+
+Example:
+    python scripts/benchmark_chunked_training.py --db keiba/data/keiba_ultimate.db --chunk-months 3 6 12
+    python scripts/benchmark_chunked_training.py --synthetic-rows 1000000 --chunk-months 3 12
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+PY_API_DIR = ROOT_DIR / "python-api"
+KEIBA_DIR = ROOT_DIR / "keiba"
+DEFAULT_DB = KEIBA_DIR / "data" / "keiba_ultimate.db"
+DEFAULT_OUTPUT = ROOT_DIR / "reports" / "chunked_training_benchmark.json"
+
+
+def _current_rss_mb() -> float:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class _RssSampler:
+    def __init__(self, interval_sec: float) -> None:
+        self.interval_sec = interval_sec
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, _current_rss_mb())
+            self._stop.wait(self.interval_sec)
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _current_rss_mb())
+
+
+def _load_frame(db_path: str, months: int | None):
+    from keiba_ai.db_ultimate_loader import load_ultimate_training_frame  # type: ignore
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = load_ultimate_training_frame(Path(db_path))
+    if months:
+        d8 = df["race_date"].astype(str).str[:8]
+        last = d8[d8.str.match(r"^\d{8}$")].max()
+        import pandas as pd
+
+        start = (pd.Timestamp(last) - pd.DateOffset(months=months)).strftime("%Y%m%d")
+        df = df[d8 > start]
+    return df
+
+
+def _run_in_memory(df, target: str, test_size: float) -> dict[str, Any]:
+    import pandas as pd
+    from keiba_ai.constants import FUTURE_FIELDS  # type: ignore
+    from keiba_ai.feature_engineering import add_derived_features  # type: ignore
+    from keiba_ai.lightgbm_feature_optimizer import prepare_for_lightgbm_ultimate  # type: ignore
+    from keiba_ai.train import _make_target  # type: ignore
+
+    y = _make_target(df, target)
+    eng = add_derived_features(df, full_history_df=df)
+    eng = eng.loc[:, ~eng.columns.duplicated()]
+    eng = eng.drop(columns=[c for c in FUTURE_FIELDS if c in eng.columns])
+    opt, _, _ = prepare_for_lightgbm_ultimate(eng, target_col=target, is_training=True)
+    X = opt.drop(columns=[c for c in ("race_id", "horse_id", "jockey_id", "trainer_id", "owner_id",
+                                      "finish_position", target) if c in opt.columns])
+    X = X.drop(columns=X.select_dtypes(include=["object"]).columns.tolist()).reset_index(drop=True)
+    dates = pd.to_datetime(eng["race_date"].astype(str).str[:8], format="%Y%m%d", errors="coerce").reset_index(drop=True)
+    tr = (dates <= dates.quantile(1.0 - test_size)).values
+    X_train, X_test = X.loc[tr], X.loc[~tr]
+    return {"rows": int(len(X)), "features": int(X.shape[1]),
+            "train_rows": int(len(X_train)), "test_rows": int(len(X_test)),
+            "y_mean": float(y.mean())}
+
+
+def _run_chunked(df, target: str, test_size: float, chunk_months: int) -> dict[str, Any]:
+    from keiba_ai.training.chunked import build_chunked_dataset  # type: ignore
+
+    ds = build_chunked_dataset(df, target, Path(tempfile.mkdtemp(prefix="bench_chunked_")), chunk_months)
+    try:
+        n_train = ds.time_split_index(test_size)
+        ds.to_lgb_binary(0, n_train, "train")
+        return {"rows": ds.n_rows, "features": len(ds.feature_columns),
+                "train_rows": n_train, "test_rows": ds.n_rows - n_train,
+                "chunks": len(ds.chunk_rows), "max_chunk_rows": max(ds.chunk_rows or [0])}
+    finally:
+        ds.cleanup()
+
+
+def _worker(mode: str, args: dict[str, Any], queue: "mp.Queue") -> None:
+    sys.path.insert(0, str(KEIBA_DIR))
+    sys.path.insert(0, str(PY_API_DIR))
+    df = _load_frame(args["db"], args["months"])
+    baseline_mb = _current_rss_mb()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with _RssSampler(args["sample_ms"] / 1000.0) as sampler, contextlib.redirect_stdout(io.StringIO()):
+        if mode == "in-memory":
+            info = _run_in_memory(df, args["target"], args["test_size"])
+        else:
+            info = _run_chunked(df, args["target"], args["test_size"], int(mode.split("-")[1]))
+    elapsed = time.perf_counter() - t0
+    _, tm_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put({
+        "mode": mode,
+        "elapsed_sec": round(elapsed, 2),
+        "raw_frame_mb": round(float(df.memory_usage(deep=True).sum()) / 2**20, 1),
+        "baseline_rss_mb": round(baseline_mb, 1),
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+        "peak_rss_delta_mb": round(sampler.peak_mb - baseline_mb, 1),
+        "tracemalloc_peak_mb": round(tm_peak / 2**20, 1),
+        **info,
+    })
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=str(DEFAULT_DB))
+    parser.add_argument("--target", default="win")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--months", type=int, default=None, help="use only the most recent N months")
+    parser.add_argument("--chunk-months", type=int, nargs="+", default=[3, 6, 12])
+    parser.add_argument("--skip-in-memory", action="store_true")
+    parser.add_argument("--sample-ms", type=int, default=50)
+    parser.add_argument("--synthetic-rows", type=int, default=0, help="benchmark a synthetic DB of N rows")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --synthetic-rows")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT))
+    args = parser.parse_args()
+
+    tmp = None
+    if args.synthetic_rows:
+        sys.path.insert(0, str(KEIBA_DIR))
+        from keiba_ai.synthetic_data import write_ultimate_db  # type: ignore
+
+        tmp = tempfile.TemporaryDirectory(prefix="bench_chunked_db_")
+        args.db = str(Path(tmp.name) / "keiba_ultimate.db")
+        write_ultimate_db(Path(args.db), args.synthetic_rows, args.seed)
+    if not Path(args.db).exists():
+        print(f"DB not found: {args.db}")
+        return 1
+
+    modes = ([] if args.skip_in_memory else ["in-memory"]) + [f"chunked-{m}" for m in args.chunk_months]
+    worker_args = {"db": args.db, "months": args.months, "target": args.target,
+                   "test_size": args.test_size, "sample_ms": args.sample_ms}
+    ctx = mp.get_context("spawn")
+    results = []
+    for mode in modes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_worker, args=(mode, worker_args, queue))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0 or queue.empty():
+            results.append({"mode": mode, "error": f"exitcode={proc.exitcode}"})
+        else:
+            results.append(queue.get())
+        r = results[-1]
+        print(f"{mode:>12}: peak RSS {r.get('peak_rss_mb', '-')} MB "
+              f"(+{r.get('peak_rss_delta_mb', '-')}), tracemalloc {r.get('tracemalloc_peak_mb', '-')} MB, "
+              f"{r.get('elapsed_sec', '-')} s")
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"db": args.db, "synthetic_rows": args.synthetic_rows or None,
+                               "target": args.target, "results": results},
+                              ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"saved: {out}")
+    if tmp is not None:
+        tmp.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
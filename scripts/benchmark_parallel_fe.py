@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Speedup curve: serial vs date-partitioned parallel feature engineering.
+
+Times add_derived_features(df, full_history_df=df, n_jobs=N) for each --jobs value on the
+training frame (keiba_ultimate.db) and reports the stateless-stage time separately from
+the total, since _fe_history still runs once on the concatenated result. Every parallel
+result is checked against the serial output with assert_frame_equal.
+
+--synthetic-rows N runs on a keiba_ai.synthetic_data DB of N rows (built in a temp dir) instead of --db.
+
+Example:
+    python scripts/benchmark_parallel_fe.py --db keiba/data/keiba_ultimate.db --jobs 1 2 4 8
+    python scripts/benchmark_parallel_fe.py --synthetic-rows 500000 --jobs 1 2 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+KEIBA_DIR = ROOT_DIR / "keiba"
+DEFAULT_DB = KEIBA_DIR / "data" / "keiba_ultimate.db"
+DEFAULT_OUTPUT = ROOT_DIR / "reports" / "parallel_fe_benchmark.json"
+sys.path.insert(0, str(KEIBA_DIR))
+
+from keiba_ai import feature_engineering as fe  # type: ignore  # noqa: E402
+from keiba_ai.db_ultimate_loader import load_ultimate_training_frame  # type: ignore  # noqa: E402
+from keiba_ai.synthetic_data import write_ultimate_db  # type: ignore  # noqa: E402
+from keiba_ai.training.parallel_fe import fe_stateless_parallel  # type: ignore  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=str(DEFAULT_DB))
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--months", type=int, default=None, help="use only the most recent N months")
+    parser.add_argument("--synthetic-rows", type=int, default=0, help="benchmark a synthetic DB of N rows")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --synthetic-rows")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT))
+    args = parser.parse_args()
+
+    tmp = None
+    if args.synthetic_rows:
+        tmp = tempfile.TemporaryDirectory(prefix="keiba_fe_bench_")
+        args.db = str(Path(tmp.name) / "keiba_ultimate.db")
+        write_ultimate_db(Path(args.db), args.synthetic_rows, args.seed)
+    if not Path(args.db).exists():
+        print(f"DB not found: {args.db}")
+        return 1
+
+    df = load_ultimate_training_frame(Path(args.db))
+    if tmp is not None:
+        tmp.cleanup()
+    if args.months:
+        dates = pd.to_datetime(df["race_date"].astype(str), format="%Y%m%d", errors="coerce")
+        df = df[dates >= dates.max() - pd.DateOffset(months=args.months)].reset_index(drop=True)
+    base = fe._decategorize(df.copy())
+    print(f"rows={len(df)} races={df['race_id'].nunique()} cpus={os.cpu_count()}")
+
+    results, serial_total, serial_stateless, serial_out = [], None, None, None
+    for n_jobs in args.jobs:
+        t0 = time.perf_counter()
+        stateless = fe_stateless_parallel(base.copy(), None, n_jobs)
+        t_stateless = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        out = fe.add_derived_features(df, full_history_df=df, n_jobs=n_jobs)
+        t_total = time.perf_counter() - t0
+        if serial_out is None:
+            serial_out, serial_total, serial_stateless = out, t_total, t_stateless
+        else:
+            pd.testing.assert_frame_equal(out, serial_out)
+        del stateless
+        results.append({
+            "n_jobs": n_jobs,
+            "stateless_sec": round(t_stateless, 3),
+            "total_sec": round(t_total, 3),
+            "stateless_speedup": round(serial_stateless / t_stateless, 2),
+            "total_speedup": round(serial_total / t_total, 2),
+        })
+        r = results[-1]
+        print(f"n_jobs={n_jobs:>2}: stateless {r['stateless_sec']:7.2f} s (x{r['stateless_speedup']}), "
+              f"total {r['total_sec']:7.2f} s (x{r['total_speedup']})")
+
+    out_path = Path(args.output)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps({"db": args.db, "synthetic_rows": args.synthetic_rows or None, "rows": len(df),
+                                    "cpus": os.cpu_count(), "results": results},
+                                   ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"saved: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
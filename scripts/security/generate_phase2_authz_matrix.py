@@ -47,6 +47,10 @@ def main() -> None:
         ]
         for r in payload["fastapi"]["routes"]
     ]
+    decision_rows = [
+        [r["endpoint"], r["method"], r["policy"], r["decision"]]
+        for r in payload["fastapi"]["policy_decisions"]
+    ]
     next_rows = [
         [
             r["route"],
@@ -70,6 +74,10 @@ def main() -> None:
             "",
             _to_md_table(["endpoint", "method", "policy", "dependencies", "source"], fastapi_rows),
             "",
+            "## FastAPI Policy Decisions",
+            "",
+            _to_md_table(["endpoint", "method", "policy", "decision"], decision_rows),
+            "",
             "## Next API Routes",
             "",
             _to_md_table(
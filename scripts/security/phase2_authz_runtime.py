@@ -49,6 +49,17 @@ DIRECT_PUBLIC_ALLOWLIST = {
     "/api/stripe/webhook",
 }
 
+# Explicit policy decisions for FastAPI routes whose level is a judgement call.
+# Keyed by "<METHOD> <path>"; rendered into the matrix next to the runtime policy.
+FASTAPI_POLICY_DECISIONS = {
+    "GET /api/analyze_race/precompute/status": "progress of an admin-started precompute run and store hit rates; admin-only like POST /api/analyze_race/precompute",
+    "GET /api/realtime-odds/browser-pool/stats": "Playwright pool launches, context recycles and waits; operational, admin-only",
+    "GET /metrics": "scraper endpoint outside /api, so no JWT; KEIBA_METRICS_TOKEN bearer required when set, 503 in production without it",
+    "GET /api/realtime-odds/recorder/status": "recorder state and disk usage; admin-only like recorder start/stop",
+    "GET /api/realtime-odds/{race_id}/drift": "per-race odds features for any signed-in user, same level as GET /api/realtime-odds/{race_id}",
+    "GET /api/realtime-odds/store/stats": "operational memory and cache stats; admin-only like POST /api/realtime-odds/refresh",
+}
+
 
 @dataclass(frozen=True)
 class FastAPIRouteInfo:
@@ -717,6 +728,11 @@ def build_matrix_payload() -> dict[str, Any]:
     fastapi_dupes = _duplicates([_key(r.endpoint, r.method) for r in fastapi_routes])
     next_unclassified = [asdict(r) for r in next_routes if r.policy == "Unclassified"]
     next_failures = [asdict(f) for f in gate_next_routes(next_routes, canonical)]
+    decisions = [
+        {"endpoint": r.endpoint, "method": r.method, "policy": r.policy, "decision": FASTAPI_POLICY_DECISIONS[k]}
+        for r in fastapi_routes
+        if (k := _key(r.endpoint, r.method)) in FASTAPI_POLICY_DECISIONS
+    ]
 
     return {
         "fastapi": {
@@ -724,6 +740,7 @@ def build_matrix_payload() -> dict[str, Any]:
             "routes": [asdict(r) for r in fastapi_routes],
             "unclassified": unclassified,
             "duplicates": fastapi_dupes,
+            "policy_decisions": decisions,
         },
         "next": {
             "count": len(next_routes),